@@ -0,0 +1,300 @@
+"""
+Motore degli achievement.
+
+Le condizioni di data/achievements/achievements.json vengono compilate una sola volta
+in coppie (contatore, soglia). I contatori sono mantenuti in modo incrementale dagli
+eventi del bus di gioco (vedi core/eventi_gioco.py) e salvati con il giocatore insieme
+agli achievement sbloccati.
+
+Per ogni contatore gli achievement ancora bloccati sono ordinati per soglia: quando il
+contatore cambia si sbloccano solo quelli che la raggiungono, e il motore si disiscrive
+dagli eventi che non possono più sbloccare nulla. Il costo per evento è proporzionale
+agli achievement interessati, non al catalogo.
+"""
+import bisect
+import logging
+import time
+
+from core.eventi_gioco import (
+    ACHIEVEMENT_SBLOCCATO, COMBATTIMENTO_CONCLUSO, GIOCATORE_MOSSO, MAPPA_CAMBIATA,
+    MISSIONE_COMPLETATA, OGGETTO_EQUIPAGGIATO, OGGETTO_OTTENUTO, ORO_GUADAGNATO
+)
+
+logger = logging.getLogger("gioco_rpg")
+
+# Valore della condizione "aree_visitate" che indica tutte le mappe del gioco
+TUTTE = "tutte"
+
+
+def _contatore_equipaggiamento(categoria, rarita):
+    """Nome del contatore degli oggetti equipaggiati di una categoria e rarità"""
+    return f"equipaggiati:{categoria}:{rarita}"
+
+
+def _compila_condizione(condizione, numero_mappe):
+    """
+    Converte una condizione del catalogo nella coppia (contatore, soglia).
+
+    Args:
+        condizione (dict): Condizione dell'achievement
+        numero_mappe (int): Numero di mappe del gioco, per le condizioni su tutte le aree
+
+    Returns:
+        tuple: (nome del contatore, soglia), None se il tipo di condizione non è supportato
+    """
+    tipo = condizione.get("tipo")
+    valore = condizione.get("valore", 1)
+    if tipo == "movimento":
+        return "movimenti", valore
+    if tipo == "combattimento_vittoria":
+        return "combattimenti_vinti", valore
+    if tipo == "combattimenti_senza_danni":
+        return "combattimenti_vinti_senza_danni", valore
+    if tipo == "oggetti_raccolti_unici":
+        return "oggetti_unici", valore
+    if tipo == "monete":
+        return "oro_massimo", valore
+    if tipo == "aree_visitate":
+        return "mappe_visitate", numero_mappe if valore == TUTTE else valore
+    if tipo == "missione_senza_combattimenti":
+        return "missioni_senza_combattimenti", valore
+    if tipo == "equipaggia_oggetto":
+        return _contatore_equipaggiamento(condizione.get("categoria"), condizione.get("rarita")), 1
+    return None
+
+
+def _evento_del_contatore(contatore):
+    """Tipo di evento che aggiorna un contatore"""
+    if contatore.startswith("equipaggiati:"):
+        return OGGETTO_EQUIPAGGIATO
+    return _EVENTI_CONTATORI[contatore]
+
+
+_EVENTI_CONTATORI = {
+    "movimenti": GIOCATORE_MOSSO,
+    "combattimenti_vinti": COMBATTIMENTO_CONCLUSO,
+    "combattimenti_vinti_senza_danni": COMBATTIMENTO_CONCLUSO,
+    "oggetti_unici": OGGETTO_OTTENUTO,
+    "oro_massimo": ORO_GUADAGNATO,
+    "mappe_visitate": MAPPA_CAMBIATA,
+    "missioni_senza_combattimenti": MISSIONE_COMPLETATA
+}
+
+
+class ProgressoAchievement:
+    """Contatori e achievement sbloccati di un giocatore, salvati con il giocatore"""
+
+    def __init__(self):
+        self.contatori = {}  # {nome contatore: valore}
+        self.insiemi = {}  # {nome contatore: set}, per i contatori di valori distinti
+        self.sbloccati = {}  # {id achievement: timestamp di sblocco}
+
+    def incrementa(self, contatore, quantita=1):
+        """
+        Incrementa un contatore.
+
+        Returns:
+            int: Il nuovo valore
+        """
+        valore = self.contatori.get(contatore, 0) + quantita
+        self.contatori[contatore] = valore
+        return valore
+
+    def massimo(self, contatore, valore):
+        """
+        Aggiorna un contatore al massimo tra il valore attuale e quello dato.
+
+        Returns:
+            int: Il nuovo valore, None se non è cambiato
+        """
+        if valore <= self.contatori.get(contatore, 0):
+            return None
+        self.contatori[contatore] = valore
+        return valore
+
+    def aggiungi_distinto(self, contatore, elemento):
+        """
+        Aggiunge un elemento all'insieme di un contatore di valori distinti.
+
+        Returns:
+            int: Il numero di elementi distinti, None se l'elemento era già presente
+        """
+        insieme = self.insiemi.setdefault(contatore, set())
+        if elemento in insieme:
+            return None
+        insieme.add(elemento)
+        self.contatori[contatore] = len(insieme)
+        return len(insieme)
+
+    def to_dict(self):
+        """
+        Converte il progresso in un dizionario serializzabile.
+
+        Returns:
+            dict: Contatori, insiemi (come liste ordinate) e achievement sbloccati
+        """
+        return {
+            "contatori": dict(self.contatori),
+            "insiemi": {nome: sorted(insieme) for nome, insieme in self.insiemi.items()},
+            "sbloccati": dict(self.sbloccati)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Crea il progresso da un dizionario prodotto da to_dict.
+
+        Args:
+            data (dict): Dati del progresso
+
+        Returns:
+            ProgressoAchievement: Il progresso ricostruito
+        """
+        progresso = cls()
+        data = data or {}
+        progresso.contatori = dict(data.get("contatori", {}))
+        progresso.insiemi = {nome: set(elementi) for nome, elementi in data.get("insiemi", {}).items()}
+        progresso.sbloccati = dict(data.get("sbloccati", {}))
+        return progresso
+
+
+class MotoreAchievement:
+    """
+    Collega il catalogo degli achievement al bus degli eventi di una partita
+    e aggiorna il progresso del giocatore.
+    """
+
+    def __init__(self, eventi):
+        """
+        Args:
+            eventi (BusEventi): Bus degli eventi della partita
+        """
+        self.eventi = eventi
+        self.giocatore = None
+        # {contatore: lista ordinata di (soglia, id)} degli achievement ancora bloccati
+        self._in_attesa = {}
+        # {tipo di evento: callback iscritta}
+        self._iscrizioni = {}
+
+    def collega(self, giocatore, numero_mappe, catalogo=None):
+        """
+        Prepara il motore per un giocatore: compila il catalogo, sblocca gli achievement
+        già raggiunti dai contatori salvati e si iscrive agli eventi necessari.
+
+        Args:
+            giocatore (Giocatore): Il giocatore, None per scollegare il motore
+            numero_mappe (int): Numero di mappe del gioco
+            catalogo (list, optional): Catalogo degli achievement, per default quello di data/
+        """
+        for tipo, callback in self._iscrizioni.items():
+            self.eventi.disiscrivi(callback)
+        self._iscrizioni = {}
+        self._in_attesa = {}
+        self.giocatore = giocatore
+        if giocatore is None:
+            return
+
+        if catalogo is None:
+            from util.data_manager import get_data_manager
+            catalogo = get_data_manager().get_achievements() or []
+
+        progresso = giocatore.progresso_achievement
+        for achievement in catalogo:
+            if achievement["id"] in progresso.sbloccati:
+                continue
+            compilata = _compila_condizione(achievement.get("condizione", {}), numero_mappe)
+            if compilata is None:
+                logger.debug(f"Condizione dell'achievement {achievement['id']} non supportata")
+                continue
+            contatore, soglia = compilata
+            bisect.insort(self._in_attesa.setdefault(contatore, []), (soglia, achievement["id"]))
+
+        # La mappa iniziale viene contata dall'evento MAPPA_CAMBIATA del primo posizionamento;
+        # qui si recupera solo quella dei salvataggi precedenti, se il contatore è ancora mantenuto
+        if giocatore.mappa_corrente and "mappe_visitate" in self._in_attesa:
+            progresso.aggiungi_distinto("mappe_visitate", giocatore.mappa_corrente)
+
+        for contatore in list(self._in_attesa):
+            self._verifica(contatore, progresso.contatori.get(contatore, 0))
+
+        for contatore in self._in_attesa:
+            tipo = _evento_del_contatore(contatore)
+            if tipo not in self._iscrizioni:
+                self._iscrizioni[tipo] = self.eventi.iscrivi(tipo, self._gestisci_evento)
+
+    def contatori_in_attesa(self):
+        """
+        Restituisce i contatori ancora mantenuti dal motore. Quelli degli eventi a cui
+        il motore si è disiscritto non vengono più aggiornati e sono esclusi.
+
+        Returns:
+            dict: {nome contatore: valore} dei contatori con achievement ancora bloccati
+        """
+        if self.giocatore is None:
+            return {}
+        contatori = self.giocatore.progresso_achievement.contatori
+        return {contatore: contatori.get(contatore, 0) for contatore in self._in_attesa}
+
+    def _gestisci_evento(self, tipo, dati):
+        """Aggiorna i contatori interessati da un evento e verifica le soglie"""
+        progresso = self.giocatore.progresso_achievement
+        aggiornati = []
+        if tipo == GIOCATORE_MOSSO:
+            aggiornati.append(("movimenti", progresso.incrementa("movimenti")))
+        elif tipo == MAPPA_CAMBIATA:
+            aggiornati.append(("mappe_visitate", progresso.aggiungi_distinto("mappe_visitate", dati["a"])))
+        elif tipo == MISSIONE_COMPLETATA:
+            if not dati["combattimenti"]:
+                aggiornati.append(("missioni_senza_combattimenti", progresso.incrementa("missioni_senza_combattimenti")))
+        elif dati.get("entita", self.giocatore.nome) != self.giocatore.nome:
+            # Oggetti e oro ottenuti da altre entità
+            return
+        elif tipo == OGGETTO_OTTENUTO:
+            aggiornati.append(("oggetti_unici", progresso.aggiungi_distinto("oggetti_unici", dati["oggetto"])))
+        elif tipo == ORO_GUADAGNATO:
+            progresso.incrementa("oro_guadagnato", dati["quantita"])
+            aggiornati.append(("oro_massimo", progresso.massimo("oro_massimo", dati["totale"])))
+        elif tipo == COMBATTIMENTO_CONCLUSO:
+            if dati["vittoria"]:
+                aggiornati.append(("combattimenti_vinti", progresso.incrementa("combattimenti_vinti")))
+                if not dati.get("danni_subiti"):
+                    aggiornati.append(("combattimenti_vinti_senza_danni",
+                                       progresso.incrementa("combattimenti_vinti_senza_danni")))
+        elif tipo == OGGETTO_EQUIPAGGIATO:
+            contatore = _contatore_equipaggiamento(dati["categoria"], dati.get("rarita"))
+            if contatore in self._in_attesa:
+                aggiornati.append((contatore, progresso.incrementa(contatore)))
+
+        for contatore, valore in aggiornati:
+            if valore is not None and contatore in self._in_attesa:
+                self._verifica(contatore, valore)
+                if contatore not in self._in_attesa:
+                    self._disiscrivi_se_inutile(_evento_del_contatore(contatore))
+
+    def _verifica(self, contatore, valore):
+        """Sblocca gli achievement del contatore la cui soglia è stata raggiunta"""
+        in_attesa = self._in_attesa[contatore]
+        while in_attesa and valore >= in_attesa[0][0]:
+            _, id_achievement = in_attesa.pop(0)
+            self._sblocca(id_achievement)
+        if not in_attesa:
+            del self._in_attesa[contatore]
+
+    def _disiscrivi_se_inutile(self, tipo):
+        """Rimuove l'iscrizione a un evento che non aggiorna più contatori in attesa"""
+        if any(_evento_del_contatore(c) == tipo for c in self._in_attesa):
+            return
+        callback = self._iscrizioni.pop(tipo, None)
+        if callback is not None:
+            self.eventi.disiscrivi(callback)
+
+    def _sblocca(self, id_achievement):
+        """Registra lo sblocco sul giocatore e lo annuncia sul bus"""
+        timestamp = time.time()
+        self.giocatore.progresso_achievement.sbloccati[id_achievement] = timestamp
+        logger.info(f"Achievement sbloccato da {self.giocatore.nome}: {id_achievement}")
+        self.eventi.emetti(ACHIEVEMENT_SBLOCCATO, id=id_achievement, timestamp=timestamp)
+
+    def __getstate__(self):
+        """Le iscrizioni vengono ricreate da Game.collega_eventi dopo il caricamento"""
+        return {"eventi": self.eventi, "giocatore": self.giocatore, "_in_attesa": {}, "_iscrizioni": {}}
@@ -0,0 +1,155 @@
+"""
+Interprete dei comandi testuali degli stati.
+
+Ogni stato dichiara per le sue fasi un RegistroComandi: per ogni azione l'elenco dei
+sinonimi (parole o frasi, compreso il numero della voce di menu) e una descrizione.
+I sinonimi sono compilati una sola volta in un trie di caratteri; interpretare un
+comando costa quindi O(lunghezza dell'input), indipendentemente dal numero di sinonimi.
+
+Le corrispondenze avvengono solo a fine parola, così "usa" non riconosce "causa"
+o "usato". Un sinonimo può essere abbreviato se il prefisso scritto appartiene a
+un'unica azione ("att" -> attacca). Le parole che seguono il sinonimo sono
+restituite come argomenti del comando.
+"""
+import re
+import unicodedata
+
+# Un prefisso deve avere almeno questa lunghezza per valere come abbreviazione
+LUNGHEZZA_MINIMA_ABBREVIAZIONE = 2
+
+# Segnaposto dei nodi del trie i cui sinonimi appartengono a più azioni
+_AMBIGUO = object()
+
+_PAROLA = re.compile(r"\w+")
+
+
+def normalizza(testo):
+    """
+    Porta un testo nella forma usata dal trie: minuscolo e senza accenti.
+
+    Args:
+        testo (str): Il testo da normalizzare
+
+    Returns:
+        str: Il testo normalizzato
+    """
+    decomposto = unicodedata.normalize("NFKD", testo.lower())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+class _Nodo:
+    """Nodo del trie dei sinonimi"""
+    __slots__ = ("figli", "azione", "unica")
+
+    def __init__(self):
+        self.figli = {}  # {carattere: _Nodo}
+        self.azione = None  # Azione del sinonimo che termina in questo nodo
+        self.unica = None  # Azione di tutti i sinonimi sotto il nodo, o _AMBIGUO
+
+
+class RegistroComandi:
+    """Sinonimi delle azioni di una fase di gioco, compilati in un trie"""
+
+    def __init__(self, voci=()):
+        """
+        Args:
+            voci (iterable, optional): Terne (azione, sinonimi, descrizione) da registrare
+        """
+        self._radice = _Nodo()
+        self._azioni = {}  # {azione: {"sinonimi": [...], "descrizione": str}}, in ordine di registrazione
+        for azione, sinonimi, descrizione in voci:
+            self.registra(azione, sinonimi, descrizione)
+
+    def registra(self, azione, sinonimi, descrizione=""):
+        """
+        Registra un'azione con i suoi sinonimi.
+
+        Args:
+            azione (str): Identificativo dell'azione restituito da interpreta
+            sinonimi (list): Parole o frasi che richiamano l'azione
+            descrizione (str, optional): Descrizione mostrata al client
+
+        Raises:
+            ValueError: Se un sinonimo appartiene già a un'altra azione
+        """
+        voce = self._azioni.setdefault(azione, {"sinonimi": [], "descrizione": descrizione})
+        if descrizione:
+            voce["descrizione"] = descrizione
+        for sinonimo in sinonimi:
+            chiave = " ".join(normalizza(parola) for parola in _PAROLA.findall(sinonimo))
+            if not chiave:
+                continue
+            nodo = self._radice
+            percorso = []
+            for carattere in chiave:
+                nodo = nodo.figli.setdefault(carattere, _Nodo())
+                percorso.append(nodo)
+            if nodo.azione is not None and nodo.azione != azione:
+                raise ValueError(f"Il sinonimo '{sinonimo}' appartiene già all'azione {nodo.azione}")
+            nodo.azione = azione
+            for nodo in percorso:
+                if nodo.unica is None:
+                    nodo.unica = azione
+                elif nodo.unica != azione:
+                    nodo.unica = _AMBIGUO
+            voce["sinonimi"].append(sinonimo)
+
+    def interpreta(self, testo):
+        """
+        Riconosce l'azione richiesta da un comando.
+
+        Vince il sinonimo completo più lungo che termina a fine parola; in sua assenza
+        la prima parola viene accettata come abbreviazione se identifica una sola azione.
+
+        Args:
+            testo (str): Il comando del giocatore
+
+        Returns:
+            tuple: (azione, argomenti) con gli argomenti come testo originale dopo il
+                   sinonimo, None se il comando non corrisponde a nessuna azione
+        """
+        nodo = self._radice
+        trovata = None  # (azione, ultima parola del sinonimo)
+        abbreviazione = None
+        # Le parole vengono estratte solo finché il trie può ancora riconoscerle
+        for indice, parola in enumerate(_PAROLA.finditer(testo or "")):
+            if indice:
+                nodo = nodo.figli.get(" ")
+                if nodo is None:
+                    break
+            for carattere in normalizza(parola.group()):
+                nodo = nodo.figli.get(carattere)
+                if nodo is None:
+                    break
+            if nodo is None:
+                break
+            if nodo.azione is not None:
+                trovata = (nodo.azione, parola)
+            elif (indice == 0 and nodo.unica not in (None, _AMBIGUO)
+                  and len(parola.group()) >= LUNGHEZZA_MINIMA_ABBREVIAZIONE):
+                abbreviazione = (nodo.unica, parola)
+
+        trovata = trovata or abbreviazione
+        if trovata is None:
+            return None
+        azione, ultima = trovata
+        argomenti = testo[ultima.end():].strip()
+        # La sola punteggiatura ("attacca!") non è un argomento
+        return azione, argomenti if _PAROLA.search(argomenti) else ""
+
+    def elenca(self):
+        """
+        Elenca le azioni registrate, per i client.
+
+        Returns:
+            list: Dizionari con azione, comando principale, sinonimi e descrizione
+        """
+        return [
+            {
+                "azione": azione,
+                "comando": voce["sinonimi"][0] if voce["sinonimi"] else azione,
+                "sinonimi": list(voce["sinonimi"]),
+                "descrizione": voce["descrizione"]
+            }
+            for azione, voce in self._azioni.items()
+        ]
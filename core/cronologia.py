@@ -0,0 +1,192 @@
+"""
+Cronologia della partita per annullare i comandi senza ricaricare la sessione.
+
+Prima di ogni comando viene registrata un'istantanea strutturale della partita: il
+giocatore, lo stack degli stati e le mappe, nella forma prodotta dai loro to_dict.
+Le istantanee sono tenute in un buffer circolare di profondità fissa.
+
+Le istantanee condividono la struttura con la precedente: ogni parte uguale a quella
+dell'istantanea precedente (una mappa, una riga della griglia, lo zaino del giocatore)
+è lo stesso oggetto, non una copia. Vengono confrontate tutte le mappe già ricostruite,
+perché un comando può modificarne una qualsiasi (ad esempio attraverso un NPG o un
+oggetto condiviso); quelle di un salvataggio ancora in forma serializzata (vedi
+MappePigre) non possono essere cambiate e sono riprese dall'istantanea precedente senza
+ricostruirle. La memoria di un'istantanea è quindi proporzionale a ciò che il comando
+ha cambiato.
+
+La cronologia vive solo in memoria: non fa parte dei salvataggi né degli snapshot
+di sessione su disco.
+"""
+import copy
+import logging
+import os
+from collections import deque
+
+from states.registro_stati import serializza_stato
+from world.gestore_mappe import MappePigre
+
+logger = logging.getLogger("gioco_rpg")
+
+# Numero di comandi che possono essere annullati
+PROFONDITA_ANNULLA = int(os.environ.get("RPG_PROFONDITA_ANNULLA", 20))
+
+
+def _condividi(nuovo, precedente):
+    """
+    Restituisce nuovo riusando le parti uguali di precedente.
+
+    Args:
+        nuovo: Valore appena serializzato
+        precedente: Valore corrispondente dell'istantanea precedente
+
+    Returns:
+        precedente se i due valori sono uguali, altrimenti nuovo con dizionari e liste
+        ricostruiti attorno alle parti invariate di precedente
+    """
+    if nuovo == precedente:
+        return precedente
+    if isinstance(nuovo, dict) and isinstance(precedente, dict):
+        return {
+            chiave: _condividi(valore, precedente[chiave]) if chiave in precedente else valore
+            for chiave, valore in nuovo.items()
+        }
+    if isinstance(nuovo, list) and isinstance(precedente, list) and len(nuovo) == len(precedente):
+        return [_condividi(a, b) for a, b in zip(nuovo, precedente)]
+    return nuovo
+
+
+class CronologiaPartita:
+    """Buffer circolare delle istantanee di una partita, per annullare i comandi"""
+
+    def __init__(self, profondita=PROFONDITA_ANNULLA):
+        """
+        Args:
+            profondita (int, optional): Numero massimo di istantanee conservate
+        """
+        self.profondita = max(0, profondita)
+        self._istantanee = deque(maxlen=self.profondita)
+
+    def __len__(self):
+        return len(self._istantanee)
+
+    def svuota(self):
+        """Scarta tutte le istantanee"""
+        self._istantanee.clear()
+
+    def registra(self, game):
+        """
+        Registra l'istantanea della partita, da chiamare prima di eseguire un comando.
+        Un'istantanea identica alla precedente non viene aggiunta.
+
+        Args:
+            game (Game): La partita
+
+        Returns:
+            bool: True se l'istantanea è stata aggiunta
+        """
+        if not self.profondita:
+            return False
+        istantanea = self._cattura(game)
+        if istantanea is None:
+            return False
+        self._istantanee.append(istantanea)
+        return True
+
+    def _cattura(self, game):
+        """
+        Crea l'istantanea della partita condividendo le parti invariate con l'ultima registrata.
+
+        Returns:
+            dict: L'istantanea, None se è identica all'ultima registrata
+        """
+        gestore = game.gestore_mappe
+        mappa_attuale = gestore.mappa_attuale.nome if gestore.mappa_attuale else None
+        precedente = self._istantanee[-1] if self._istantanee else None
+
+        if precedente is None:
+            # Prima istantanea: tutte le mappe, senza ricostruire quelle mai usate
+            mappe = {nome: copy.deepcopy(gestore.dati_mappa(nome)) for nome in gestore.mappe}
+            precedente = {}
+        else:
+            mappe = dict(precedente["mappe"])
+            pigre = isinstance(gestore.mappe, MappePigre)
+            for nome in gestore.mappe:
+                if not pigre or gestore.mappe.e_caricata(nome):
+                    mappe[nome] = _condividi(copy.deepcopy(gestore.dati_mappa(nome)), precedente["mappe"].get(nome))
+            for nome in [nome for nome in mappe if nome not in gestore.mappe]:
+                del mappe[nome]
+
+        # I to_dict possono restituire dizionari e liste vivi degli oggetti (dati_temporanei,
+        # progresso_missioni...): l'istantanea ne tiene una copia che la partita non tocca più
+        istantanea = {
+            "giocatore": _condividi(copy.deepcopy(game.giocatore.to_dict()) if game.giocatore else None,
+                                    precedente.get("giocatore")),
+            "stati": _condividi(copy.deepcopy([serializza_stato(stato) for stato in game.stato_stack]),
+                                precedente.get("stati")),
+            "mappe": mappe,
+            "mappa_attuale": mappa_attuale,
+            "attivo": game.attivo
+        }
+
+        if precedente and all(istantanea[chiave] == precedente[chiave] for chiave in istantanea):
+            return None
+        return istantanea
+
+    def annulla(self, game, passi=1):
+        """
+        Riporta la partita a com'era prima degli ultimi comandi.
+
+        Args:
+            game (Game): La partita
+            passi (int, optional): Numero di comandi da annullare
+
+        Returns:
+            int: Numero di comandi effettivamente annullati (0 se la cronologia è vuota)
+        """
+        if not self._istantanee or passi < 1:
+            return 0
+        # Un'istantanea uguale allo stato attuale, lasciata da un comando senza effetto,
+        # non conta come passo da annullare
+        attuale = self._cattura(game) or self._istantanee.pop()
+        passi = min(passi, len(self._istantanee))
+        if not passi:
+            return 0
+
+        for _ in range(passi - 1):
+            self._istantanee.pop()
+        self._ripristina(game, self._istantanee.pop(), attuale)
+        logger.info(f"Annullati {passi} comandi")
+        return passi
+
+    def _ripristina(self, game, istantanea, attuale):
+        """
+        Applica un'istantanea alla partita.
+
+        Vengono ricostruite solo le mappe la cui forma differisce da quella
+        dell'istantanea dello stato attuale. I from_dict ricevono una copia dei dati:
+        possono tenerne dizionari e liste, che sono condivisi con le altre istantanee.
+        """
+        from entities.giocatore import Giocatore
+        from world.mappa import Mappa
+
+        gestore = game.gestore_mappe
+        for nome in [nome for nome in gestore.mappe if nome not in istantanea["mappe"]]:
+            del gestore.mappe[nome]
+        for nome, dati in istantanea["mappe"].items():
+            if attuale["mappe"].get(nome) is not dati:
+                gestore.mappe[nome] = Mappa.from_dict(copy.deepcopy(dati))
+
+        giocatore = copy.deepcopy(istantanea["giocatore"])
+        game.giocatore = Giocatore.from_dict(giocatore) if giocatore else None
+        game.collega_eventi()
+
+        gestore.mappa_attuale = None
+        if istantanea["mappa_attuale"]:
+            gestore.imposta_mappa_attuale(istantanea["mappa_attuale"])
+
+        game.ricostruisci_stack_stati(copy.deepcopy(istantanea["stati"]))
+        game.attivo = istantanea["attivo"]
+
+    def __getstate__(self):
+        """Le istantanee non vengono serializzate con la partita"""
+        return {"profondita": self.profondita, "_istantanee": deque(maxlen=self.profondita)}
@@ -0,0 +1,179 @@
+"""
+Bus degli eventi di gioco.
+
+Le azioni del gioco (danni, oggetti ottenuti, cambi di mappa, dialoghi, oggetti
+interattivi) emettono eventi tipizzati sul bus del Game. Funzionalità come obiettivi,
+notifiche, metriche o un narratore si iscrivono ai tipi che interessano loro:
+    - gli iscritti sincroni vengono chiamati subito con (tipo, dati)
+    - gli iscritti differiti ricevono gli eventi accodati in blocco con svuota(),
+      eseguita al termine di ogni comando
+
+Le liste di iscritti per tipo sono precalcolate a ogni iscrizione: emettere un
+evento a cui nessuno è iscritto costa una ricerca in un dizionario.
+"""
+import logging
+
+logger = logging.getLogger("gioco_rpg")
+
+# Tipi di evento emessi dal gioco, con i campi dei dati
+DANNO_SUBITO = "danno_subito"  # entita, danno, hp, sconfitto
+OGGETTO_OTTENUTO = "oggetto_ottenuto"  # entita, oggetto
+MAPPA_CAMBIATA = "mappa_cambiata"  # da, a, x, y
+NODO_DIALOGO = "nodo_dialogo"  # npg, nodo
+STATO_OGGETTO_CAMBIATO = "stato_oggetto_cambiato"  # oggetto, da, a
+GIOCATORE_MOSSO = "giocatore_mosso"  # mappa, x, y
+ORO_GUADAGNATO = "oro_guadagnato"  # entita, quantita, totale
+OGGETTO_EQUIPAGGIATO = "oggetto_equipaggiato"  # oggetto, categoria, rarita
+COMBATTIMENTO_CONCLUSO = "combattimento_concluso"  # avversario, vittoria, danni_subiti
+ACHIEVEMENT_SBLOCCATO = "achievement_sbloccato"  # id, timestamp
+MISSIONE_INIZIATA = "missione_iniziata"  # id
+MISSIONE_COMPLETATA = "missione_completata"  # id, combattimenti
+
+TIPI_EVENTO = frozenset({
+    DANNO_SUBITO,
+    OGGETTO_OTTENUTO,
+    MAPPA_CAMBIATA,
+    NODO_DIALOGO,
+    STATO_OGGETTO_CAMBIATO,
+    GIOCATORE_MOSSO,
+    ORO_GUADAGNATO,
+    OGGETTO_EQUIPAGGIATO,
+    COMBATTIMENTO_CONCLUSO,
+    ACHIEVEMENT_SBLOCCATO,
+    MISSIONE_INIZIATA,
+    MISSIONE_COMPLETATA
+})
+
+# Iscrizione a tutti i tipi di evento
+TUTTI = "*"
+
+# Eventi accodati oltre i quali la coda differita viene svuotata anche a metà comando
+MAX_EVENTI_IN_CODA = 1000
+
+
+class BusEventi:
+    """Bus degli eventi di una partita, con iscritti sincroni e differiti"""
+
+    def __init__(self):
+        """Inizializza il bus senza iscritti"""
+        # Iscrizioni nell'ordine di registrazione: (tipo, callback, differito)
+        self._iscrizioni = []
+        # Liste precalcolate per tipo, che includono gli iscritti a TUTTI
+        self._sincroni = {}  # {tipo: tuple di callback}
+        self._differiti = {}  # {tipo: tuple di callback}
+        self._coda = []  # Eventi in attesa per gli iscritti differiti: (tipo, dati)
+        self.eventi_emessi = 0
+
+    def iscrivi(self, tipo, callback, differito=False):
+        """
+        Iscrive una callback a un tipo di evento.
+
+        Args:
+            tipo (str): Uno dei TIPI_EVENTO, o TUTTI
+            callback (callable): Per gli iscritti sincroni callback(tipo, dati); per quelli
+                differiti callback(eventi) con la lista delle coppie (tipo, dati) accodate
+            differito (bool): Se True, riceve gli eventi in blocco con svuota()
+
+        Returns:
+            callable: La callback, da passare a disiscrivi
+
+        Raises:
+            ValueError: Se il tipo di evento non esiste
+        """
+        if tipo != TUTTI and tipo not in TIPI_EVENTO:
+            raise ValueError(f"Tipo di evento sconosciuto: {tipo}")
+        self._iscrizioni.append((tipo, callback, differito))
+        self._ricalcola()
+        return callback
+
+    def disiscrivi(self, callback):
+        """
+        Rimuove tutte le iscrizioni di una callback.
+
+        Args:
+            callback (callable): La callback passata a iscrivi
+        """
+        self._iscrizioni = [i for i in self._iscrizioni if i[1] is not callback]
+        self._ricalcola()
+
+    def _ricalcola(self):
+        """Ricostruisce le liste di iscritti per tipo"""
+        sincroni = {}
+        differiti = {}
+        for tipo in TIPI_EVENTO:
+            for tipo_iscrizione, callback, differito in self._iscrizioni:
+                if tipo_iscrizione in (tipo, TUTTI):
+                    (differiti if differito else sincroni).setdefault(tipo, []).append(callback)
+        self._sincroni = {tipo: tuple(callbacks) for tipo, callbacks in sincroni.items()}
+        self._differiti = {tipo: tuple(callbacks) for tipo, callbacks in differiti.items()}
+
+    def ha_iscritti(self, tipo):
+        """
+        Indica se qualcuno è iscritto a un tipo di evento, per evitare di
+        preparare i dati di eventi che nessuno riceverebbe.
+
+        Args:
+            tipo (str): Tipo di evento
+
+        Returns:
+            bool: True se esiste almeno un iscritto
+        """
+        return tipo in self._sincroni or tipo in self._differiti
+
+    def emetti(self, tipo, **dati):
+        """
+        Emette un evento: lo consegna agli iscritti sincroni e lo accoda per quelli differiti.
+        Gli errori degli iscritti vengono registrati nel log senza interrompere il gioco.
+
+        Args:
+            tipo (str): Tipo di evento
+            **dati: Dati dell'evento
+        """
+        sincroni = self._sincroni.get(tipo)
+        differito = tipo in self._differiti
+        if sincroni is None and not differito:
+            return
+        self.eventi_emessi += 1
+        if sincroni is not None:
+            for callback in sincroni:
+                try:
+                    callback(tipo, dati)
+                except Exception as e:
+                    logger.error(f"Errore in un iscritto all'evento {tipo}: {e}")
+        if differito:
+            self._coda.append((tipo, dati))
+            if len(self._coda) >= MAX_EVENTI_IN_CODA:
+                self.svuota()
+
+    def svuota(self):
+        """
+        Consegna agli iscritti differiti gli eventi accodati, in un'unica chiamata
+        per iscritto con i soli eventi dei tipi a cui è iscritto.
+
+        Returns:
+            int: Numero di eventi consegnati
+        """
+        if not self._coda:
+            return 0
+        eventi, self._coda = self._coda, []
+
+        # Raggruppa gli eventi per callback mantenendo l'ordine di emissione
+        blocchi = {}
+        for evento in eventi:
+            for callback in self._differiti.get(evento[0], ()):
+                blocchi.setdefault(callback, []).append(evento)
+        for callback, blocco in blocchi.items():
+            try:
+                callback(blocco)
+            except Exception as e:
+                logger.error(f"Errore in un iscritto differito agli eventi di gioco: {e}")
+        return len(eventi)
+
+    def __getstate__(self):
+        """Le iscrizioni appartengono al processo: non vengono serializzate"""
+        return {"eventi_emessi": self.eventi_emessi}
+
+    def __setstate__(self, state):
+        """Ricostruisce un bus vuoto"""
+        self.__init__()
+        self.eventi_emessi = state.get("eventi_emessi", 0)
@@ -0,0 +1,290 @@
+import json
+import queue
+import threading
+from collections import deque
+
+
+# Capacità predefinite: storico per la ripresa e coda per singolo client
+CAPACITA_STORICO_PREDEFINITA = 256
+CAPACITA_CODA_CLIENT_PREDEFINITA = 64
+
+
+class IscrizioneEventi:
+    """
+    Rappresenta un singolo client connesso al flusso eventi di una sessione.
+    Ogni iscrizione ha una coda limitata: se il client non la svuota abbastanza
+    in fretta il produttore non si blocca mai, la coda viene scartata e al client
+    viene inviato un unico evento "risincronizza".
+    """
+
+    def __init__(self, capacita=CAPACITA_CODA_CLIENT_PREDEFINITA):
+        """
+        Inizializza l'iscrizione
+
+        Args:
+            capacita (int): Numero massimo di eventi in attesa per questo client
+        """
+        self.coda = queue.Queue(maxsize=capacita)
+        self.eventi_scartati = 0
+        self.attiva = True
+        # Callback opzionale invocata dopo ogni consegna (es. per risvegliare un event loop)
+        self.al_nuovo_evento = None
+
+    def consegna(self, evento):
+        """
+        Accoda un evento senza bloccare il chiamante.
+        Il canale chiama consegna tenendo il proprio lock: le consegne a un'iscrizione
+        non sono mai concorrenti, quindi dopo lo svuotamento la coda ha sempre posto
+        per l'evento "risincronizza".
+
+        Args:
+            evento (dict): Evento da consegnare
+
+        Returns:
+            bool: True se l'evento è stato accodato, False se il client era in ritardo
+        """
+        try:
+            self.coda.put_nowait(evento)
+            self._segnala()
+            return True
+        except queue.Full:
+            # Il client è troppo lento: svuota la coda e chiedi una risincronizzazione
+            scartati = 0
+            while True:
+                try:
+                    self.coda.get_nowait()
+                    scartati += 1
+                except queue.Empty:
+                    break
+            self.eventi_scartati += scartati + 1
+            self.coda.put_nowait({
+                "id": evento["id"],
+                "tipo": "risincronizza",
+                "dati": {"motivo": "coda_piena", "eventi_scartati": scartati + 1}
+            })
+            self._segnala()
+            return False
+
+    def _segnala(self):
+        """Invoca la callback di nuovo evento, se impostata"""
+        if self.al_nuovo_evento is not None:
+            self.al_nuovo_evento()
+
+    def prossimo(self, timeout=None):
+        """
+        Attende il prossimo evento.
+
+        Args:
+            timeout (float, optional): Secondi massimi di attesa
+
+        Returns:
+            dict: L'evento, o None se il timeout è scaduto
+        """
+        try:
+            return self.coda.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def prossimo_disponibile(self):
+        """
+        Restituisce il prossimo evento già in coda senza attendere.
+
+        Returns:
+            dict: L'evento, o None se la coda è vuota
+        """
+        try:
+            return self.coda.get_nowait()
+        except queue.Empty:
+            return None
+
+    def chiudi(self):
+        """Segna l'iscrizione come non più attiva"""
+        self.attiva = False
+        self._segnala()
+
+
+class CanaleEventi:
+    """
+    Flusso di eventi di una singola sessione di gioco.
+    Mantiene uno storico limitato (per la ripresa da Last-Event-ID),
+    la versione corrente dello stato e l'elenco dei client iscritti.
+    """
+
+    def __init__(self, capacita_storico=CAPACITA_STORICO_PREDEFINITA,
+                 capacita_client=CAPACITA_CODA_CLIENT_PREDEFINITA):
+        """
+        Inizializza il canale
+
+        Args:
+            capacita_storico (int): Numero di eventi conservati per la ripresa
+            capacita_client (int): Capacità della coda di ogni client
+        """
+        self._lock = threading.Lock()
+        self._storico = deque(maxlen=capacita_storico)
+        self._iscritti = set()
+        self._capacita_client = capacita_client
+        self.ultimo_id = 0
+        self.versione_stato = 0
+
+    def pubblica(self, tipo, dati=None):
+        """
+        Pubblica un evento a tutti i client iscritti.
+
+        Args:
+            tipo (str): Tipo di evento ("output", "notifica", "stato", ...)
+            dati (dict, optional): Contenuto dell'evento
+
+        Returns:
+            dict: L'evento pubblicato
+        """
+        with self._lock:
+            return self._pubblica(tipo, dati)
+
+    def _pubblica(self, tipo, dati):
+        """
+        Assegna l'id all'evento e lo consegna (da chiamare con il lock acquisito).
+        La consegna non blocca e avviene sotto il lock, così ogni client riceve gli
+        eventi nell'ordine dei loro id.
+        """
+        self.ultimo_id += 1
+        evento = {"id": self.ultimo_id, "tipo": tipo, "dati": dati or {}}
+        self._storico.append(evento)
+        for iscrizione in self._iscritti:
+            iscrizione.consegna(evento)
+        return evento
+
+    def incrementa_versione(self, dati=None):
+        """
+        Incrementa la versione dello stato e la pubblica come evento "stato".
+
+        Args:
+            dati (dict, optional): Informazioni aggiuntive sullo stato
+
+        Returns:
+            dict: L'evento pubblicato
+        """
+        with self._lock:
+            self.versione_stato += 1
+            contenuto = {"versione": self.versione_stato}
+            contenuto.update(dati or {})
+            return self._pubblica("stato", contenuto)
+
+    def iscrivi(self, ultimo_id_ricevuto=None):
+        """
+        Registra un nuovo client, eventualmente riprendendo da un evento precedente.
+
+        Args:
+            ultimo_id_ricevuto (int, optional): Id dell'ultimo evento ricevuto dal client
+
+        Returns:
+            IscrizioneEventi: L'iscrizione creata
+        """
+        iscrizione = IscrizioneEventi(self._capacita_client)
+        with self._lock:
+            if ultimo_id_ricevuto is not None and ultimo_id_ricevuto > self.ultimo_id:
+                # Id proveniente da un'altra istanza del canale (es. riavvio o cambio di shard)
+                iscrizione.consegna({
+                    "id": self.ultimo_id,
+                    "tipo": "risincronizza",
+                    "dati": {"motivo": "canale_diverso"}
+                })
+            elif ultimo_id_ricevuto is not None and ultimo_id_ricevuto < self.ultimo_id:
+                mancanti = [e for e in self._storico if e["id"] > ultimo_id_ricevuto]
+                storico_completo = bool(mancanti) and mancanti[0]["id"] == ultimo_id_ricevuto + 1
+                if storico_completo and len(mancanti) <= self._capacita_client:
+                    for evento in mancanti:
+                        iscrizione.consegna(evento)
+                else:
+                    # Lo storico non copre più il punto di ripresa
+                    iscrizione.consegna({
+                        "id": self.ultimo_id,
+                        "tipo": "risincronizza",
+                        "dati": {"motivo": "storico_insufficiente"}
+                    })
+            self._iscritti.add(iscrizione)
+        return iscrizione
+
+    def disiscrivi(self, iscrizione):
+        """
+        Rimuove un client dal canale.
+
+        Args:
+            iscrizione (IscrizioneEventi): L'iscrizione da rimuovere
+        """
+        iscrizione.chiudi()
+        with self._lock:
+            self._iscritti.discard(iscrizione)
+
+    def numero_iscritti(self):
+        """Restituisce il numero di client attualmente connessi"""
+        with self._lock:
+            return len(self._iscritti)
+
+
+class GestoreFlussiEventi:
+    """
+    Registro dei canali di eventi, uno per sessione.
+    I canali vengono creati solo quando un client si iscrive, così le sessioni
+    che usano esclusivamente il polling non pagano alcun costo di pubblicazione.
+    """
+
+    def __init__(self, capacita_storico=CAPACITA_STORICO_PREDEFINITA,
+                 capacita_client=CAPACITA_CODA_CLIENT_PREDEFINITA):
+        self._lock = threading.Lock()
+        self._canali = {}
+        self.capacita_storico = capacita_storico
+        self.capacita_client = capacita_client
+
+    def ottieni_canale(self, id_sessione, crea=True):
+        """
+        Restituisce il canale di una sessione.
+
+        Args:
+            id_sessione (str): ID della sessione
+            crea (bool): Se True, crea il canale se non esiste
+
+        Returns:
+            CanaleEventi: Il canale, o None se non esiste e crea è False
+        """
+        with self._lock:
+            canale = self._canali.get(id_sessione)
+            if canale is None and crea:
+                canale = CanaleEventi(self.capacita_storico, self.capacita_client)
+                self._canali[id_sessione] = canale
+            return canale
+
+    def rimuovi_canale(self, id_sessione):
+        """
+        Rimuove il canale di una sessione.
+
+        Args:
+            id_sessione (str): ID della sessione
+        """
+        with self._lock:
+            self._canali.pop(id_sessione, None)
+
+    def pubblica(self, id_sessione, tipo, dati=None):
+        """
+        Pubblica un evento sul canale di una sessione, se qualcuno l'ha mai aperto.
+
+        Returns:
+            dict: L'evento pubblicato o None se il canale non esiste
+        """
+        canale = self.ottieni_canale(id_sessione, crea=False)
+        if canale is None:
+            return None
+        return canale.pubblica(tipo, dati)
+
+
+def formatta_evento_sse(evento):
+    """
+    Converte un evento nel formato testuale Server-Sent Events.
+
+    Args:
+        evento (dict): Evento con chiavi "id", "tipo" e "dati"
+
+    Returns:
+        str: Blocco SSE pronto da inviare al client
+    """
+    dati = json.dumps(evento["dati"], ensure_ascii=False)
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {dati}\n\n"
@@ -1,7 +1,11 @@
 from world.gestore_mappe import GestitoreMappe
 from core.io_interface import TerminalIO
+from core.eventi_gioco import BusEventi
+from core.achievements import MotoreAchievement, ProgressoAchievement
+from core.missioni import GestoreMissioni
+from core.cronologia import CronologiaPartita
+from core.tracciamento_stati import CAMBIA, POP, PUSH, get_tracciatore_stati
 import json
-import ast  # Importa ast per literal_eval
 
 
 class Game:
@@ -20,8 +24,17 @@ class Game:
         self.attivo = True
         self.io = io_handler
         
+        # Bus degli eventi di gioco (vedi core/eventi_gioco.py) con achievement e missioni che lo ascoltano
+        self.eventi = BusEventi()
+        self.achievements = MotoreAchievement(self.eventi)
+        self.missioni = GestoreMissioni(self)
+        
+        # Istantanee dei comandi precedenti, per annullarli (vedi core/cronologia.py)
+        self.cronologia = CronologiaPartita()
+        
         # Inizializza il gestore delle mappe
         self.gestore_mappe = GestitoreMappe()
+        self.collega_eventi()
         
         # Imposta la mappa iniziale del giocatore (taverna per default)
         # Solo se il giocatore è già stato creato
@@ -32,6 +45,59 @@ class Game:
         if stato_iniziale is not None and not e_temporaneo:
             self.push_stato(stato_iniziale)
 
+    def collega_eventi(self):
+        """
+        Collega il bus degli eventi al gestore delle mappe e al giocatore,
+        che vi emettono i cambi di mappa, i danni e gli oggetti ottenuti,
+        e prepara achievement e missioni del giocatore.
+        Va richiamato quando il giocatore viene sostituito.
+        """
+        # Le partite serializzate con pickle prima del bus ne sono prive
+        if getattr(self, "eventi", None) is None:
+            self.eventi = BusEventi()
+        if getattr(self, "achievements", None) is None:
+            self.achievements = MotoreAchievement(self.eventi)
+        if getattr(self, "missioni", None) is None:
+            self.missioni = GestoreMissioni(self)
+        
+        self.gestore_mappe.eventi = self.eventi
+        if self.giocatore is not None:
+            self.giocatore.eventi = self.eventi
+            if not hasattr(self.giocatore, "progresso_achievement"):
+                self.giocatore.progresso_achievement = ProgressoAchievement()
+        self.achievements.collega(self.giocatore, len(self.gestore_mappe.mappe))
+        self.missioni.collega(self.giocatore)
+
+    def registra_snapshot(self):
+        """
+        Registra nella cronologia lo stato della partita prima di un comando.
+        
+        Returns:
+            bool: True se l'istantanea è stata aggiunta
+        """
+        # Le partite serializzate con pickle prima della cronologia ne sono prive
+        if getattr(self, "cronologia", None) is None:
+            self.cronologia = CronologiaPartita()
+        # Prima del comando di apertura il giocatore non è ancora su una mappa:
+        # annullare fino a quel punto lascerebbe la partita senza posizione
+        if self.giocatore is None or self.giocatore.mappa_corrente is None:
+            return False
+        return self.cronologia.registra(self)
+    
+    def annulla(self, passi=1):
+        """
+        Annulla gli ultimi comandi riportando la partita all'istantanea registrata prima di essi.
+        
+        Args:
+            passi (int): Numero di comandi da annullare
+            
+        Returns:
+            int: Numero di comandi annullati
+        """
+        if getattr(self, "cronologia", None) is None:
+            return 0
+        return self.cronologia.annulla(self, passi)
+
     def imposta_mappa_iniziale(self, mappa_nome=None):
         """
         Imposta la mappa iniziale per il giocatore
@@ -97,6 +163,7 @@ class Game:
             if self.stato_corrente():
                 self.stato_corrente().pausa(self)  # Mette in pausa lo stato corrente
             self.stato_stack.append(nuovo_stato)
+            get_tracciatore_stati().transizione(PUSH, nuovo_stato)
             nuovo_stato.entra(self)
         except Exception as e:
             self.io.mostra_messaggio(f"Errore durante il push dello stato: {e}")
@@ -120,6 +187,7 @@ class Game:
                 # Procedi normalmente
                 stato_corrente.esci(self)
                 self.stato_stack.pop()
+                get_tracciatore_stati().transizione(POP, stato_corrente)
                 
             # Riprende lo stato precedente se esiste
             if self.stato_corrente():
@@ -160,6 +228,7 @@ class Game:
                 self.stato_corrente().esci(self)
                 self.stato_stack.pop()
             self.stato_stack.append(nuovo_stato)
+            get_tracciatore_stati().transizione(CAMBIA, nuovo_stato)
             nuovo_stato.entra(self)
         except Exception as e:
             self.io.mostra_messaggio(f"Errore durante il cambio di stato: {e}")
@@ -179,7 +248,8 @@ class Game:
                 
             try:
                 # Esegue lo stato corrente
-                self.stato_corrente().esegui(self)
+                self.esegui_stato_corrente()
+                self.eventi.svuota()
             except Exception as e:
                 self.io.mostra_messaggio(f"Errore durante l'esecuzione dello stato: {e}")
                 import traceback
@@ -190,6 +260,15 @@ class Game:
                 if not self.stato_stack:
                     self.attivo = False
 
+    def esegui_stato_corrente(self):
+        """
+        Esegue lo stato corrente misurandone il tempo per stato e fase
+        (vedi core/tracciamento_stati.py)
+        """
+        stato = self.stato_corrente()
+        if stato is not None:
+            get_tracciatore_stati().esegui(stato, self)
+
     def termina(self):
         """
         Termina il gioco in modo pulito
@@ -286,161 +365,202 @@ class Game:
             
         return spostamento
 
-    def salva(self, file_path="salvataggio.json"):
+    def crea_dati_salvataggio(self):
         """
-        Salva lo stato corrente del gioco in un file JSON
+        Costruisce il documento di salvataggio dello stato corrente del gioco
         
-        Args:
-            file_path (str): Percorso del file di salvataggio
-            
         Returns:
-            bool: True se il salvataggio è riuscito, False altrimenti
+            dict: Dati serializzabili in JSON del salvataggio
         """
-        try:
-            # Importa il modulo di configurazione
-            from util.config import get_save_path, create_backup, SAVE_FORMAT_VERSION
-            import logging
-            import json
-
-            logger = logging.getLogger("gioco_rpg")
-            
-            # Converti il percorso usando il modulo di configurazione
-            save_path = get_save_path(file_path)
+        from util.config import SAVE_FORMAT_VERSION
+        
+        # Ottieni dati serializzabili del giocatore
+        if hasattr(self.giocatore, 'to_dict'):
+            giocatore_data = self.giocatore.to_dict()
+        else:
+            # Fallback al salvataggio base
+            inventario_data = []
+            for oggetto in self.giocatore.inventario:
+                if hasattr(oggetto, 'to_dict') and callable(getattr(oggetto, 'to_dict')):
+                    inventario_data.append(oggetto.to_dict())
+                else:
+                    # Salva tutti gli attributi dell'oggetto
+                    oggetto_data = {
+                        "nome": getattr(oggetto, 'nome', 'Oggetto sconosciuto'),
+                        "tipo": getattr(oggetto, 'tipo', 'vario'),
+                        "descrizione": getattr(oggetto, 'descrizione', ''),
+                        "valore": getattr(oggetto, 'valore', 0),
+                        "effetto": getattr(oggetto, 'effetto', {}),
+                    }
+                    inventario_data.append(oggetto_data)
+                    
+            # Serializza arma equipaggiata
+            arma_data = None
+            if hasattr(self.giocatore, 'arma') and self.giocatore.arma:
+                if hasattr(self.giocatore.arma, 'to_dict'):
+                    arma_data = self.giocatore.arma.to_dict()
+                else:
+                    arma_data = {
+                        "nome": getattr(self.giocatore.arma, 'nome', 'Arma sconosciuta'),
+                        "tipo": "arma",
+                        "descrizione": getattr(self.giocatore.arma, 'descrizione', ''),
+                        "valore": getattr(self.giocatore.arma, 'valore', 0),
+                        "effetto": getattr(self.giocatore.arma, 'effetto', {}),
+                    }
             
-            # Crea un backup se il file esiste già
-            if save_path.exists():
-                backup_path = create_backup(save_path)
-                if backup_path:
-                    logger.info(f"Creato backup del salvataggio precedente: {backup_path}")
+            # Serializza armatura equipaggiata
+            armatura_data = None
+            if hasattr(self.giocatore, 'armatura') and self.giocatore.armatura:
+                if hasattr(self.giocatore.armatura, 'to_dict'):
+                    armatura_data = self.giocatore.armatura.to_dict()
+                else:
+                    armatura_data = {
+                        "nome": getattr(self.giocatore.armatura, 'nome', 'Armatura sconosciuta'),
+                        "tipo": "armatura",
+                        "descrizione": getattr(self.giocatore.armatura, 'descrizione', ''),
+                        "valore": getattr(self.giocatore.armatura, 'valore', 0),
+                        "effetto": getattr(self.giocatore.armatura, 'effetto', {}),
+                    }
                     
-            # Ottieni dati serializzabili del giocatore
-            if hasattr(self.giocatore, 'to_dict'):
-                giocatore_data = self.giocatore.to_dict()
-            else:
-                # Fallback al salvataggio base
-                inventario_data = []
-                for oggetto in self.giocatore.inventario:
-                    if hasattr(oggetto, 'to_dict') and callable(getattr(oggetto, 'to_dict')):
-                        inventario_data.append(oggetto.to_dict())
-                    else:
-                        # Salva tutti gli attributi dell'oggetto
-                        oggetto_data = {
-                            "nome": getattr(oggetto, 'nome', 'Oggetto sconosciuto'),
-                            "tipo": getattr(oggetto, 'tipo', 'vario'),
-                            "descrizione": getattr(oggetto, 'descrizione', ''),
-                            "valore": getattr(oggetto, 'valore', 0),
-                            "effetto": getattr(oggetto, 'effetto', {}),
-                        }
-                        inventario_data.append(oggetto_data)
-                        
-                # Serializza arma equipaggiata
-                arma_data = None
-                if hasattr(self.giocatore, 'arma') and self.giocatore.arma:
-                    if hasattr(self.giocatore.arma, 'to_dict'):
-                        arma_data = self.giocatore.arma.to_dict()
-                    else:
-                        arma_data = {
-                            "nome": getattr(self.giocatore.arma, 'nome', 'Arma sconosciuta'),
-                            "tipo": "arma",
-                            "descrizione": getattr(self.giocatore.arma, 'descrizione', ''),
-                            "valore": getattr(self.giocatore.arma, 'valore', 0),
-                            "effetto": getattr(self.giocatore.arma, 'effetto', {}),
-                        }
-                
-                # Serializza armatura equipaggiata
-                armatura_data = None
-                if hasattr(self.giocatore, 'armatura') and self.giocatore.armatura:
-                    if hasattr(self.giocatore.armatura, 'to_dict'):
-                        armatura_data = self.giocatore.armatura.to_dict()
+            # Serializza accessori
+            accessori_data = []
+            if hasattr(self.giocatore, 'accessori'):
+                for acc in self.giocatore.accessori:
+                    if hasattr(acc, 'to_dict'):
+                        accessori_data.append(acc.to_dict())
                     else:
-                        armatura_data = {
-                            "nome": getattr(self.giocatore.armatura, 'nome', 'Armatura sconosciuta'),
-                            "tipo": "armatura",
-                            "descrizione": getattr(self.giocatore.armatura, 'descrizione', ''),
-                            "valore": getattr(self.giocatore.armatura, 'valore', 0),
-                            "effetto": getattr(self.giocatore.armatura, 'effetto', {}),
+                        acc_data = {
+                            "nome": getattr(acc, 'nome', 'Accessorio sconosciuto'),
+                            "tipo": "accessorio",
+                            "descrizione": getattr(acc, 'descrizione', ''),
+                            "valore": getattr(acc, 'valore', 0),
+                            "effetto": getattr(acc, 'effetto', {}),
                         }
-                        
-                # Serializza accessori
-                accessori_data = []
-                if hasattr(self.giocatore, 'accessori'):
-                    for acc in self.giocatore.accessori:
-                        if hasattr(acc, 'to_dict'):
-                            accessori_data.append(acc.to_dict())
-                        else:
-                            acc_data = {
-                                "nome": getattr(acc, 'nome', 'Accessorio sconosciuto'),
-                                "tipo": "accessorio",
-                                "descrizione": getattr(acc, 'descrizione', ''),
-                                "valore": getattr(acc, 'valore', 0),
-                                "effetto": getattr(acc, 'effetto', {}),
-                            }
-                            accessori_data.append(acc_data)
-                        
-                giocatore_data = {
-                    "nome": self.giocatore.nome,
-                    "classe": self.giocatore.classe,
-                    "hp": self.giocatore.hp,
-                    "hp_max": getattr(self.giocatore, 'hp_max', self.giocatore.hp),
-                    "mappa": self.giocatore.mappa_corrente,
-                    "posizione": [self.giocatore.x, self.giocatore.y],
-                    "oro": getattr(self.giocatore, 'oro', 0),
-                    "inventario": inventario_data,
-                    "arma": arma_data,
-                    "armatura": armatura_data,
-                    "accessori": accessori_data,
-                    "forza_base": getattr(self.giocatore, 'forza_base', 10),
-                    "destrezza_base": getattr(self.giocatore, 'destrezza_base', 10),
-                    "costituzione_base": getattr(self.giocatore, 'costituzione_base', 10),
-                    "intelligenza_base": getattr(self.giocatore, 'intelligenza_base', 10),
-                    "saggezza_base": getattr(self.giocatore, 'saggezza_base', 10),
-                    "carisma_base": getattr(self.giocatore, 'carisma_base', 10),
-                    "livello": getattr(self.giocatore, 'livello', 1),
-                    "esperienza": getattr(self.giocatore, 'esperienza', 0),
-                }
-                
-            # Serializza lo stack degli stati
-            stati_data = []
-            for stato in self.stato_stack:
-                if hasattr(stato, 'to_dict'):
-                    stati_data.append(stato.to_dict())
-                else:
-                    # Fallback per stati che non hanno to_dict
-                    stati_data.append({"type": stato.__class__.__name__})
-            
-            # Componi il dizionario completo
-            data = {
-                "giocatore": giocatore_data,
-                "stati": stati_data,
-                "attivo": self.attivo,
-                "mappa_corrente": self.giocatore.mappa_corrente,
-                "versione_gioco": SAVE_FORMAT_VERSION,  # Usa la versione dal modulo config
-                "timestamp": __import__('time').time(),  # Quando è stato fatto il salvataggio
-                "mappe": self.gestore_mappe.to_dict()  # Salva lo stato completo delle mappe
+                        accessori_data.append(acc_data)
+                    
+            giocatore_data = {
+                "nome": self.giocatore.nome,
+                "classe": self.giocatore.classe,
+                "hp": self.giocatore.hp,
+                "hp_max": getattr(self.giocatore, 'hp_max', self.giocatore.hp),
+                "mappa": self.giocatore.mappa_corrente,
+                "posizione": [self.giocatore.x, self.giocatore.y],
+                "oro": getattr(self.giocatore, 'oro', 0),
+                "inventario": inventario_data,
+                "arma": arma_data,
+                "armatura": armatura_data,
+                "accessori": accessori_data,
+                "forza_base": getattr(self.giocatore, 'forza_base', 10),
+                "destrezza_base": getattr(self.giocatore, 'destrezza_base', 10),
+                "costituzione_base": getattr(self.giocatore, 'costituzione_base', 10),
+                "intelligenza_base": getattr(self.giocatore, 'intelligenza_base', 10),
+                "saggezza_base": getattr(self.giocatore, 'saggezza_base', 10),
+                "carisma_base": getattr(self.giocatore, 'carisma_base', 10),
+                "livello": getattr(self.giocatore, 'livello', 1),
+                "esperienza": getattr(self.giocatore, 'esperienza', 0),
             }
             
-            # Aggiungi tutti gli NPG mappa per mappa
-            data["npg"] = {
-                nome_mappa: {
-                    str(posizione): npg.to_dict() for posizione, npg in mappa.npg.items()
-                }
-                for nome_mappa, mappa in self.gestore_mappe.mappe.items()
-            }
+        # Serializza lo stack degli stati
+        from states.registro_stati import serializza_stato
+        stati_data = [serializza_stato(stato) for stato in self.stato_stack]
+        
+        # Componi il dizionario completo
+        data = {
+            "giocatore": giocatore_data,
+            "stati": stati_data,
+            "attivo": self.attivo,
+            "mappa_corrente": self.giocatore.mappa_corrente,
+            "versione_gioco": SAVE_FORMAT_VERSION,  # Usa la versione dal modulo config
+            "timestamp": __import__('time').time(),  # Quando è stato fatto il salvataggio
+            "mappe": self.gestore_mappe.to_dict()  # Salva lo stato completo delle mappe
+        }
+        
+        # Aggiungi tutti gli NPG mappa per mappa (già serializzati insieme alle mappe)
+        data["npg"] = {
+            nome_mappa: dati_mappa.get("npg", {})
+            for nome_mappa, dati_mappa in data["mappe"]["mappe"].items()
+        }
+        
+        return data
+
+    def salva_asincrono(self, file_path="salvataggio.json"):
+        """
+        Accoda il salvataggio dello stato corrente sullo scrittore in background.
+        Sul thread chiamante vengono solo raccolti e copiati i dati: backup,
+        serializzazione e scrittura atomica avvengono sul pool di scrittura.
+        
+        Args:
+            file_path (str): Percorso del file di salvataggio
             
-            # Serializza e salva su file
-            save_path.parent.mkdir(exist_ok=True, parents=True)  # Assicura che la directory esista
-            with open(save_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
-                
-            logger.info(f"Salvataggio completato: {save_path}")
-            return True
+        Returns:
+            Future: Completato con True a scrittura avvenuta o con l'eccezione in caso di errore
+        """
+        from util.config import get_save_path
+        from util.scrittore_salvataggi import get_scrittore_salvataggi
+        
+        # Converti il percorso usando il modulo di configurazione
+        save_path = get_save_path(file_path)
+        return get_scrittore_salvataggi().accoda(save_path, self.crea_dati_salvataggio())
+
+    def salva(self, file_path="salvataggio.json"):
+        """
+        Salva lo stato corrente del gioco (nel formato scelto in util.config) e attende la fine della scrittura
+        
+        Args:
+            file_path (str): Percorso del file di salvataggio
             
+        Returns:
+            bool: True se il salvataggio è riuscito, False altrimenti
+        """
+        try:
+            return self.salva_asincrono(file_path).result()
         except Exception as e:
             import traceback
+            import logging
             logging.getLogger("gioco_rpg").error(f"Errore durante il salvataggio: {e}")
             logging.getLogger("gioco_rpg").error(traceback.format_exc())
             return False
     
+    def ricostruisci_stack_stati(self, stati_data):
+        """
+        Ricrea lo stack degli stati a partire dalla loro forma serializzata.
+        Mappe e giocatore devono essere già ripristinati: gli stati vi ricollegano
+        i riferimenti salvati (vedi BaseState.ricollega).
+        
+        Args:
+            stati_data (list): Lista dei dizionari prodotti da to_dict() degli stati
+        """
+        import logging
+        logger = logging.getLogger("gioco_rpg")
+        
+        from states.registro_stati import deserializza_stato
+        
+        self.stato_stack = []
+        for stato_dato in stati_data:
+            # Ottieni il tipo dello stato
+            stato_tipo = stato_dato.get("type")
+            if not stato_tipo:
+                continue
+                
+            # Risolve la classe con il registro degli stati e la ricostruisce con from_dict
+            try:
+                self.stato_stack.append(deserializza_stato(stato_dato))
+            except KeyError:
+                logger.warning(f"Stato non registrato: {stato_tipo}")
+                self.io.mostra_messaggio(f"Avviso: stato {stato_tipo} sconosciuto")
+            except Exception as e:
+                logger.error(f"Errore nel caricamento dello stato {stato_tipo}: {str(e)}")
+                import traceback
+                logger.error(traceback.format_exc())
+                continue
+
+        for indice, stato in enumerate(self.stato_stack):
+            stato.set_game_context(self)
+            try:
+                stato.ricollega(self, self.stato_stack[:indice])
+            except Exception as e:
+                logger.error(f"Errore nel ricollegamento dello stato {type(stato).__name__}: {str(e)}")
+
     def carica(self, file_path="salvataggio.json"):
         """
         Carica uno stato di gioco da un file JSON
@@ -466,14 +586,23 @@ class Game:
                 self.io.mostra_messaggio(f"File di salvataggio non trovato: {save_path}")
                 return False
             
-            # Carica e valida dati
+            # Apri il salvataggio (il formato è riconosciuto dal contenuto). Le mappe e gli NPG
+            # restano nel salvataggio e vengono ricostruiti solo quando servono.
+            from util.formato_salvataggi import apri_salvataggio
             try:
-                with open(save_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                vista = apri_salvataggio(save_path)
+                data = {
+                    chiave: vista.leggi(chiave)
+                    for chiave in vista.chiavi() if chiave not in ("mappe", "npg")
+                }
             except json.JSONDecodeError as e:
                 logger.error(f"File di salvataggio non valido (JSON errato): {e}")
                 self.io.mostra_messaggio("File di salvataggio danneggiato")
                 return False
+            except (OSError, EOFError, ValueError) as e:
+                logger.error(f"File di salvataggio non valido (contenuto danneggiato): {e}")
+                self.io.mostra_messaggio("File di salvataggio danneggiato")
+                return False
                 
             # Valida dati caricati
             valid, message = validate_save_data(data)
@@ -482,8 +611,19 @@ class Game:
                 self.io.mostra_messaggio(message)
                 return False
                 
-            # Migra dati se necessario
-            data = migrate_save_data(data)
+            # Migra dati se necessario: i passi di migrazione possono toccare qualsiasi sezione,
+            # quindi un salvataggio vecchio viene letto e migrato per intero
+            from util.migrazioni import richiede_migrazione
+            if richiede_migrazione(data):
+                from util.formato_salvataggi import VistaDocumento
+                documento = migrate_save_data(vista.documento())
+                vista = VistaDocumento(documento)
+                data = {chiave: valore for chiave, valore in documento.items() if chiave not in ("mappe", "npg")}
+
+                # Riscrivi in background il salvataggio migrato, così la migrazione non si ripete
+                if not richiede_migrazione(documento):
+                    from util.scrittore_salvataggi import get_scrittore_salvataggi
+                    get_scrittore_salvataggi().accoda(save_path, documento)
             
             # Registry per oggetti già caricati (evita riferimenti circolari)
             # Da usare solo con le classi che supportano il parametro
@@ -495,22 +635,11 @@ class Game:
             from items.oggetto import Oggetto
             from items.oggetto_interattivo import OggettoInterattivo
             
-            # Mappa delle classi di stato ai loro moduli
-            mapping_stati = {
-                "TavernaState": "states.taverna",
-                "DialogoState": "states.dialogo", 
-                "CombattimentoState": "states.combattimento",
-                "MercatoState": "states.mercato",
-                "GestioneInventarioState": "states.gestione_inventario",
-                "ProvaAbilitaState": "states.prova_abilita",
-                "MappaState": "states.mappa_state",
-                "MenuState": "states.menu"
-            }
-            
             # Carica il giocatore
             try:
                 # Usa direttamente la versione standard senza loaded_objects per il giocatore
                 self.giocatore = Giocatore.from_dict(data["giocatore"])
+                self.collega_eventi()
             except KeyError:
                 logger.error("Dati del giocatore mancanti o incompleti nel salvataggio")
                 self.io.mostra_messaggio("Dati del giocatore mancanti o incompleti nel salvataggio")
@@ -520,48 +649,11 @@ class Game:
                 self.io.mostra_messaggio(f"Errore nella creazione del giocatore: {str(e)}")
                 return False
 
-            # Ricrea lo stack degli stati
-            self.stato_stack = []
-            for stato_dato in data.get("stati", []):
-                # Ottieni il tipo dello stato
-                stato_tipo = stato_dato.get("type")
-                if not stato_tipo:
-                    continue
-                    
-                # Importa dinamicamente la classe di stato
-                try:
-                    # Utilizza il mapping per trovare il modulo corretto
-                    if stato_tipo in mapping_stati:
-                        modulo_nome = mapping_stati[stato_tipo]
-                        
-                        # Importa dinamicamente il modulo
-                        import importlib
-                        modulo = importlib.import_module(modulo_nome)
-                        
-                        # Ottieni la classe dallo stesso nome
-                        classe_stato = getattr(modulo, stato_tipo)
-                        
-                        # Ricostruisci lo stato usando from_dict
-                        if hasattr(classe_stato, 'from_dict'):
-                            # Usa semplicemente la versione standard
-                            stato = classe_stato.from_dict(stato_dato)
-                            self.stato_stack.append(stato)
-                        else:
-                            logger.warning(f"Stato {stato_tipo} non ha un metodo from_dict")
-                            self.io.mostra_messaggio(f"Avviso: {stato_tipo} non ha un metodo from_dict")
-                    else:
-                        logger.warning(f"Mappatura non trovata per {stato_tipo}")
-                        self.io.mostra_messaggio(f"Avviso: mappatura non trovata per {stato_tipo}")
-                except Exception as e:
-                    logger.error(f"Errore nel caricamento dello stato {stato_tipo}: {str(e)}")
-                    import traceback
-                    logger.error(traceback.format_exc())
-                    continue
-
             # Carica le mappe e gli oggetti interattivi se presenti
-            if "mappe" in data:
+            # (subito solo la mappa attuale, le altre al primo accesso)
+            if "mappe" in vista.chiavi():
                 try:
-                    self.gestore_mappe.from_dict(data["mappe"])
+                    self.gestore_mappe.from_vista(vista)
                     logger.info("Mondo di gioco caricato con successo!")
                 except Exception as e:
                     logger.error(f"Errore nel caricamento delle mappe: {str(e)}")
@@ -569,13 +661,13 @@ class Game:
                     logger.error(traceback.format_exc())
             else:
                 # Compatibilità con vecchi salvataggi - ricrea NPC nelle mappe
-                for mappa_nome, npcs in data.get("npg", {}).items():
+                for mappa_nome, npcs in vista.leggi("npg", predefinito={}).items():
                     mappa = self.gestore_mappe.ottieni_mappa(mappa_nome)
                     if mappa:
                         for pos_str, npg_data in npcs.items():
                             try:
-                                import ast
-                                pos = ast.literal_eval(pos_str)
+                                from util.posizioni import decodifica_posizione
+                                pos = decodifica_posizione(pos_str)
                                 npg = NPG.from_dict(npg_data)
                                 mappa.npg[pos] = npg
                             except Exception as e:
@@ -585,13 +677,12 @@ class Game:
             mappa_corrente = data.get("mappa_corrente", "taverna")
             self.gestore_mappe.imposta_mappa_attuale(mappa_corrente)
             
+            # Ricrea lo stack degli stati, dopo le mappe a cui gli stati si riferiscono
+            self.ricostruisci_stack_stati(data.get("stati", []))
+            
             # Imposta lo stato attivo
             self.attivo = data.get("attivo", True)
             
-            # Pulisci vecchi backup
-            from util.config import clean_old_backups
-            clean_old_backups()
-            
             logger.info(f"Partita di {self.giocatore.nome} caricata con successo!")
             self.io.mostra_messaggio(f"Partita di {self.giocatore.nome} caricata con successo!")
             return True
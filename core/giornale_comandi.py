@@ -0,0 +1,142 @@
+"""
+Giornale dei comandi di una sessione web.
+
+Il giornale è un file JSON Lines: la prima riga è l'intestazione con il seme della
+sessione, il numero dell'operazione da cui parte e lo snapshot della sessione in quel
+momento (vedi core/snapshot_sessione.py); ogni riga successiva è un'operazione
+(comando, movimento, annullamento) annotata prima di eseguirla, così anche il comando
+che ha causato un errore resta nel giornale.
+
+Con il seme, ogni operazione usa gli stessi tiri di dado (vedi util/casualita.py):
+rieseguendo le operazioni sull'intestazione si ricostruisce la sessione
+(vedi util/riproduzione.py).
+
+Le righe sono aggiunte in coda al file, una scrittura per operazione. Quando la
+sessione cambia fuori dalle operazioni annotate (caricamento di un salvataggio) il
+giornale riparte con una nuova intestazione.
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+logger = logging.getLogger("gioco_rpg")
+
+# Versione del formato del giornale
+VERSIONE_GIORNALE = 1
+
+# Tipi di riga del giornale
+INIZIO = "inizio"
+COMANDO = "comando"
+MOVIMENTO = "muovi"
+ANNULLA = "annulla"
+# Sessione ricaricata dal disco: la cronologia per annullare, che vive solo in memoria, è persa
+RICARICA = "ricarica"
+
+# Se False i server non scrivono giornali
+GIORNALE_ATTIVO = os.environ.get("RPG_GIORNALE_COMANDI", "1") != "0"
+
+
+class GiornaleComandi:
+    """Scrittura del giornale dei comandi di una sessione"""
+
+    def __init__(self, percorso):
+        """
+        Args:
+            percorso (str | Path): File del giornale
+        """
+        self.percorso = Path(percorso)
+
+    def inizia(self, sessione):
+        """
+        Riscrive il giornale con l'intestazione dello stato attuale della sessione.
+
+        Args:
+            sessione (StatoGioco): La sessione
+        """
+        from core.snapshot_sessione import crea_snapshot
+
+        intestazione = {
+            "tipo": INIZIO,
+            "versione": VERSIONE_GIORNALE,
+            "seme": sessione.seme,
+            "operazioni": sessione.operazioni_eseguite,
+            "ts": time.time(),
+            "snapshot": crea_snapshot(sessione)
+        }
+        self.percorso.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.percorso, "w", encoding="utf-8") as f:
+            f.write(json.dumps(intestazione, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+    def prosegue(self, sessione):
+        """
+        Indica se il giornale su disco arriva esattamente allo stato della sessione,
+        così che le nuove operazioni possano esservi aggiunte.
+
+        Args:
+            sessione (StatoGioco): La sessione
+
+        Returns:
+            bool: True se l'ultima operazione annotata è quella precedente alla prossima
+        """
+        try:
+            with open(self.percorso, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                dimensione = f.tell()
+                # L'intestazione può essere lunga: l'ultima riga di un'operazione no
+                f.seek(max(0, dimensione - 4096))
+                coda = f.read().splitlines()
+        except OSError:
+            return False
+        if not coda:
+            return False
+        try:
+            ultima = json.loads(coda[-1])
+        except ValueError:
+            return False
+
+        if ultima.get("tipo") == INIZIO:
+            return ultima.get("seme") == sessione.seme and ultima.get("operazioni") == sessione.operazioni_eseguite
+        if ultima.get("tipo") == RICARICA:
+            return ultima.get("n") == sessione.operazioni_eseguite
+        return ultima.get("n") == sessione.operazioni_eseguite - 1
+
+    def annota(self, tipo, indice, argomento=None):
+        """
+        Aggiunge un'operazione al giornale. Un errore di scrittura viene registrato nel
+        log senza interrompere il gioco.
+
+        Args:
+            tipo (str): Tipo dell'operazione (COMANDO, MOVIMENTO, ANNULLA, RICARICA)
+            indice (int): Numero progressivo dell'operazione nella sessione
+            argomento (optional): Testo del comando, direzione o numero di passi
+        """
+        riga = {"tipo": tipo, "n": indice, "arg": argomento, "ts": round(time.time(), 3)}
+        try:
+            with open(self.percorso, "a", encoding="utf-8") as f:
+                f.write(json.dumps(riga, separators=(",", ":"), ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error(f"Impossibile scrivere il giornale {self.percorso}: {e}")
+
+
+def leggi_giornale(percorso):
+    """
+    Legge un giornale dei comandi.
+
+    Args:
+        percorso (str | Path): File del giornale
+
+    Returns:
+        tuple: (intestazione, lista delle operazioni)
+
+    Raises:
+        ValueError: Se il file non inizia con un'intestazione di una versione supportata
+    """
+    with open(percorso, "r", encoding="utf-8") as f:
+        righe = [json.loads(riga) for riga in f if riga.strip()]
+    if not righe or righe[0].get("tipo") != INIZIO:
+        raise ValueError(f"{percorso} non è un giornale dei comandi")
+    if righe[0].get("versione") != VERSIONE_GIORNALE:
+        raise ValueError(f"Versione del giornale non supportata: {righe[0].get('versione')}")
+    return righe[0], righe[1:]
@@ -0,0 +1,317 @@
+"""
+Gestione delle missioni.
+
+Le missioni sono definite in data/missioni/missioni.json: ogni missione ha un avvio
+(un nodo di dialogo di un NPG, oppure "automatica"), un elenco di obiettivi e una
+ricompensa. Tipi di obiettivo:
+    - parla_con (npg): raggiungere un nodo di dialogo dell'NPG
+    - raggiungi_mappa (mappa): entrare nella mappa
+    - raccogli_oggetto (oggetto, quantita): ottenere l'oggetto
+    - sconfiggi (nemico, quantita): vincere un combattimento contro il nemico
+
+Gli obiettivi di una missione vanno completati in ordine: di ogni missione attiva solo
+il primo obiettivo incompleto è indicizzato per (tipo, bersaglio), così "torna da" un NPG
+non si completa prima degli obiettivi che lo precedono. Ogni evento del bus di gioco
+consulta solo gli obiettivi che dipendono da esso, qualunque sia il numero di missioni
+attive; l'evento che avvia una missione non fa avanzare i suoi obiettivi.
+
+I combattimenti svolti durante una missione sono la differenza tra un unico contatore
+dei combattimenti conclusi e il suo valore all'avvio della missione.
+
+Il progresso resta negli attributi del giocatore già salvati:
+    progresso_missioni = {id: {"obiettivi": [avanzamento per obiettivo], "combattimenti_inizio": n}}
+    missioni_attive / missioni_completate = liste di id
+"""
+import logging
+
+from core.eventi_gioco import (
+    COMBATTIMENTO_CONCLUSO, MAPPA_CAMBIATA, MISSIONE_COMPLETATA, MISSIONE_INIZIATA,
+    NODO_DIALOGO, OGGETTO_OTTENUTO
+)
+
+logger = logging.getLogger("gioco_rpg")
+
+# Tipo di obiettivo -> (evento che lo fa avanzare, campo della definizione con il bersaglio)
+TIPI_OBIETTIVO = {
+    "parla_con": (NODO_DIALOGO, "npg"),
+    "raggiungi_mappa": (MAPPA_CAMBIATA, "mappa"),
+    "raccogli_oggetto": (OGGETTO_OTTENUTO, "oggetto"),
+    "sconfiggi": (COMBATTIMENTO_CONCLUSO, "nemico")
+}
+
+# Contatore del progresso del giocatore con i combattimenti conclusi durante le missioni
+CONTATORE_COMBATTIMENTI = "combattimenti_conclusi"
+
+
+def _bersaglio_evento(tipo, dati, giocatore):
+    """
+    Restituisce la chiave (tipo di obiettivo, bersaglio) toccata da un evento.
+
+    Returns:
+        tuple: La chiave dell'indice, None se l'evento non può far avanzare obiettivi
+    """
+    if tipo == NODO_DIALOGO:
+        return ("parla_con", dati["npg"])
+    if tipo == MAPPA_CAMBIATA:
+        return ("raggiungi_mappa", dati["a"])
+    if tipo == OGGETTO_OTTENUTO:
+        if dati["entita"] != giocatore.nome:
+            return None
+        return ("raccogli_oggetto", dati["oggetto"])
+    if tipo == COMBATTIMENTO_CONCLUSO and dati["vittoria"]:
+        return ("sconfiggi", dati["avversario"])
+    return None
+
+
+class GestoreMissioni:
+    """Fa avanzare le missioni del giocatore ascoltando il bus degli eventi della partita"""
+
+    def __init__(self, gioco):
+        """
+        Args:
+            gioco (Game): La partita, per il bus degli eventi, i messaggi e le ricompense
+        """
+        self.gioco = gioco
+        self.giocatore = None
+        self.definizioni = {}  # {id missione: definizione}
+        # {(tipo obiettivo, bersaglio): {(id missione, indice obiettivo)}} degli obiettivi incompleti
+        self._indice = {}
+        # {(npg, nodo): [id missione]} delle missioni che si avviano da un dialogo
+        self._avvii = {}
+        self._iscrizioni = {}  # {tipo di evento: callback iscritta}
+
+    def collega(self, giocatore, catalogo=None):
+        """
+        Prepara le missioni di un giocatore: ricostruisce gli indici dal progresso salvato,
+        avvia le missioni automatiche e si iscrive agli eventi necessari.
+
+        Args:
+            giocatore (Giocatore): Il giocatore, None per scollegare il gestore
+            catalogo (list, optional): Definizioni delle missioni, per default quelle di data/
+        """
+        self.giocatore = giocatore
+        self._indice = {}
+        self._avvii = {}
+        if giocatore is None:
+            self._aggiorna_iscrizioni()
+            return
+
+        if catalogo is None:
+            from util.data_manager import get_data_manager
+            catalogo = get_data_manager().get_missioni() or []
+        self.definizioni = {missione["id"]: missione for missione in catalogo}
+
+        for id_missione in giocatore.missioni_attive:
+            if id_missione in self.definizioni:
+                self._indicizza(id_missione)
+            else:
+                logger.warning(f"Missione attiva sconosciuta: {id_missione}")
+
+        avviate = set(giocatore.missioni_attive) | set(giocatore.missioni_completate)
+        for id_missione, missione in self.definizioni.items():
+            if id_missione in avviate:
+                continue
+            if missione.get("automatica"):
+                self.avvia(id_missione)
+            elif "avvio" in missione:
+                chiave = (missione["avvio"]["npg"], missione["avvio"]["nodo"])
+                self._avvii.setdefault(chiave, []).append(id_missione)
+
+        self._aggiorna_iscrizioni()
+
+    def avvia(self, id_missione):
+        """
+        Avvia una missione. Gli obiettivi di tipo raggiungi_mappa già soddisfatti
+        dalla posizione del giocatore vengono completati subito.
+
+        Args:
+            id_missione (str): ID della missione
+
+        Returns:
+            bool: True se la missione è stata avviata
+        """
+        giocatore = self.giocatore
+        missione = self.definizioni.get(id_missione)
+        if missione is None or id_missione in giocatore.missioni_attive or id_missione in giocatore.missioni_completate:
+            return False
+
+        giocatore.missioni_attive.append(id_missione)
+        giocatore.progresso_missioni[id_missione] = {
+            "obiettivi": [0] * len(missione.get("obiettivi", [])),
+            "combattimenti_inizio": self._combattimenti_conclusi()
+        }
+        self._indicizza(id_missione)
+        if self.gioco.io:
+            self.gioco.io.mostra_messaggio(f"\n*Nuova missione: {missione['nome']}*")
+        self.gioco.eventi.emetti(MISSIONE_INIZIATA, id=id_missione)
+
+        self._avanza_se_nella_mappa(id_missione)
+        self._aggiorna_iscrizioni()
+        return True
+
+    def _combattimenti_conclusi(self):
+        """Valore attuale del contatore dei combattimenti conclusi"""
+        return self.giocatore.progresso_achievement.contatori.get(CONTATORE_COMBATTIMENTI, 0)
+
+    def _indicizza(self, id_missione):
+        """
+        Aggiunge all'indice il primo obiettivo incompleto di una missione attiva.
+
+        Returns:
+            tuple: La chiave dell'obiettivo indicizzato, None se sono tutti completi
+        """
+        obiettivi = self.definizioni[id_missione].get("obiettivi", [])
+        progresso = self.giocatore.progresso_missioni.get(id_missione)
+        if not isinstance(progresso, dict) or len(progresso.get("obiettivi", [])) != len(obiettivi):
+            # Progresso assente o di una versione precedente della missione: riparte da zero
+            progresso = {"obiettivi": [0] * len(obiettivi), "combattimenti_inizio": self._combattimenti_conclusi()}
+            self.giocatore.progresso_missioni[id_missione] = progresso
+        elif "combattimenti_inizio" not in progresso:
+            # Progresso salvato quando i combattimenti erano contati per missione
+            progresso["combattimenti_inizio"] = self._combattimenti_conclusi() - progresso.pop("combattimenti", 0)
+
+        for indice, obiettivo in enumerate(obiettivi):
+            if progresso["obiettivi"][indice] < obiettivo.get("quantita", 1):
+                chiave = (obiettivo["tipo"], obiettivo[TIPI_OBIETTIVO[obiettivo["tipo"]][1]])
+                self._indice.setdefault(chiave, set()).add((id_missione, indice))
+                return chiave
+        return None
+
+    def _avanza_se_nella_mappa(self, id_missione):
+        """Completa l'obiettivo raggiungi_mappa corrente di una missione se il giocatore è già nella mappa"""
+        mappa = self.giocatore.mappa_corrente
+        if mappa and (id_missione, self._prossimo_indice(id_missione)) in self._indice.get(("raggiungi_mappa", mappa), ()):
+            self._avanza(("raggiungi_mappa", mappa), solo=id_missione)
+
+    def _prossimo_indice(self, id_missione):
+        """Indice del primo obiettivo incompleto di una missione, None se sono tutti completi"""
+        obiettivi = self.definizioni[id_missione].get("obiettivi", [])
+        progresso = self.giocatore.progresso_missioni[id_missione]["obiettivi"]
+        for indice, (avanzamento, obiettivo) in enumerate(zip(progresso, obiettivi)):
+            if avanzamento < obiettivo.get("quantita", 1):
+                return indice
+        return None
+
+    def _aggiorna_iscrizioni(self):
+        """Si iscrive solo agli eventi che possono avviare o far avanzare una missione"""
+        necessari = {TIPI_OBIETTIVO[tipo][0] for tipo, _ in self._indice}
+        if self._avvii:
+            necessari.add(NODO_DIALOGO)
+        if self.giocatore is not None and self.giocatore.missioni_attive:
+            # Conta i combattimenti svolti durante le missioni attive
+            necessari.add(COMBATTIMENTO_CONCLUSO)
+
+        for tipo in set(self._iscrizioni) - necessari:
+            self.gioco.eventi.disiscrivi(self._iscrizioni.pop(tipo))
+        for tipo in necessari - set(self._iscrizioni):
+            self._iscrizioni[tipo] = self.gioco.eventi.iscrivi(tipo, self._gestisci_evento)
+
+    def _gestisci_evento(self, tipo, dati):
+        """Avvia le missioni legate a un dialogo e fa avanzare gli obiettivi interessati"""
+        avviate = ()
+        if tipo == NODO_DIALOGO and self._avvii:
+            avviate = self._avvii.pop((dati["npg"], dati["nodo"]), ())
+            for id_missione in avviate:
+                self.avvia(id_missione)
+        if tipo == COMBATTIMENTO_CONCLUSO:
+            self.giocatore.progresso_achievement.incrementa(CONTATORE_COMBATTIMENTI)
+
+        chiave = _bersaglio_evento(tipo, dati, self.giocatore)
+        if chiave is not None and chiave in self._indice:
+            # Il dialogo che avvia una missione non conta per i suoi obiettivi
+            self._avanza(chiave, escludi=avviate)
+
+    def _avanza(self, chiave, solo=None, escludi=()):
+        """
+        Fa avanzare gli obiettivi indicizzati sotto una chiave, indicizza gli obiettivi
+        successivi a quelli completati e completa le missioni finite.
+
+        Args:
+            chiave (tuple): (tipo obiettivo, bersaglio)
+            solo (str, optional): Limita l'avanzamento agli obiettivi di questa missione
+            escludi (iterable, optional): Missioni i cui obiettivi non avanzano
+        """
+        completati = []
+        for id_missione, indice in list(self._indice.get(chiave, ())):
+            if (solo is not None and id_missione != solo) or id_missione in escludi:
+                continue
+            obiettivi = self.definizioni[id_missione]["obiettivi"]
+            progresso = self.giocatore.progresso_missioni[id_missione]["obiettivi"]
+            progresso[indice] += 1
+            if progresso[indice] >= obiettivi[indice].get("quantita", 1):
+                completati.append((id_missione, indice))
+
+        for id_missione, indice in completati:
+            in_attesa = self._indice[chiave]
+            in_attesa.discard((id_missione, indice))
+            if not in_attesa:
+                del self._indice[chiave]
+            obiettivi = self.definizioni[id_missione]["obiettivi"]
+            if self.gioco.io and obiettivi[indice].get("descrizione"):
+                self.gioco.io.mostra_messaggio(f"*Obiettivo completato: {obiettivi[indice]['descrizione']}*")
+            if self._indicizza(id_missione) is None:
+                self._completa(id_missione)
+            else:
+                self._avanza_se_nella_mappa(id_missione)
+
+        if completati:
+            self._aggiorna_iscrizioni()
+
+    def _completa(self, id_missione):
+        """Chiude una missione e assegna la ricompensa"""
+        giocatore = self.giocatore
+        missione = self.definizioni[id_missione]
+        giocatore.missioni_attive.remove(id_missione)
+        giocatore.missioni_completate.append(id_missione)
+        progresso = giocatore.progresso_missioni.pop(id_missione, {})
+        combattimenti = self._combattimenti_conclusi() - progresso.get("combattimenti_inizio", self._combattimenti_conclusi())
+
+        if self.gioco.io:
+            self.gioco.io.mostra_messaggio(f"\n*Missione completata: {missione['nome']}*")
+        ricompensa = missione.get("ricompensa", {})
+        if ricompensa.get("oro"):
+            giocatore.aggiungi_oro(ricompensa["oro"], self.gioco)
+        if ricompensa.get("esperienza"):
+            giocatore.guadagna_esperienza(ricompensa["esperienza"], self.gioco)
+        for oggetto in ricompensa.get("oggetti", []):
+            giocatore.aggiungi_item(oggetto)
+
+        logger.info(f"Missione completata da {giocatore.nome}: {id_missione}")
+        self.gioco.eventi.emetti(MISSIONE_COMPLETATA, id=id_missione, combattimenti=combattimenti)
+
+    def riepilogo(self):
+        """
+        Descrive le missioni attive e completate del giocatore.
+
+        Returns:
+            dict: Liste "attive" (con l'avanzamento di ogni obiettivo) e "completate"
+        """
+        def descrivi(id_missione, progresso=None):
+            missione = self.definizioni.get(id_missione, {"id": id_missione, "nome": id_missione})
+            voce = {
+                "id": id_missione,
+                "nome": missione.get("nome", id_missione),
+                "descrizione": missione.get("descrizione", "")
+            }
+            if progresso is not None:
+                voce["obiettivi"] = [
+                    {
+                        "descrizione": obiettivo.get("descrizione", ""),
+                        "avanzamento": min(avanzamento, obiettivo.get("quantita", 1)),
+                        "quantita": obiettivo.get("quantita", 1)
+                    }
+                    for obiettivo, avanzamento in zip(missione.get("obiettivi", []), progresso["obiettivi"])
+                ]
+            return voce
+
+        giocatore = self.giocatore
+        return {
+            "attive": [descrivi(id_missione, giocatore.progresso_missioni.get(id_missione, {"obiettivi": []}))
+                       for id_missione in giocatore.missioni_attive],
+            "completate": [descrivi(id_missione) for id_missione in giocatore.missioni_completate]
+        }
+
+    def __getstate__(self):
+        """Indici e iscrizioni vengono ricreati da Game.collega_eventi dopo il caricamento"""
+        return {"gioco": self.gioco, "giocatore": self.giocatore, "definizioni": {},
+                "_indice": {}, "_avvii": {}, "_iscrizioni": {}}
@@ -0,0 +1,249 @@
+"""
+Archivio delle notifiche di una sessione.
+
+Le notifiche sono conservate in un buffer circolare a capacità fissa: quando è pieno
+la notifica più vecchia viene sovrascritta. Accanto al buffer vengono mantenuti in modo
+incrementale:
+    - l'indice id -> numero progressivo (che identifica anche lo slot del buffer)
+    - il contatore e l'elenco ordinato delle notifiche non lette
+    - gli indici secondari per tipo (tutte e non lette)
+così elenco, conteggio e lettura di una notifica non scorrono mai l'intero archivio.
+"""
+import os
+import threading
+import time
+from collections import deque
+from uuid import uuid4
+
+
+# Numero massimo di notifiche conservate per sessione
+CAPACITA_NOTIFICHE_PREDEFINITA = int(os.environ.get("RPG_CAPACITA_NOTIFICHE", 500))
+
+
+class CodaNotifiche:
+    """
+    Buffer circolare delle notifiche di una sessione.
+    Ogni notifica riceve un numero progressivo: lo slot che la contiene è
+    progressivo % capacità, e i progressivi crescenti danno l'ordine cronologico.
+    """
+
+    def __init__(self, capacita=CAPACITA_NOTIFICHE_PREDEFINITA):
+        """
+        Inizializza l'archivio vuoto
+
+        Args:
+            capacita (int): Numero massimo di notifiche conservate
+        """
+        self.capacita = max(1, int(capacita))
+        self._slot = [None] * self.capacita
+        # Progressivo che verrà assegnato alla prossima notifica
+        self._prossimo = 0
+        self._indice = {}  # {id notifica: progressivo}
+        self._per_tipo = {}  # {tipo: deque di progressivi in ordine cronologico}
+        # I dizionari conservano l'ordine di inserimento: usati come insiemi ordinati
+        self._non_lette = {}  # {progressivo: None}
+        self._non_lette_per_tipo = {}  # {tipo: {progressivo: None}}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._indice)
+
+    @property
+    def totale_non_lette(self):
+        """int: Numero di notifiche non lette conservate"""
+        return len(self._non_lette)
+
+    def aggiungi(self, tipo, messaggio, data=None):
+        """
+        Aggiunge una notifica, sovrascrivendo la più vecchia se l'archivio è pieno.
+
+        Args:
+            tipo (str): Tipo della notifica ("info", "warning", "achievement", "quest", "combat", ecc.)
+            messaggio (str): Testo della notifica
+            data (dict, optional): Dati aggiuntivi
+
+        Returns:
+            dict: La notifica aggiunta
+        """
+        notifica = {
+            "id": str(uuid4()),
+            "tipo": tipo,
+            "messaggio": messaggio,
+            "data": data or {},
+            "timestamp": time.time(),
+            "letta": False
+        }
+        with self._lock:
+            self._inserisci(notifica)
+        return notifica
+
+    def _inserisci(self, notifica):
+        """Inserisce una notifica nel prossimo slot aggiornando gli indici (con il lock acquisito)"""
+        progressivo = self._prossimo
+        slot = progressivo % self.capacita
+        if self._slot[slot] is not None:
+            self._rimuovi_da_indici(progressivo - self.capacita, self._slot[slot])
+        self._slot[slot] = notifica
+        self._prossimo += 1
+
+        tipo = notifica.get("tipo")
+        self._indice[notifica["id"]] = progressivo
+        self._per_tipo.setdefault(tipo, deque()).append(progressivo)
+        if not notifica.get("letta", False):
+            self._non_lette[progressivo] = None
+            self._non_lette_per_tipo.setdefault(tipo, {})[progressivo] = None
+
+    def _rimuovi_da_indici(self, progressivo, notifica):
+        """Toglie dagli indici la notifica sovrascritta, che è sempre la più vecchia"""
+        tipo = notifica.get("tipo")
+        self._indice.pop(notifica["id"], None)
+        per_tipo = self._per_tipo[tipo]
+        per_tipo.popleft()
+        if not per_tipo:
+            del self._per_tipo[tipo]
+        if progressivo in self._non_lette:
+            del self._non_lette[progressivo]
+            non_lette_tipo = self._non_lette_per_tipo[tipo]
+            del non_lette_tipo[progressivo]
+            if not non_lette_tipo:
+                del self._non_lette_per_tipo[tipo]
+
+    def segna_letta(self, id_notifica):
+        """
+        Segna una notifica come letta.
+
+        Args:
+            id_notifica (str): ID della notifica
+
+        Returns:
+            bool: True se la notifica è conservata nell'archivio
+        """
+        with self._lock:
+            progressivo = self._indice.get(id_notifica)
+            if progressivo is None:
+                return False
+            notifica = self._slot[progressivo % self.capacita]
+            if not notifica["letta"]:
+                notifica["letta"] = True
+                del self._non_lette[progressivo]
+                non_lette_tipo = self._non_lette_per_tipo[notifica.get("tipo")]
+                del non_lette_tipo[progressivo]
+                if not non_lette_tipo:
+                    del self._non_lette_per_tipo[notifica.get("tipo")]
+            return True
+
+    def segna_tutte_lette(self):
+        """
+        Segna come lette tutte le notifiche non lette.
+
+        Returns:
+            int: Numero di notifiche segnate
+        """
+        with self._lock:
+            for progressivo in self._non_lette:
+                self._slot[progressivo % self.capacita]["letta"] = True
+            segnate = len(self._non_lette)
+            self._non_lette.clear()
+            self._non_lette_per_tipo.clear()
+            return segnate
+
+    def elenca(self, solo_non_lette=True, tipo=None, limite=50, dopo=None):
+        """
+        Elenca le notifiche in ordine cronologico.
+
+        Senza cursore restituisce le `limite` notifiche più recenti che rispettano i filtri.
+        Con il cursore `dopo` restituisce le prime `limite` notifiche successive a quella
+        indicata: passando come cursore l'ID dell'ultima notifica ricevuta si scorrono
+        tutte le notifiche senza duplicati. Il costo è proporzionale alle notifiche
+        successive al cursore, non alla dimensione dell'archivio.
+
+        Args:
+            solo_non_lette (bool): Se True, esclude le notifiche già lette
+            tipo (str, optional): Restituisce solo le notifiche di questo tipo
+            limite (int): Numero massimo di notifiche restituite
+            dopo (str, optional): ID della notifica da cui riprendere
+
+        Returns:
+            tuple: (lista di notifiche, bool che indica se ne restano altre dopo l'ultima
+                   restituita, bool che indica se il cursore è uscito dall'archivio)
+
+        Raises:
+            KeyError: Se il cursore non è un ID emesso da questo archivio
+        """
+        with self._lock:
+            cursore = -1
+            cursore_scaduto = False
+            if dopo is not None:
+                if dopo in self._indice:
+                    cursore = self._indice[dopo]
+                elif self._prossimo > len(self._indice):
+                    # La notifica del cursore è stata sovrascritta: si riparte dalla più vecchia
+                    cursore_scaduto = True
+                else:
+                    raise KeyError(dopo)
+
+            if solo_non_lette:
+                progressivi = self._non_lette if tipo is None else self._non_lette_per_tipo.get(tipo, {})
+            elif tipo is not None:
+                progressivi = self._per_tipo.get(tipo, ())
+            else:
+                progressivi = range(self._prossimo - len(self._indice), self._prossimo)
+
+            # Scorre dal più recente fermandosi al cursore
+            selezionati = []
+            for progressivo in reversed(progressivi):
+                if progressivo <= cursore:
+                    break
+                selezionati.append(progressivo)
+                if dopo is None and len(selezionati) >= limite:
+                    break
+            selezionati.reverse()
+
+            if dopo is None:
+                altre = False
+            else:
+                altre = len(selezionati) > limite
+                selezionati = selezionati[:limite]
+            notifiche = [dict(self._slot[p % self.capacita]) for p in selezionati]
+            return notifiche, altre, cursore_scaduto
+
+    def to_dict(self):
+        """
+        Converte l'archivio in un dizionario serializzabile.
+
+        Returns:
+            dict: Progressivo successivo e notifiche in ordine cronologico
+        """
+        with self._lock:
+            primo = self._prossimo - len(self._indice)
+            return {
+                "prossimo": self._prossimo,
+                "notifiche": [self._slot[p % self.capacita] for p in range(primo, self._prossimo)]
+            }
+
+    def __getstate__(self):
+        """Serializza con pickle solo il contenuto, senza il lock"""
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        """Ricostruisce archivio e indici dal contenuto serializzato"""
+        self.__dict__.update(CodaNotifiche.from_dict(state).__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Ricostruisce l'archivio e i suoi indici da un dizionario.
+        Usa la capacità corrente: se è stata ridotta vengono mantenute le notifiche più recenti.
+
+        Args:
+            data (dict): Dizionario prodotto da to_dict
+
+        Returns:
+            CodaNotifiche: L'archivio ricostruito
+        """
+        coda = cls()
+        notifiche = data.get("notifiche", [])[-coda.capacita:]
+        coda._prossimo = max(0, data.get("prossimo", len(notifiche)) - len(notifiche))
+        for notifica in notifiche:
+            coda._inserisci(notifica)
+        return coda
@@ -0,0 +1,316 @@
+"""
+Formato compatto e versionato per le sessioni web salvate in SESSIONS_DIR.
+
+Invece di serializzare con pickle l'intero grafo di oggetti (gestore mappe,
+riferimenti al DataManager, back-reference self.gioco degli stati...) lo
+snapshot usa i metodi to_dict/from_dict già esistenti e salva solo:
+    - il giocatore
+    - lo stack degli stati
+    - le mappe che differiscono dai modelli statici in data/mappe
+    - il buffer di output della sessione
+    - le notifiche della sessione
+
+Gli snapshot di uno schema precedente vengono portati a quello corrente dai passi
+registrati con @migrazione_snapshot prima di ricostruire la sessione.
+
+Struttura del file:
+    MAGIC (4 byte) | versione schema (1 byte) | flag (1 byte) | payload
+dove il payload è JSON compatto UTF-8, compresso con zlib se il flag lo indica.
+
+Confronto con pickle su una sessione di esempio:
+    python -m core.snapshot_sessione
+"""
+import json
+import logging
+import pickle
+import time
+import zlib
+
+from core.notifiche import CodaNotifiche
+from core.stato_gioco import StatoGioco, GameIOWeb
+from core.game import Game
+from states.registro_stati import serializza_stato
+from util.casualita import nuovo_seme
+
+logger = logging.getLogger("gioco_rpg")
+
+# Intestazione che identifica uno snapshot (i file pickle iniziano con b"\x80")
+MAGIC_SNAPSHOT = b"RPGS"
+
+# Versione dello schema dello snapshot: incrementarla a ogni modifica incompatibile
+VERSIONE_SCHEMA_SNAPSHOT = 1
+
+# versione dello schema -> passo che porta lo snapshot alla versione successiva
+_migrazioni_schema = {}
+
+# Flag del byte di intestazione
+FLAG_ZLIB = 0x01
+
+# Livello di compressione: le sessioni vengono salvate a ogni richiesta, conta la velocità
+LIVELLO_COMPRESSIONE = 1
+
+_LUNGHEZZA_INTESTAZIONE = len(MAGIC_SNAPSHOT) + 2
+
+# Mappe così come vengono caricate da data/mappe, calcolate una sola volta per processo
+_modelli_mappe = None
+
+
+def _ottieni_modelli_mappe():
+    """
+    Restituisce la forma serializzata delle mappe appena caricate dai file JSON.
+
+    Returns:
+        dict: Nome mappa -> dizionario prodotto da Mappa.to_dict()
+    """
+    global _modelli_mappe
+    if _modelli_mappe is None:
+        from world.gestore_mappe import GestitoreMappe
+        gestore = GestitoreMappe()
+        _modelli_mappe = {nome: mappa.to_dict() for nome, mappa in gestore.mappe.items()}
+    return _modelli_mappe
+
+
+def migrazione_snapshot(da_versione):
+    """
+    Decoratore che registra il passo che porta uno snapshot dallo schema da_versione
+    a quello successivo. La funzione riceve il dizionario dello snapshot, lo modifica
+    e lo restituisce; il campo versione_schema viene aggiornato automaticamente.
+
+    Args:
+        da_versione (int): Versione dello schema a cui si applica il passo
+    """
+    def registra(funzione):
+        if da_versione in _migrazioni_schema:
+            raise ValueError(f"Migrazione dello snapshot dallo schema {da_versione} già registrata")
+        _migrazioni_schema[da_versione] = funzione
+        return funzione
+    return registra
+
+
+def migra_snapshot(dati):
+    """
+    Porta uno snapshot alla versione corrente dello schema.
+
+    Args:
+        dati (dict): Snapshot di una versione qualsiasi dello schema
+
+    Returns:
+        dict: Lo snapshot nella versione VERSIONE_SCHEMA_SNAPSHOT
+
+    Raises:
+        ValueError: Se la versione è sconosciuta, più recente di quella corrente o
+                    priva di un passo di migrazione
+    """
+    versione = dati.get("versione_schema")
+    if not isinstance(versione, int) or versione > VERSIONE_SCHEMA_SNAPSHOT:
+        raise ValueError(f"Versione dello snapshot di sessione non supportata: {versione}")
+    while versione < VERSIONE_SCHEMA_SNAPSHOT:
+        passo = _migrazioni_schema.get(versione)
+        if passo is None:
+            raise ValueError(f"Nessuna migrazione dello snapshot di sessione dallo schema {versione}")
+        dati = passo(dati)
+        versione += 1
+        dati["versione_schema"] = versione
+    return dati
+
+
+def crea_snapshot(sessione):
+    """
+    Converte una sessione in un dizionario serializzabile.
+
+    Args:
+        sessione (StatoGioco): La sessione da convertire
+
+    Returns:
+        dict: Lo snapshot della sessione
+    """
+    game = sessione.game
+    modelli = _ottieni_modelli_mappe()
+
+    # Salva solo le mappe modificate rispetto ai modelli statici
+    mappe_modificate = {}
+    for nome in game.gestore_mappe.mappe:
+        # Le mappe mai usate dopo un caricamento non vengono ricostruite solo per confrontarle
+        dati_mappa = game.gestore_mappe.dati_mappa(nome)
+        if modelli.get(nome) != dati_mappa:
+            mappe_modificate[nome] = dati_mappa
+
+    stati = [serializza_stato(stato) for stato in game.stato_stack]
+
+    mappa_attuale = game.gestore_mappe.mappa_attuale
+
+    return {
+        "versione_schema": VERSIONE_SCHEMA_SNAPSHOT,
+        "giocatore": game.giocatore.to_dict() if game.giocatore else None,
+        "stati": stati,
+        "attivo": game.attivo,
+        "mappa_attuale": mappa_attuale.nome if mappa_attuale else None,
+        "mappe": mappe_modificate,
+        "mappe_rimosse": [nome for nome in modelli if nome not in game.gestore_mappe.mappe],
+        "output": {
+            "buffer": sessione.io_buffer.buffer,
+            "ultimo_input": sessione.io_buffer.last_input,
+            "ultimo_output": sessione.ultimo_output
+        },
+        "notifiche": sessione.notifiche.to_dict(),
+        "casualita": {
+            "seme": getattr(sessione, "seme", None),
+            "operazioni": getattr(sessione, "operazioni_eseguite", 0)
+        }
+    }
+
+
+def ripristina_snapshot(dati):
+    """
+    Ricostruisce una sessione da uno snapshot.
+
+    Args:
+        dati (dict): Snapshot prodotto da crea_snapshot
+
+    Returns:
+        StatoGioco: La sessione ricostruita
+
+    Raises:
+        ValueError: Se lo snapshot usa una versione dello schema non supportata
+    """
+    from entities.giocatore import Giocatore
+    from world.mappa import Mappa
+
+    dati = migra_snapshot(dati)
+
+    giocatore = Giocatore.from_dict(dati["giocatore"]) if dati.get("giocatore") else None
+
+    # Ricostruisce la sessione senza eseguire entra() sullo stato iniziale
+    io_buffer = GameIOWeb()
+    game = Game(giocatore, None, io_handler=io_buffer, e_temporaneo=True)
+
+    # Le mappe non presenti nello snapshot restano quelle appena caricate dai modelli
+    for nome in dati.get("mappe_rimosse", []):
+        game.gestore_mappe.mappe.pop(nome, None)
+    for nome, dati_mappa in dati.get("mappe", {}).items():
+        game.gestore_mappe.mappe[nome] = Mappa.from_dict(dati_mappa)
+    if dati.get("mappa_attuale"):
+        game.gestore_mappe.imposta_mappa_attuale(dati["mappa_attuale"])
+
+    game.ricostruisci_stack_stati(dati.get("stati", []))
+    game.attivo = dati.get("attivo", True)
+
+    output = dati.get("output", {})
+    io_buffer.buffer = output.get("buffer", [])
+    io_buffer.last_input = output.get("ultimo_input", "")
+
+    sessione = StatoGioco.da_partita(game, io_buffer)
+    sessione.ultimo_output = output.get("ultimo_output", "")
+    sessione.notifiche = CodaNotifiche.from_dict(dati.get("notifiche", {}))
+    # Gli snapshot precedenti al giornale dei comandi non hanno il seme
+    casualita = dati.get("casualita", {})
+    sessione.seme = casualita.get("seme")
+    if sessione.seme is None:
+        sessione.seme = nuovo_seme()
+    sessione.operazioni_eseguite = casualita.get("operazioni", 0)
+    return sessione
+
+
+def codifica_sessione(sessione, comprimi=True):
+    """
+    Serializza una sessione nel formato snapshot.
+
+    Args:
+        sessione (StatoGioco): La sessione da serializzare
+        comprimi (bool): Se True, comprime il payload con zlib
+
+    Returns:
+        bytes: Il contenuto da scrivere su disco
+    """
+    payload = json.dumps(crea_snapshot(sessione), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    flag = 0
+    if comprimi:
+        payload = zlib.compress(payload, LIVELLO_COMPRESSIONE)
+        flag |= FLAG_ZLIB
+    return MAGIC_SNAPSHOT + bytes([VERSIONE_SCHEMA_SNAPSHOT, flag]) + payload
+
+
+def e_snapshot(contenuto):
+    """
+    Indica se un contenuto binario è uno snapshot di sessione.
+
+    Args:
+        contenuto (bytes): Contenuto del file di sessione
+
+    Returns:
+        bool: True se il contenuto inizia con l'intestazione dello snapshot
+    """
+    return contenuto[:len(MAGIC_SNAPSHOT)] == MAGIC_SNAPSHOT
+
+
+def decodifica_sessione(contenuto):
+    """
+    Ricostruisce una sessione da un contenuto prodotto da codifica_sessione.
+
+    Args:
+        contenuto (bytes): Il contenuto letto da disco
+
+    Returns:
+        StatoGioco: La sessione ricostruita
+
+    Raises:
+        ValueError: Se il contenuto non è uno snapshot valido
+    """
+    if len(contenuto) < _LUNGHEZZA_INTESTAZIONE or not e_snapshot(contenuto):
+        raise ValueError("Il contenuto non è uno snapshot di sessione")
+
+    versione = contenuto[len(MAGIC_SNAPSHOT)]
+    flag = contenuto[len(MAGIC_SNAPSHOT) + 1]
+    if versione > VERSIONE_SCHEMA_SNAPSHOT:
+        raise ValueError(f"Snapshot creato da una versione più recente del gioco (schema {versione})")
+
+    payload = contenuto[_LUNGHEZZA_INTESTAZIONE:]
+    if flag & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return ripristina_snapshot(json.loads(payload.decode("utf-8")))
+
+
+def confronta_con_pickle(sessione, ripetizioni=20):
+    """
+    Misura dimensione e velocità dello snapshot rispetto a pickle.
+
+    Args:
+        sessione (StatoGioco): La sessione da usare per la misura
+        ripetizioni (int): Numero di ripetizioni per ogni misura
+
+    Returns:
+        dict: Dimensioni in byte e tempi medi in millisecondi per ciascun formato
+    """
+    def misura(funzione, argomento):
+        inizio = time.perf_counter()
+        for _ in range(ripetizioni):
+            risultato = funzione(argomento)
+        return risultato, (time.perf_counter() - inizio) * 1000 / ripetizioni
+
+    formati = {
+        "pickle": (pickle.dumps, pickle.loads),
+        "snapshot_json": (lambda s: codifica_sessione(s, comprimi=False), decodifica_sessione),
+        "snapshot_zlib": (codifica_sessione, decodifica_sessione),
+    }
+
+    risultati = {}
+    for nome, (codifica, decodifica) in formati.items():
+        contenuto, tempo_codifica = misura(codifica, sessione)
+        _, tempo_decodifica = misura(decodifica, contenuto)
+        risultati[nome] = {
+            "byte": len(contenuto),
+            "codifica_ms": round(tempo_codifica, 3),
+            "decodifica_ms": round(tempo_decodifica, 3)
+        }
+    return risultati
+
+
+if __name__ == "__main__":
+    from entities.giocatore import Giocatore
+    from states.taverna import TavernaState
+
+    logging.getLogger().setLevel(logging.WARNING)
+    sessione_prova = StatoGioco(Giocatore("Prova", "guerriero"), TavernaState(None))
+    for formato, misure in confronta_con_pickle(sessione_prova).items():
+        print(f"{formato:15} {misure['byte']:>9} byte  "
+              f"codifica {misure['codifica_ms']:>8} ms  decodifica {misure['decodifica_ms']:>8} ms")
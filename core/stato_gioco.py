@@ -1,5 +1,10 @@
+from contextlib import contextmanager
+
 from core.game import Game
+from core.giornale_comandi import ANNULLA, COMANDO, MOVIMENTO, RICARICA
 from core.io_interface import GameIO
+from core.notifiche import CodaNotifiche
+from util.casualita import generatore_operazione, nuovo_seme, usa_generatore
 
 
 class GameIOWeb(GameIO):
@@ -30,6 +35,15 @@ class GameIOWeb(GameIO):
         """Imposta l'input che verrà restituito alla prossima chiamata di richiedi_input"""
         self.last_input = input_text
     
+    @property
+    def ultimo_input(self):
+        """Ultimo input ricevuto, con il nome usato dagli stati (vedi GameIO)"""
+        return self.last_input
+
+    @ultimo_input.setter
+    def ultimo_input(self, valore):
+        self.last_input = valore
+    
     def get_output(self) -> list:
         """Restituisce tutto l'output accumulato come una lista di dizionari"""
         return self.buffer
@@ -68,9 +82,38 @@ class StatoGioco:
             giocatore: L'oggetto giocatore
             stato_iniziale: Lo stato iniziale del gioco (es. TavernaState)
         """
-        self.io_buffer = GameIOWeb()
-        self.game = Game(giocatore, stato_iniziale, io_handler=self.io_buffer)
+        io_buffer = GameIOWeb()
+        self._inizializza(Game(giocatore, stato_iniziale, io_handler=io_buffer), io_buffer)
+    
+    @classmethod
+    def da_partita(cls, game, io_buffer):
+        """
+        Crea una sessione attorno a una partita già costruita (ad esempio ricostruita
+        da uno snapshot), senza eseguire entra() su uno stato iniziale
+        
+        Args:
+            game: La partita
+            io_buffer: Il GameIOWeb usato dalla partita
+            
+        Returns:
+            StatoGioco: La nuova sessione
+        """
+        istanza = cls.__new__(cls)
+        istanza._inizializza(game, io_buffer)
+        return istanza
+    
+    def _inizializza(self, game, io_buffer):
+        """Imposta la partita e lo stato iniziale della sessione"""
+        self.io_buffer = io_buffer
+        self.game = game
         self.ultimo_output = ""
+        self.notifiche = CodaNotifiche()
+        
+        # Seme dei tiri di dado e numero delle operazioni eseguite (vedi util/casualita.py)
+        self.seme = nuovo_seme()
+        self.operazioni_eseguite = 0
+        # Giornale dei comandi, collegato dal server (vedi core/giornale_comandi.py)
+        self.giornale = None
     
     @classmethod
     def from_dict(cls, data):
@@ -97,12 +140,50 @@ class StatoGioco:
         gioco.carica()  # carica lo stato del gioco
         
         # Crea l'istanza di StatoGioco
-        istanza = cls(giocatore, gioco.stato_corrente())
-        istanza.game = gioco
-        istanza.io_buffer = io_buffer
+        istanza = cls.da_partita(gioco, io_buffer)
         istanza.ultimo_output = data.get("output", "")
         
         return istanza
+    
+    @contextmanager
+    def _operazione(self, tipo, argomento=None):
+        """
+        Numera un'operazione della sessione, la annota nel giornale dei comandi e la
+        esegue con il generatore casuale derivato dal seme e dal suo numero
+        
+        Args:
+            tipo: Tipo dell'operazione per il giornale
+            argomento: Argomento dell'operazione per il giornale
+        """
+        # Le sessioni serializzate prima del giornale ne sono prive
+        if getattr(self, "seme", None) is None:
+            self.seme = nuovo_seme()
+            self.operazioni_eseguite = 0
+        indice = self.operazioni_eseguite
+        self.operazioni_eseguite += 1
+        
+        giornale = getattr(self, "giornale", None)
+        if giornale is not None:
+            giornale.annota(tipo, indice, argomento)
+        with usa_generatore(generatore_operazione(self.seme, indice)):
+            yield
+    
+    def collega_giornale(self, giornale):
+        """
+        Collega il giornale dei comandi alla sessione. Se il giornale non arriva allo
+        stato attuale della sessione riparte con una nuova intestazione.
+        
+        Args:
+            giornale: Il GiornaleComandi della sessione
+        """
+        if getattr(self, "seme", None) is None:
+            self.seme = nuovo_seme()
+            self.operazioni_eseguite = 0
+        self.giornale = giornale
+        if giornale.prosegue(self):
+            giornale.annota(RICARICA, self.operazioni_eseguite)
+        else:
+            giornale.inizia(self)
         
     def processa_comando(self, comando: str) -> str:
         """
@@ -120,9 +201,15 @@ class StatoGioco:
         # Imposta l'input che verrà utilizzato
         self.io_buffer.set_input(comando)
         
+        # Registra lo stato precedente al comando, per poterlo annullare
+        self.game.registra_snapshot()
+        
         # Elabora il comando nello stato corrente
-        if self.game.stato_corrente():
-            self.game.stato_corrente().esegui(self.game)
+        with self._operazione(COMANDO, comando):
+            self.game.esegui_stato_corrente()
+        
+        # Consegna agli iscritti differiti gli eventi emessi dal comando
+        self.game.eventi.svuota()
         
         # Memorizza e restituisce l'output
         self.ultimo_output = self.io_buffer.get_output_text()
@@ -180,6 +267,47 @@ class StatoGioco:
             "statistiche": statistiche
         }
     
+    def verifica_salvataggio_consentito(self):
+        """
+        Verifica che lo stato corrente permetta di salvare la partita
+        
+        Returns:
+            str: Il motivo per cui non è possibile salvare, None se il salvataggio è consentito
+        """
+        # Importa le classi degli stati instabili
+        from states.combattimento import CombattimentoState
+        from states.mercato import MercatoState
+        from states.dialogo import DialogoState
+        from states.prova_abilita import ProvaAbilitaState
+        
+        # Verifica se il gioco è in uno stato instabile
+        if isinstance(self.game.stato_corrente(), (CombattimentoState, ProvaAbilitaState, DialogoState)):
+            return "Non puoi salvare durante un combattimento, una prova o un dialogo."
+            
+        # Verifica la fase nel MercatoState (solo durante le vendite non è consentito)
+        if isinstance(self.game.stato_corrente(), MercatoState) and hasattr(self.game.stato_corrente(), 'fase'):
+            fase_mercato = self.game.stato_corrente().fase
+            if fase_mercato in ["vendi_oggetto_lista", "vendi_oggetto_conferma", "compra_pozione"]:
+                return "Non puoi salvare durante una transazione al mercato."
+        
+        return None
+    
+    def salva_asincrono(self, file_path="salvataggio.json"):
+        """
+        Accoda il salvataggio dello stato corrente senza attendere la scrittura su disco
+        
+        Args:
+            file_path: Percorso del file di salvataggio
+            
+        Returns:
+            Future: Il future della scrittura, None se il salvataggio non è consentito
+        """
+        motivo = self.verifica_salvataggio_consentito()
+        if motivo:
+            self.io_buffer.mostra_messaggio(motivo)
+            return None
+        return self.game.salva_asincrono(file_path)
+    
     def salva(self, file_path="salvataggio.json"):
         """
         Salva lo stato corrente su file
@@ -191,36 +319,10 @@ class StatoGioco:
             bool: True se il salvataggio è avvenuto con successo, False altrimenti
         """
         try:
-            # Importa le classi degli stati instabili
-            from states.combattimento import CombattimentoState
-            from states.mercato import MercatoState
-            from states.dialogo import DialogoState
-            from states.prova_abilita import ProvaAbilitaState
-            
-            # Verifica se il gioco è in uno stato instabile
-            if isinstance(self.game.stato_corrente(), (CombattimentoState, ProvaAbilitaState, DialogoState)):
-                self.io_buffer.mostra_messaggio("Non puoi salvare durante un combattimento, una prova o un dialogo.")
+            motivo = self.verifica_salvataggio_consentito()
+            if motivo:
+                self.io_buffer.mostra_messaggio(motivo)
                 return False
-                
-            # Verifica la fase nel MercatoState (solo durante le vendite non è consentito)
-            if isinstance(self.game.stato_corrente(), MercatoState) and hasattr(self.game.stato_corrente(), 'fase'):
-                fase_mercato = self.game.stato_corrente().fase
-                if fase_mercato in ["vendi_oggetto_lista", "vendi_oggetto_conferma", "compra_pozione"]:
-                    self.io_buffer.mostra_messaggio("Non puoi salvare durante una transazione al mercato.")
-                    return False
-            
-            # Ottieni stato completo
-            stato_corrente = self.get_stato_attuale()
-            
-            # Ottieni informazioni sulle mappe se disponibili
-            mappe_data = {}
-            if hasattr(self.game, 'gestore_mappe') and hasattr(self.game.gestore_mappe, 'mappe'):
-                for nome_mappa, mappa in self.game.gestore_mappe.mappe.items():
-                    if hasattr(mappa, 'to_dict'):
-                        mappe_data[nome_mappa] = mappa.to_dict()
-            
-            # Aggiungi informazioni sulle mappe allo stato
-            stato_corrente['mappe'] = mappe_data
             
             # Delega al Game per salvare su file
             risultato = self.game.salva(file_path)
@@ -245,7 +347,31 @@ class StatoGioco:
         Returns:
             True se il caricamento è riuscito, False altrimenti
         """
-        return self.game.carica(file_path)
+        risultato = self.game.carica(file_path)
+        if risultato:
+            # Il caricamento non passa dal giornale dei comandi, che riparte dallo stato
+            # caricato: i comandi precedenti non possono più essere annullati
+            if getattr(self.game, "cronologia", None) is not None:
+                self.game.cronologia.svuota()
+            if getattr(self, "giornale", None) is not None:
+                self.giornale.inizia(self)
+        return risultato
+    
+    def annulla(self, passi=1):
+        """
+        Annulla gli ultimi comandi della partita
+        
+        Args:
+            passi: Numero di comandi da annullare
+            
+        Returns:
+            Il numero di comandi annullati
+        """
+        with self._operazione(ANNULLA, passi):
+            annullati = self.game.annulla(passi)
+        # Consegna agli iscritti differiti gli eventi emessi ricollegando il giocatore
+        self.game.eventi.svuota()
+        return annullati
     
     def ottieni_posizione_giocatore(self):
         """
@@ -266,4 +392,8 @@ class StatoGioco:
         Returns:
             True se il movimento è avvenuto, False altrimenti
         """
-        return self.game.muovi_giocatore(direzione) 
\ No newline at end of file
+        self.game.registra_snapshot()
+        with self._operazione(MOVIMENTO, direzione):
+            risultato = self.game.muovi_giocatore(direzione)
+        self.game.eventi.svuota()
+        return risultato 
\ No newline at end of file
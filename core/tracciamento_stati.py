@@ -0,0 +1,172 @@
+"""
+Tracciamento dell'esecuzione degli stati di gioco.
+
+Game misura ogni chiamata a esegui() dello stato corrente, sia nel loop da terminale
+sia nei comandi web, e conta le transizioni push, pop e cambio di stato. Le misure
+sono aggregate nel processo per classe di stato e per valore dell'attributo "fase"
+(letto prima dell'esecuzione: è la fase che elabora l'input) ed esposte su /metriche.
+
+Un'esecuzione più lunga del budget viene registrata nel log e tra i superamenti
+recenti. Il budget vale per tutti gli stati (RPG_BUDGET_STATO_MS) e una classe di
+stato può indicarne uno proprio con l'attributo BUDGET_ESECUZIONE_MS.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("gioco_rpg")
+
+# Budget (millisecondi) di una chiamata a esegui() di uno stato
+BUDGET_STATO_MS = float(os.environ.get("RPG_BUDGET_STATO_MS", 50))
+
+# Numero di superamenti del budget conservati per /metriche
+MAX_SUPERAMENTI_RECENTI = 50
+
+# Chiave delle esecuzioni di stati privi dell'attributo fase
+SENZA_FASE = "-"
+
+# Tipi di transizione tra stati
+PUSH = "push"
+POP = "pop"
+CAMBIA = "cambia"
+
+
+class TracciatoreStati:
+    """Statistiche di esecuzione e transizioni degli stati, aggregate nel processo"""
+
+    def __init__(self, budget_ms=BUDGET_STATO_MS):
+        """
+        Args:
+            budget_ms (float, optional): Budget predefinito di una chiamata a esegui()
+        """
+        self.budget_ms = budget_ms
+        self._lock = threading.Lock()
+        # {(classe, fase): [chiamate, totale_s, massimo_s, oltre_budget]}
+        self._esecuzioni = {}
+        # {classe: {tipo di transizione: numero}}
+        self._transizioni = {}
+        self._superamenti = deque(maxlen=MAX_SUPERAMENTI_RECENTI)
+
+    def esegui(self, stato, gioco):
+        """
+        Esegue uno stato misurandone la durata.
+
+        Args:
+            stato (BaseState): Lo stato da eseguire
+            gioco (Game): La partita
+
+        Returns:
+            Il valore restituito da stato.esegui
+        """
+        classe = type(stato).__name__
+        fase = getattr(stato, "fase", SENZA_FASE)
+        inizio = time.perf_counter()
+        try:
+            return stato.esegui(gioco)
+        finally:
+            durata = time.perf_counter() - inizio
+            self._registra(classe, fase, durata, getattr(stato, "BUDGET_ESECUZIONE_MS", None))
+
+    def _registra(self, classe, fase, durata, budget_ms=None):
+        """Aggiunge una misura alle statistiche e controlla il budget"""
+        chiave = (classe, fase if isinstance(fase, (str, int)) else str(fase))
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        oltre = durata * 1000 > budget_ms
+        with self._lock:
+            voce = self._esecuzioni.get(chiave)
+            if voce is None:
+                voce = self._esecuzioni[chiave] = [0, 0.0, 0.0, 0]
+            voce[0] += 1
+            voce[1] += durata
+            if durata > voce[2]:
+                voce[2] = durata
+            if oltre:
+                voce[3] += 1
+                self._superamenti.append({
+                    "stato": classe,
+                    "fase": chiave[1],
+                    "durata_ms": round(durata * 1000, 3),
+                    "budget_ms": budget_ms,
+                    "timestamp": time.time()
+                })
+        if oltre:
+            logger.warning(f"{classe} (fase {chiave[1]}) ha impiegato {durata * 1000:.1f} ms, budget {budget_ms:.0f} ms")
+
+    def transizione(self, tipo, stato):
+        """
+        Conta una transizione di stato.
+
+        Args:
+            tipo (str): PUSH, POP o CAMBIA
+            stato: Lo stato che entra (PUSH, CAMBIA) o che esce (POP)
+        """
+        classe = type(stato).__name__
+        with self._lock:
+            conteggi = self._transizioni.setdefault(classe, {})
+            conteggi[tipo] = conteggi.get(tipo, 0) + 1
+
+    def metriche(self):
+        """
+        Restituisce le statistiche aggregate.
+
+        Returns:
+            dict: Budget, statistiche per stato e per fase (chiamate, tempo totale, medio e
+                  massimo in ms, chiamate oltre il budget), transizioni e superamenti recenti
+        """
+        with self._lock:
+            esecuzioni = {chiave: list(voce) for chiave, voce in self._esecuzioni.items()}
+            transizioni = {classe: dict(conteggi) for classe, conteggi in self._transizioni.items()}
+            superamenti = list(self._superamenti)
+
+        stati = {}
+        for (classe, fase), (chiamate, totale, massimo, oltre_budget) in esecuzioni.items():
+            voce_stato = stati.setdefault(classe, {
+                "chiamate": 0, "totale_ms": 0.0, "massimo_ms": 0.0, "oltre_budget": 0, "fasi": {}
+            })
+            voce_stato["fasi"][str(fase)] = {
+                "chiamate": chiamate,
+                "totale_ms": round(totale * 1000, 3),
+                "medio_ms": round(totale * 1000 / chiamate, 3),
+                "massimo_ms": round(massimo * 1000, 3),
+                "oltre_budget": oltre_budget
+            }
+            voce_stato["chiamate"] += chiamate
+            voce_stato["totale_ms"] += totale * 1000
+            voce_stato["massimo_ms"] = max(voce_stato["massimo_ms"], round(massimo * 1000, 3))
+            voce_stato["oltre_budget"] += oltre_budget
+        for classe, voce_stato in stati.items():
+            voce_stato["totale_ms"] = round(voce_stato["totale_ms"], 3)
+            voce_stato["transizioni"] = transizioni.get(classe, {})
+        for classe, conteggi in transizioni.items():
+            if classe not in stati:
+                stati[classe] = {"chiamate": 0, "totale_ms": 0.0, "massimo_ms": 0.0, "oltre_budget": 0,
+                                 "fasi": {}, "transizioni": conteggi}
+
+        return {
+            "budget_ms": self.budget_ms,
+            "stati": stati,
+            "superamenti_recenti": superamenti
+        }
+
+    def azzera(self):
+        """Azzera tutte le statistiche"""
+        with self._lock:
+            self._esecuzioni.clear()
+            self._transizioni.clear()
+            self._superamenti.clear()
+
+
+# Istanza condivisa del tracciatore
+tracciatore_stati = TracciatoreStati()
+
+
+def get_tracciatore_stati():
+    """
+    Ottieni l'istanza del tracciatore degli stati.
+
+    Returns:
+        TracciatoreStati: L'istanza condivisa
+    """
+    return tracciatore_stati
@@ -1,5 +1,6 @@
-import random
+from util.casualita import rng
 from core.io_interface import TerminalIO
+from core.eventi_gioco import DANNO_SUBITO, OGGETTO_OTTENUTO, ORO_GUADAGNATO
 
 # Mappa delle abilità associate alle caratteristiche (D&D 5e style)
 ABILITA_ASSOCIATE = {
@@ -22,12 +23,16 @@ ABILITA_ASSOCIATE = {
     "medicina": "saggezza"
 }
 
+# Caratteristiche delle entità: ciascuna ha un valore base e un modificatore corrente
+# (modificatore_<caratteristica>), che include gli effetti dell'equipaggiamento
+CARATTERISTICHE = ("forza", "destrezza", "costituzione", "intelligenza", "saggezza", "carisma")
+
 class Dado:
     def __init__(self, facce):
         self.facce = facce
 
     def tira(self):
-        return random.randint(1, self.facce)
+        return rng().randint(1, self.facce)
 
 class Entita:
     def __init__(self, nome, hp=10, hp_max=10, forza_base=10, difesa=0, destrezza_base=10, costituzione_base=10, intelligenza_base=10, saggezza_base=10, carisma_base=10, token="E"):
@@ -73,6 +78,8 @@ class Entita:
         
         # Contesto di gioco
         self.gioco = None
+        # Bus degli eventi di gioco (impostato da Game.collega_eventi per il giocatore)
+        self.eventi = None
         
     def set_game_context(self, gioco):
         """
@@ -98,9 +105,18 @@ class Entita:
         
         if game_ctx:
             game_ctx.io.mostra_messaggio(f"{self.nome} subisce {danno_effettivo} danni!")
+        
+        self._emetti_evento(game_ctx, DANNO_SUBITO, entita=self.nome, danno=danno_effettivo,
+                            hp=self.hp, sconfitto=self.hp == 0)
             
         return self.hp > 0
         
+    def _emetti_evento(self, game_ctx, tipo, **dati):
+        """Emette un evento sul bus del gioco, se l'entità ne conosce uno"""
+        eventi = getattr(game_ctx, "eventi", None) or getattr(self, "eventi", None)
+        if eventi is not None:
+            eventi.emetti(tipo, **dati)
+        
     def attacca(self, bersaglio, gioco=None):
         """Metodo unificato per attaccare"""
         # Usa il contesto di gioco memorizzato se non viene fornito
@@ -139,12 +155,15 @@ class Entita:
                     # Crea un oggetto corrispondente
                     oggetto = Oggetto.from_dict(pozione)
                     self.inventario.append(oggetto)
+                    self._emetti_evento(self.gioco, OGGETTO_OTTENUTO, entita=self.nome, oggetto=oggetto.nome)
                     return
                     
             # Se non trova corrispondenze, aggiungi come stringa
             self.inventario.append(item)
+            self._emetti_evento(self.gioco, OGGETTO_OTTENUTO, entita=self.nome, oggetto=item)
         else:
             self.inventario.append(item)
+            self._emetti_evento(self.gioco, OGGETTO_OTTENUTO, entita=self.nome, oggetto=getattr(item, "nome", str(item)))
         
     def rimuovi_item(self, nome_item):
         """Rimuove un item dall'inventario"""
@@ -172,6 +191,8 @@ class Entita:
         if game_ctx:
             game_ctx.io.mostra_messaggio(f"{self.nome} ha ricevuto {quantita} monete d'oro! (Totale: {self.oro})")
         
+        self._emetti_evento(game_ctx, ORO_GUADAGNATO, entita=self.nome, quantita=quantita, totale=self.oro)
+        
     def guadagna_esperienza(self, quantita, gioco=None):
         """Aggiunge esperienza e verifica se è possibile salire di livello"""
         # Usa il contesto di gioco memorizzato se non viene fornito
@@ -198,10 +219,9 @@ class Entita:
         self.hp = self.hp_max  # Cura completamente quando sale di livello
         
         # Incrementa un valore base a caso
-        import random
         caratteristiche = ["forza_base", "destrezza_base", "costituzione_base", 
                           "intelligenza_base", "saggezza_base", "carisma_base"]
-        caratteristica_da_aumentare = random.choice(caratteristiche)
+        caratteristica_da_aumentare = rng().choice(caratteristiche)
         
         setattr(self, caratteristica_da_aumentare, getattr(self, caratteristica_da_aumentare) + 1)
         # Ricalcola il modificatore corrispondente
@@ -402,6 +422,9 @@ class Entita:
             "intelligenza_base": self.intelligenza_base,
             "saggezza_base": self.saggezza_base,
             "carisma_base": self.carisma_base,
+            # I modificatori non si ricavano dai valori base: includono gli effetti dell'equipaggiamento
+            "modificatori": {caratteristica: getattr(self, f"modificatore_{caratteristica}")
+                             for caratteristica in CARATTERISTICHE},
             "x": self.x,
             "y": self.y,
             "mappa_corrente": self.mappa_corrente,
@@ -466,6 +489,9 @@ class Entita:
         entita.oro = data.get("oro", 0)
         entita.esperienza = data.get("esperienza", 0)
         entita.livello = data.get("livello", 1)
+        for caratteristica, valore in data.get("modificatori", {}).items():
+            if caratteristica in CARATTERISTICHE:
+                setattr(entita, f"modificatore_{caratteristica}", valore)
         
         # Gli oggetti complessi (inventario, arma, armatura, accessori) 
         # verranno gestiti nelle classi derivate
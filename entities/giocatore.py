@@ -1,7 +1,8 @@
 import json
 import os
 from items.oggetto import Oggetto
-from entities.entita import Entita, ABILITA_ASSOCIATE
+from entities.entita import Entita, ABILITA_ASSOCIATE, CARATTERISTICHE
+from core.achievements import ProgressoAchievement
 
 class Giocatore(Entita):
     def __init__(self, nome, classe):
@@ -37,6 +38,9 @@ class Giocatore(Entita):
         self.missioni_attive = []
         self.missioni_completate = []
         
+        # Contatori e achievement sbloccati (aggiornati da core.achievements)
+        self.progresso_achievement = ProgressoAchievement()
+        
         # Inizializza competenze in abilità specifiche per classe
         self._inizializza_competenze()
         
@@ -365,7 +369,8 @@ class Giocatore(Entita):
             "missioni_completate": self.missioni_completate,
             "posizione": [self.x, self.y],  # Per compatibilità
             "mana": getattr(self, "mana", 0),
-            "mana_max": getattr(self, "mana_max", 0)
+            "mana_max": getattr(self, "mana_max", 0),
+            "achievements": self.progresso_achievement.to_dict()
         })
         
         return data
@@ -431,6 +436,7 @@ class Giocatore(Entita):
         giocatore.progresso_missioni = data.get("progresso_missioni", {})
         giocatore.missioni_attive = data.get("missioni_attive", [])
         giocatore.missioni_completate = data.get("missioni_completate", [])
+        giocatore.progresso_achievement = ProgressoAchievement.from_dict(data.get("achievements"))
         
         # Caricamento dell'inventario e dell'equipaggiamento richiede oggetti
         # Questo è fatto esternamente o in modo più complesso
@@ -475,4 +481,43 @@ class Giocatore(Entita):
                 
         giocatore.accessori = accessori
         
+        # L'equipaggiamento indossato è tra gli oggetti dell'inventario: ricollega le istanze
+        # così che rimuoverlo o scambiarlo agisca sull'oggetto dell'inventario
+        giocatore._ricollega_equipaggiamento()
+        
+        # Modificatori correnti: includono gli effetti dell'equipaggiamento indossato
+        if "modificatori" in data:
+            for caratteristica, valore in data["modificatori"].items():
+                if caratteristica in CARATTERISTICHE:
+                    setattr(giocatore, f"modificatore_{caratteristica}", valore)
+        else:
+            # Dati salvati prima dei modificatori: riapplica gli effetti sulle caratteristiche
+            # come fa Oggetto.equipaggia (la difesa salvata include già arma e armatura)
+            effetti = [{"forza": giocatore.arma.effetto.get("forza", 0)}] if giocatore.arma else []
+            effetti.extend(acc.effetto for acc in giocatore.accessori)
+            for effetto in effetti:
+                for stat, valore in effetto.items():
+                    if stat in CARATTERISTICHE:
+                        setattr(giocatore, stat, getattr(giocatore, stat) + valore)
+        
+        giocatore.mana = data.get("mana", giocatore.mana)
+        giocatore.mana_max = data.get("mana_max", giocatore.mana_max)
+        
         return giocatore
+
+    def _ricollega_equipaggiamento(self):
+        """Sostituisce arma, armatura e accessori con gli oggetti uguali dell'inventario"""
+        disponibili = list(self.inventario)
+
+        def oggetto_inventario(oggetto):
+            for candidato in disponibili:
+                if candidato.to_dict() == oggetto.to_dict():
+                    disponibili.remove(candidato)
+                    return candidato
+            return oggetto
+
+        if self.arma:
+            self.arma = oggetto_inventario(self.arma)
+        if self.armatura:
+            self.armatura = oggetto_inventario(self.armatura)
+        self.accessori = [oggetto_inventario(acc) for acc in self.accessori]
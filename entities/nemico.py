@@ -1,6 +1,6 @@
 import json
 import os
-import random
+from util.casualita import rng
 from entities.entita import Entita
 
 class Nemico(Entita):
@@ -98,7 +98,7 @@ class Nemico(Entita):
                 
                 # Scegli un mostro casuale
                 if mostri_filtrati:
-                    tipo_mostro = random.choice(list(mostri_filtrati.keys()))
+                    tipo_mostro = rng().choice(list(mostri_filtrati.keys()))
                     return cls(nome="", tipo_mostro=tipo_mostro)
                 else:
                     # Se non ci sono mostri nel JSON, crea un nemico generico
@@ -1,6 +1,6 @@
 from entities.giocatore import Giocatore
 from items.oggetto import Oggetto
-from entities.entita import Entita, ABILITA_ASSOCIATE
+from entities.entita import Entita, ABILITA_ASSOCIATE, CARATTERISTICHE
 from util.data_manager import get_data_manager
 
 class NPG(Entita):
@@ -130,7 +130,8 @@ class NPG(Entita):
                     else:
                         # Formato non riconosciuto, ignora
                         continue
-                conv_data["opzioni"] = options
+                # Copia: i dati della conversazione sono condivisi dalla cache del data manager
+                conv_data = dict(conv_data, opzioni=options)
             
             return conv_data
         
@@ -244,6 +245,14 @@ class NPG(Entita):
         npg.modificatore_intelligenza = npg.calcola_modificatore(npg.intelligenza_base)
         npg.modificatore_saggezza = npg.calcola_modificatore(npg.saggezza_base)
         npg.modificatore_carisma = npg.calcola_modificatore(npg.carisma_base)
+        for caratteristica, valore in data.get("modificatori", {}).items():
+            if caratteristica in CARATTERISTICHE:
+                setattr(npg, f"modificatore_{caratteristica}", valore)
+        
+        # L'inventario cambia con gli scambi: quello dei dati JSON vale solo come predefinito
+        if "inventario" in data:
+            npg.inventario = [Oggetto.from_dict(item) if isinstance(item, dict) else item
+                              for item in data["inventario"]]
         
         # Imposta attributi specifici
         npg.stato_corrente = data.get("stato_corrente", "default")
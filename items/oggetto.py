@@ -1,3 +1,5 @@
+from core.eventi_gioco import OGGETTO_EQUIPAGGIATO
+
 class Oggetto:
     def __init__(self, nome, tipo, effetto=None, valore=0, descrizione=""):
         self.nome = nome
@@ -72,6 +74,11 @@ class Oggetto:
                     setattr(giocatore, stat, getattr(giocatore, stat) + valore)
             if gioco:
                 gioco.io.mostra_messaggio(f"Hai equipaggiato {self.nome} come accessorio.")
+        else:
+            return
+        
+        giocatore._emetti_evento(gioco, OGGETTO_EQUIPAGGIATO, oggetto=self.nome, categoria=self.tipo,
+                                 rarita=getattr(self, "rarita", None))
 
     def rimuovi(self, giocatore, gioco=None):
         # Versione silenziosa se non viene fornito gioco
@@ -1,5 +1,6 @@
 from util.dado import Dado
 from util.data_manager import get_data_manager
+from core.eventi_gioco import STATO_OGGETTO_CAMBIATO
 
 class OggettoInterattivo:
     def __init__(self, nome, descrizione="", stato="chiuso", contenuto=None, posizione=None, token="O"):
@@ -136,6 +137,10 @@ class OggettoInterattivo:
                 else:
                     gioco.io.mostra_messaggio(f"{self.nome} è ora {nuovo_stato}.")
             
+            eventi_gioco = getattr(gioco, "eventi", None)
+            if eventi_gioco is not None:
+                eventi_gioco.emetti(STATO_OGGETTO_CAMBIATO, oggetto=self.nome, da=vecchio_stato, a=nuovo_stato)
+            
             # Attiva eventi nel mondo
             if gioco and nuovo_stato in self.eventi:
                 for evento in self.eventi[nuovo_stato]:
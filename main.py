@@ -1,14 +1,7 @@
 from entities.giocatore import Giocatore
-from states.combattimento import CombattimentoState
-from states.menu import MenuState
 from core.game import Game
-from states.taverna import TavernaState
-from states.scelta_mappa_state import SceltaMappaState
+from states.registro_stati import classe_stato
 from util.funzioni_utili import avanti
-from items.oggetto import Oggetto
-from entities.entita import Entita
-from world.mappa import Mappa
-from world.gestore_mappe import GestitoreMappe
 from core.io_interface import TerminalIO
 import json
 import os
@@ -55,15 +48,17 @@ def main():
     # Crea un oggetto per l'I/O che verrà utilizzato per tutta l'applicazione
     io_handler = TerminalIO()
     
-    # Creazione oggetto temporaneo gioco per i messaggi iniziali
-    gioco_temp = Game(None, None, io_handler, e_temporaneo=True)
-    
-    gioco_temp.io.mostra_messaggio("Benvenuto avventuriero!")
+    # Il menu iniziale usa direttamente l'I/O: il gioco e gli stati vengono
+    # creati solo dopo la scelta, così l'avvio resta immediato
+    io_handler.mostra_messaggio("Benvenuto avventuriero!")
     
     # Mostra menu iniziale
-    gioco_temp.io.mostra_messaggio("1. Nuova Partita")
-    gioco_temp.io.mostra_messaggio("2. Carica Partita")
-    scelta = gioco_temp.io.richiedi_input("> ")
+    io_handler.mostra_messaggio("1. Nuova Partita")
+    io_handler.mostra_messaggio("2. Carica Partita")
+    scelta = io_handler.richiedi_input("> ")
+    
+    # Lo stato di partenza viene importato dal registro degli stati
+    SceltaMappaState = classe_stato("SceltaMappaState")
 
     if scelta == "2":
         # Crea un gioco temporaneo solo per il caricamento, passando l'io_handler
@@ -96,8 +91,8 @@ def main():
                 gioco.giocatore.set_game_context(gioco)
     else:
         # Chiedi input iniziale
-        nome = gioco_temp.io.richiedi_input("Come ti chiami? ")
-        classe = richiedi_classe(gioco_temp.io)
+        nome = io_handler.richiedi_input("Come ti chiami? ")
+        classe = richiedi_classe(io_handler)
         giocatore = Giocatore(nome, classe)
         
         # Crea il gioco con il giocatore
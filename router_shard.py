@@ -0,0 +1,453 @@
+"""
+Router locale per il deployment a shard del server di gioco.
+
+Avvia più processi server.py (shard), ciascuno responsabile di un sottoinsieme
+di sessioni assegnate tramite hashing coerente di id_sessione, e inoltra loro
+le richieste HTTP. Tutti gli shard condividono SESSIONS_DIR su disco: quando la
+topologia cambia (shard aggiunto o drenato) i vecchi proprietari rilasciano le
+sessioni che cambiano proprietario, che vengono ricaricate dal disco dal nuovo shard.
+
+La verifica locale di affinità e ribilanciamento è in util/verifica_shard.py.
+
+Avvio:
+    python router_shard.py --shard 3 --porta 8080
+
+Amministrazione:
+    GET  /router/stato                  Shard attivi e richieste in corso
+    POST /router/aggiungi               Avvia un nuovo shard, lo inserisce nell'anello e fa
+                                        rilasciare agli altri shard le sessioni spostate
+    POST /router/drena {"shard": "..."} Toglie uno shard dall'anello, ne attende le
+                                        richieste in corso, gli fa rilasciare le
+                                        sessioni e lo arresta
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import urlsplit, parse_qs
+from uuid import uuid4
+
+from util.hash_coerente import AnelloHashCoerente
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("gioco_rpg.router")
+
+# Deve coincidere con HEADER_ID_SESSIONE_ROUTER in server.py
+HEADER_ID_SESSIONE_ROUTER = "X-RPG-Id-Sessione"
+
+# Rotte a lunga durata che non contano come richieste in corso durante un drenaggio
+ROTTE_STREAMING = {"/eventi"}
+
+# Header hop-by-hop da non inoltrare (RFC 7230, sezione 6.1)
+HEADER_HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade"
+}
+
+# Secondi massimi di attesa per le richieste in corso durante un cambio di topologia
+TIMEOUT_CAMBIO_TOPOLOGIA = 30
+
+
+class Shard:
+    """Un processo server.py avviato e gestito dal router"""
+
+    def __init__(self, id_shard, host, porta, processo=None):
+        self.id_shard = id_shard
+        self.host = host
+        self.porta = porta
+        self.processo = processo
+
+    def avvia(self, python=sys.executable):
+        """Avvia il processo dello shard"""
+        env = dict(os.environ)
+        env["RPG_SHARD_ID"] = self.id_shard
+        env["RPG_PORTA"] = str(self.porta)
+        cartella = os.path.dirname(os.path.abspath(__file__))
+        self.processo = subprocess.Popen([python, "server.py"], cwd=cartella, env=env)
+
+    def attendi_pronto(self, timeout=30):
+        """
+        Attende che lo shard risponda su /shard/info.
+
+        Returns:
+            bool: True se lo shard è pronto entro il timeout
+        """
+        scadenza = time.time() + timeout
+        while time.time() < scadenza:
+            if self.processo is not None and self.processo.poll() is not None:
+                return False
+            try:
+                stato, _ = self.richiesta("GET", "/shard/info")
+                if stato == 200:
+                    return True
+            except OSError:
+                pass
+            time.sleep(0.2)
+        return False
+
+    def richiesta(self, metodo, percorso, dati=None, timeout=10):
+        """
+        Esegue una richiesta JSON verso lo shard.
+
+        Returns:
+            tuple: (codice di stato, corpo decodificato)
+        """
+        connessione = http.client.HTTPConnection(self.host, self.porta, timeout=timeout)
+        try:
+            corpo = json.dumps(dati).encode("utf-8") if dati is not None else None
+            headers = {"Content-Type": "application/json"} if corpo is not None else {}
+            connessione.request(metodo, percorso, body=corpo, headers=headers)
+            risposta = connessione.getresponse()
+            contenuto = risposta.read()
+            try:
+                return risposta.status, json.loads(contenuto or b"null")
+            except ValueError:
+                return risposta.status, None
+        finally:
+            connessione.close()
+
+    def arresta(self, timeout=10):
+        """Arresta il processo dello shard"""
+        if self.processo is None or self.processo.poll() is not None:
+            return
+        self.processo.terminate()
+        try:
+            self.processo.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.processo.kill()
+
+
+class RouterShard:
+    """
+    Instrada le richieste verso gli shard tramite hashing coerente di id_sessione.
+    Durante un cambio di topologia le nuove richieste vengono trattenute finché
+    quelle in corso non sono terminate, così una sessione non viene mai servita
+    da due shard contemporaneamente.
+    """
+
+    def __init__(self, host_shard="127.0.0.1", porta_base=5001, python=sys.executable):
+        self.host_shard = host_shard
+        self.python = python
+        self.anello = AnelloHashCoerente()
+        self.shard = {}  # id_shard -> Shard
+        self._porte = count(porta_base)
+        self._numeratore = count(1)
+        self._turno = count()
+        self._condizione = threading.Condition()
+        self._in_corso = {}  # id_shard -> richieste non streaming in corso
+        self._cambio_in_corso = False
+
+    # --- Topologia -------------------------------------------------------
+
+    def _attendi_quiete(self):
+        """Blocca le nuove richieste e attende che quelle in corso terminino (da chiamare con la condizione acquisita)"""
+        while self._cambio_in_corso:
+            self._condizione.wait()
+        self._cambio_in_corso = True
+        if not self._condizione.wait_for(lambda: sum(self._in_corso.values()) == 0,
+                                         timeout=TIMEOUT_CAMBIO_TOPOLOGIA):
+            logger.warning("Timeout in attesa delle richieste in corso: cambio di topologia forzato")
+
+    def _fine_cambio(self):
+        """Sblocca le richieste trattenute (da chiamare con la condizione acquisita)"""
+        self._cambio_in_corso = False
+        self._condizione.notify_all()
+
+    def aggiungi_shard(self):
+        """
+        Avvia un nuovo shard e lo inserisce nell'anello.
+
+        Returns:
+            Shard: Lo shard avviato, o None se non è partito
+        """
+        id_shard = f"shard-{next(self._numeratore)}"
+        shard = Shard(id_shard, self.host_shard, next(self._porte))
+        shard.avvia(self.python)
+        if not shard.attendi_pronto():
+            logger.error(f"Lo shard {id_shard} non è partito")
+            shard.arresta()
+            return None
+
+        with self._condizione:
+            self._attendi_quiete()
+            try:
+                self.shard[id_shard] = shard
+                self._in_corso[id_shard] = 0
+                self.anello.aggiungi_nodo(id_shard)
+                # Prima di sbloccare le richieste: una copia in memoria rimasta sul vecchio
+                # proprietario non deve più essere servita se la sessione vi tornasse
+                rilasciate = self._rilascia_spostate()
+            finally:
+                self._fine_cambio()
+        logger.info(f"Shard {id_shard} aggiunto sulla porta {shard.porta} ({rilasciate} sessioni spostate)")
+        return shard
+
+    def _rilascia_spostate(self):
+        """
+        Fa rilasciare a ogni shard le sessioni in memoria che l'anello assegna ora a un
+        altro shard (da chiamare durante un cambio di topologia).
+
+        Returns:
+            int: Numero di sessioni rilasciate
+        """
+        rilasciate = 0
+        for shard in list(self.shard.values()):
+            if shard.id_shard not in self.anello.nodi:
+                continue
+            try:
+                _, risposta = shard.richiesta("GET", "/shard/sessioni")
+                spostate = [id_sessione for id_sessione in (risposta or {}).get("sessioni", [])
+                            if self.anello.nodo_per(id_sessione) != shard.id_shard]
+                if spostate:
+                    _, risposta = shard.richiesta("POST", "/shard/rilascia", {"id_sessioni": spostate})
+                    rilasciate += (risposta or {}).get("rilasciate", 0)
+            except OSError as e:
+                logger.error(f"Errore durante il rilascio delle sessioni spostate da {shard.id_shard}: {e}")
+        return rilasciate
+
+    def drena_shard(self, id_shard, arresta=True):
+        """
+        Toglie uno shard dall'anello e gli fa rilasciare le sessioni.
+
+        Returns:
+            tuple: (successo, messaggio)
+        """
+        with self._condizione:
+            if id_shard not in self.anello.nodi:
+                return False, f"Shard {id_shard} non presente nell'anello"
+            if len(self.anello) == 1:
+                return False, "Impossibile drenare l'ultimo shard"
+            self._attendi_quiete()
+            try:
+                self.anello.rimuovi_nodo(id_shard)
+            finally:
+                self._fine_cambio()
+
+        shard = self.shard[id_shard]
+        try:
+            _, risposta = shard.richiesta("POST", "/shard/rilascia", {})
+            rilasciate = (risposta or {}).get("rilasciate", 0)
+        except OSError as e:
+            logger.error(f"Errore durante il rilascio delle sessioni di {id_shard}: {e}")
+            rilasciate = 0
+
+        if arresta:
+            # Chiude anche eventuali flussi SSE: i client si riconnettono al nuovo shard
+            shard.arresta()
+            with self._condizione:
+                self.shard.pop(id_shard, None)
+                self._in_corso.pop(id_shard, None)
+        logger.info(f"Shard {id_shard} drenato ({rilasciate} sessioni rilasciate)")
+        return True, f"Shard {id_shard} drenato ({rilasciate} sessioni rilasciate)"
+
+    def arresta_tutti(self):
+        """Arresta tutti gli shard"""
+        for shard in list(self.shard.values()):
+            shard.arresta()
+
+    def stato(self):
+        """Restituisce una fotografia della topologia corrente"""
+        with self._condizione:
+            return {
+                "shard": [
+                    {
+                        "id": s.id_shard,
+                        "porta": s.porta,
+                        "nell_anello": s.id_shard in self.anello.nodi,
+                        "richieste_in_corso": self._in_corso.get(s.id_shard, 0)
+                    }
+                    for s in self.shard.values()
+                ]
+            }
+
+    # --- Instradamento ---------------------------------------------------
+
+    def scegli_shard(self, id_sessione):
+        """
+        Sceglie lo shard per una richiesta.
+
+        Args:
+            id_sessione (str): ID della sessione, None per le richieste senza sessione
+
+        Returns:
+            Shard: Lo shard responsabile
+        """
+        if id_sessione:
+            return self.shard[self.anello.nodo_per(id_sessione)]
+        # Richieste senza sessione: distribuzione a turno
+        nodi = sorted(self.anello.nodi)
+        return self.shard[nodi[next(self._turno) % len(nodi)]]
+
+    def inizia_richiesta(self, id_sessione, streaming=False):
+        """
+        Registra l'inizio di una richiesta e restituisce lo shard scelto.
+        Attende se è in corso un cambio di topologia.
+        """
+        with self._condizione:
+            while self._cambio_in_corso:
+                self._condizione.wait()
+            shard = self.scegli_shard(id_sessione)
+            if not streaming:
+                self._in_corso[shard.id_shard] += 1
+            return shard
+
+    def fine_richiesta(self, shard, streaming=False):
+        """Registra la fine di una richiesta"""
+        if streaming:
+            return
+        with self._condizione:
+            if shard.id_shard in self._in_corso:
+                self._in_corso[shard.id_shard] -= 1
+            self._condizione.notify_all()
+
+
+def estrai_id_sessione(query, corpo, content_type):
+    """
+    Estrae id_sessione dalla query string o dal corpo JSON della richiesta.
+
+    Returns:
+        str: L'ID sessione o None
+    """
+    valori = parse_qs(query).get("id_sessione")
+    if valori:
+        return valori[0]
+    if corpo and content_type and "json" in content_type:
+        try:
+            dati = json.loads(corpo)
+        except ValueError:
+            return None
+        if isinstance(dati, dict) and isinstance(dati.get("id_sessione"), str):
+            return dati["id_sessione"]
+    return None
+
+
+def crea_handler(router):
+    """Crea la classe di handler HTTP legata al router"""
+
+    class HandlerRouter(BaseHTTPRequestHandler):
+        def log_message(self, formato, *args):
+            logger.debug(formato % args)
+
+        def _rispondi_json(self, stato, dati):
+            corpo = json.dumps(dati, ensure_ascii=False).encode("utf-8")
+            self.send_response(stato)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _gestisci_amministrazione(self, percorso, corpo):
+            if percorso == "/router/stato" and self.command == "GET":
+                self._rispondi_json(200, router.stato())
+            elif percorso == "/router/aggiungi" and self.command == "POST":
+                shard = router.aggiungi_shard()
+                if shard is None:
+                    self._rispondi_json(500, {"errore": "Avvio dello shard non riuscito"})
+                else:
+                    self._rispondi_json(200, {"shard": shard.id_shard, "porta": shard.porta})
+            elif percorso == "/router/drena" and self.command == "POST":
+                try:
+                    dati = json.loads(corpo or b"{}")
+                except ValueError:
+                    dati = {}
+                id_shard = dati.get("shard")
+                if not id_shard:
+                    self._rispondi_json(400, {"errore": "Shard non specificato"})
+                    return
+                successo, messaggio = router.drena_shard(id_shard, dati.get("arresta", True))
+                self._rispondi_json(200 if successo else 400, {"messaggio" if successo else "errore": messaggio})
+            else:
+                self._rispondi_json(404, {"errore": "Comando del router non valido"})
+
+        def _inoltra(self):
+            parti = urlsplit(self.path)
+            lunghezza = int(self.headers.get("Content-Length") or 0)
+            corpo = self.rfile.read(lunghezza) if lunghezza else b""
+
+            if parti.path.startswith("/router/"):
+                self._gestisci_amministrazione(parti.path, corpo)
+                return
+
+            headers = {k: v for k, v in self.headers.items() if k.lower() not in HEADER_HOP_BY_HOP}
+            headers.pop(HEADER_ID_SESSIONE_ROUTER, None)
+            id_sessione = estrai_id_sessione(parti.query, corpo, self.headers.get("Content-Type"))
+            if parti.path == "/inizia" and self.command == "POST":
+                # Il router sceglie l'ID della nuova sessione: nasce già sullo shard corretto
+                id_sessione = str(uuid4())
+                headers[HEADER_ID_SESSIONE_ROUTER] = id_sessione
+
+            streaming = parti.path in ROTTE_STREAMING
+            shard = router.inizia_richiesta(id_sessione, streaming)
+            try:
+                connessione = http.client.HTTPConnection(shard.host, shard.porta, timeout=None if streaming else 120)
+                try:
+                    connessione.request(self.command, self.path, body=corpo or None, headers=headers)
+                    risposta = connessione.getresponse()
+                    self.send_response(risposta.status)
+                    for nome, valore in risposta.getheaders():
+                        if nome.lower() not in HEADER_HOP_BY_HOP:
+                            self.send_header(nome, valore)
+                    self.send_header("X-RPG-Shard", shard.id_shard)
+                    self.end_headers()
+                    # Copia il corpo man mano che arriva (necessario per i flussi SSE)
+                    while True:
+                        blocco = risposta.read1(65536)
+                        if not blocco:
+                            break
+                        self.wfile.write(blocco)
+                        self.wfile.flush()
+                finally:
+                    connessione.close()
+            except (OSError, http.client.HTTPException) as e:
+                logger.error(f"Errore nell'inoltro a {shard.id_shard}: {e}")
+                try:
+                    self._rispondi_json(502, {"errore": f"Shard {shard.id_shard} non raggiungibile"})
+                except OSError:
+                    pass
+            finally:
+                router.fine_richiesta(shard, streaming)
+
+        do_GET = _inoltra
+        do_POST = _inoltra
+        do_PUT = _inoltra
+        do_DELETE = _inoltra
+        do_OPTIONS = _inoltra
+
+    return HandlerRouter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Router per il deployment a shard del server di gioco")
+    parser.add_argument("--shard", type=int, default=2, help="Numero di shard da avviare")
+    parser.add_argument("--host", default="0.0.0.0", help="Indirizzo su cui ascolta il router")
+    parser.add_argument("--porta", type=int, default=8080, help="Porta del router")
+    parser.add_argument("--porta-base", type=int, default=5001, help="Prima porta usata dagli shard")
+    args = parser.parse_args()
+
+    router = RouterShard(porta_base=args.porta_base)
+    for _ in range(args.shard):
+        if router.aggiungi_shard() is None:
+            router.arresta_tutti()
+            sys.exit(1)
+
+    server = ThreadingHTTPServer((args.host, args.porta), crea_handler(router))
+    server.daemon_threads = True
+    logger.info(f"Router in ascolto su {args.host}:{args.porta} con {args.shard} shard")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        router.arresta_tutti()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response, stream_with_context
 from uuid import uuid4
 import os
 import pickle
@@ -6,13 +6,26 @@ import json
 import time
 import datetime
 import logging
+import threading
+import functools
 from flask_cors import CORS
 
 from core.stato_gioco import StatoGioco
+from core.flusso_eventi import GestoreFlussiEventi, formatta_evento_sse
+from core.snapshot_sessione import codifica_sessione, decodifica_sessione, e_snapshot
+from core.notifiche import CodaNotifiche
+from core.eventi_gioco import ACHIEVEMENT_SBLOCCATO, MISSIONE_COMPLETATA, MISSIONE_INIZIATA
+from core.giornale_comandi import GiornaleComandi, GIORNALE_ATTIVO
+from core.tracciamento_stati import get_tracciatore_stati
 from entities.giocatore import Giocatore
-from states.taverna import TavernaState
+from states.registro_stati import classe_stato
 from util.data_manager import get_data_manager
-from util.config import SESSIONS_DIR, SAVE_DIR, BACKUPS_DIR, get_save_path, list_save_files, delete_save_file, get_session_path
+from util.indice_salvataggi import get_indice_salvataggi, formatta_data, CAMPI_ORDINAMENTO
+from util.scrittore_salvataggi import get_scrittore_salvataggi, scrivi_file_atomico
+from util.storico_salvataggi import get_storico_salvataggi
+from util.formato_salvataggi import leggi_salvataggio, scrivi_salvataggio, rileva_formato_file
+from util.config import SESSIONS_DIR, SAVE_DIR, BACKUPS_DIR, DEFAULT_SESSION_PREFIX, get_save_path, delete_save_file, get_session_path, get_journal_path
+from util.config import SAVE_FORMATS, SAVE_FORMAT_JSON, SAVE_FORMAT_GZIP, SAVE_FORMAT_SECTIONS
 
 # Configura il logger
 logging.basicConfig(level=logging.INFO)
@@ -33,40 +46,361 @@ os.makedirs(ASSETS_DIR, exist_ok=True)
 # Dizionario per memorizzare le sessioni attive in memoria
 sessioni_attive = {}  # {uuid: StatoGioco}
 
-# Dizionario per memorizzare le notifiche di sistema
-notifiche_sistema = {}  # {uuid: [lista di notifiche]}
+# Identificativo dello shard quando il server gira dietro router_shard.py.
+# In modalità shard più processi condividono SESSIONS_DIR, quindi la copia in
+# memoria di una sessione va confrontata con il file su disco prima dell'uso.
+SHARD_ID = os.environ.get("RPG_SHARD_ID")
+HEADER_ID_SESSIONE_ROUTER = "X-RPG-Id-Sessione"
+
+# Firma (mtime_ns, dimensione) del file di sessione letto o scritto per ultimo
+firme_sessioni = {}  # {uuid: (mtime_ns, size)}
+
+
+# Lock per sessione: serializza le richieste concorrenti sulla stessa partita
+lock_sessioni = {}  # {uuid: threading.RLock}
+_lock_registro_sessioni = threading.Lock()
+
+def ottieni_lock_sessione(id_sessione):
+    """Restituisce il lock associato a una sessione, creandolo se necessario"""
+    with _lock_registro_sessioni:
+        lock = lock_sessioni.get(id_sessione)
+        if lock is None:
+            lock = threading.RLock()
+            lock_sessioni[id_sessione] = lock
+        return lock
+
+def con_lock_sessione(funzione):
+    """
+    Decoratore per le rotte che modificano una sessione: esegue la rotta
+    tenendo il lock della sessione indicata nella richiesta.
+    """
+    @functools.wraps(funzione)
+    def wrapper(*args, **kwargs):
+        dati = request.get_json(silent=True) or {}
+        id_sessione = dati.get("id_sessione") or request.args.get("id_sessione")
+        if not id_sessione:
+            # La rotta stessa restituirà l'errore di sessione mancante
+            return funzione(*args, **kwargs)
+        with ottieni_lock_sessione(id_sessione):
+            return funzione(*args, **kwargs)
+    return wrapper
+
+# Flussi SSE per sessione (vedi /eventi)
+gestore_eventi = GestoreFlussiEventi()
+
+# Secondi tra due heartbeat sul flusso SSE, per rilevare i client disconnessi
+INTERVALLO_HEARTBEAT_SSE = 15
+
+# Politica di scadenza delle sessioni (secondi, configurabile con variabili d'ambiente):
+# - una sessione non usata da TTL_SESSIONE_IN_MEMORIA viene tolta dalla memoria ("ibernata"):
+#   il suo file resta su disco e viene ricaricato alla richiesta successiva
+# - un file di sessione non modificato da TTL_FILE_SESSIONE viene archiviato o eliminato
+#   secondo POLITICA_SESSIONI_SCADUTE ("archivia" o "elimina")
+TTL_SESSIONE_IN_MEMORIA = float(os.environ.get("RPG_TTL_SESSIONE_MEMORIA", 30 * 60))
+TTL_FILE_SESSIONE = float(os.environ.get("RPG_TTL_FILE_SESSIONE", 7 * 24 * 3600))
+POLITICA_SESSIONI_SCADUTE = os.environ.get("RPG_POLITICA_SESSIONI_SCADUTE", "archivia")
+INTERVALLO_MIETITORE = float(os.environ.get("RPG_INTERVALLO_MIETITORE", 60))
+ARCHIVIO_SESSIONI_DIR = SESSIONS_DIR / "archivio"
+
+# Istante dell'ultimo uso di ogni sessione in memoria
+ultimo_accesso_sessioni = {}  # {uuid: timestamp}
+
+# Indicatori aggiornati dal mietitore delle sessioni (vedi /metriche)
+metriche_sessioni = {
+    "ibernate": 0,
+    "scadute_totali": 0,
+    "ibernate_totali": 0,
+    "strutture_liberate_totali": 0,
+    "ultimo_ciclo": None,
+    "durata_ultimo_ciclo_ms": 0.0
+}
+
+# Tipo MIME dei salvataggi esportati, per formato
+MIMETYPE_FORMATI_SALVATAGGIO = {
+    SAVE_FORMAT_JSON: "application/json",
+    SAVE_FORMAT_GZIP: "application/gzip",
+    SAVE_FORMAT_SECTIONS: "application/octet-stream"
+}
+
+def pubblica_aggiornamento(id_sessione, sessione, output=None):
+    """
+    Pubblica sul flusso SSE della sessione l'output prodotto e la nuova versione dello stato.
+    Non fa nulla se nessun client ha mai aperto il flusso per questa sessione.
+    """
+    canale = gestore_eventi.ottieni_canale(id_sessione, crea=False)
+    if canale is None:
+        return
+    
+    if output is None:
+        output = sessione.io_buffer.get_output_structured()
+    if output:
+        canale.pubblica("output", {"output": list(output)})
+    
+    stato_nome = "NessunoStato"
+    if sessione.game.stato_corrente():
+        stato_nome = type(sessione.game.stato_corrente()).__name__
+    canale.incrementa_versione({"stato_nome": stato_nome, "fine": not sessione.game.attivo})
 
 def salva_sessione(id_sessione, sessione):
-    """Salva una sessione su disco"""
+    """Salva una sessione su disco nel formato snapshot compatto"""
     percorso = get_session_path(id_sessione)
-    with open(percorso, 'wb') as f:
-        pickle.dump(sessione, f)
+    # Codifica prima di toccare il file: se fallisce resta su disco lo snapshot precedente
+    contenuto = codifica_sessione(sessione)
+    scrivi_file_atomico(percorso, lambda f: f.write(contenuto), binario=True)
+    firme_sessioni[id_sessione] = _firma_file_sessione(percorso)
+    ultimo_accesso_sessioni[id_sessione] = time.time()
 
 def carica_sessione(id_sessione):
     """Carica una sessione da disco"""
     percorso = get_session_path(id_sessione)
     if os.path.exists(percorso):
         with open(percorso, 'rb') as f:
-            return pickle.load(f)
+            contenuto = f.read()
+        if e_snapshot(contenuto):
+            sessione = decodifica_sessione(contenuto)
+        else:
+            # Sessione salvata prima dell'introduzione degli snapshot
+            sessione = pickle.loads(contenuto)
+            if not hasattr(sessione, "notifiche"):
+                sessione.notifiche = CodaNotifiche()
+            sessione.game.collega_eventi()
+        firme_sessioni[id_sessione] = _firma_file_sessione(percorso)
+        return sessione
     return None
 
-def aggiungi_notifica(id_sessione, tipo, messaggio, data=None):
-    """Aggiunge una notifica al sistema"""
-    if id_sessione not in notifiche_sistema:
-        notifiche_sistema[id_sessione] = []
-    
-    notifica = {
-        "id": str(uuid4()),
-        "tipo": tipo,  # "info", "warning", "achievement", "quest", "combat", ecc.
-        "messaggio": messaggio,
-        "data": data or {},
-        "timestamp": time.time(),
-        "letta": False
-    }
+def _firma_file_sessione(percorso):
+    """Restituisce (mtime_ns, dimensione) del file di sessione, None se non esiste"""
+    try:
+        info = os.stat(percorso)
+        return (info.st_mtime_ns, info.st_size)
+    except OSError:
+        return None
+
+def ottieni_sessione(id_sessione):
+    """
+    Restituisce una sessione dalla memoria o, se assente, dal disco.
+    In modalità shard la copia in memoria viene scartata se un altro processo
+    ha nel frattempo riscritto il file di sessione.
+    """
+    sessione = sessioni_attive.get(id_sessione)
+    if sessione is not None:
+        if SHARD_ID is None or firme_sessioni.get(id_sessione) == _firma_file_sessione(get_session_path(id_sessione)):
+            _segna_accesso_sessione(id_sessione)
+            return sessione
+    
+    sessione = carica_sessione(id_sessione)
+    if sessione:
+        registra_sessione(id_sessione, sessione)
+        _segna_accesso_sessione(id_sessione)
+    return sessione
+
+def registra_sessione(id_sessione, sessione, giornale=True):
+    """
+    Rende attiva una sessione in memoria e collega gli eventi della partita
+    alle notifiche della sessione (achievement sbloccati, missioni iniziate e completate).
+    
+    Args:
+        id_sessione (str): ID della sessione
+        sessione (StatoGioco): La sessione
+        giornale (bool, optional): Collega anche il giornale dei comandi (vedi collega_giornale_sessione)
+    """
+    sessioni_attive[id_sessione] = sessione
     
-    notifiche_sistema[id_sessione].append(notifica)
+    def notifica_achievement(eventi):
+        catalogo = {a["id"]: a for a in get_data_manager().get_achievements() or []}
+        for _, dati in eventi:
+            achievement = catalogo.get(dati["id"], {})
+            aggiungi_notifica(id_sessione, "achievement",
+                              f"Achievement sbloccato: {achievement.get('nome', dati['id'])}",
+                              {"id": dati["id"], "punteggio": achievement.get("punteggio", 0)})
+    
+    def notifica_missione(eventi):
+        definizioni = sessione.game.missioni.definizioni
+        for tipo, dati in eventi:
+            nome = definizioni.get(dati["id"], {}).get("nome", dati["id"])
+            testo = "Nuova missione" if tipo == MISSIONE_INIZIATA else "Missione completata"
+            aggiungi_notifica(id_sessione, "quest", f"{testo}: {nome}", {"id": dati["id"]})
+    
+    sessione.game.eventi.iscrivi(ACHIEVEMENT_SBLOCCATO, notifica_achievement, differito=True)
+    sessione.game.eventi.iscrivi(MISSIONE_INIZIATA, notifica_missione, differito=True)
+    sessione.game.eventi.iscrivi(MISSIONE_COMPLETATA, notifica_missione, differito=True)
+    
+    if giornale:
+        collega_giornale_sessione(id_sessione, sessione)
+
+def collega_giornale_sessione(id_sessione, sessione):
+    """Annota i comandi della sessione per poterla riprodurre (vedi util/riproduzione.py)"""
+    if GIORNALE_ATTIVO:
+        sessione.collega_giornale(GiornaleComandi(get_journal_path(id_sessione)))
+
+def _segna_accesso_sessione(id_sessione):
+    """
+    Registra l'uso di una sessione. Una sessione usata solo in lettura non riscrive il suo
+    file: ogni tanto ne aggiorna la data di modifica, così il mietitore (anche di un altro
+    shard) non lo considera scaduto.
+    """
+    adesso = time.time()
+    precedente = ultimo_accesso_sessioni.get(id_sessione)
+    ultimo_accesso_sessioni[id_sessione] = adesso
+    if precedente is None or adesso - precedente > TTL_FILE_SESSIONE / 4:
+        try:
+            percorso = get_session_path(id_sessione)
+            if adesso - os.path.getmtime(percorso) > TTL_FILE_SESSIONE / 4:
+                os.utime(percorso)
+                firme_sessioni[id_sessione] = _firma_file_sessione(percorso)
+        except OSError:
+            pass
+
+def rilascia_sessioni(id_sessioni=None):
+    """
+    Rimuove dalla memoria le sessioni indicate (tutte se None), così che un altro
+    processo possa prenderle in carico. Non serve salvarle: ogni rotta che modifica
+    una sessione la scrive già su disco, mentre una copia non aggiornata non deve
+    sovrascrivere quella più recente scritta da un altro shard.
+    
+    Returns:
+        int: Numero di sessioni rilasciate
+    """
+    if id_sessioni is None:
+        id_sessioni = list(sessioni_attive.keys())
+    rilasciate = 0
+    for id_sessione in id_sessioni:
+        with ottieni_lock_sessione(id_sessione):
+            if sessioni_attive.pop(id_sessione, None) is not None:
+                rilasciate += 1
+            firme_sessioni.pop(id_sessione, None)
+            ultimo_accesso_sessioni.pop(id_sessione, None)
+    return rilasciate
+
+def aggiungi_notifica(id_sessione, tipo, messaggio, data=None):
+    """
+    Aggiunge una notifica alla sessione e la pubblica sul flusso eventi.
+    La notifica viene salvata su disco con la sessione: chi la chiama fuori
+    da una rotta che salva la sessione deve salvarla esplicitamente.
+    
+    Returns:
+        dict: La notifica aggiunta, None se la sessione non esiste
+    """
+    sessione = ottieni_sessione(id_sessione)
+    if sessione is None:
+        return None
+    notifica = sessione.notifiche.aggiungi(tipo, messaggio, data)
+    gestore_eventi.pubblica(id_sessione, "notifica", notifica)
     return notifica
 
+def _archivia_file_sessione(percorso):
+    """Sposta un file di sessione scaduto in un archivio zip mensile (uno per processo)"""
+    import zipfile
+    ARCHIVIO_SESSIONI_DIR.mkdir(exist_ok=True, parents=True)
+    nome_archivio = f"sessioni_{datetime.datetime.now().strftime('%Y%m')}_{os.getpid()}.zip"
+    with zipfile.ZipFile(ARCHIVIO_SESSIONI_DIR / nome_archivio, 'a', compression=zipfile.ZIP_DEFLATED) as archivio:
+        archivio.write(percorso, arcname=percorso.name)
+    percorso.unlink()
+
+def mieti_sessioni(adesso=None):
+    """
+    Esegue un ciclo del mietitore delle sessioni:
+    iberna le sessioni inattive in memoria, archivia o elimina i file di sessione scaduti
+    e libera lock e canali SSE delle sessioni che non esistono più.
+    
+    Args:
+        adesso (float, optional): Istante di riferimento, per default time.time()
+        
+    Returns:
+        dict: Numero di sessioni ibernate, scadute e liberate nel ciclo
+    """
+    inizio = time.perf_counter()
+    adesso = adesso or time.time()
+    
+    # 1. Iberna le sessioni inattive (il file su disco è già aggiornato da ogni rotta che le modifica)
+    ibernate = 0
+    for id_sessione, ultimo_accesso in list(ultimo_accesso_sessioni.items()):
+        if adesso - ultimo_accesso <= TTL_SESSIONE_IN_MEMORIA:
+            continue
+        canale = gestore_eventi.ottieni_canale(id_sessione, crea=False)
+        if canale is not None and canale.numero_iscritti() > 0:
+            # Un client è ancora collegato al flusso SSE
+            continue
+        lock = ottieni_lock_sessione(id_sessione)
+        if not lock.acquire(blocking=False):
+            continue
+        try:
+            if adesso - ultimo_accesso_sessioni.get(id_sessione, adesso) > TTL_SESSIONE_IN_MEMORIA:
+                if sessioni_attive.pop(id_sessione, None) is not None:
+                    ibernate += 1
+                firme_sessioni.pop(id_sessione, None)
+                ultimo_accesso_sessioni.pop(id_sessione, None)
+        finally:
+            lock.release()
+    
+    # 2. Archivia o elimina i file di sessione scaduti
+    scadute = 0
+    su_disco = set()
+    prefisso, estensione = DEFAULT_SESSION_PREFIX, ".pickle"
+    for percorso in SESSIONS_DIR.glob(f"{prefisso}*{estensione}"):
+        id_sessione = percorso.name[len(prefisso):-len(estensione)]
+        try:
+            scaduto = adesso - percorso.stat().st_mtime > TTL_FILE_SESSIONE
+        except OSError:
+            continue
+        if not scaduto or id_sessione in sessioni_attive:
+            su_disco.add(id_sessione)
+            continue
+        try:
+            # Il giornale dei comandi segue la sorte del file di sessione
+            for file_sessione in (percorso, get_journal_path(id_sessione)):
+                if file_sessione is not percorso and not file_sessione.exists():
+                    continue
+                if POLITICA_SESSIONI_SCADUTE == "elimina":
+                    file_sessione.unlink()
+                else:
+                    _archivia_file_sessione(file_sessione)
+            scadute += 1
+        except OSError as e:
+            logger.error(f"Errore durante la rimozione della sessione scaduta {id_sessione}: {e}")
+            su_disco.add(id_sessione)
+    
+    # 3. Libera le strutture delle sessioni che non esistono più né in memoria né su disco
+    esistenti = su_disco | set(sessioni_attive)
+    liberate = 0
+    for id_sessione in list(lock_sessioni):
+        if id_sessione not in esistenti:
+            canale = gestore_eventi.ottieni_canale(id_sessione, crea=False)
+            if canale is None or canale.numero_iscritti() == 0:
+                gestore_eventi.rimuovi_canale(id_sessione)
+                with _lock_registro_sessioni:
+                    lock_sessioni.pop(id_sessione, None)
+                liberate += 1
+    
+    metriche_sessioni["ibernate"] = len(su_disco - set(sessioni_attive))
+    metriche_sessioni["ibernate_totali"] += ibernate
+    metriche_sessioni["scadute_totali"] += scadute
+    metriche_sessioni["strutture_liberate_totali"] += liberate
+    metriche_sessioni["ultimo_ciclo"] = adesso
+    metriche_sessioni["durata_ultimo_ciclo_ms"] = round((time.perf_counter() - inizio) * 1000, 3)
+    if ibernate or scadute or liberate:
+        logger.info(f"Mietitore sessioni: {ibernate} ibernate, {scadute} scadute, {liberate} liberate")
+    return {"ibernate": ibernate, "scadute": scadute, "liberate": liberate}
+
+def avvia_mietitore_sessioni():
+    """Avvia il thread che esegue mieti_sessioni ogni INTERVALLO_MIETITORE secondi (0 per disattivarlo)"""
+    if INTERVALLO_MIETITORE <= 0:
+        return None
+    
+    def ciclo():
+        while True:
+            time.sleep(INTERVALLO_MIETITORE)
+            try:
+                mieti_sessioni()
+            except Exception as e:
+                logger.error(f"Errore nel mietitore delle sessioni: {e}")
+    
+    thread = threading.Thread(target=ciclo, name="mietitore_sessioni", daemon=True)
+    thread.start()
+    return thread
+
+avvia_mietitore_sessioni()
+
 @app.route("/")
 def home():
     """Pagina principale"""
@@ -75,11 +409,13 @@ def home():
         "endpoints": {
             "POST /inizia": "Crea una nuova partita",
             "POST /comando": "Invia un comando alla partita",
+            "POST /comandi": "Invia una sequenza di comandi alla partita in un'unica richiesta",
             "GET /stato": "Ottieni lo stato attuale della partita",
             "POST /salva": "Salva la partita corrente",
             "POST /carica": "Carica una partita esistente",
             "GET /mappa": "Ottieni informazioni sulla mappa",
             "POST /muovi": "Muovi il giocatore in una direzione",
+            "POST /annulla": "Annulla gli ultimi comandi della partita",
             "GET /inventario": "Ottieni l'inventario del giocatore",
             "GET /statistiche": "Ottieni le statistiche del giocatore",
             "GET /posizione": "Ottieni la posizione del giocatore",
@@ -96,7 +432,10 @@ def home():
             "POST /esplora": "Esplora l'ambiente circostante",
             "POST /preferenze": "Salva le preferenze dell'utente",
             "POST /elimina_salvataggio": "Elimina un salvataggio",
+            "GET /storico_salvataggio": "Elenca le versioni ripristinabili di un salvataggio",
+            "POST /ripristina_salvataggio": "Ripristina un salvataggio a una versione precedente",
             "GET /notifiche": "Ottieni le notifiche non lette",
+            "GET /eventi": "Flusso SSE di output, notifiche e versioni dello stato della sessione",
             "POST /leggi_notifica": "Segna una notifica come letta",
             "GET /asset": "Ottieni un asset grafico",
             "GET /assets_info": "Ottieni informazioni sugli asset disponibili",
@@ -106,7 +445,8 @@ def home():
             "GET /abilita": "Ottieni le abilità del giocatore",
             "POST /usa_abilita": "Usa un'abilità del giocatore",
             "POST /esporta_salvataggio": "Esporta un salvataggio come file",
-            "POST /importa_salvataggio": "Importa un salvataggio da file"
+            "POST /importa_salvataggio": "Importa un salvataggio da file",
+            "GET /metriche": "Ottieni le metriche interne del server"
         }
     })
 
@@ -118,19 +458,29 @@ def inizia_gioco():
     nome = data.get("nome", "Avventuriero")
     classe = data.get("classe", "guerriero").lower()
     
-    # Crea un nuovo ID di sessione
+    # Crea un nuovo ID di sessione (dietro il router degli shard l'ID è scelto dal router,
+    # così la sessione nasce direttamente sullo shard che ne sarà responsabile)
     id_sessione = str(uuid4())
+    if SHARD_ID is not None and request.headers.get(HEADER_ID_SESSIONE_ROUTER):
+        id_sessione = request.headers[HEADER_ID_SESSIONE_ROUTER]
     
     # Crea un nuovo giocatore
     giocatore = Giocatore(nome, classe)
     
-    # Crea una nuova sessione di gioco
-    sessione = StatoGioco(giocatore, TavernaState())
-    sessioni_attive[id_sessione] = sessione
+    # Crea una nuova sessione di gioco (i moduli degli stati vengono importati
+    # dal registro alla prima partita, non all'avvio del server)
+    sessione = StatoGioco(giocatore, classe_stato("TavernaState")(None))
+    registra_sessione(id_sessione, sessione, giornale=False)
     
     # Esegui il primo comando vuoto per ottenere l'output iniziale
     sessione.processa_comando("")
     
+    # Il giornale parte dallo stato dopo il comando di apertura: lo snapshot di una
+    # partita non ancora avviata non si riprodurrebbe uguale. Per lo stesso motivo
+    # il comando di apertura non si può annullare.
+    sessione.game.cronologia.svuota()
+    collega_giornale_sessione(id_sessione, sessione)
+    
     # Salva la sessione su disco
     salva_sessione(id_sessione, sessione)
     
@@ -144,6 +494,7 @@ def inizia_gioco():
     })
 
 @app.route("/comando", methods=["POST"])
+@con_lock_sessione
 def esegui_comando():
     """Elabora un comando inviato dal client"""
     # Estrai i dati dalla richiesta
@@ -155,25 +506,19 @@ def esegui_comando():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    # Controlla se la sessione è attiva in memoria
-    sessione = sessioni_attive.get(id_sessione)
-    
-    # Se non è in memoria, prova a caricarla da disco
-    if not sessione:
-        sessione = carica_sessione(id_sessione)
-        if sessione:
-            # Se trovata su disco, caricala in memoria
-            sessioni_attive[id_sessione] = sessione
+    # Cerca la sessione in memoria o su disco
+    sessione = ottieni_sessione(id_sessione)
     
-    # Se ancora non trovata, restituisci errore
+    # Se non trovata, restituisci errore
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
     
     # Elabora il comando
     sessione.processa_comando(comando)
     
-    # Salva la sessione aggiornata
+    # Salva la sessione aggiornata e avvisa i client in ascolto sul flusso SSE
     salva_sessione(id_sessione, sessione)
+    pubblica_aggiornamento(id_sessione, sessione)
     
     # Ottieni lo stato corrente
     stato_attuale = sessione.get_stato_attuale()
@@ -200,6 +545,98 @@ def esegui_comando():
         "fine": gioco_terminato
     })
 
+@app.route("/comandi", methods=["POST"])
+@con_lock_sessione
+def esegui_comandi():
+    """
+    Elabora una sequenza ordinata di comandi in un'unica richiesta.
+    
+    Utile per i flussi a fasi (menu -> selezione -> conferma): i comandi vengono
+    eseguiti uno dopo l'altro sotto il lock della sessione, l'output di ogni
+    passo viene raccolto separatamente e la sessione viene salvata una sola volta.
+    """
+    # Estrai i dati dalla richiesta
+    data = request.json or {}
+    id_sessione = data.get("id_sessione")
+    comandi = data.get("comandi", [])
+    interrompi_su_errore = data.get("interrompi_su_errore", False)
+    interrompi_su_cambio_stato = data.get("interrompi_su_cambio_stato", False)
+    
+    # Verifica che l'ID sessione sia stato fornito
+    if not id_sessione:
+        return jsonify({"errore": "ID sessione non fornito"}), 400
+    
+    # Verifica che i comandi siano una lista di stringhe
+    if not isinstance(comandi, list) or not all(isinstance(c, str) for c in comandi):
+        return jsonify({"errore": "I comandi devono essere una lista di stringhe"}), 400
+    
+    # Cerca la sessione in memoria o su disco
+    sessione = ottieni_sessione(id_sessione)
+    
+    if not sessione:
+        return jsonify({"errore": "Sessione non trovata"}), 404
+    
+    risultati = []
+    interrotto = False
+    for indice, comando in enumerate(comandi):
+        stato_prima = sessione.game.stato_corrente()
+        
+        # Elabora il comando come farebbe /comando
+        eccezione = None
+        try:
+            sessione.processa_comando(comando)
+        except Exception as e:
+            logger.error(f"Errore durante il comando {indice} ('{comando}'): {str(e)}")
+            eccezione = str(e)
+        
+        # Raccogli l'output strutturato di questo passo e pulisci il buffer
+        output_strutturato = list(sessione.io_buffer.get_output_structured())
+        sessione.io_buffer.clear()
+        if eccezione:
+            output_strutturato.append({"tipo": "errore", "testo": eccezione})
+        
+        stato_dopo = sessione.game.stato_corrente()
+        errore = any(msg.get("tipo") == "errore" for msg in output_strutturato)
+        cambio_stato = stato_dopo is not stato_prima
+        
+        gestore_eventi.pubblica(id_sessione, "output", {"indice": indice, "output": output_strutturato})
+        
+        risultati.append({
+            "indice": indice,
+            "comando": comando,
+            "output": output_strutturato,
+            "stato_nome": type(stato_dopo).__name__ if stato_dopo else "NessunoStato",
+            "errore": errore,
+            "cambio_stato": cambio_stato
+        })
+        
+        # Decidi se interrompere la sequenza
+        if eccezione or not sessione.game.attivo:
+            interrotto = indice < len(comandi) - 1
+            break
+        if (interrompi_su_errore and errore) or (interrompi_su_cambio_stato and cambio_stato):
+            interrotto = indice < len(comandi) - 1
+            break
+    
+    # Salva la sessione una sola volta alla fine della sequenza
+    salva_sessione(id_sessione, sessione)
+    pubblica_aggiornamento(id_sessione, sessione, output=[])
+    
+    # Ottieni lo stato corrente
+    stato_attuale = sessione.get_stato_attuale()
+    stato_nome = "NessunoStato"
+    if sessione.game.stato_corrente():
+        stato_nome = type(sessione.game.stato_corrente()).__name__
+    
+    return jsonify({
+        "risultati": risultati,
+        "eseguiti": len(risultati),
+        "interrotto": interrotto,
+        "stato": stato_attuale,
+        "stato_nome": stato_nome,
+        "fine": not sessione.game.attivo
+    })
+
 @app.route("/stato", methods=["GET"])
 def ottieni_stato():
     """Ottieni lo stato attuale della sessione"""
@@ -211,7 +648,7 @@ def ottieni_stato():
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
     # Cerca la sessione in memoria o su disco
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -220,6 +657,7 @@ def ottieni_stato():
     return jsonify(sessione.get_stato_attuale())
 
 @app.route("/salva", methods=["POST"])
+@con_lock_sessione
 def salva_partita():
     """Salva la partita su file"""
     # Estrai i dati dalla richiesta
@@ -232,7 +670,7 @@ def salva_partita():
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
     # Cerca la sessione
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -241,14 +679,31 @@ def salva_partita():
     try:
         # Ottieni il percorso completo tramite il modulo di configurazione
         percorso = get_save_path(nome_file)
-        sessione.salva(percorso)
-        logger.info(f"Partita salvata in {percorso}")
-        return jsonify({"messaggio": f"Partita salvata in {nome_file}"})
+        
+        # La scrittura avviene in background: la richiesta paga solo la copia dei dati
+        motivo = sessione.verifica_salvataggio_consentito()
+        if motivo:
+            return jsonify({"errore": motivo}), 409
+        futuro = sessione.game.salva_asincrono(percorso)
+        
+        def al_termine(futuro_completato):
+            errore = futuro_completato.exception()
+            if errore is not None:
+                # La callback gira fuori dalla richiesta: prende il lock per salvare la notifica
+                with ottieni_lock_sessione(id_sessione):
+                    if aggiungi_notifica(id_sessione, "errore", f"Salvataggio di {nome_file} non riuscito: {errore}"):
+                        salva_sessione(id_sessione, ottieni_sessione(id_sessione))
+            else:
+                logger.info(f"Partita salvata in {percorso}")
+        futuro.add_done_callback(al_termine)
+        
+        return jsonify({"messaggio": f"Salvataggio in {nome_file} avviato", "in_corso": not futuro.done()})
     except Exception as e:
         logger.error(f"Errore durante il salvataggio: {str(e)}")
         return jsonify({"errore": f"Errore durante il salvataggio: {str(e)}"}), 500
 
 @app.route("/carica", methods=["POST"])
+@con_lock_sessione
 def carica_partita():
     """Carica una partita da file"""
     # Estrai i dati dalla richiesta
@@ -261,7 +716,7 @@ def carica_partita():
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
     # Cerca la sessione o creane una nuova
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -280,6 +735,7 @@ def carica_partita():
             # Salva la sessione aggiornata
             sessioni_attive[id_sessione] = sessione
             salva_sessione(id_sessione, sessione)
+            pubblica_aggiornamento(id_sessione, sessione)
             
             # Ottieni informazioni sul giocatore
             stato = sessione.get_stato_attuale()
@@ -305,7 +761,7 @@ def ottieni_mappa():
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
     # Cerca la sessione
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -319,6 +775,7 @@ def ottieni_mappa():
     return jsonify(info_posizione)
 
 @app.route("/muovi", methods=["POST"])
+@con_lock_sessione
 def muovi_giocatore():
     """Muovi il giocatore nella direzione specificata"""
     # Estrai i dati dalla richiesta
@@ -333,7 +790,7 @@ def muovi_giocatore():
         return jsonify({"errore": "Direzione non fornita"}), 400
     
     # Cerca la sessione
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -341,8 +798,9 @@ def muovi_giocatore():
     # Muovi il giocatore
     spostamento = sessione.muovi_giocatore(direzione)
     
-    # Salva la sessione aggiornata
+    # Salva la sessione aggiornata e avvisa i client in ascolto sul flusso SSE
     salva_sessione(id_sessione, sessione)
+    pubblica_aggiornamento(id_sessione, sessione)
     
     # Restituisci lo stato aggiornato
     return jsonify({
@@ -350,6 +808,40 @@ def muovi_giocatore():
         "stato": sessione.get_stato_attuale()
     })
 
+@app.route("/annulla", methods=["POST"])
+@con_lock_sessione
+def annulla_comandi():
+    """Riporta la partita a com'era prima degli ultimi comandi"""
+    data = request.json or {}
+    id_sessione = data.get("id_sessione")
+    passi = data.get("passi", 1)
+    
+    if not id_sessione:
+        return jsonify({"errore": "ID sessione non fornito"}), 400
+    if not isinstance(passi, int) or isinstance(passi, bool) or passi < 1:
+        return jsonify({"errore": "Il numero di passi deve essere un intero positivo"}), 400
+    
+    sessione = ottieni_sessione(id_sessione)
+    if not sessione:
+        return jsonify({"errore": "Sessione non trovata"}), 404
+    
+    annullati = sessione.annulla(passi)
+    if not annullati:
+        return jsonify({"errore": "Nessun comando da annullare"}), 400
+    
+    sessione.io_buffer.clear()
+    sessione.io_buffer.messaggio_sistema(f"Annullati {annullati} comandi")
+    sessione.ultimo_output = sessione.io_buffer.get_output_text()
+    
+    # Salva la sessione aggiornata e avvisa i client in ascolto sul flusso SSE
+    salva_sessione(id_sessione, sessione)
+    pubblica_aggiornamento(id_sessione, sessione)
+    
+    return jsonify({
+        "annullati": annullati,
+        "stato": sessione.get_stato_attuale()
+    })
+
 @app.route("/inventario", methods=["GET"])
 def ottieni_inventario():
     """Ottieni l'inventario del giocatore"""
@@ -358,7 +850,7 @@ def ottieni_inventario():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -379,7 +871,7 @@ def ottieni_statistiche():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -403,7 +895,7 @@ def ottieni_posizione():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -430,20 +922,12 @@ def ottieni_missioni():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
     
-    # Questa funzione presuppone che lo stato del gioco tenga traccia delle missioni
-    # Implementa la logica per estrarre le missioni dallo stato del gioco
-    stato = sessione.get_stato_attuale()
-    missioni = {
-        "attive": stato.get("missioni_attive", []),
-        "completate": stato.get("missioni_completate", [])
-    }
-    
-    return jsonify(missioni)
+    return jsonify(sessione.game.missioni.riepilogo())
 
 @app.route("/combattimento", methods=["GET"])
 def ottieni_stato_combattimento():
@@ -453,7 +937,7 @@ def ottieni_stato_combattimento():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -478,6 +962,7 @@ def ottieni_stato_combattimento():
     })
 
 @app.route("/azione_combattimento", methods=["POST"])
+@con_lock_sessione
 def esegui_azione_combattimento():
     """Esegui un'azione di combattimento"""
     # Estrai i dati dalla richiesta
@@ -493,7 +978,7 @@ def esegui_azione_combattimento():
     if not azione:
         return jsonify({"errore": "Azione non specificata"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -506,8 +991,9 @@ def esegui_azione_combattimento():
     # Elabora il comando come un normale comando di gioco
     sessione.processa_comando(comando)
     
-    # Salva la sessione aggiornata
+    # Salva la sessione aggiornata e avvisa i client in ascolto sul flusso SSE
     salva_sessione(id_sessione, sessione)
+    pubblica_aggiornamento(id_sessione, sessione)
     
     # Ottieni l'output strutturato
     output_strutturato = sessione.io_buffer.get_output_structured()
@@ -533,7 +1019,7 @@ def ottieni_npc():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -545,6 +1031,7 @@ def ottieni_npc():
     return jsonify(npc)
 
 @app.route("/oggetto", methods=["POST"])
+@con_lock_sessione
 def interagisci_oggetto():
     """Interagisci con un oggetto nell'inventario o nell'ambiente"""
     # Estrai i dati dalla richiesta
@@ -559,7 +1046,7 @@ def interagisci_oggetto():
     if not oggetto:
         return jsonify({"errore": "Oggetto non specificato"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -570,8 +1057,9 @@ def interagisci_oggetto():
     # Elabora il comando
     sessione.processa_comando(comando)
     
-    # Salva la sessione aggiornata
+    # Salva la sessione aggiornata e avvisa i client in ascolto sul flusso SSE
     salva_sessione(id_sessione, sessione)
+    pubblica_aggiornamento(id_sessione, sessione)
     
     # Ottieni l'output strutturato
     output_strutturato = sessione.io_buffer.get_output_structured()
@@ -587,30 +1075,50 @@ def interagisci_oggetto():
         "stato": stato
     })
 
+def leggi_parametri_elenco_salvataggi():
+    """
+    Legge dalla query string ordinamento e paginazione per gli elenchi dei salvataggi.
+    
+    Returns:
+        dict: Argomenti per IndiceSalvataggi.elenca
+        
+    Raises:
+        ValueError: Se un parametro non è valido
+    """
+    ordina_per = request.args.get("ordina", "timestamp")
+    if ordina_per not in CAMPI_ORDINAMENTO:
+        raise ValueError(f"Campo di ordinamento non valido: {ordina_per}")
+    ordine = request.args.get("ordine", "desc")
+    if ordine not in ("asc", "desc"):
+        raise ValueError(f"Ordine non valido: {ordine}")
+    offset = int(request.args.get("offset", 0))
+    limite = request.args.get("limite")
+    limite = int(limite) if limite is not None else None
+    if offset < 0 or (limite is not None and limite < 0):
+        raise ValueError("offset e limite devono essere positivi")
+    return {"ordina_per": ordina_per, "decrescente": ordine == "desc", "offset": offset, "limite": limite}
+
 @app.route("/salvataggi", methods=["GET"])
 def elenca_salvataggi():
     """Ottieni la lista dei salvataggi disponibili"""
     try:
-        # Ottieni tutti i file di salvataggio
-        salvataggi = []
-        for file in os.listdir(SAVE_DIR):
-            if file.endswith(".json"):
-                percorso = get_save_path(file)
-                try:
-                    with open(percorso, 'r') as f:
-                        dati = json.load(f)
-                        # Estrai le informazioni rilevanti dal salvataggio
-                        info_salvataggio = {
-                            "nome_file": file,
-                            "nome_personaggio": dati.get("giocatore", {}).get("nome", "Sconosciuto"),
-                            "classe": dati.get("giocatore", {}).get("classe", "Sconosciuto"),
-                            "livello": dati.get("giocatore", {}).get("livello", 1),
-                            "data_salvataggio": dati.get("metadata", {}).get("data_salvataggio", "Sconosciuta")
-                        }
-                        salvataggi.append(info_salvataggio)
-                except Exception as e:
-                    # Se un file è corrotto, lo saltiamo
-                    continue
+        parametri = leggi_parametri_elenco_salvataggi()
+    except ValueError as e:
+        return jsonify({"errore": str(e)}), 400
+    
+    try:
+        # I metadati arrivano dall'indice: i salvataggi corrotti vengono saltati
+        voci, _ = get_indice_salvataggi().elenca(solo_validi=True, **parametri)
+        salvataggi = [
+            {
+                "nome_file": voce["file"],
+                "nome_personaggio": voce.get("giocatore", "Sconosciuto"),
+                "classe": voce.get("classe", "Sconosciuto"),
+                "livello": voce.get("livello", 1),
+                "data_salvataggio": formatta_data(voce["timestamp"]) if voce.get("timestamp") else "Sconosciuta"
+            }
+            for voce in voci
+        ]
         
         return jsonify(salvataggi)
     except Exception as e:
@@ -624,7 +1132,7 @@ def ottieni_log():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -642,6 +1150,7 @@ def ottieni_log():
     })
 
 @app.route("/equipaggiamento", methods=["POST"])
+@con_lock_sessione
 def gestisci_equipaggiamento():
     """Gestisci l'equipaggiamento del giocatore"""
     # Estrai i dati dalla richiesta
@@ -660,7 +1169,7 @@ def gestisci_equipaggiamento():
     if not azione:
         return jsonify({"errore": "Azione non specificata"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -680,8 +1189,9 @@ def gestisci_equipaggiamento():
     # Elabora il comando
     sessione.processa_comando(comando)
     
-    # Salva la sessione aggiornata
+    # Salva la sessione aggiornata e avvisa i client in ascolto sul flusso SSE
     salva_sessione(id_sessione, sessione)
+    pubblica_aggiornamento(id_sessione, sessione)
     
     # Ottieni l'output strutturato
     output_strutturato = sessione.io_buffer.get_output_structured()
@@ -706,7 +1216,7 @@ def ottieni_azioni_disponibili():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -715,10 +1225,14 @@ def ottieni_azioni_disponibili():
     # nel contesto attuale (ad es. in base allo stato, posizione, NPC presenti, ecc.)
     stato = sessione.get_stato_attuale()
     
-    # Ottieni il nome dello stato corrente
+    # Ottieni il nome dello stato corrente e i comandi accettati dalla sua fase
     stato_nome = "NessunoStato"
-    if sessione.game.stato_corrente():
-        stato_nome = type(sessione.game.stato_corrente()).__name__
+    comandi = []
+    stato_corrente = sessione.game.stato_corrente()
+    if stato_corrente:
+        stato_nome = type(stato_corrente).__name__
+        if hasattr(stato_corrente, "comandi_disponibili"):
+            comandi = stato_corrente.comandi_disponibili()
     
     # Definisci azioni diverse in base al contesto
     azioni_contesto = {
@@ -732,8 +1246,11 @@ def ottieni_azioni_disponibili():
     # Le azioni disponibili possono essere estratte dallo stato o dedotte dal contesto
     azioni = []
     
+    # Se lo stato dichiara i suoi comandi, usali
+    if comandi:
+        azioni = [comando["comando"] for comando in comandi]
     # Se il gioco fornisce direttamente le azioni disponibili, usale
-    if "azioni_disponibili" in stato:
+    elif "azioni_disponibili" in stato:
         azioni = stato["azioni_disponibili"]
     else:
         # Altrimenti, deduci le azioni in base al contesto
@@ -755,11 +1272,13 @@ def ottieni_azioni_disponibili():
     
     return jsonify({
         "azioni": azioni,
+        "comandi": comandi,
         "bersagli": bersagli,
         "contesto": stato_nome
     })
 
 @app.route("/dialogo", methods=["POST"])
+@con_lock_sessione
 def gestisci_dialogo():
     """Gestisci il dialogo con un NPC"""
     # Estrai i dati dalla richiesta
@@ -774,7 +1293,7 @@ def gestisci_dialogo():
     if not npc:
         return jsonify({"errore": "NPC non specificato"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -788,8 +1307,9 @@ def gestisci_dialogo():
     # Elabora il comando
     sessione.processa_comando(comando)
     
-    # Salva la sessione aggiornata
+    # Salva la sessione aggiornata e avvisa i client in ascolto sul flusso SSE
     salva_sessione(id_sessione, sessione)
+    pubblica_aggiornamento(id_sessione, sessione)
     
     # Ottieni l'output strutturato
     output_strutturato = sessione.io_buffer.get_output_structured()
@@ -812,6 +1332,7 @@ def gestisci_dialogo():
     })
 
 @app.route("/esplora", methods=["POST"])
+@con_lock_sessione
 def esplora_ambiente():
     """Esplora l'ambiente circostante"""
     # Estrai i dati dalla richiesta
@@ -821,7 +1342,7 @@ def esplora_ambiente():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -829,8 +1350,9 @@ def esplora_ambiente():
     # Esegui un comando "guarda" o "esplora"
     sessione.processa_comando("guarda")
     
-    # Salva la sessione aggiornata
+    # Salva la sessione aggiornata e avvisa i client in ascolto sul flusso SSE
     salva_sessione(id_sessione, sessione)
+    pubblica_aggiornamento(id_sessione, sessione)
     
     # Ottieni l'output strutturato
     output_strutturato = sessione.io_buffer.get_output_structured()
@@ -850,6 +1372,7 @@ def esplora_ambiente():
     })
 
 @app.route("/preferenze", methods=["POST"])
+@con_lock_sessione
 def salva_preferenze():
     """Salva le preferenze dell'utente"""
     # Estrai i dati dalla richiesta
@@ -860,7 +1383,7 @@ def salva_preferenze():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
@@ -870,6 +1393,7 @@ def salva_preferenze():
     try:
         sessione.salva_preferenze(preferenze)
         salva_sessione(id_sessione, sessione)
+        pubblica_aggiornamento(id_sessione, sessione)
         return jsonify({"messaggio": "Preferenze salvate con successo"})
     except Exception as e:
         return jsonify({"errore": f"Errore durante il salvataggio delle preferenze: {str(e)}"}), 500
@@ -894,41 +1418,139 @@ def elimina_salvataggio():
         logger.error(f"Errore durante l'eliminazione del salvataggio: {str(e)}")
         return jsonify({"errore": f"Errore durante l'eliminazione del salvataggio: {str(e)}"}), 500
 
+@app.route("/storico_salvataggio", methods=["GET"])
+def storico_salvataggio():
+    """Elenca le versioni ripristinabili di un salvataggio"""
+    nome_file = request.args.get("nome_file")
+    if not nome_file:
+        return jsonify({"errore": "Nome file non fornito"}), 400
+    
+    try:
+        versioni = get_storico_salvataggi().elenca_versioni(nome_file)
+        for versione in versioni:
+            versione["data"] = formatta_data(versione["timestamp"])
+        return jsonify({"nome_file": nome_file, "versioni": versioni})
+    except Exception as e:
+        logger.error(f"Errore nella lettura dello storico di {nome_file}: {str(e)}")
+        return jsonify({"errore": f"Errore nella lettura dello storico: {str(e)}"}), 500
+
+@app.route("/ripristina_salvataggio", methods=["POST"])
+def ripristina_salvataggio():
+    """Ripristina un salvataggio a una versione precedente del suo storico"""
+    data = request.json or {}
+    nome_file = data.get("nome_file")
+    versione = data.get("versione")
+    nome_destinazione = data.get("nome_file_destinazione", nome_file)
+    
+    if not nome_file or versione is None:
+        return jsonify({"errore": "Nome file o versione non forniti"}), 400
+    
+    # Il ripristino scrive solo nella cartella dei salvataggi: niente ../ né percorsi assoluti
+    nome_destinazione = os.path.basename(str(nome_destinazione))
+    if not nome_destinazione or nome_destinazione in (".", ".."):
+        return jsonify({"errore": "Nome file di destinazione non valido"}), 400
+    
+    try:
+        documento = get_storico_salvataggi().ricostruisci(nome_file, int(versione))
+        if documento is None:
+            return jsonify({"errore": f"Versione {versione} di {nome_file} non trovata"}), 404
+        
+        # Il ripristino passa dalla pipeline di scrittura: diventa a sua volta una nuova versione
+        get_scrittore_salvataggi().accoda(get_save_path(nome_destinazione), documento).result()
+        return jsonify({"messaggio": f"Versione {versione} di {nome_file} ripristinata in {nome_destinazione}"})
+    except Exception as e:
+        logger.error(f"Errore durante il ripristino di {nome_file}: {str(e)}")
+        return jsonify({"errore": f"Errore durante il ripristino: {str(e)}"}), 500
+
 @app.route("/notifiche", methods=["GET"])
 def ottieni_notifiche():
-    """Ottieni le notifiche per la sessione corrente"""
+    """
+    Ottieni le notifiche per la sessione corrente.
+    Senza cursore restituisce le più recenti; con il parametro dopo (o since) uguale
+    all'ID dell'ultima notifica ricevuta restituisce solo quelle successive.
+    """
     id_sessione = request.args.get("id_sessione")
     
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    # Inizializza l'array di notifiche se non esiste
-    if id_sessione not in notifiche_sistema:
-        notifiche_sistema[id_sessione] = []
+    sessione = ottieni_sessione(id_sessione)
+    if not sessione:
+        return jsonify({"errore": "Sessione non trovata"}), 404
     
     # Filtra le notifiche in base ai parametri
     solo_non_lette = request.args.get("solo_non_lette", "true").lower() == "true"
     tipo = request.args.get("tipo")
-    limite = int(request.args.get("limite", 50))
+    dopo = request.args.get("dopo") or request.args.get("since")
+    try:
+        limite = max(1, int(request.args.get("limite", 50)))
+    except ValueError:
+        return jsonify({"errore": "Limite non valido"}), 400
     
-    notifiche = notifiche_sistema[id_sessione]
+    try:
+        notifiche, altre, cursore_scaduto = sessione.notifiche.elenca(solo_non_lette, tipo, limite, dopo)
+    except KeyError:
+        return jsonify({"errore": "Cursore non valido"}), 400
     
-    # Applica i filtri
-    if solo_non_lette:
-        notifiche = [n for n in notifiche if not n.get("letta", False)]
+    risposta = {
+        "notifiche": notifiche,
+        "totale_non_lette": sessione.notifiche.totale_non_lette,
+        "altre": altre,
+        # ID da passare come cursore alla richiesta successiva
+        "ultimo_id": notifiche[-1]["id"] if notifiche else dopo
+    }
+    if cursore_scaduto:
+        risposta["cursore_scaduto"] = True
+    return jsonify(risposta)
+
+@app.route("/eventi", methods=["GET"])
+def flusso_eventi():
+    """
+    Flusso Server-Sent Events della sessione: output strutturato, notifiche e
+    incrementi di versione dello stato, inviati nel momento in cui avvengono.
+    Supporta la ripresa tramite l'header Last-Event-ID (o il parametro ultimo_id).
+    """
+    id_sessione = request.args.get("id_sessione")
     
-    if tipo:
-        notifiche = [n for n in notifiche if n.get("tipo") == tipo]
+    if not id_sessione:
+        return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    # Limita il numero di notifiche
-    notifiche = notifiche[-limite:] if len(notifiche) > limite else notifiche
+    # Verifica che la sessione esista
+    if id_sessione not in sessioni_attive and not os.path.exists(get_session_path(id_sessione)):
+        return jsonify({"errore": "Sessione non trovata"}), 404
     
-    return jsonify({
-        "notifiche": notifiche,
-        "totale_non_lette": len([n for n in notifiche_sistema[id_sessione] if not n.get("letta", False)])
-    })
+    # Determina da quale evento riprendere
+    ultimo_id = request.headers.get("Last-Event-ID") or request.args.get("ultimo_id")
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id is not None else None
+    except ValueError:
+        return jsonify({"errore": "ID evento non valido"}), 400
+    
+    canale = gestore_eventi.ottieni_canale(id_sessione)
+    iscrizione = canale.iscrivi(ultimo_id)
+    
+    def genera():
+        try:
+            # Suggerisce al browser dopo quanto riconnettersi
+            yield "retry: 3000\n\n"
+            while iscrizione.attiva:
+                evento = iscrizione.prossimo(timeout=INTERVALLO_HEARTBEAT_SSE)
+                if evento is None:
+                    # Commento SSE: mantiene viva la connessione e rileva i client chiusi
+                    yield ": heartbeat\n\n"
+                    continue
+                yield formatta_evento_sse(evento)
+        finally:
+            canale.disiscrivi(iscrizione)
+    
+    return Response(
+        stream_with_context(genera()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.route("/leggi_notifica", methods=["POST"])
+@con_lock_sessione
 def leggi_notifica():
     """Segna una notifica come letta"""
     data = request.json or {}
@@ -939,23 +1561,22 @@ def leggi_notifica():
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
-    if id_sessione not in notifiche_sistema:
-        return jsonify({"errore": "Nessuna notifica trovata per questa sessione"}), 404
+    sessione = ottieni_sessione(id_sessione)
+    if not sessione:
+        return jsonify({"errore": "Sessione non trovata"}), 404
     
     if tutte:
         # Segna tutte le notifiche come lette
-        for notifica in notifiche_sistema[id_sessione]:
-            notifica["letta"] = True
+        if sessione.notifiche.segna_tutte_lette():
+            salva_sessione(id_sessione, sessione)
         return jsonify({"messaggio": "Tutte le notifiche segnate come lette"})
     
     if not id_notifica:
         return jsonify({"errore": "ID notifica non fornito"}), 400
     
-    # Cerca la notifica specifica
-    for notifica in notifiche_sistema[id_sessione]:
-        if notifica["id"] == id_notifica:
-            notifica["letta"] = True
-            return jsonify({"messaggio": "Notifica segnata come letta"})
+    if sessione.notifiche.segna_letta(id_notifica):
+        salva_sessione(id_sessione, sessione)
+        return jsonify({"messaggio": "Notifica segnata come letta"})
     
     return jsonify({"errore": "Notifica non trovata"}), 404
 
@@ -986,7 +1607,7 @@ def ottieni_tutorial():
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
     # Verifica che la sessione esista
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
     
@@ -1009,33 +1630,28 @@ def ottieni_achievements():
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
     # Verifica che la sessione esista
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
     
-    # In un'implementazione reale, questi dati verrebbero estratti dallo stato del gioco
-    stato = sessione.get_stato_attuale()
-    
-    # Carica tutti gli achievement possibili dal file esterno
-    tutti_achievements = get_data_manager().get_achievements()
-    
-    # Ottieni gli achievement sbloccati dal giocatore
-    achievements_sbloccati = stato.get("achievements", [])
-    
-    # Aggiorna lo stato di sblocco per ogni achievement
-    for achievement in tutti_achievements:
-        achievement["sbloccato"] = achievement["id"] in achievements_sbloccati
-        
-        # Se è sbloccato, aggiungi la data di sblocco
-        if achievement["sbloccato"] and "timestamp_achievements" in stato:
-            timestamp = stato["timestamp_achievements"].get(achievement["id"])
-            if timestamp:
-                achievement["data_sblocco"] = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+    # Gli sblocchi sono calcolati dal motore degli achievement mentre si gioca:
+    # qui si leggono soltanto, senza modificare il catalogo in cache
+    progresso = sessione.game.giocatore.progresso_achievement
+    achievements = []
+    for achievement in get_data_manager().get_achievements() or []:
+        achievement = dict(achievement)
+        timestamp = progresso.sbloccati.get(achievement["id"])
+        achievement["sbloccato"] = timestamp is not None
+        if timestamp is not None:
+            achievement["data_sblocco"] = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+        achievements.append(achievement)
     
     return jsonify({
-        "achievements": tutti_achievements,
-        "totale": len(tutti_achievements),
-        "sbloccati": len(achievements_sbloccati)
+        "achievements": achievements,
+        "totale": len(achievements),
+        "sbloccati": len(progresso.sbloccati),
+        # Solo i contatori ancora aggiornati: quelli senza achievement bloccati restano fermi
+        "contatori": sessione.game.achievements.contatori_in_attesa()
     })
 
 @app.route("/oggetto_dettagli", methods=["GET"])
@@ -1052,7 +1668,7 @@ def ottieni_dettagli_oggetto():
         return jsonify({"errore": "ID oggetto o nome oggetto non fornito"}), 400
     
     # Verifica che la sessione esista
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
     
@@ -1103,7 +1719,7 @@ def ottieni_abilita():
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
     # Verifica che la sessione esista
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
     
@@ -1118,6 +1734,7 @@ def ottieni_abilita():
     })
 
 @app.route("/usa_abilita", methods=["POST"])
+@con_lock_sessione
 def usa_abilita():
     """Usa un'abilità del giocatore"""
     data = request.json or {}
@@ -1133,7 +1750,7 @@ def usa_abilita():
         return jsonify({"errore": "ID abilità o nome abilità non fornito"}), 400
     
     # Verifica che la sessione esista
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
     
@@ -1150,8 +1767,9 @@ def usa_abilita():
     # Elabora il comando
     sessione.processa_comando(comando)
     
-    # Salva la sessione aggiornata
+    # Salva la sessione aggiornata e avvisa i client in ascolto sul flusso SSE
     salva_sessione(id_sessione, sessione)
+    pubblica_aggiornamento(id_sessione, sessione)
     
     # Ottieni l'output strutturato
     output_strutturato = sessione.io_buffer.get_output_structured()
@@ -1170,15 +1788,20 @@ def usa_abilita():
     })
 
 @app.route("/esporta_salvataggio", methods=["POST"])
+@con_lock_sessione
 def esporta_salvataggio():
-    """Esporta un salvataggio come file scaricabile"""
+    """Esporta un salvataggio come file scaricabile (JSON o compresso con gzip)"""
     data = request.json or {}
     id_sessione = data.get("id_sessione")
     nome_file = data.get("nome_file")
+    formato = data.get("formato")
     
     if not id_sessione:
         return jsonify({"errore": "ID sessione non fornito"}), 400
     
+    if formato is not None and formato not in SAVE_FORMATS:
+        return jsonify({"errore": f"Formato non valido, valori ammessi: {', '.join(SAVE_FORMATS)}"}), 400
+    
     if not nome_file:
         # Genera un nome file basato sulla data e ora
         nome_file = f"salvataggio_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
@@ -1188,7 +1811,7 @@ def esporta_salvataggio():
         nome_file += ".json"
     
     # Verifica che la sessione esista
-    sessione = sessioni_attive.get(id_sessione) or carica_sessione(id_sessione)
+    sessione = ottieni_sessione(id_sessione)
     if not sessione:
         return jsonify({"errore": "Sessione non trovata"}), 404
     
@@ -1197,12 +1820,23 @@ def esporta_salvataggio():
     try:
         sessione.salva(percorso_temp)
         
+        # Se il formato richiesto è diverso da quello dei salvataggi, converti il file in memoria
+        sorgente = percorso_temp
+        if formato is not None and formato != rileva_formato_file(percorso_temp):
+            import io
+            sorgente = io.BytesIO()
+            scrivi_salvataggio(sorgente, leggi_salvataggio(percorso_temp), formato)
+            sorgente.seek(0)
+        else:
+            formato = rileva_formato_file(percorso_temp)
+        
         # Invia il file al client
+        compresso = formato == SAVE_FORMAT_GZIP
         return send_file(
-            percorso_temp,
+            sorgente,
             as_attachment=True,
-            download_name=nome_file,
-            mimetype="application/json"
+            download_name=nome_file + ".gz" if compresso else nome_file,
+            mimetype=MIMETYPE_FORMATI_SALVATAGGIO[formato]
         )
     except Exception as e:
         return jsonify({"errore": f"Errore durante l'esportazione: {str(e)}"}), 500
@@ -1218,19 +1852,21 @@ def importa_salvataggio():
     if file.filename == "":
         return jsonify({"errore": "Nessun file selezionato"}), 400
     
-    if not file.filename.endswith(".json"):
-        return jsonify({"errore": "Il file deve essere in formato JSON"}), 400
+    # I salvataggi compressi esportati hanno estensione .json.gz
+    nome_file = os.path.basename(file.filename)
+    if nome_file.endswith(".gz"):
+        nome_file = nome_file[:-3]
+    if not nome_file.endswith(".json"):
+        return jsonify({"errore": "Il file deve essere in formato JSON o JSON compresso (.json.gz)"}), 400
     
-    # Salva il file caricato
-    nome_file = file.filename
+    # Salva il file caricato (il formato viene riconosciuto dal contenuto)
     percorso = os.path.join(SAVE_DIR, nome_file)
     
     try:
         file.save(percorso)
         
         # Carica il salvataggio per verificare che sia valido
-        with open(percorso, 'r') as f:
-            dati_salvati = json.load(f)
+        dati_salvati = leggi_salvataggio(percorso)
         
         # Crea un nuovo ID di sessione
         id_sessione = str(uuid4())
@@ -1245,7 +1881,7 @@ def importa_salvataggio():
         # Carichiamo il gioco completo (incluso lo stack degli stati)
         if sessione.game.carica(percorso):
             # Memorizza la sessione
-            sessioni_attive[id_sessione] = sessione
+            registra_sessione(id_sessione, sessione)
             salva_sessione(id_sessione, sessione)
             
             # Ottieni lo stato iniziale
@@ -1271,46 +1907,82 @@ def importa_salvataggio():
 def lista_salvataggi():
     """Restituisce la lista dei salvataggi disponibili"""
     try:
-        # Ottieni tutti i file di salvataggio
+        parametri = leggi_parametri_elenco_salvataggi()
+    except ValueError as e:
+        return jsonify({"errore": str(e)}), 400
+    
+    try:
+        voci, totale = get_indice_salvataggi().elenca(**parametri)
         salvataggi = []
-        for file in list_save_files():
-            percorso = get_save_path(file)
-            try:
-                with open(percorso, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                # Estrai informazioni rilevanti
-                timestamp = data.get("timestamp", 0)
-                versione = data.get("versione_gioco", "sconosciuta")
-                nome_giocatore = data.get("giocatore", {}).get("nome", "Sconosciuto")
-                livello = data.get("giocatore", {}).get("livello", 1)
-                classe = data.get("giocatore", {}).get("classe", "sconosciuto")
-                mappa = data.get("mappa_corrente", "sconosciuta")
-                
-                # Converti timestamp in data leggibile
-                data_ora = datetime.datetime.fromtimestamp(timestamp).strftime("%d/%m/%Y %H:%M:%S")
-                
-                salvataggi.append({
-                    "file": file,
-                    "giocatore": nome_giocatore,
-                    "livello": livello,
-                    "classe": classe,
-                    "mappa": mappa,
-                    "data": data_ora,
-                    "versione": versione
-                })
-            except Exception as e:
+        for voce in voci:
+            if "errore" in voce:
                 # Salvataggio corrotto o non valido
                 salvataggi.append({
-                    "file": file,
+                    "file": voce["file"],
                     "giocatore": "Salvataggio corrotto",
-                    "errore": str(e)
+                    "errore": voce["errore"]
                 })
+                continue
+                
+            salvataggi.append({
+                "file": voce["file"],
+                "giocatore": voce["giocatore"],
+                "livello": voce["livello"],
+                "classe": voce["classe"],
+                "mappa": voce["mappa"],
+                "data": formatta_data(voce["timestamp"]),
+                "versione": voce["versione"]
+            })
                 
-        return jsonify({"salvataggi": salvataggi})
+        return jsonify({"salvataggi": salvataggi, "totale": totale})
     except Exception as e:
         logger.error(f"Errore nella lettura dei salvataggi: {str(e)}")
         return jsonify({"errore": f"Errore nella lettura dei salvataggi: {str(e)}"}), 500
 
+@app.route("/metriche", methods=["GET"])
+def ottieni_metriche():
+    """Restituisce le metriche interne del processo"""
+    return jsonify({
+        "salvataggi": get_scrittore_salvataggi().metriche(),
+        "sessioni": dict(
+            metriche_sessioni,
+            attive=len(sessioni_attive),
+            notifiche_in_memoria=sum(len(s.notifiche) for s in list(sessioni_attive.values()))
+        ),
+        "stati": get_tracciatore_stati().metriche()
+    })
+
+@app.route("/shard/info", methods=["GET"])
+def info_shard():
+    """Informazioni sullo shard (usato dal router per i controlli di salute)"""
+    return jsonify({
+        "shard": SHARD_ID,
+        "pid": os.getpid(),
+        "sessioni_in_memoria": len(sessioni_attive)
+    })
+
+@app.route("/shard/sessioni", methods=["GET"])
+def sessioni_shard():
+    """ID delle sessioni in memoria (usato dal router per rilasciare quelle spostate)"""
+    return jsonify({"sessioni": list(sessioni_attive.keys())})
+
+@app.route("/shard/rilascia", methods=["POST"])
+def rilascia_shard():
+    """
+    Rimuove dalla memoria le sessioni dello shard (tutte o quelle indicate),
+    in modo che lo shard possa essere drenato o le sessioni ribilanciate.
+    """
+    data = request.get_json(silent=True) or {}
+    id_sessioni = data.get("id_sessioni")
+    
+    if id_sessioni is not None and not isinstance(id_sessioni, list):
+        return jsonify({"errore": "id_sessioni deve essere una lista"}), 400
+    
+    rilasciate = rilascia_sessioni(id_sessioni)
+    logger.info(f"Shard {SHARD_ID}: rilasciate {rilasciate} sessioni")
+    return jsonify({"rilasciate": rilasciate})
+
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0") 
\ No newline at end of file
+    porta = int(os.environ.get("RPG_PORTA", 5000))
+    # Il reloader di debug avvierebbe un secondo processo: disabilitato in modalità shard
+    app.run(debug=SHARD_ID is None, host="0.0.0.0", port=porta, threaded=True) 
\ No newline at end of file
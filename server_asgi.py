@@ -0,0 +1,354 @@
+"""
+Modalità di servizio asincrona (ASGI) per l'API di gioco.
+
+Espone le stesse rotte di server.py: ogni richiesta HTTP viene inoltrata
+all'applicazione Flask su un pool di thread limitato, così la logica di gioco
+(CPU-bound) e l'I/O su disco di salvataggi e sessioni non bloccano mai l'event loop.
+Le richieste sulla stessa sessione attendono il proprio turno sull'event loop, prima
+di occupare un thread del pool: molte richieste su una sessione non possono tenere
+occupati tutti i thread in attesa del lock per sessione di server.py. Il corpo della
+risposta viene inviato a blocchi man mano che l'app lo produce (ad esempio send_file).
+
+Il flusso SSE /eventi è gestito direttamente sull'event loop: una connessione
+inattiva non occupa alcun thread, quindi un solo processo può mantenere aperte
+molte connessioni di giocatori per lo più inattivi.
+
+Avvio (richiede un server ASGI, ad esempio uvicorn):
+    uvicorn server_asgi:app
+"""
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from server import app as flask_app, gestore_eventi, sessioni_attive, INTERVALLO_HEARTBEAT_SSE
+from core.flusso_eventi import formatta_evento_sse
+from util.config import get_session_path
+
+logger = logging.getLogger("gioco_rpg")
+
+# Numero massimo di richieste di gioco eseguite in parallelo
+MAX_WORKER_GIOCO = int(os.environ.get("RPG_MAX_WORKER", 8))
+
+# Dimensione massima accettata per il corpo di una richiesta (16 MB)
+DIMENSIONE_MASSIMA_CORPO = 16 * 1024 * 1024
+
+# Byte della risposta letti dall'app WSGI per ogni passaggio sul pool di thread
+DIMENSIONE_BLOCCO_RISPOSTA = 64 * 1024
+
+
+def _leggi_blocco(iteratore):
+    """
+    Legge dalla risposta WSGI fino a DIMENSIONE_BLOCCO_RISPOSTA byte.
+
+    Returns:
+        tuple: (byte letti, True se la risposta è terminata)
+    """
+    parti = []
+    dimensione = 0
+    for parte in iteratore:
+        parti.append(parte)
+        dimensione += len(parte)
+        if dimensione >= DIMENSIONE_BLOCCO_RISPOSTA:
+            return b"".join(parti), False
+    return b"".join(parti), True
+
+
+class ServerASGI:
+    """
+    Applicazione ASGI che avvolge l'app WSGI di Flask.
+    Le rotte normali vengono eseguite su un ThreadPoolExecutor limitato,
+    mentre i flussi SSE vengono serviti in modo nativo sull'event loop.
+    """
+
+    def __init__(self, wsgi_app, max_worker=MAX_WORKER_GIOCO):
+        """
+        Inizializza il server ASGI
+
+        Args:
+            wsgi_app: Applicazione WSGI da servire (l'app Flask)
+            max_worker (int): Dimensione del pool di thread per la logica di gioco
+        """
+        self.wsgi_app = wsgi_app
+        self.max_worker = max_worker
+        self.executor = ThreadPoolExecutor(max_workers=max_worker, thread_name_prefix="gioco")
+        # id_sessione -> [asyncio.Lock, richieste che lo usano]; usato solo dall'event loop
+        self._turni_sessioni = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._gestisci_lifespan(receive, send)
+        elif scope["type"] == "http":
+            if scope["path"] == "/eventi" and scope["method"] == "GET":
+                await self._flusso_eventi(scope, receive, send)
+            else:
+                await self._inoltra_wsgi(scope, receive, send)
+
+    async def _gestisci_lifespan(self, receive, send):
+        """Gestisce gli eventi di avvio e spegnimento del server ASGI"""
+        while True:
+            messaggio = await receive()
+            if messaggio["type"] == "lifespan.startup":
+                logger.info(f"Server ASGI avviato con {self.max_worker} worker di gioco")
+                await send({"type": "lifespan.startup.complete"})
+            elif messaggio["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _leggi_corpo(self, receive):
+        """
+        Legge l'intero corpo della richiesta.
+
+        Returns:
+            bytes: Il corpo, o None se supera la dimensione massima o il client si è disconnesso
+        """
+        parti = []
+        dimensione = 0
+        while True:
+            messaggio = await receive()
+            if messaggio["type"] == "http.disconnect":
+                return None
+            parte = messaggio.get("body", b"")
+            dimensione += len(parte)
+            if dimensione > DIMENSIONE_MASSIMA_CORPO:
+                return None
+            parti.append(parte)
+            if not messaggio.get("more_body", False):
+                return b"".join(parti)
+
+    def _costruisci_environ(self, scope, corpo):
+        """
+        Converte uno scope ASGI in un environ WSGI.
+
+        Args:
+            scope (dict): Scope HTTP ASGI
+            corpo (bytes): Corpo della richiesta
+
+        Returns:
+            dict: Environ WSGI equivalente
+        """
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": str(server[0]),
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": str(client[0]),
+            "CONTENT_LENGTH": str(len(corpo)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(corpo),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for nome, valore in scope.get("headers", []):
+            nome = nome.decode("latin-1")
+            valore = valore.decode("latin-1")
+            if nome == "content-type":
+                environ["CONTENT_TYPE"] = valore
+            elif nome == "content-length":
+                continue
+            else:
+                chiave = "HTTP_" + nome.upper().replace("-", "_")
+                if chiave in environ:
+                    valore = environ[chiave] + "," + valore
+                environ[chiave] = valore
+        return environ
+
+    @staticmethod
+    def _id_sessione(scope, corpo):
+        """
+        Estrae id_sessione dalla query string o dal corpo JSON, come con_lock_sessione.
+
+        Returns:
+            str: L'ID sessione o None
+        """
+        valori = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("id_sessione")
+        if valori:
+            return valori[0]
+        tipo = dict(scope.get("headers", [])).get(b"content-type", b"")
+        if corpo and b"json" in tipo:
+            try:
+                dati = json.loads(corpo)
+            except ValueError:
+                return None
+            if isinstance(dati, dict) and isinstance(dati.get("id_sessione"), str):
+                return dati["id_sessione"]
+        return None
+
+    @contextlib.asynccontextmanager
+    async def _turno_sessione(self, id_sessione):
+        """Attende sull'event loop che le richieste precedenti sulla stessa sessione terminino"""
+        if not id_sessione:
+            yield
+            return
+        turno = self._turni_sessioni.setdefault(id_sessione, [asyncio.Lock(), 0])
+        turno[1] += 1
+        try:
+            async with turno[0]:
+                yield
+        finally:
+            turno[1] -= 1
+            if not turno[1]:
+                del self._turni_sessioni[id_sessione]
+
+    def _esegui_wsgi(self, environ):
+        """
+        Esegue l'app WSGI in un thread del pool e legge il primo blocco della risposta.
+
+        Returns:
+            tuple: (codice di stato, lista di header, primo blocco del corpo,
+                    True se la risposta è terminata, iterabile WSGI della risposta)
+        """
+        risposta = {}
+
+        def start_response(status, headers, exc_info=None):
+            risposta["status"] = int(status.split(" ", 1)[0])
+            risposta["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+        risultato = self.wsgi_app(environ, start_response)
+        try:
+            iteratore = iter(risultato)
+            blocco, finito = _leggi_blocco(iteratore)
+        except BaseException:
+            if hasattr(risultato, "close"):
+                risultato.close()
+            raise
+        return risposta["status"], risposta["headers"], blocco, finito, risultato, iteratore
+
+    async def _inoltra_wsgi(self, scope, receive, send):
+        """Inoltra una richiesta all'app Flask sul pool di thread"""
+        corpo = await self._leggi_corpo(receive)
+        if corpo is None:
+            await self._invia_json(send, 413, {"errore": "Corpo della richiesta troppo grande o connessione interrotta"})
+            return
+
+        environ = self._costruisci_environ(scope, corpo)
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._turno_sessione(self._id_sessione(scope, corpo)):
+                status, headers, blocco, finito, risultato, iteratore = await loop.run_in_executor(
+                    self.executor, self._esegui_wsgi, environ)
+        except Exception as e:
+            logger.error(f"Errore durante l'elaborazione della richiesta {scope['path']}: {str(e)}")
+            await self._invia_json(send, 500, {"errore": f"Errore interno: {str(e)}"})
+            return
+
+        try:
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            while not finito:
+                await send({"type": "http.response.body", "body": blocco, "more_body": True})
+                blocco, finito = await loop.run_in_executor(self.executor, _leggi_blocco, iteratore)
+            await send({"type": "http.response.body", "body": blocco})
+        finally:
+            if hasattr(risultato, "close"):
+                await loop.run_in_executor(self.executor, risultato.close)
+
+    async def _invia_json(self, send, status, dati):
+        """Invia una risposta JSON completa"""
+        corpo = json.dumps(dati, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode())]
+        })
+        await send({"type": "http.response.body", "body": corpo})
+
+    async def _flusso_eventi(self, scope, receive, send):
+        """
+        Versione asincrona di /eventi: attende i nuovi eventi senza occupare thread.
+        """
+        parametri = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        id_sessione = parametri.get("id_sessione", [None])[0]
+        if not id_sessione:
+            await self._invia_json(send, 400, {"errore": "ID sessione non fornito"})
+            return
+
+        # Verifica che la sessione esista (controllo su disco fuori dall'event loop)
+        loop = asyncio.get_running_loop()
+        esiste = id_sessione in sessioni_attive or await loop.run_in_executor(
+            self.executor, os.path.exists, get_session_path(id_sessione))
+        if not esiste:
+            await self._invia_json(send, 404, {"errore": "Sessione non trovata"})
+            return
+
+        # Determina da quale evento riprendere
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        ultimo_id = headers.get("last-event-id") or parametri.get("ultimo_id", [None])[0]
+        try:
+            ultimo_id = int(ultimo_id) if ultimo_id is not None else None
+        except ValueError:
+            await self._invia_json(send, 400, {"errore": "ID evento non valido"})
+            return
+
+        canale = gestore_eventi.ottieni_canale(id_sessione)
+        segnale = asyncio.Event()
+        iscrizione = canale.iscrivi(ultimo_id)
+        iscrizione.al_nuovo_evento = lambda: loop.call_soon_threadsafe(segnale.set)
+
+        async def attendi_disconnessione():
+            while True:
+                messaggio = await receive()
+                if messaggio["type"] == "http.disconnect":
+                    iscrizione.chiudi()
+                    return
+
+        sorveglianza = asyncio.ensure_future(attendi_disconnessione())
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ]
+            })
+            await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+
+            while iscrizione.attiva:
+                evento = iscrizione.prossimo_disponibile()
+                if evento is not None:
+                    await send({
+                        "type": "http.response.body",
+                        "body": formatta_evento_sse(evento).encode("utf-8"),
+                        "more_body": True
+                    })
+                    continue
+
+                # Coda vuota: attendi un nuovo evento o invia un heartbeat
+                segnale.clear()
+                if not iscrizione.coda.empty():
+                    continue
+                try:
+                    await asyncio.wait_for(segnale.wait(), timeout=INTERVALLO_HEARTBEAT_SSE)
+                except asyncio.TimeoutError:
+                    await send({"type": "http.response.body", "body": b": heartbeat\n\n", "more_body": True})
+        finally:
+            sorveglianza.cancel()
+            canale.disiscrivi(iscrizione)
+
+
+# Applicazione ASGI pronta per uvicorn/hypercorn
+app = ServerASGI(flask_app)
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        logger.error("Per la modalità ASGI è necessario un server ASGI (es. 'pip install uvicorn')")
+        sys.exit(1)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("RPG_PORTA", 8000)))
@@ -1,8 +1,49 @@
+from states.registro_stati import deserializza_stato, registra_stato
+
+# Elementi a cui i dati salvati di uno stato possono riferirsi (vedi BaseState.riferimento_elemento):
+# tipo di riferimento -> (raccolta della mappa, raccolta degli stati)
+RACCOLTE_RIFERIBILI = {
+    "npg": ("npg", "npg_presenti"),
+    "oggetto": ("oggetti", "oggetti_interattivi")
+}
+
 class BaseState:
     """
     Classe base per tutti gli stati del gioco.
     Ogni stato specifico deve ereditare da questa classe e implementare il metodo esegui().
     """
+    # Versione del formato prodotto da to_dict: va incrementata, insieme a migra_dati,
+    # quando una sottoclasse cambia i dati che salva
+    VERSIONE_STATO = 1
+
+    # Comandi testuali accettati in ciascuna fase: {fase: RegistroComandi}.
+    # Attributo di classe, compilato una sola volta e non serializzato con lo stato
+    comandi = {}
+
+    # Budget (millisecondi) di una chiamata a esegui(), None per quello predefinito
+    # (vedi core/tracciamento_stati.py)
+    BUDGET_ESECUZIONE_MS = None
+
+    def __init_subclass__(cls, **kwargs):
+        """Registra ogni sottoclasse nel registro degli stati (vedi states/registro_stati.py)"""
+        super().__init_subclass__(**kwargs)
+        registra_stato(cls)
+
+    @classmethod
+    def migra_dati(cls, data, versione):
+        """
+        Aggiorna i dati salvati da una versione precedente del formato dello stato.
+        Le sottoclassi che incrementano VERSIONE_STATO la sovrascrivono.
+
+        Args:
+            data (dict): Dati dello stato
+            versione (int): Versione dei dati
+
+        Returns:
+            dict: I dati nel formato della versione corrente
+        """
+        return data
+
     def __init__(self):
         """Inizializza lo stato base"""
         # Contesto di gioco
@@ -32,6 +73,38 @@ class BaseState:
             
         raise NotImplementedError("Ogni stato deve implementare esegui()")
     
+    def registro_comandi(self):
+        """
+        Restituisce il registro dei comandi della fase corrente.
+
+        Returns:
+            RegistroComandi: Il registro, None se la fase non accetta comandi testuali
+        """
+        return self.comandi.get(getattr(self, "fase", None))
+
+    def interpreta_comando(self, testo):
+        """
+        Interpreta un comando testuale con il registro della fase corrente.
+
+        Args:
+            testo (str): Il comando del giocatore
+
+        Returns:
+            tuple: (azione, argomenti), None se il comando non è riconosciuto
+        """
+        registro = self.registro_comandi()
+        return registro.interpreta(testo) if registro else None
+
+    def comandi_disponibili(self):
+        """
+        Elenca i comandi accettati nella fase corrente.
+
+        Returns:
+            list: Azioni con sinonimi e descrizione (vedi RegistroComandi.elenca)
+        """
+        registro = self.registro_comandi()
+        return registro.elenca() if registro else []
+
     def entra(self, gioco=None):
         """
         Metodo chiamato quando si entra nello stato.
@@ -222,6 +295,75 @@ class BaseState:
             
         return game_ctx.cambia_mappa(mappa_dest, x, y)
 
+    # Riferimenti tra i dati salvati e le entità condivise
+
+    def riferimento_elemento(self, elemento, gioco=None):
+        """
+        Crea un riferimento serializzabile a un NPG o a un oggetto interattivo condiviso
+        con la mappa corrente o con un altro stato della pila, da risolvere con
+        risolvi_riferimento dopo il ripristino.
+
+        Args:
+            elemento: L'NPG o l'oggetto interattivo
+            gioco: L'istanza del gioco (opzionale se il contesto è già memorizzato)
+
+        Returns:
+            dict: Il riferimento, None se l'elemento non è condiviso
+        """
+        game_ctx = gioco if gioco else getattr(self, 'gioco', None)
+        if not game_ctx or elemento is None:
+            return None
+
+        mappa = self.ottieni_mappa_corrente(game_ctx)
+        for tipo, (raccolta_mappa, raccolta_stato) in RACCOLTE_RIFERIBILI.items():
+            if mappa is not None:
+                for (x, y), presente in getattr(mappa, raccolta_mappa).items():
+                    if presente is elemento:
+                        return {"mappa": mappa.nome, tipo: [x, y]}
+            for indice, stato in enumerate(game_ctx.stato_stack):
+                for chiave, presente in getattr(stato, raccolta_stato, {}).items():
+                    if presente is elemento:
+                        return {"stato": indice, tipo: chiave}
+        return None
+
+    def risolvi_riferimento(self, riferimento, gioco=None):
+        """
+        Risolve un riferimento creato da riferimento_elemento.
+
+        Args:
+            riferimento (dict): Il riferimento
+            gioco: L'istanza del gioco (opzionale se il contesto è già memorizzato)
+
+        Returns:
+            L'NPG o l'oggetto interattivo, None se non è più presente
+        """
+        game_ctx = gioco if gioco else getattr(self, 'gioco', None)
+        if not game_ctx or not riferimento:
+            return None
+
+        for tipo, (raccolta_mappa, raccolta_stato) in RACCOLTE_RIFERIBILI.items():
+            if tipo not in riferimento:
+                continue
+            if "mappa" in riferimento:
+                mappa = game_ctx.gestore_mappe.ottieni_mappa(riferimento["mappa"])
+                return getattr(mappa, raccolta_mappa).get(tuple(riferimento[tipo])) if mappa else None
+            indice = riferimento.get("stato", len(game_ctx.stato_stack))
+            if indice < len(game_ctx.stato_stack):
+                return getattr(game_ctx.stato_stack[indice], raccolta_stato, {}).get(riferimento[tipo])
+        return None
+
+    def ricollega(self, gioco, stati_sotto):
+        """
+        Chiamato dopo la ricostruzione della pila degli stati da dati salvati, con mappe e
+        giocatore già ripristinati. Gli stati che salvano riferimenti (ad altri stati, a NPG
+        o a oggetti delle mappe) la sovrascrivono per risolverli.
+
+        Args:
+            gioco: L'istanza del gioco
+            stati_sotto (list): Gli stati sotto questo nella pila, dal fondo
+        """
+        pass
+
     def to_dict(self):
         """
         Converte lo stato in un dizionario per la serializzazione.
@@ -303,52 +445,16 @@ class BaseState:
         Returns:
             BaseState: Nuova istanza di stato o istanza di base in caso di errore
         """
-        # Se c'è un tipo specifico, crea l'istanza appropriata
+        # Se c'è un tipo specifico, crea l'istanza appropriata tramite il registro degli stati
         state_type = data.get("type")
         if state_type != cls.__name__:
-            # Importazione dinamica dello stato corretto
-            import importlib
-            import traceback
-            
             try:
-                # Cerca in tutti i moduli states
-                # Correzione: mappatura esplicita dei nomi delle classi ai moduli
-                state_module_map = {
-                    "TavernaState": "taverna",
-                    "MercatoState": "mercato",
-                    "CombattimentoState": "combattimento",
-                    "DialogoState": "dialogo",
-                    "GestioneInventarioState": "gestione_inventario",
-                    "ProvaAbilitaState": "prova_abilita",
-                    "MappaState": "mappa_state",
-                    "SceltaMappaState": "scelta_mappa_state",
-                    "MenuState": "menu"
-                }
-                
-                # Usa la mappatura se disponibile, altrimenti fallback al nome in minuscolo
-                module_suffix = state_module_map.get(state_type, state_type.lower())
-                module_name = f"states.{module_suffix}"
-                
-                module = importlib.import_module(module_name)
-                state_class = getattr(module, state_type)
-                
-                # Crea l'istanza usando il metodo from_dict della classe
-                if hasattr(state_class, 'from_dict'):
-                    return state_class.from_dict(data)
-                else:
-                    # Se non ha un metodo from_dict, crea un'istanza di default
-                    return state_class()
-            except (ImportError, AttributeError) as e:
+                return deserializza_stato(data)
+            except Exception as e:
                 # Log dell'errore per debug
                 print(f"Errore durante il caricamento dello stato {state_type}: {e}")
-                print(traceback.format_exc())
                 # Fallback a un'istanza base invece di None
                 return cls()
-            except Exception as e:
-                # Cattura qualsiasi altro errore imprevisto
-                print(f"Errore imprevisto durante il caricamento dello stato: {e}")
-                print(traceback.format_exc())
-                return cls()
         
         # Istanza base
         return cls()
@@ -376,10 +482,10 @@ class BaseGameState(BaseState):
         
     def _init_commands(self):
         """
-        Metodo per inizializzare i comandi e le mappature dello stato.
-        Questa è un'implementazione di base vuota che le sottoclassi possono sovrascrivere.
+        Metodo per inizializzare i comandi dello stato che dipendono dall'istanza.
+        I comandi testuali fissi sono dichiarati nell'attributo di classe comandi,
+        compilato una sola volta per classe.
         """
-        # Implementazione di base vuota
         pass
         
     def entra(self, gioco=None):
@@ -451,4 +557,36 @@ class BaseGameState(BaseState):
             state.game = None  # Sarà impostato più tardi
             state.nome_stato = data.get("nome_stato", "sconosciuto")
             
-        return state
\ No newline at end of file
+        return state
+
+    def _serializza_elementi(self):
+        """
+        Serializza gli NPG presenti e gli oggetti interattivi degli stati che li hanno.
+
+        Returns:
+            dict: Dati da aggiungere a quelli di to_dict
+        """
+        return {
+            "npg_presenti": {nome: npg.to_dict() for nome, npg in self.npg_presenti.items()},
+            "oggetti_interattivi": {chiave: oggetto.to_dict() for chiave, oggetto in self.oggetti_interattivi.items()}
+        }
+
+    def _ripristina_elementi(self, data):
+        """
+        Riporta gli NPG presenti e gli oggetti interattivi creati dal costruttore allo stato
+        salvato da _serializza_elementi. Gli oggetti restano quelli del costruttore, che ha
+        creato anche i collegamenti e gli eventi non serializzati.
+
+        Args:
+            data (dict): Dati dello stato
+        """
+        from entities.npg import NPG
+        from items.oggetto import Oggetto
+
+        for nome, dati_npg in data.get("npg_presenti", {}).items():
+            self.npg_presenti[nome] = NPG.from_dict(dati_npg)
+        for chiave, dati_oggetto in data.get("oggetti_interattivi", {}).items():
+            oggetto = self.oggetti_interattivi.get(chiave)
+            if oggetto is not None:
+                oggetto.stato = dati_oggetto.get("stato", oggetto.stato)
+                oggetto.contenuto = [Oggetto.from_dict(item) for item in dati_oggetto.get("contenuto", [])]
\ No newline at end of file
@@ -3,8 +3,20 @@ from entities.nemico import Nemico
 from entities.giocatore import Giocatore
 from entities.npg import NPG
 from util.dado import Dado
+from core.eventi_gioco import COMBATTIMENTO_CONCLUSO, ORO_GUADAGNATO
+from core.comandi import RegistroComandi
 
 class CombattimentoState(BaseState):
+    # Comandi testuali della scelta dell'azione, con il numero della voce come azione
+    comandi = {
+        "esegui_azione": RegistroComandi([
+            ("1", ["attacca", "colpisco", "1"], "Attacca"),
+            ("2", ["usa", "oggetto", "pozione", "2"], "Usa oggetto"),
+            ("3", ["cambia", "equipaggiamento", "arma", "3"], "Cambia equipaggiamento"),
+            ("4", ["fuggi", "fuga", "scappa", "4"], "Fuggi")
+        ])
+    }
+    
     def __init__(self, nemico=None, npg_ostile=None):
         """
         Inizializza lo stato di combattimento.
@@ -68,27 +80,9 @@ class CombattimentoState(BaseState):
         """Fase di esecuzione dell'azione scelta"""
         scelta_input = gioco.io.ultimo_input
         
-        # Funzione per elaborare i comandi testuali
-        def elabora_comando_combattimento(cmd):
-            cmd = cmd.lower().strip()
-            
-            # Mappatura comandi di testo alle azioni
-            if any(x in cmd for x in ["attacca", "colpisco", "1"]):
-                return "1"
-            elif any(x in cmd for x in ["usa", "oggetto", "pozione", "2"]):
-                return "2"
-            elif any(x in cmd for x in ["cambia", "equipaggiamento", "arma", "3"]):
-                return "3"
-            elif any(x in cmd for x in ["fuggi", "fuga", "scappa", "4"]):
-                return "4"
-            else:
-                return None
-        
-        # Elabora il comando testuale o numerico
-        if scelta_input.isdigit() and scelta_input in ["1", "2", "3", "4"]:
-            scelta = scelta_input
-        else:
-            scelta = elabora_comando_combattimento(scelta_input)
+        # Elabora il comando testuale o numerico (vedi core/comandi.py)
+        risultato = self.interpreta_comando(scelta_input)
+        scelta = risultato[0] if risultato else None
         
         if scelta == "1":
             self._gestisci_attacco(giocatore, gioco)
@@ -205,8 +199,10 @@ class CombattimentoState(BaseState):
             if scelta == "1":
                 self.dati_temporanei["tipo_equip"] = "arma"
                 # Filtra le armi dall'inventario
-                armi = [item for item in giocatore.inventario 
-                       if not isinstance(item, str) and hasattr(item, 'tipo') and item.tipo == "arma"]
+                # Posizioni nell'inventario: i dati temporanei finiscono nello snapshot JSON della sessione
+                indici = [i for i, item in enumerate(giocatore.inventario)
+                          if not isinstance(item, str) and hasattr(item, 'tipo') and item.tipo == "arma"]
+                armi = [giocatore.inventario[i] for i in indici]
                 
                 if not armi:
                     gioco.io.mostra_messaggio("\nNon hai altre armi nell'inventario!")
@@ -220,7 +216,7 @@ class CombattimentoState(BaseState):
                     gioco.io.mostra_messaggio(f"{i}. {arma.nome}{bonus}")
                 gioco.io.mostra_messaggio(f"{len(armi) + 1}. Annulla")
                 
-                self.dati_temporanei["items"] = armi
+                self.dati_temporanei["items"] = indici
                 self.dati_temporanei["fase_equip"] = "scelta_item"
                 gioco.io.richiedi_input("\nScegli: ")
                 return
@@ -228,8 +224,9 @@ class CombattimentoState(BaseState):
             elif scelta == "2":
                 self.dati_temporanei["tipo_equip"] = "armatura"
                 # Filtra le armature dall'inventario
-                armature = [item for item in giocatore.inventario 
-                           if not isinstance(item, str) and hasattr(item, 'tipo') and item.tipo == "armatura"]
+                indici = [i for i, item in enumerate(giocatore.inventario)
+                          if not isinstance(item, str) and hasattr(item, 'tipo') and item.tipo == "armatura"]
+                armature = [giocatore.inventario[i] for i in indici]
                 
                 if not armature:
                     gioco.io.mostra_messaggio("\nNon hai altre armature nell'inventario!")
@@ -243,7 +240,7 @@ class CombattimentoState(BaseState):
                     gioco.io.mostra_messaggio(f"{i}. {armatura.nome}{bonus}")
                 gioco.io.mostra_messaggio(f"{len(armature) + 1}. Annulla")
                 
-                self.dati_temporanei["items"] = armature
+                self.dati_temporanei["items"] = indici
                 self.dati_temporanei["fase_equip"] = "scelta_item"
                 gioco.io.richiedi_input("\nScegli: ")
                 return
@@ -251,8 +248,9 @@ class CombattimentoState(BaseState):
             elif scelta == "3":
                 self.dati_temporanei["tipo_equip"] = "accessorio"
                 # Filtra gli accessori dall'inventario
-                accessori = [item for item in giocatore.inventario 
-                            if not isinstance(item, str) and hasattr(item, 'tipo') and item.tipo == "accessorio"]
+                indici = [i for i, item in enumerate(giocatore.inventario)
+                          if not isinstance(item, str) and hasattr(item, 'tipo') and item.tipo == "accessorio"]
+                accessori = [giocatore.inventario[i] for i in indici]
                 
                 if not accessori:
                     gioco.io.mostra_messaggio("\nNon hai altri accessori nell'inventario!")
@@ -271,7 +269,7 @@ class CombattimentoState(BaseState):
                     gioco.io.mostra_messaggio(f"{i}. {accessorio.nome}{bonus}")
                 gioco.io.mostra_messaggio(f"{len(accessori) + 1}. Annulla")
                 
-                self.dati_temporanei["items"] = accessori
+                self.dati_temporanei["items"] = indici
                 self.dati_temporanei["fase_equip"] = "scelta_item"
                 gioco.io.richiedi_input("\nScegli: ")
                 return
@@ -289,7 +287,8 @@ class CombattimentoState(BaseState):
                 
         elif self.dati_temporanei["fase_equip"] == "scelta_item":
             # Elabora la scelta dell'item
-            items = self.dati_temporanei.get("items", [])
+            indici = self.dati_temporanei.get("items", [])
+            items = [giocatore.inventario[i] for i in indici if i < len(giocatore.inventario)]
             
             try:
                 scelta = int(gioco.io.ultimo_input)
@@ -361,6 +360,7 @@ class CombattimentoState(BaseState):
         if giocatore.hp <= 0:
             gioco.io.mostra_messaggio(f"\n{self.avversario.nome} ti ha sconfitto! Sei ferito gravemente...")
             giocatore.hp = 1  # Invece di morire, il giocatore resta con 1 HP
+            self._emetti_fine_combattimento(gioco, vittoria=False)
             if gioco.stato_corrente():
                 gioco.pop_stato()
             return True
@@ -374,6 +374,8 @@ class CombattimentoState(BaseState):
             giocatore.oro += oro_guadagnato
             
             gioco.io.mostra_messaggio(f"Hai guadagnato {oro_guadagnato} monete d'oro!")
+            if oro_guadagnato:
+                gioco.eventi.emetti(ORO_GUADAGNATO, entita=giocatore.nome, quantita=oro_guadagnato, totale=giocatore.oro)
             
             # Controlla se c'è un oggetto da saccheggiare
             if hasattr(self.avversario, 'inventario') and self.avversario.inventario and len(self.avversario.inventario) > 0:
@@ -393,11 +395,17 @@ class CombattimentoState(BaseState):
             else:
                 gioco.io.mostra_messaggio(f"Hai guadagnato {exp_guadagnata} punti esperienza!")
             
+            self._emetti_fine_combattimento(gioco, vittoria=True)
             if gioco.stato_corrente():
                 gioco.pop_stato()
             return True
             
         return False
+    
+    def _emetti_fine_combattimento(self, gioco, vittoria):
+        """Emette l'evento di fine combattimento con i danni subiti dal giocatore"""
+        gioco.eventi.emetti(COMBATTIMENTO_CONCLUSO, avversario=self.avversario.nome, vittoria=vittoria,
+                            danni_subiti=self.dati_temporanei.get("danni_subiti", 0))
         
     def _gestisci_attacco(self, giocatore, gioco):
         """Gestisce l'attacco del giocatore"""
@@ -436,8 +444,8 @@ class CombattimentoState(BaseState):
             
         # Descrizione dell'attacco
         if hasattr(self.avversario, 'armi') and self.avversario.armi:
-            import random
-            arma = random.choice(self.avversario.armi)
+            from util.casualita import rng
+            arma = rng().choice(self.avversario.armi)
             gioco.io.mostra_messaggio(f"\n{self.avversario.nome} ti attacca con {arma}!")
         else:
             gioco.io.mostra_messaggio(f"\n{self.avversario.nome} ti attacca!")
@@ -447,6 +455,8 @@ class CombattimentoState(BaseState):
         
         gioco.io.mostra_messaggio(f"Subisci {danno_effettivo} danni!")
         giocatore.ferisci(danno, gioco)
+        # Salvato con lo stato, per gli achievement sui combattimenti senza danni
+        self.dati_temporanei["danni_subiti"] = self.dati_temporanei.get("danni_subiti", 0) + danno_effettivo
     
     def _applica_effetto_oggetto(self, giocatore, item, gioco):
         """Applica l'effetto di un oggetto"""
@@ -479,6 +489,7 @@ class CombattimentoState(BaseState):
         risultato_tiro = self.dado_d20.tira()
         if risultato_tiro >= 10:
             gioco.io.mostra_messaggio(f"\nSei riuscito a fuggire! (Tiro: {risultato_tiro})")
+            self._emetti_fine_combattimento(gioco, vittoria=False)
             if gioco.stato_corrente():
                 gioco.pop_stato()
         else:
@@ -538,8 +549,15 @@ class CombattimentoState(BaseState):
         stato.turno = data.get("turno", 1)
         stato.fase = data.get("fase", "scelta")
         stato.dati_temporanei = data.get("dati_temporanei", {})
+        stato._riferimento_npg = data.get("npg_riferimento")
         
         return stato
+    
+    def ricollega(self, gioco, stati_sotto):
+        """Sostituisce l'NPG ostile ricostruito con quello condiviso a cui si riferiva"""
+        npg = self.risolvi_riferimento(getattr(self, "_riferimento_npg", None), gioco)
+        if npg is not None:
+            self.npg_ostile = self.avversario = npg
         
     def to_dict(self):
         """
@@ -561,6 +579,8 @@ class CombattimentoState(BaseState):
                 # Aggiungi un campo type per distinguere tra NPG e Nemico
                 if self.npg_ostile is not None:
                     avversario_dict["type"] = "NPG"
+                    # L'NPG è condiviso con la mappa o con lo stato da cui è partito il combattimento
+                    data["npg_riferimento"] = self.riferimento_elemento(self.npg_ostile)
                 data["avversario"] = avversario_dict
         
         return data
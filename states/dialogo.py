@@ -1,5 +1,6 @@
 from states.base_state import BaseState
 from entities.npg import NPG
+from core.eventi_gioco import NODO_DIALOGO
 
 class DialogoState(BaseState):
     """Stato che gestisce il dialogo con un NPG"""
@@ -49,6 +50,10 @@ class DialogoState(BaseState):
             gioco.pop_stato()  # Esce dallo stato corrente
             return self.stato_ritorno or "mappa"
         
+        eventi = getattr(gioco, "eventi", None)
+        if eventi is not None:
+            eventi.emetti(NODO_DIALOGO, npg=self.npg.nome, nodo=self.stato_corrente)
+        
         # Gestisce gli effetti legati allo stato della conversazione
         if "effetto" in dati_conversazione:
             self._gestisci_effetto(dati_conversazione["effetto"], gioco)
@@ -216,6 +221,8 @@ class DialogoState(BaseState):
                 data["npg"] = self.npg.to_dict()
             else:
                 data["npg"] = {"nome": self.npg.nome}
+            # L'NPG è condiviso con la mappa o con lo stato da cui è partito il dialogo
+            data["npg_riferimento"] = self.riferimento_elemento(self.npg)
         
         return data
     
@@ -247,10 +254,19 @@ class DialogoState(BaseState):
         state = cls(npg, stato_ritorno=data.get("stato_ritorno"))
         
         # Ripristina attributi
+        state.fase = data.get("fase", "conversazione")
+        state.stato_corrente = data.get("stato_corrente", "inizio")
         state.dati_contestuali = data.get("dati_contestuali", {})
         state.ultimo_input = data.get("ultimo_input")
+        state._riferimento_npg = data.get("npg_riferimento")
         
         return state
+    
+    def ricollega(self, gioco, stati_sotto):
+        """Sostituisce l'NPG ricostruito con quello condiviso a cui si riferiva"""
+        npg = self.risolvi_riferimento(getattr(self, "_riferimento_npg", None), gioco)
+        if npg is not None:
+            self.npg = npg
         
     def __getstate__(self):
         """
@@ -290,11 +290,20 @@ class GestioneInventarioState(BaseState):
         state.fase = data.get("fase", "menu_principale")
         state.ultimo_input = data.get("ultimo_input")
         
-        # Nota: stato_precedente verrà gestito dal chiamante
-        # perché potrebbe richiedere riferimenti all'intero stack di stati
+        # stato_precedente è uno degli stati sotto nella pila: viene risolto da ricollega
+        stato_precedente = data.get("stato_precedente")
+        state._tipo_stato_precedente = (stato_precedente.get("type") if isinstance(stato_precedente, dict)
+                                        else data.get("stato_precedente_tipo"))
         
         return state
 
+    def ricollega(self, gioco, stati_sotto):
+        """Ricollega stato_precedente allo stato più vicino del tipo salvato"""
+        tipo = getattr(self, "_tipo_stato_precedente", None)
+        if tipo:
+            self.stato_precedente = next((stato for stato in reversed(stati_sotto)
+                                          if type(stato).__name__ == tipo), None)
+
 # I vecchi metodi non sono più necessari perché ora abbiamo versioni separate per ogni fase
 # def _usa_oggetto(self, gioco): ...
 # def _equipaggia_oggetto(self, gioco): ...
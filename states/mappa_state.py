@@ -286,7 +286,14 @@ class MappaState(BaseState):
         # Ripristina attributi
         state.mostra_leggenda = data.get("mostra_leggenda", True)
         
-        # Nota: stato_origine verrà gestito dopo il caricamento completo
-        # dello stack degli stati, in quanto potrebbe richiedere riferimenti circolari
+        # stato_origine è uno degli stati sotto nella pila: viene risolto da ricollega
+        state._tipo_stato_origine = data.get("stato_origine_tipo")
         
         return state
+
+    def ricollega(self, gioco, stati_sotto):
+        """Ricollega stato_origine allo stato più vicino del tipo salvato"""
+        tipo = getattr(self, "_tipo_stato_origine", None)
+        if tipo:
+            self.stato_origine = next((stato for stato in reversed(stati_sotto)
+                                       if type(stato).__name__ == tipo), None)
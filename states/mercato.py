@@ -6,17 +6,36 @@ from entities.giocatore import Giocatore
 from states.gestione_inventario import GestioneInventarioState
 from items.oggetto_interattivo import Baule, Leva, Porta, OggettoInterattivo, Trappola, OggettoRompibile
 from items.oggetto import Oggetto  # Assicurati che questa importazione sia corretta
+from core.eventi_gioco import MAPPA_CAMBIATA, ORO_GUADAGNATO
 from states.prova_abilita import ProvaAbilitaState
 from world.mappa import Mappa
 from world.gestore_mappe import GestitoreMappe
 from core.io_interface import GameIO  # Importazione corretta per l'interfaccia IO
 from util.data_manager import get_data_manager
+from core.comandi import RegistroComandi
 import logging
 
 
 class MercatoState(BaseGameState):
     """Classe che rappresenta lo stato del mercato"""
     
+    # Comandi testuali del menu principale, con il numero della voce come azione
+    comandi = {
+        "menu_principale": RegistroComandi([
+            ("1", ["compra", "acquista", "pozione", "1"], "Compra pozione (5 oro)"),
+            ("2", ["vendi", "vende", "vendere", "2"], "Vendi oggetto"),
+            ("3", ["parla", "mercante", "conversare", "3"], "Parla con un mercante"),
+            ("4", ["sfida", "combatti", "duello", "4"], "Sfida un mercante"),
+            ("5", ["inventario", "zaino", "gestisci", "5"], "Gestisci inventario"),
+            ("6", ["esplora", "cerca", "oggetti", "6"], "Esplora oggetti nel mercato"),
+            ("7", ["prova", "abilità", "skill", "7"], "Prova abilità"),
+            ("8", ["mappa", "visualizza", "8"], "Visualizza mappa"),
+            ("9", ["muovi", "movimento", "vai", "9"], "Muoviti sulla mappa"),
+            ("10", ["interagisci", "ambiente", "interazione", "10"], "Interagisci con l'ambiente"),
+            ("11", ["viaggia", "zona", "cambio", "11"], "Viaggia verso un'altra zona")
+        ])
+    }
+    
     def __init__(self, game):
         super().__init__(game)
         self.nome_stato = "mercato"
@@ -166,7 +185,10 @@ class MercatoState(BaseGameState):
             if mappa:
                 gioco.gestore_mappe.imposta_mappa_attuale("mercato")
                 x, y = mappa.pos_iniziale_giocatore
+                mappa_precedente = gioco.giocatore.mappa_corrente
                 gioco.giocatore.imposta_posizione("mercato", x, y)
+                if mappa_precedente != "mercato" and getattr(gioco, "eventi", None) is not None:
+                    gioco.eventi.emetti(MAPPA_CAMBIATA, da=mappa_precedente, a="mercato", x=x, y=y)
                 # Popola la mappa con gli oggetti interattivi e gli NPG
                 gioco.gestore_mappe.trasferisci_oggetti_da_stato("mercato", self)
             self.prima_visita_completata = True
@@ -263,33 +285,11 @@ class MercatoState(BaseGameState):
             self.esegui(gioco)
     
     def _elabora_comando_mercato(self, cmd):
-        cmd = cmd.lower().strip()
-        
-        # Mappatura comandi di testo alle azioni
-        if any(x in cmd for x in ["compra", "pozione", "acquista"]):
-            return "1"
-        elif any(x in cmd for x in ["vendi", "vende", "vendere"]):
-            return "2"
-        elif any(x in cmd for x in ["parla", "mercante", "conversare"]):
-            return "3"
-        elif any(x in cmd for x in ["sfida", "combatti", "duello"]):
-            return "4"
-        elif any(x in cmd for x in ["inventario", "zaino", "gestisci"]):
-            return "5"
-        elif any(x in cmd for x in ["esplora", "cerca", "oggetti"]):
-            return "6"
-        elif any(x in cmd for x in ["prova", "abilità", "skill"]):
-            return "7"
-        elif any(x in cmd for x in ["mappa", "visualizza"]):
-            return "8"
-        elif any(x in cmd for x in ["muovi", "movimento", "vai"]):
-            return "9"
-        elif any(x in cmd for x in ["interagisci", "ambiente", "interazione"]):
-            return "10"
-        elif any(x in cmd for x in ["viaggia", "zona", "cambio", "mappa"]):
-            return "11"
-        else:
+        # Riconosce il comando testuale con il registro della fase (vedi core/comandi.py)
+        risultato = self.interpreta_comando(cmd)
+        if risultato is None:
             return cmd  # ritorna il comando originale se non corrisponde a nessuna azione
+        return risultato[0]
     
     def _compra_pozione(self, gioco):
         if gioco.giocatore.oro >= 5:
@@ -376,6 +376,8 @@ class MercatoState(BaseGameState):
         if conferma.lower() == "s":
             oggetto = gioco.giocatore.inventario.pop(idx)
             gioco.giocatore.oro += prezzo_vendita
+            gioco.eventi.emetti(ORO_GUADAGNATO, entita=gioco.giocatore.nome, quantita=prezzo_vendita,
+                                totale=gioco.giocatore.oro)
             gioco.io.mostra_messaggio(f"Hai venduto {oggetto} per {prezzo_vendita} monete d'oro!")
         else:
             gioco.io.mostra_messaggio("Vendita annullata.")
@@ -605,12 +607,6 @@ class MercatoState(BaseGameState):
         # Dopo l'interazione, torneremo al menu principale
         self.fase = "menu_principale"
     
-    def _init_commands(self):
-        """Inizializza i comandi e le loro mappature per questo stato"""
-        # Questo è un metodo temporaneo che può essere implementato completamente in futuro
-        # Per ora è vuoto per consentire l'esecuzione del gioco
-        pass
-        
     def to_dict(self):
         """
         Converte lo stato del mercato in un dizionario per la serializzazione.
@@ -621,12 +617,23 @@ class MercatoState(BaseGameState):
         # Ottieni il dizionario base
         data = super().to_dict()
         
+        # L'NPG e l'oggetto scelti diventano riferimenti, risolti da ricollega
+        dati_contestuali = dict(self.dati_contestuali)
+        for chiave in ("npg_combattimento", "oggetto_interazione"):
+            if chiave in dati_contestuali:
+                dati_contestuali[chiave] = self.riferimento_elemento(dati_contestuali[chiave])
+        
         # Aggiungi attributi specifici
         data.update({
             "fase": self.fase,
             "ultimo_input": self.ultimo_input,
-            # Non serializzare mercanti, scorte, oggetti_interattivi poiché sono generati dinamicamente
+            "prima_visita_completata": hasattr(self, 'prima_visita_completata'),
+            "nome_npg_attivo": self.nome_npg_attivo,
+            "stato_conversazione": self.stato_conversazione,
+            "mostra_mappa": self.mostra_mappa,
+            "dati_contestuali": dati_contestuali
         })
+        data.update(self._serializza_elementi())
         
         return data
     
@@ -642,40 +649,29 @@ class MercatoState(BaseGameState):
         Returns:
             MercatoState: Nuova istanza di MercatoState
         """
-        # Otteniamo innanzitutto uno stato di base attraverso la classe padre
-        state = super().from_dict(data, game)
-        
-        # Inizializziamo manualmente gli attributi specifici di MercatoState
-        state.nome_stato = "mercato"
+        # Il costruttore crea NPG e oggetti interattivi, poi riportati allo stato salvato
+        state = cls(game)
         state.game = game
+        
         state.fase = data.get("fase", "menu_principale")
         state.ultimo_input = data.get("ultimo_input")
-        state.dati_contestuali = {}
-        state.prima_visita_completata = False
-        
-        # Inizializza gli NPC del mercato
-        state.npg_presenti = {
-            "Araldo": NPG("Araldo"),
-            "Violetta": NPG("Violetta"),
-            "Gundren": NPG("Gundren")
-        }
-        state.nome_npg_attivo = None
-        state.stato_conversazione = "inizio"
-        state.stato_precedente = None
-        
-        # Inizializza gli oggetti interattivi vuoti (verranno caricati dal sistema JSON)
-        state.oggetti_interattivi = {}
-        state.mostra_mappa = False
-        
-        # Direzioni di movimento
-        state.direzioni = {
-            "nord": (0, -1),
-            "sud": (0, 1),
-            "est": (1, 0),
-            "ovest": (-1, 0)
-        }
+        # esegui posiziona il giocatore finché l'attributo non esiste (senza il dato, il
+        # mercato è già stato visitato)
+        if data.get("prima_visita_completata", True):
+            state.prima_visita_completata = True
+        state.nome_npg_attivo = data.get("nome_npg_attivo")
+        state.stato_conversazione = data.get("stato_conversazione", "inizio")
+        state.mostra_mappa = data.get("mostra_mappa", False)
+        state.dati_contestuali = dict(data.get("dati_contestuali", {}))
+        state._ripristina_elementi(data)
         
         return state
+    
+    def ricollega(self, gioco, stati_sotto):
+        """Risolve i riferimenti salvati in dati_contestuali da to_dict"""
+        for chiave in ("npg_combattimento", "oggetto_interazione"):
+            if chiave in self.dati_contestuali:
+                self.dati_contestuali[chiave] = self.risolvi_riferimento(self.dati_contestuali[chiave], gioco)
         
     def __getstate__(self):
         """
@@ -184,7 +184,6 @@ class ProvaAbilitaState(BaseState):
                 
                 self.dati_contestuali["fase_npg"] = "scelta_npg"
                 self.dati_contestuali["tipo_lista"] = "dizionario"
-                self.dati_contestuali["stato_precedente"] = stato_precedente
                 self.ultimo_input = gioco.io.richiedi_input("\nScegli NPG: ")
                 return
             else:
@@ -194,7 +193,6 @@ class ProvaAbilitaState(BaseState):
                 
                 self.dati_contestuali["fase_npg"] = "scelta_npg"
                 self.dati_contestuali["tipo_lista"] = "lista"
-                self.dati_contestuali["stato_precedente"] = stato_precedente
                 self.ultimo_input = gioco.io.richiedi_input("\nScegli NPG: ")
                 return
         
@@ -202,7 +200,9 @@ class ProvaAbilitaState(BaseState):
         if self.dati_contestuali["fase_npg"] == "scelta_npg":
             try:
                 scelta = int(self.ultimo_input)
-                stato_precedente = self.dati_contestuali["stato_precedente"]
+                # Lo stato che ha invocato la prova è ancora sotto questo nella pila: non va nei
+                # dati contestuali, che finiscono nello snapshot JSON della sessione
+                stato_precedente = gioco.stato_stack[-2]
                 
                 if self.dati_contestuali["tipo_lista"] == "dizionario":
                     if 1 <= scelta <= len(stato_precedente.npg_presenti):
@@ -300,7 +300,6 @@ class ProvaAbilitaState(BaseState):
                 
                 self.dati_contestuali["fase_oggetto"] = "scelta_oggetto"
                 self.dati_contestuali["tipo_lista"] = "dizionario"
-                self.dati_contestuali["stato_precedente"] = stato_precedente
                 self.ultimo_input = gioco.io.richiedi_input("\nScegli oggetto: ")
                 return
             else:
@@ -314,7 +313,6 @@ class ProvaAbilitaState(BaseState):
                 
                 self.dati_contestuali["fase_oggetto"] = "scelta_oggetto"
                 self.dati_contestuali["tipo_lista"] = "lista"
-                self.dati_contestuali["stato_precedente"] = stato_precedente
                 self.ultimo_input = gioco.io.richiedi_input("\nScegli oggetto: ")
                 return
         
@@ -322,7 +320,7 @@ class ProvaAbilitaState(BaseState):
         if self.dati_contestuali["fase_oggetto"] == "scelta_oggetto":
             try:
                 scelta = int(self.ultimo_input)
-                stato_precedente = self.dati_contestuali["stato_precedente"]
+                stato_precedente = gioco.stato_stack[-2]
                 
                 if self.dati_contestuali["tipo_lista"] == "dizionario":
                     num_opzione_torna = len(stato_precedente.oggetti_interattivi) + 1
@@ -0,0 +1,137 @@
+"""
+Registro delle classi di stato.
+
+Ogni sottoclasse di BaseState si registra con il proprio nome al momento della
+definizione (BaseState.__init_subclass__): la ricostruzione di uno stato salvato
+risolve la classe con una ricerca in un dizionario, senza importlib.
+
+I moduli del package states vengono importati una sola volta, alla prima richiesta
+di uno stato non ancora registrato, così anche gli stati aggiunti in nuovi moduli
+vengono trovati senza mappe da mantenere a mano.
+
+Ogni stato serializzato porta la versione del formato della sua classe
+(VERSIONE_STATO); i dati di una versione precedente passano da migra_dati della
+classe prima di from_dict.
+"""
+import logging
+
+logger = logging.getLogger("gioco_rpg")
+
+# Chiave dei dati serializzati con la versione del formato dello stato
+CHIAVE_VERSIONE = "versione_stato"
+
+_stati = {}  # {nome della classe: classe}
+_scoperta_eseguita = False
+
+
+def registra_stato(classe):
+    """
+    Registra una classe di stato con il suo nome. Usabile anche come decoratore
+    per stati che non derivano da BaseState.
+
+    Args:
+        classe (type): La classe di stato
+
+    Returns:
+        type: La stessa classe
+    """
+    nome = classe.__name__
+    precedente = _stati.get(nome)
+    if precedente is not None and precedente is not classe and precedente.__module__ != classe.__module__:
+        logger.warning(f"Stato {nome} di {classe.__module__} sostituisce quello di {precedente.__module__}")
+    _stati[nome] = classe
+    return classe
+
+
+def _scopri_stati():
+    """Importa una sola volta tutti i moduli del package states, che registrano i loro stati"""
+    global _scoperta_eseguita
+    if _scoperta_eseguita:
+        return
+    _scoperta_eseguita = True
+    # Importati qui: servono solo alla prima scoperta e non devono pesare sull'avvio
+    import importlib
+    import pkgutil
+    import states
+    for modulo in pkgutil.iter_modules(states.__path__):
+        try:
+            importlib.import_module(f"states.{modulo.name}")
+        except Exception as e:
+            logger.error(f"Impossibile importare il modulo di stati {modulo.name}: {e}")
+
+
+def classe_stato(nome):
+    """
+    Restituisce la classe di stato registrata con un nome.
+
+    Args:
+        nome (str): Nome della classe (campo "type" degli stati serializzati)
+
+    Returns:
+        type: La classe, None se nessuno stato ha quel nome
+    """
+    classe = _stati.get(nome)
+    if classe is None and not _scoperta_eseguita:
+        _scopri_stati()
+        classe = _stati.get(nome)
+    return classe
+
+
+def stati_registrati():
+    """
+    Returns:
+        dict: {nome: classe} di tutti gli stati del package states
+    """
+    _scopri_stati()
+    return dict(_stati)
+
+
+def serializza_stato(stato):
+    """
+    Converte uno stato in dizionario indicando tipo e versione del formato.
+
+    Args:
+        stato: Lo stato da serializzare
+
+    Returns:
+        dict: I dati dello stato
+    """
+    if hasattr(stato, "to_dict"):
+        dati = stato.to_dict()
+    else:
+        dati = {}
+    dati.setdefault("type", stato.__class__.__name__)
+    dati[CHIAVE_VERSIONE] = getattr(stato, "VERSIONE_STATO", 1)
+    return dati
+
+
+def deserializza_stato(dati):
+    """
+    Ricostruisce uno stato dai dati prodotti da serializza_stato (o da to_dict
+    nei salvataggi precedenti al registro, considerati di versione 1).
+
+    Args:
+        dati (dict): I dati dello stato
+
+    Returns:
+        BaseState: Lo stato ricostruito
+
+    Raises:
+        KeyError: Se il tipo dello stato non è registrato
+        ValueError: Se i dati sono di una versione più recente della classe
+    """
+    nome = dati.get("type")
+    classe = classe_stato(nome)
+    if classe is None:
+        raise KeyError(f"Stato non registrato: {nome}")
+
+    versione = dati.get(CHIAVE_VERSIONE, 1)
+    versione_classe = getattr(classe, "VERSIONE_STATO", 1)
+    if versione > versione_classe:
+        raise ValueError(f"Lo stato {nome} è della versione {versione}, supportata fino alla {versione_classe}")
+    if versione < versione_classe:
+        dati = classe.migra_dati(dict(dati), versione)
+
+    if hasattr(classe, "from_dict"):
+        return classe.from_dict(dati)
+    return classe()
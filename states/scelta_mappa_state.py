@@ -3,6 +3,7 @@ from states.taverna import TavernaState
 from states.mercato import MercatoState
 from states.mappa_state import MappaState
 from util.funzioni_utili import avanti
+from core.eventi_gioco import MAPPA_CAMBIATA
 
 class SceltaMappaState(BaseGameState):
     """
@@ -152,7 +153,12 @@ class SceltaMappaState(BaseGameState):
                 # Cambia la mappa corrente
                 gioco.gestore_mappe.imposta_mappa_attuale(mappa_destinazione)
                 x, y = mappa.pos_iniziale_giocatore
+                mappa_precedente = gioco.giocatore.mappa_corrente
                 gioco.giocatore.imposta_posizione(mappa_destinazione, x, y)
+                # Il viaggio è l'ingresso nella mappa per achievement e missioni: il nuovo
+                # stato trova il giocatore già sulla mappa e non lo conta
+                if mappa_precedente != mappa_destinazione and getattr(gioco, "eventi", None) is not None:
+                    gioco.eventi.emetti(MAPPA_CAMBIATA, da=mappa_precedente, a=mappa_destinazione, x=x, y=y)
                 
                 # Invece di rimuovere questo stato e poi aggiungere quello nuovo,
                 # sostituiamo direttamente lo stato corrente usando cambia_stato
@@ -10,12 +10,33 @@ from states.prova_abilita import ProvaAbilitaState
 from world.mappa import Mappa
 from world.gestore_mappe import GestitoreMappe
 from util.data_manager import get_data_manager
+from core.comandi import RegistroComandi
+from core.eventi_gioco import MAPPA_CAMBIATA
 import logging
 
 
 class TavernaState(BaseGameState):
     """Classe che rappresenta lo stato della taverna"""
     
+    # Comandi testuali del menu principale, con il numero della voce come azione
+    comandi = {
+        "elabora_scelta": RegistroComandi([
+            ("1", ["parla", "dialoga", "conversa", "1"], "Parla con qualcuno"),
+            ("2", ["viaggia", "vai", "zona", "cambio", "2"], "Viaggia verso un'altra zona"),
+            ("3", ["statistiche", "stat", "status", "3"], "Mostra statistiche"),
+            ("4", ["combatti", "attacca", "lotta", "4"], "Combatti con un nemico"),
+            ("5", ["sfida", "duello", "5"], "Sfida un NPC"),
+            ("6", ["esplora", "cerca", "oggetti", "6"], "Esplora oggetti nella taverna"),
+            ("7", ["inventario", "zaino", "7"], "Mostra inventario"),
+            ("8", ["prova", "abilità", "skill", "8"], "Prova abilità"),
+            ("9", ["mappa", "guarda mappa", "visualizza", "9"], "Visualizza mappa"),
+            ("10", ["muovi", "sposta", "10"], "Muoviti sulla mappa"),
+            ("11", ["interagisci", "usa", "ambiente", "11"], "Interagisci con l'ambiente"),
+            ("12", ["salva", "save", "12"], "Salva partita"),
+            ("13", ["esci", "quit", "exit", "13"], "Esci dal gioco")
+        ])
+    }
+    
     def __init__(self, game):
         super().__init__(game)
         self.nome_stato = "taverna"
@@ -92,12 +113,6 @@ class TavernaState(BaseGameState):
         # Inizializza menu e comandi
         self._init_commands()
 
-    def _init_commands(self):
-        """Inizializza i comandi e le loro mappature per questo stato"""
-        # Questo è un metodo temporaneo che può essere implementato completamente in futuro
-        # Per ora è vuoto per consentire l'esecuzione del gioco
-        pass
-
     def esegui(self, gioco):
         if self.prima_visita:
             gioco.io.mostra_messaggio(f"Benvenuto {gioco.giocatore.nome} sei appena arrivato nella Taverna Il Portale Spalancato a Waterdeep. Sei di ritrono da un lungo viaggio che ti ha permesso di ottenere molti tesori ma anche molte cicatrici. Entri con passo svelto e ti dirigi verso la tua prossima avventura")
@@ -108,7 +123,11 @@ class TavernaState(BaseGameState):
             if mappa:
                 gioco.gestore_mappe.imposta_mappa_attuale("taverna")
                 x, y = mappa.pos_iniziale_giocatore
+                mappa_precedente = gioco.giocatore.mappa_corrente
                 gioco.giocatore.imposta_posizione("taverna", x, y)
+                # Il primo posizionamento è l'ingresso nella mappa per achievement e missioni
+                if mappa_precedente != "taverna" and getattr(gioco, "eventi", None) is not None:
+                    gioco.eventi.emetti(MAPPA_CAMBIATA, da=mappa_precedente, a="taverna", x=x, y=y)
                 # Popola la mappa con gli oggetti interattivi e gli NPG
                 gioco.gestore_mappe.trasferisci_oggetti_da_stato("taverna", self)
 
@@ -210,37 +229,11 @@ class TavernaState(BaseGameState):
             self.fase = "menu_principale"
     
     def _elabora_comando(self, cmd):
-        cmd = cmd.lower().strip()
-        
-        # Mappatura comandi di testo ai numeri
-        if any(parola in cmd for parola in ["parla", "dialoga", "conversa"]):
-            return "1"
-        elif any(parola in cmd for parola in ["viaggia", "vai", "zona", "cambio", "mappa"]):
-            return "2"
-        elif any(parola in cmd for parola in ["statistiche", "stat", "status"]):
-            return "3"
-        elif any(parola in cmd for parola in ["combatti", "attacca", "lotta"]):
-            return "4"
-        elif any(parola in cmd for parola in ["sfida", "duello"]):
-            return "5"
-        elif any(parola in cmd for parola in ["esplora", "cerca", "oggetti"]):
-            return "6"
-        elif any(parola in cmd for parola in ["inventario", "zaino", "oggetti"]):
-            return "7"
-        elif any(parola in cmd for parola in ["prova", "abilità", "skill"]):
-            return "8"
-        elif any(parola in cmd for parola in ["mappa", "guarda mappa", "visualizza"]):
-            return "9"
-        elif any(parola in cmd for parola in ["muovi", "vai", "sposta"]):
-            return "10"
-        elif any(parola in cmd for parola in ["interagisci", "usa", "ambiente"]):
-            return "11"
-        elif any(parola in cmd for parola in ["salva", "save"]):
-            return "12"
-        elif any(parola in cmd for parola in ["esci", "quit", "exit"]):
-            return "13"
-        else:
+        # Riconosce il comando testuale con il registro della fase (vedi core/comandi.py)
+        risultato = self.interpreta_comando(cmd)
+        if risultato is None:
             return cmd  # ritorna il comando originale se non corrisponde a nessuna azione
+        return risultato[0]
     
     def _parla_con_npg(self, gioco):
         # Verifica se abbiamo già mostrato la lista degli NPG
@@ -544,31 +537,36 @@ class TavernaState(BaseGameState):
         # Ottieni il dizionario base
         data = super().to_dict()
         
-        # Rimuovi il dizionario npg_presenti prima, dato che verrà serializzato separatamente
-        if "npg_presenti" in data:
-            del data["npg_presenti"]
-            
-        # Serializza manualmente gli NPG per evitare problemi di serializzazione
-        npg_dict = {}
-        try:
-            for nome, npg in self.npg_presenti.items():
-                if hasattr(npg, 'to_dict') and callable(getattr(npg, 'to_dict')):
-                    npg_dict[nome] = npg.to_dict()
-        except:
-            # In caso di errore, salviamo solo i nomi degli NPG
-            npg_dict = {nome: {"nome": nome} for nome in self.npg_presenti.keys()}
-            
         # Aggiungi attributi specifici
         data.update({
             "fase": self.fase,
             "ultimo_input": self.ultimo_input,
             "ultima_scelta": self.ultima_scelta,
-            "npg_nomi": list(self.npg_presenti.keys())  # Salva solo i nomi degli NPG
-            # Non serializzare oggetti_interattivi poiché sono generati dinamicamente
+            "prima_visita": self.prima_visita,
+            "nome_npg_attivo": self.nome_npg_attivo,
+            "stato_conversazione": self.stato_conversazione,
+            "mostra_mappa": self.mostra_mappa,
+            "dati_contestuali": self._dati_contestuali_serializzabili()
         })
+        data.update(self._serializza_elementi())
         
         return data
     
+    def _dati_contestuali_serializzabili(self):
+        """
+        Copia di dati_contestuali per to_dict: gli NPG e gli oggetti delle liste mostrate
+        al giocatore diventano riferimenti, risolti da ricollega
+        """
+        dati = dict(self.dati_contestuali)
+        if "npg_lista" in dati:
+            dati["npg_lista"] = [self.riferimento_elemento(npg) for npg in dati["npg_lista"]]
+        if "npg_scelto" in dati:
+            dati["npg_scelto"] = self.riferimento_elemento(dati["npg_scelto"])
+        if "oggetti_lista" in dati:
+            dati["oggetti_lista"] = [[list(pos), self.riferimento_elemento(oggetto)]
+                                     for pos, oggetto in dati["oggetti_lista"]]
+        return dati
+    
     @classmethod
     def from_dict(cls, data, game=None):
         """
@@ -581,50 +579,33 @@ class TavernaState(BaseGameState):
         Returns:
             TavernaState: Nuova istanza di TavernaState
         """
-        # Creiamo un oggetto senza chiamare __init__ per evitare l'errore del parametro mancante
-        state = object.__new__(cls)
-        
-        # Inizializziamo manualmente gli attributi basilari
-        state.nome_stato = "taverna"
-        state.ultima_scelta = None
-        state.prima_visita = False  # Non è la prima visita durante un caricamento
-        state.fase = "menu_principale"
-        state.ultimo_input = None
-        state.dati_contestuali = {}
+        # Il costruttore crea NPG e oggetti interattivi, poi riportati allo stato salvato
+        state = cls(game)
         state.game = game
         
-        # Ricrea gli NPG dai nomi
-        state.npg_presenti = {}
-        npg_nomi = data.get("npg_nomi", ["Durnan", "Elminster", "Mirt"])
-        for nome in npg_nomi:
-            from entities.npg import NPG
-            state.npg_presenti[nome] = NPG(nome)
-        
-        # Inizializza gli oggetti interattivi vuoti (verranno caricati dal sistema JSON)
-        state.oggetti_interattivi = {}
-        
-        # Carica altri attributi dal dizionario se presenti
+        # Carica gli attributi dal dizionario (senza prima_visita, la taverna è già stata visitata)
         state.fase = data.get("fase", "menu_principale")
         state.ultimo_input = data.get("ultimo_input")
         state.ultima_scelta = data.get("ultima_scelta")
-        state.nome_npg_attivo = None
-        state.stato_conversazione = "inizio"
-        state.stato_precedente = None
-        state.mostra_mappa = False
-        
-        # Direzioni di movimento
-        state.direzioni = {
-            "nord": (0, -1),
-            "sud": (0, 1),
-            "est": (1, 0),
-            "ovest": (-1, 0)
-        }
-        
-        # Inizializza menu e comandi
-        if hasattr(state, '_init_commands'):
-            state._init_commands()
+        state.prima_visita = data.get("prima_visita", False)
+        state.nome_npg_attivo = data.get("nome_npg_attivo")
+        state.stato_conversazione = data.get("stato_conversazione", "inizio")
+        state.mostra_mappa = data.get("mostra_mappa", False)
+        state.dati_contestuali = dict(data.get("dati_contestuali", {}))
+        state._ripristina_elementi(data)
         
         return state
+    
+    def ricollega(self, gioco, stati_sotto):
+        """Risolve i riferimenti salvati in dati_contestuali da to_dict"""
+        dati = self.dati_contestuali
+        if "npg_lista" in dati:
+            dati["npg_lista"] = [self.risolvi_riferimento(riferimento, gioco) for riferimento in dati["npg_lista"]]
+        if "npg_scelto" in dati:
+            dati["npg_scelto"] = self.risolvi_riferimento(dati["npg_scelto"], gioco)
+        if "oggetti_lista" in dati:
+            dati["oggetti_lista"] = [(tuple(pos), self.risolvi_riferimento(riferimento, gioco))
+                                     for pos, riferimento in dati["oggetti_lista"]]
         
     def __getstate__(self):
         """
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from util.config import BACKUPS_DIR
+
+logger = logging.getLogger("gioco_rpg")
+
+# Cartella dei blob indirizzati per contenuto
+ARCHIVIO_DIR = BACKUPS_DIR / "contenuti"
+
+# Percorsi del documento i cui figli diventano blob separati (la radice è la tupla vuota).
+# Le singole mappe cambiano di rado: salvandole una per una, le mappe non toccate
+# vengono condivise tra versioni e tra giocatori.
+SEZIONI_SUDDIVISE = {(), ("mappe",), ("mappe", "mappe"), ("npg",)}
+
+# Chiave che, in un manifesto, sostituisce una sezione con il riferimento al suo blob
+CHIAVE_BLOB = "@blob"
+
+# Età minima (secondi) di un blob non referenziato prima che la raccolta lo elimini:
+# protegge i blob appena scritti il cui manifesto non è ancora stato salvato
+ETA_MINIMA_RACCOLTA = 3600
+
+
+class ArchivioContenuti:
+    """
+    Archivio di sezioni di documenti JSON indirizzate per contenuto.
+    Un documento viene scomposto in sezioni, ogni sezione viene salvata una sola volta
+    come blob compresso nominato con l'hash del suo contenuto, e il documento viene
+    rappresentato da un piccolo manifesto che riferisce i blob.
+    I riferimenti vengono contati a partire dai manifesti durante la raccolta, così
+    più processi possono scrivere nell'archivio senza un contatore condiviso.
+    """
+
+    def __init__(self, cartella=ARCHIVIO_DIR):
+        """
+        Inizializza l'archivio
+
+        Args:
+            cartella (Path): Cartella in cui salvare i blob
+        """
+        self.cartella = Path(cartella)
+
+    @staticmethod
+    def _serializza(valore):
+        """Forma canonica di una sezione: stesso contenuto, stessi byte"""
+        return json.dumps(valore, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def _percorso_blob(self, hash_blob):
+        return self.cartella / hash_blob[:2] / f"{hash_blob}.json.z"
+
+    def salva_blob(self, valore):
+        """
+        Salva una sezione nell'archivio se non è già presente.
+
+        Args:
+            valore: Sezione serializzabile in JSON
+
+        Returns:
+            str: Hash della sezione
+        """
+        contenuto = self._serializza(valore)
+        hash_blob = hashlib.blake2b(contenuto, digest_size=20).hexdigest()
+        percorso = self._percorso_blob(hash_blob)
+        try:
+            # Blob già presente: rinfresca l'mtime così la raccolta non elimina un blob
+            # appena riutilizzato. Un unico passo, senza controllare prima se esiste: se
+            # la raccolta lo elimina nel frattempo viene riscritto qui sotto.
+            os.utime(percorso)
+            return hash_blob
+        except FileNotFoundError:
+            pass
+
+        percorso.parent.mkdir(parents=True, exist_ok=True)
+        temporaneo = percorso.with_name(f".{percorso.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporaneo, 'wb') as f:
+            f.write(zlib.compress(contenuto, 6))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporaneo, percorso)
+        return hash_blob
+
+    def leggi_blob(self, hash_blob):
+        """
+        Legge una sezione dall'archivio.
+
+        Args:
+            hash_blob (str): Hash della sezione
+
+        Returns:
+            La sezione decodificata
+
+        Raises:
+            FileNotFoundError: Se il blob non esiste
+        """
+        with open(self._percorso_blob(hash_blob), 'rb') as f:
+            return json.loads(zlib.decompress(f.read()).decode("utf-8"))
+
+    def crea_manifesto(self, documento, percorso=()):
+        """
+        Scompone un documento in blob e restituisce il suo manifesto.
+
+        Args:
+            documento: Documento JSON da archiviare
+            percorso (tuple): Percorso corrente nel documento (uso interno)
+
+        Returns:
+            Il manifesto: il documento con le sezioni sostituite da {"@blob": hash}
+        """
+        if percorso in SEZIONI_SUDDIVISE and isinstance(documento, dict):
+            return {chiave: self.crea_manifesto(valore, percorso + (chiave,)) for chiave, valore in documento.items()}
+        if isinstance(documento, (dict, list)) and documento:
+            return {CHIAVE_BLOB: self.salva_blob(documento)}
+        return documento
+
+    def ricomponi(self, manifesto):
+        """
+        Ricostruisce un documento a partire dal suo manifesto.
+
+        Args:
+            manifesto: Manifesto prodotto da crea_manifesto
+
+        Returns:
+            Il documento completo
+        """
+        if isinstance(manifesto, dict):
+            if len(manifesto) == 1 and CHIAVE_BLOB in manifesto:
+                return self.leggi_blob(manifesto[CHIAVE_BLOB])
+            return {chiave: self.ricomponi(valore) for chiave, valore in manifesto.items()}
+        return manifesto
+
+    @staticmethod
+    def blob_referenziati(manifesto):
+        """
+        Elenca gli hash riferiti da un manifesto.
+
+        Args:
+            manifesto: Manifesto prodotto da crea_manifesto
+
+        Returns:
+            list: Hash dei blob (con ripetizioni)
+        """
+        hash_trovati = []
+        da_visitare = [manifesto]
+        while da_visitare:
+            nodo = da_visitare.pop()
+            if isinstance(nodo, dict):
+                if len(nodo) == 1 and CHIAVE_BLOB in nodo:
+                    hash_trovati.append(nodo[CHIAVE_BLOB])
+                else:
+                    da_visitare.extend(nodo.values())
+        return hash_trovati
+
+    def conta_riferimenti(self, manifesti):
+        """
+        Conta i riferimenti a ogni blob.
+
+        Args:
+            manifesti (iterable): Tutti i manifesti in uso
+
+        Returns:
+            dict: hash -> numero di riferimenti
+        """
+        conteggi = {}
+        for manifesto in manifesti:
+            for hash_blob in self.blob_referenziati(manifesto):
+                conteggi[hash_blob] = conteggi.get(hash_blob, 0) + 1
+        return conteggi
+
+    def raccogli_spazzatura(self, manifesti=None, eta_minima=ETA_MINIMA_RACCOLTA):
+        """
+        Elimina i blob che nessun manifesto riferisce più.
+
+        Args:
+            manifesti (iterable, optional): Manifesti in uso; se None usa manifesti_in_uso()
+            eta_minima (float): Età minima in secondi di un blob per poter essere eliminato
+
+        Returns:
+            dict: Blob esaminati, eliminati e byte liberati
+        """
+        if manifesti is None:
+            manifesti = manifesti_in_uso()
+        conteggi = self.conta_riferimenti(manifesti)
+        limite = time.time() - eta_minima
+        esaminati = eliminati = liberati = 0
+
+        for percorso in self.cartella.glob("*/*.json.z") if self.cartella.exists() else []:
+            esaminati += 1
+            hash_blob = percorso.name[:-len(".json.z")]
+            if conteggi.get(hash_blob):
+                continue
+            try:
+                info = percorso.stat()
+                if info.st_mtime > limite:
+                    continue
+                percorso.unlink()
+                eliminati += 1
+                liberati += info.st_size
+            except OSError as e:
+                logger.error(f"Errore durante la rimozione del blob {percorso.name}: {e}")
+
+        if eliminati:
+            logger.info(f"Raccolta dell'archivio: eliminati {eliminati} blob ({liberati} byte)")
+        return {"esaminati": esaminati, "eliminati": eliminati, "byte_liberati": liberati}
+
+    def dimensione(self):
+        """
+        Restituisce lo spazio occupato dai blob.
+
+        Returns:
+            int: Byte occupati su disco
+        """
+        if not self.cartella.exists():
+            return 0
+        return sum(p.stat().st_size for p in self.cartella.glob("*/*.json.z"))
+
+
+def manifesti_in_uso():
+    """
+    Raccoglie i manifesti di tutti gli utilizzatori dell'archivio:
+    backup in BACKUPS_DIR e basi delle catene dello storico dei salvataggi.
+
+    Returns:
+        generator: I manifesti trovati
+    """
+    from util.config import iter_backup_manifests
+    from util.storico_salvataggi import get_storico_salvataggi
+
+    yield from iter_backup_manifests()
+    yield from get_storico_salvataggi().manifesti()
+
+
+# Istanza condivisa dell'archivio
+archivio_contenuti = ArchivioContenuti()
+
+
+def get_archivio_contenuti():
+    """
+    Ottieni l'istanza dell'archivio indirizzato per contenuto.
+
+    Returns:
+        ArchivioContenuti: L'istanza condivisa
+    """
+    return archivio_contenuti
@@ -0,0 +1,67 @@
+"""
+Generatori di numeri casuali delle partite.
+
+Ogni operazione di una sessione (comando, movimento, annullamento) usa un generatore
+derivato dal seme della sessione e dal numero progressivo dell'operazione: rieseguire
+le stesse operazioni dallo stesso punto produce gli stessi tiri di dado, anche se nel
+frattempo altre sessioni hanno usato il caso. Il generatore attivo è legato al contesto
+(thread o task) che esegue l'operazione.
+
+Il codice di gioco ottiene il generatore con rng() invece di usare il modulo random;
+fuori da un'operazione di sessione (gioco da terminale, strumenti) rng() restituisce
+il generatore globale di random.
+"""
+import random
+import secrets
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_generatore_corrente = ContextVar("generatore_corrente", default=None)
+
+# Istanza usata dalle funzioni di modulo di random (random.randint, random.choice, ...)
+_generatore_globale = random._inst
+
+
+def rng():
+    """
+    Returns:
+        random.Random: Il generatore dell'operazione in corso, altrimenti quello globale
+    """
+    return _generatore_corrente.get() or _generatore_globale
+
+
+def nuovo_seme():
+    """
+    Returns:
+        int: Un seme casuale per una nuova sessione
+    """
+    return secrets.randbits(64)
+
+
+def generatore_operazione(seme, indice):
+    """
+    Crea il generatore di un'operazione di sessione.
+
+    Args:
+        seme (int): Seme della sessione
+        indice (int): Numero progressivo dell'operazione nella sessione
+
+    Returns:
+        random.Random: Generatore che dipende solo da seme e indice
+    """
+    return random.Random(f"{seme}:{indice}")
+
+
+@contextmanager
+def usa_generatore(generatore):
+    """
+    Rende un generatore quello restituito da rng() per la durata del blocco.
+
+    Args:
+        generatore (random.Random): Il generatore da usare
+    """
+    token = _generatore_corrente.set(generatore)
+    try:
+        yield generatore
+    finally:
+        _generatore_corrente.reset(token)
@@ -13,6 +13,8 @@ DATA_DIR = BASE_DIR / "data"
 SAVE_DIR = BASE_DIR / "salvataggi"
 SESSIONS_DIR = BASE_DIR / "sessioni"
 BACKUPS_DIR = BASE_DIR / "backup"
+# Giornali dei comandi delle sessioni, creata alla prima scrittura (vedi core/giornale_comandi.py)
+JOURNALS_DIR = SESSIONS_DIR / "giornali"
 
 # Assicurati che tutte le directory esistano
 for directory in [DATA_DIR, SAVE_DIR, SESSIONS_DIR, BACKUPS_DIR]:
@@ -24,9 +26,29 @@ DEFAULT_MAP_SAVE_PATH = SAVE_DIR / "mappe_salvataggio.json"
 DEFAULT_SESSION_PREFIX = "sessione_"
 DEFAULT_BACKUP_PREFIX = "backup_"
 
+# Indice dei metadati dei salvataggi (senza estensione .json per non comparire tra i salvataggi)
+SAVE_INDEX_PATH = SAVE_DIR / ".indice_salvataggi"
+
 # Versione corrente del formato di salvataggio
 SAVE_FORMAT_VERSION = "1.0.0"
 
+# Formati dei file di salvataggio: JSON leggibile, JSON compatto compresso con gzip, oppure
+# sezioni compresse separatamente con un indice (caricabili una alla volta, vedi util.formato_salvataggi).
+# In lettura il formato viene riconosciuto dal contenuto, quindi i formati possono convivere.
+SAVE_FORMAT_JSON = "json"
+SAVE_FORMAT_GZIP = "gzip"
+SAVE_FORMAT_SECTIONS = "sezioni"
+SAVE_FORMATS = (SAVE_FORMAT_JSON, SAVE_FORMAT_GZIP, SAVE_FORMAT_SECTIONS)
+
+# Formato usato per scrivere i nuovi salvataggi
+SAVE_FORMAT = os.environ.get("RPG_FORMATO_SALVATAGGI", SAVE_FORMAT_JSON)
+if SAVE_FORMAT not in SAVE_FORMATS:
+    logger.warning(f"Formato di salvataggio sconosciuto '{SAVE_FORMAT}', uso '{SAVE_FORMAT_JSON}'")
+    SAVE_FORMAT = SAVE_FORMAT_JSON
+
+# Livello di compressione gzip e zlib (1 = più veloce, 9 = file più piccoli)
+SAVE_COMPRESSION_LEVEL = 6
+
 def get_save_path(filename=None):
     """
     Ottiene il percorso completo per un file di salvataggio.
@@ -40,6 +62,9 @@ def get_save_path(filename=None):
     if not filename:
         return DEFAULT_SAVE_PATH
     
+    # Accetta anche percorsi (Path) già risolti
+    filename = str(filename)
+    
     # Se il nome del file non ha estensione .json, aggiungila
     if not filename.lower().endswith('.json'):
         filename += '.json'
@@ -94,6 +119,9 @@ def get_backup_path(original_filename):
 def create_backup(filepath):
     """
     Crea un backup del file specificato.
+    I file JSON vengono archiviati come manifesto nell'archivio indirizzato per contenuto:
+    le sezioni già presenti (ad esempio le mappe non modificate) non vengono riscritte.
+    Gli altri file vengono copiati per intero.
     
     Args:
         filepath (str o Path): Percorso del file da copiare
@@ -102,6 +130,8 @@ def create_backup(filepath):
         Path: Percorso del file di backup, None se si è verificato un errore
     """
     import shutil
+    import json
+    import time
     
     source_path = Path(filepath)
     if not source_path.exists():
@@ -114,14 +144,92 @@ def create_backup(filepath):
         # Assicurati che la directory di backup esista
         backup_path.parent.mkdir(exist_ok=True, parents=True)
         
-        # Copia il file
-        shutil.copy2(source_path, backup_path)
+        documento = None
+        if source_path.suffix.lower() == ".json":
+            from util.formato_salvataggi import leggi_salvataggio
+            try:
+                documento = leggi_salvataggio(source_path)
+            except (OSError, ValueError, EOFError):
+                documento = None
+        
+        if isinstance(documento, dict):
+            from util.archivio_contenuti import get_archivio_contenuti
+            manifesto = get_archivio_contenuti().crea_manifesto(documento)
+            with open(backup_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "tipo_backup": "manifesto",
+                    "originale": source_path.name,
+                    "timestamp": time.time(),
+                    "manifesto": manifesto
+                }, f, separators=(",", ":"), ensure_ascii=False)
+        else:
+            # Copia il file
+            shutil.copy2(source_path, backup_path)
         logger.info(f"Backup creato: {backup_path}")
         return backup_path
     except Exception as e:
         logger.error(f"Errore durante la creazione del backup: {e}")
         return None
 
+def read_backup(backup_name):
+    """
+    Legge il contenuto di un backup, ricomponendolo se è un manifesto.
+    
+    Args:
+        backup_name (str): Nome del file di backup in BACKUPS_DIR
+        
+    Returns:
+        dict: Il documento salvato nel backup
+    """
+    from util.formato_salvataggi import leggi_salvataggio
+    
+    dati = leggi_salvataggio(BACKUPS_DIR / os.path.basename(backup_name))
+    if isinstance(dati, dict) and dati.get("tipo_backup") == "manifesto":
+        from util.archivio_contenuti import get_archivio_contenuti
+        return get_archivio_contenuti().ricomponi(dati["manifesto"])
+    return dati
+
+def restore_backup(backup_name, filename):
+    """
+    Ripristina un backup come file di salvataggio.
+    
+    Args:
+        backup_name (str): Nome del file di backup in BACKUPS_DIR
+        filename (str): Nome del salvataggio da sovrascrivere
+        
+    Returns:
+        bool: True se il ripristino è riuscito, False altrimenti
+    """
+    try:
+        documento = read_backup(backup_name)
+        from util.scrittore_salvataggi import get_scrittore_salvataggi
+        return get_scrittore_salvataggi().accoda(get_save_path(filename), documento).result()
+    except Exception as e:
+        logger.error(f"Errore durante il ripristino del backup {backup_name}: {e}")
+        return False
+
+def iter_backup_manifests():
+    """
+    Restituisce i manifesti dei backup presenti in BACKUPS_DIR.
+    
+    Returns:
+        generator: I manifesti dei backup archiviati per contenuto
+    """
+    import json
+    
+    for percorso in BACKUPS_DIR.glob("*.json"):
+        try:
+            with open(percorso, 'r', encoding='utf-8') as f:
+                # I backup copiati per intero non iniziano con il marcatore del manifesto
+                if f.read(32).find('"tipo_backup"') < 0:
+                    continue
+                f.seek(0)
+                dati = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(dati, dict) and dati.get("tipo_backup") == "manifesto":
+            yield dati["manifesto"]
+
 def get_session_path(session_id):
     """
     Ottiene il percorso completo per un file di sessione.
@@ -134,6 +242,18 @@ def get_session_path(session_id):
     """
     return SESSIONS_DIR / f"{DEFAULT_SESSION_PREFIX}{session_id}.pickle"
 
+def get_journal_path(session_id):
+    """
+    Ottiene il percorso completo del giornale dei comandi di una sessione.
+    
+    Args:
+        session_id (str): ID della sessione
+        
+    Returns:
+        Path: Percorso completo del giornale
+    """
+    return JOURNALS_DIR / f"{DEFAULT_SESSION_PREFIX}{session_id}.jsonl"
+
 def list_save_files():
     """
     Elenca tutti i file di salvataggio disponibili.
@@ -191,36 +311,29 @@ def validate_save_data(data):
 
 def migrate_save_data(data):
     """
-    Migra i dati alla versione corrente se necessario.
+    Migra i dati alla versione corrente se necessario, applicando in sequenza
+    i passi registrati in util.migrazioni.
     
     Args:
         data (dict): Dati del salvataggio
         
     Returns:
-        dict: Dati migrati alla versione corrente
+        dict: Dati migrati alla versione corrente (invariati se non esiste un percorso di migrazione)
     """
-    versione_origine = data.get("versione_gioco", "0.0.0")
+    from util.migrazioni import migra, richiede_migrazione
     
     # Se già nella versione corrente, non fare nulla
-    if versione_origine == SAVE_FORMAT_VERSION:
+    if not richiede_migrazione(data):
         return data
-        
-    logger.info(f"Migrazione dati da versione {versione_origine} a {SAVE_FORMAT_VERSION}")
     
-    # Migrazione dalla 0.9.0 alla 1.0.0
-    if versione_origine == "0.9.0" and SAVE_FORMAT_VERSION == "1.0.0":
-        # Aggiorna formato
-        data["versione_gioco"] = "1.0.0"
-        
-        # Aggiungi eventuali campi mancanti
-        if "giocatore" in data and isinstance(data["giocatore"], dict):
-            giocatore = data["giocatore"]
-            if "accessori" not in giocatore:
-                giocatore["accessori"] = []
-                
-    # Altre migrazioni da aggiungere in futuro
-    
-    return data
+    versione_origine = data.get("versione_gioco", "0.0.0")
+    logger.info(f"Migrazione dati da versione {versione_origine} a {SAVE_FORMAT_VERSION}")
+    try:
+        return migra(data)
+    except ValueError as e:
+        # Non blocca il caricamento, solo un avviso
+        logger.warning(str(e))
+        return data
 
 def delete_save_file(filename):
     """
@@ -235,10 +348,13 @@ def delete_save_file(filename):
     file_path = get_save_path(filename)
     try:
         if file_path.exists():
-            # Prima crea un backup
-            create_backup(file_path)
+            # Prima registra l'ultima versione nello storico, così resta ripristinabile
+            from util.storico_salvataggi import get_storico_salvataggi
+            get_storico_salvataggi().registra_file(file_path)
             # Poi elimina
             file_path.unlink()
+            from util.indice_salvataggi import get_indice_salvataggi
+            get_indice_salvataggi().rimuovi(file_path)
             logger.info(f"File di salvataggio eliminato: {file_path}")
             return True
         else:
@@ -254,6 +370,9 @@ def clean_old_backups(max_backups=20):
     
     Args:
         max_backups (int): Numero massimo di backup da mantenere
+        
+    Returns:
+        dict: Esito della raccolta dell'archivio, None se nessun backup è stato rimosso
     """
     backup_files = list(BACKUPS_DIR.glob("*.json"))
     
@@ -268,4 +387,9 @@ def clean_old_backups(max_backups=20):
                 file.unlink()
                 logger.info(f"Rimosso backup vecchio: {file.name}")
             except Exception as e:
-                logger.error(f"Errore durante la rimozione del backup {file.name}: {e}") 
\ No newline at end of file
+                logger.error(f"Errore durante la rimozione del backup {file.name}: {e}")
+        
+        # Elimina le sezioni archiviate non più riferite da alcun backup
+        from util.archivio_contenuti import get_archivio_contenuti
+        return get_archivio_contenuti().raccogli_spazzatura()
+    return None 
\ No newline at end of file
@@ -1,4 +1,4 @@
-import random
+from util.casualita import rng
 
 class Dado:
     """
@@ -11,7 +11,7 @@ class Dado:
     
     def tira(self):
         """Esegue un singolo tiro di dado."""
-        return random.randint(1, self.facce)
+        return rng().randint(1, self.facce)
     
     def tiri_multipli(self, numero_tiri):
         """Esegue più tiri di dado e restituisce una lista dei risultati."""
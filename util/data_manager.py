@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+import threading
 from pathlib import Path
 
 # Configura il logger
@@ -27,20 +28,39 @@ class DataManager:
         return cls._instance
     
     def _initialize(self):
-        """Inizializza le directory per i dati."""
+        """
+        Inizializza le directory per i dati.
+        Nessun file viene letto qui: ogni tipo di dati viene caricato alla prima richiesta.
+        """
         self._data_paths = {
             "classi": DATA_DIR / "classes",
             "tutorials": DATA_DIR / "tutorials",
             "achievements": DATA_DIR / "achievements",
+            "missioni": DATA_DIR / "missioni",
             "oggetti": DATA_DIR / "items",
             "npc": DATA_DIR / "npc",
             "assets_info": DATA_DIR / "assets_info"
         }
+        # Esito della verifica della directory, per i tipi di dati già usati
+        self._directory_verificate = {}  # {tipo: bool}
+    
+    def _verifica_directory(self, data_type):
+        """
+        Controlla, una sola volta per tipo, che la directory dei dati esista.
         
-        # Assicurati che tutte le directory esistano
-        for path in self._data_paths.values():
-            if not path.exists():
+        Args:
+            data_type (str): Tipo di dati
+            
+        Returns:
+            bool: True se la directory esiste
+        """
+        if data_type not in self._directory_verificate:
+            path = self._data_paths[data_type]
+            esiste = path.exists()
+            if not esiste:
                 logger.warning(f"Directory dati non trovata: {path}")
+            self._directory_verificate[data_type] = esiste
+        return self._directory_verificate[data_type]
     
     def load_data(self, data_type, file_name=None, reload=False):
         """
@@ -73,7 +93,7 @@ class DataManager:
         file_path = self._data_paths[data_type] / file_name
         
         try:
-            if not file_path.exists():
+            if not self._verifica_directory(data_type) or not file_path.exists():
                 logger.error(f"File non trovato: {file_path}")
                 return {}
             
@@ -100,7 +120,7 @@ class DataManager:
             return []
         
         path = self._data_paths[data_type]
-        if not path.exists():
+        if not self._verifica_directory(data_type):
             return []
         
         return [f.name for f in path.glob("*.json")]
@@ -117,6 +137,10 @@ class DataManager:
         """Ottieni gli achievement del gioco."""
         return self.load_data("achievements")
     
+    def get_missioni(self):
+        """Ottieni le definizioni delle missioni del gioco."""
+        return self.load_data("missioni")
+    
     def get_items(self, category=None):
         """
         Ottieni gli oggetti del gioco, opzionalmente filtrati per categoria.
@@ -306,8 +330,9 @@ class DataManager:
             logger.error(f"Errore nel salvataggio del file {file_path}: {str(e)}")
             return False
 
-# Istanza globale per facile accesso
-data_manager = DataManager()
+# Istanza globale, creata al primo utilizzo e non all'importazione del modulo
+_data_manager = None
+_lock_data_manager = threading.Lock()
 
 def get_data_manager():
     """
@@ -316,4 +341,15 @@ def get_data_manager():
     Returns:
         DataManager: L'istanza singleton del gestore dati.
     """
-    return data_manager 
\ No newline at end of file
+    global _data_manager
+    if _data_manager is None:
+        with _lock_data_manager:
+            if _data_manager is None:
+                _data_manager = DataManager()
+    return _data_manager
+
+def __getattr__(nome):
+    """Mantiene disponibile l'attributo di modulo data_manager, creandolo al primo accesso"""
+    if nome == "data_manager":
+        return get_data_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}") 
\ No newline at end of file
@@ -0,0 +1,360 @@
+"""
+Formati dei file di salvataggio.
+
+    json     JSON indentato, leggibile a mano
+    gzip     JSON compatto compresso con gzip
+    sezioni  documento diviso in sezioni compresse separatamente, con un indice:
+
+        MAGIC (4 byte) | versione (1 byte) | sezioni zlib ... | indice JSON | offset indice (8 byte)
+
+    L'indice elenca per ogni sezione il percorso nel documento, l'offset e la lunghezza.
+    Il giocatore, lo stack degli stati e ogni singola mappa sono sezioni distinte,
+    così il caricamento può decodificare subito solo ciò che serve (vedi apri_salvataggio).
+
+Il formato di un file viene riconosciuto dai primi byte, quindi un salvataggio
+scritto in un formato resta leggibile anche dopo aver cambiato SAVE_FORMAT.
+"""
+import gzip
+import io
+import json
+import logging
+import struct
+import zlib
+
+from util.config import (SAVE_FORMAT, SAVE_FORMAT_JSON, SAVE_FORMAT_GZIP, SAVE_FORMAT_SECTIONS,
+                         SAVE_FORMATS, SAVE_COMPRESSION_LEVEL)
+
+logger = logging.getLogger("gioco_rpg")
+
+# Primi byte di un file gzip (un salvataggio JSON inizia sempre con "{" o con spazi)
+MAGIC_GZIP = b"\x1f\x8b"
+
+# Primi byte di un salvataggio a sezioni e versione del suo layout
+MAGIC_SEZIONI = b"RPGT"
+VERSIONE_SEZIONI = 1
+
+# Percorsi del documento i cui figli diventano sezioni separate (la radice è la tupla vuota)
+SEZIONI_INDICIZZATE = {(), ("mappe",), ("mappe", "mappe")}
+
+_CODA_SEZIONI = struct.Struct(">Q")
+_LUNGHEZZA_MAGIC = max(len(MAGIC_GZIP), len(MAGIC_SEZIONI))
+
+
+def rileva_formato(intestazione):
+    """
+    Riconosce il formato di un salvataggio dai suoi primi byte.
+
+    Args:
+        intestazione (bytes): Primi byte del file (ne bastano 4)
+
+    Returns:
+        str: Uno di SAVE_FORMATS
+    """
+    if intestazione[:len(MAGIC_GZIP)] == MAGIC_GZIP:
+        return SAVE_FORMAT_GZIP
+    if intestazione[:len(MAGIC_SEZIONI)] == MAGIC_SEZIONI:
+        return SAVE_FORMAT_SECTIONS
+    return SAVE_FORMAT_JSON
+
+
+def rileva_formato_file(percorso):
+    """
+    Riconosce il formato di un file di salvataggio.
+
+    Args:
+        percorso (str o Path): Percorso del file
+
+    Returns:
+        str: Uno di SAVE_FORMATS
+    """
+    with open(percorso, 'rb') as f:
+        return rileva_formato(f.read(_LUNGHEZZA_MAGIC))
+
+
+def _compatto(valore):
+    return json.dumps(valore, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _dividi_in_sezioni(valore, percorso=()):
+    """Genera le coppie (percorso, valore) delle sezioni di un documento"""
+    if percorso in SEZIONI_INDICIZZATE and isinstance(valore, dict) and valore:
+        for chiave, figlio in valore.items():
+            yield from _dividi_in_sezioni(figlio, percorso + (chiave,))
+    else:
+        yield percorso, valore
+
+
+def _scrivi_sezioni(f, dati):
+    """Scrive un documento nel formato a sezioni, una sezione alla volta"""
+    f.write(MAGIC_SEZIONI + bytes([VERSIONE_SEZIONI]))
+    offset = len(MAGIC_SEZIONI) + 1
+    indice = []
+    for percorso, valore in _dividi_in_sezioni(dati):
+        contenuto = zlib.compress(_compatto(valore), SAVE_COMPRESSION_LEVEL)
+        f.write(contenuto)
+        indice.append([list(percorso), offset, len(contenuto)])
+        offset += len(contenuto)
+    f.write(_compatto({"sezioni": indice}))
+    f.write(_CODA_SEZIONI.pack(offset))
+
+
+def scrivi_salvataggio(f, dati, formato=None):
+    """
+    Serializza un salvataggio su un file binario aperto, un pezzo alla volta:
+    il documento non viene mai convertito in un'unica stringa in memoria.
+
+    Args:
+        f: File aperto in scrittura binaria (non viene chiuso)
+        dati (dict): Documento da salvare
+        formato (str, optional): Uno di SAVE_FORMATS, se None usa SAVE_FORMAT
+    """
+    formato = formato or SAVE_FORMAT
+    if formato not in SAVE_FORMATS:
+        raise ValueError(f"Formato di salvataggio non supportato: {formato}")
+
+    if formato == SAVE_FORMAT_SECTIONS:
+        _scrivi_sezioni(f, dati)
+    elif formato == SAVE_FORMAT_GZIP:
+        # mtime=0 rende il contenuto compresso deterministico
+        compresso = gzip.GzipFile(fileobj=f, mode='wb', compresslevel=SAVE_COMPRESSION_LEVEL, mtime=0)
+        testo = io.TextIOWrapper(compresso, encoding='utf-8')
+        json.dump(dati, testo, separators=(",", ":"), ensure_ascii=False)
+        testo.flush()
+        testo.detach()
+        # Chiudere il GzipFile scrive la coda del formato ma lascia aperto f
+        compresso.close()
+    else:
+        testo = io.TextIOWrapper(f, encoding='utf-8')
+        json.dump(dati, testo, indent=4, ensure_ascii=False)
+        testo.flush()
+        testo.detach()
+
+
+def _apri_flusso(sorgente):
+    """Restituisce il formato e un flusso binario posizionato all'inizio del contenuto"""
+    intestazione = sorgente.read(_LUNGHEZZA_MAGIC)
+    if getattr(sorgente, "seekable", lambda: False)():
+        sorgente.seek(-len(intestazione), io.SEEK_CUR)
+    else:
+        sorgente = io.BufferedReader(_FlussoConIntestazione(intestazione, sorgente))
+    return rileva_formato(intestazione), sorgente
+
+
+def leggi_salvataggio(sorgente):
+    """
+    Legge un salvataggio completo in qualsiasi formato supportato, riconosciuto dai primi byte.
+    Il contenuto compresso viene decompresso durante la lettura, senza caricarlo prima in memoria.
+
+    Args:
+        sorgente: Percorso del file oppure file già aperto in lettura binaria
+
+    Returns:
+        Il documento letto
+
+    Raises:
+        ValueError: Se il contenuto non è JSON valido
+        OSError: Se il file non è leggibile o il contenuto compresso è danneggiato
+    """
+    if not hasattr(sorgente, 'read'):
+        with open(sorgente, 'rb') as f:
+            return leggi_salvataggio(f)
+
+    formato, sorgente = _apri_flusso(sorgente)
+    if formato == SAVE_FORMAT_SECTIONS:
+        return VistaSezionata(sorgente.read()).documento()
+    if formato == SAVE_FORMAT_GZIP:
+        with gzip.GzipFile(fileobj=sorgente, mode='rb') as compresso:
+            return _carica_json(compresso)
+    return _carica_json(sorgente)
+
+
+def apri_salvataggio(sorgente):
+    """
+    Apre un salvataggio per leggerlo una sezione alla volta.
+    Con il formato a sezioni vengono decompresse e decodificate solo le sezioni richieste;
+    con gli altri formati il documento viene decodificato per intero e la vista lo percorre.
+
+    Args:
+        sorgente: Percorso del file oppure file già aperto in lettura binaria
+
+    Returns:
+        VistaDocumento o VistaSezionata: Vista sul contenuto del salvataggio
+    """
+    if not hasattr(sorgente, 'read'):
+        with open(sorgente, 'rb') as f:
+            return apri_salvataggio(f)
+
+    formato, sorgente = _apri_flusso(sorgente)
+    if formato == SAVE_FORMAT_SECTIONS:
+        return VistaSezionata(sorgente.read())
+    return VistaDocumento(leggi_salvataggio(sorgente))
+
+
+def _carica_json(f):
+    """Decodifica il JSON di un file binario senza chiuderlo"""
+    testo = io.TextIOWrapper(f, encoding='utf-8')
+    try:
+        return json.load(testo)
+    finally:
+        testo.detach()
+
+
+class VistaDocumento:
+    """Vista su un salvataggio già decodificato per intero"""
+
+    def __init__(self, documento):
+        self._documento = documento
+
+    def _nodo(self, percorso):
+        nodo = self._documento
+        for chiave in percorso:
+            if not isinstance(nodo, dict) or chiave not in nodo:
+                raise KeyError("/".join(percorso))
+            nodo = nodo[chiave]
+        return nodo
+
+    def chiavi(self, *percorso):
+        """
+        Elenca le chiavi di un dizionario del documento.
+
+        Args:
+            *percorso (str): Chiavi che portano al dizionario (nessuna per la radice)
+
+        Returns:
+            list: Le chiavi, vuota se il percorso non esiste o non è un dizionario
+        """
+        try:
+            nodo = self._nodo(percorso)
+        except KeyError:
+            return []
+        return list(nodo) if isinstance(nodo, dict) else []
+
+    def leggi(self, *percorso, predefinito=None):
+        """
+        Restituisce il valore che si trova a un percorso del documento.
+
+        Args:
+            *percorso (str): Chiavi che portano al valore
+            predefinito: Valore restituito se il percorso non esiste
+
+        Returns:
+            Il valore trovato
+        """
+        try:
+            return self._nodo(percorso)
+        except KeyError:
+            return predefinito
+
+    def documento(self):
+        """
+        Returns:
+            dict: Il documento completo
+        """
+        return self._documento
+
+
+class VistaSezionata:
+    """Vista su un salvataggio a sezioni: ogni sezione viene decodificata solo quando richiesta"""
+
+    def __init__(self, contenuto):
+        """
+        Args:
+            contenuto (bytes): Contenuto completo del file
+
+        Raises:
+            ValueError: Se il contenuto non è un salvataggio a sezioni valido
+        """
+        if contenuto[:len(MAGIC_SEZIONI)] != MAGIC_SEZIONI or len(contenuto) < len(MAGIC_SEZIONI) + 1 + _CODA_SEZIONI.size:
+            raise ValueError("Il contenuto non è un salvataggio a sezioni")
+        versione = contenuto[len(MAGIC_SEZIONI)]
+        if versione > VERSIONE_SEZIONI:
+            raise ValueError(f"Salvataggio creato da una versione più recente del gioco (layout {versione})")
+
+        self._contenuto = contenuto
+        (offset_indice,) = _CODA_SEZIONI.unpack(contenuto[-_CODA_SEZIONI.size:])
+        indice = json.loads(contenuto[offset_indice:-_CODA_SEZIONI.size].decode("utf-8"))
+        # percorso -> (offset, lunghezza); figli -> chiavi dirette di ogni percorso suddiviso
+        self._sezioni = {}
+        self._figli = {}
+        for percorso, offset, lunghezza in indice["sezioni"]:
+            percorso = tuple(percorso)
+            self._sezioni[percorso] = (offset, lunghezza)
+            for i in range(len(percorso)):
+                figli = self._figli.setdefault(percorso[:i], [])
+                if percorso[i] not in figli:
+                    figli.append(percorso[i])
+
+    def _decodifica(self, percorso):
+        offset, lunghezza = self._sezioni[percorso]
+        return json.loads(zlib.decompress(self._contenuto[offset:offset + lunghezza]).decode("utf-8"))
+
+    def chiavi(self, *percorso):
+        """
+        Elenca le chiavi di un dizionario del documento senza decodificarne i valori
+        quando il dizionario è suddiviso in sezioni.
+
+        Args:
+            *percorso (str): Chiavi che portano al dizionario (nessuna per la radice)
+
+        Returns:
+            list: Le chiavi, vuota se il percorso non esiste o non è un dizionario
+        """
+        if percorso in self._figli:
+            return list(self._figli[percorso])
+        valore = self.leggi(*percorso)
+        return list(valore) if isinstance(valore, dict) else []
+
+    def leggi(self, *percorso, predefinito=None):
+        """
+        Restituisce il valore che si trova a un percorso del documento,
+        decodificando solo le sezioni necessarie.
+
+        Args:
+            *percorso (str): Chiavi che portano al valore
+            predefinito: Valore restituito se il percorso non esiste
+
+        Returns:
+            Il valore trovato
+        """
+        if percorso in self._sezioni:
+            return self._decodifica(percorso)
+        if percorso in self._figli:
+            return {chiave: self.leggi(*percorso, chiave) for chiave in self._figli[percorso]}
+        # Il percorso può cadere all'interno di una sezione
+        for i in range(len(percorso) - 1, 0, -1):
+            if percorso[:i] in self._sezioni:
+                valore = self._decodifica(percorso[:i])
+                for chiave in percorso[i:]:
+                    if not isinstance(valore, dict) or chiave not in valore:
+                        return predefinito
+                    valore = valore[chiave]
+                return valore
+        return predefinito
+
+    def documento(self):
+        """
+        Returns:
+            dict: Il documento completo
+        """
+        return self.leggi()
+
+
+class _FlussoConIntestazione(io.RawIOBase):
+    """Flusso non riposizionabile che restituisce di nuovo i byte già letti per riconoscere il formato"""
+
+    def __init__(self, intestazione, flusso):
+        self._intestazione = intestazione
+        self._flusso = flusso
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._intestazione:
+            n = min(len(buffer), len(self._intestazione))
+            buffer[:n] = self._intestazione[:n]
+            self._intestazione = self._intestazione[n:]
+            return n
+        dati = self._flusso.read(len(buffer))
+        buffer[:len(dati)] = dati
+        return len(dati)
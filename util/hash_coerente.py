@@ -0,0 +1,89 @@
+import bisect
+import hashlib
+
+
+class AnelloHashCoerente:
+    """
+    Anello di hashing coerente con nodi virtuali.
+    Assegna ogni chiave (ad es. un id_sessione) a uno dei nodi registrati in modo che
+    aggiungendo o rimuovendo un nodo si spostino solo le chiavi di sua competenza.
+    """
+
+    def __init__(self, nodi=None, repliche=64):
+        """
+        Inizializza l'anello
+
+        Args:
+            nodi (iterable, optional): Nodi iniziali
+            repliche (int): Numero di nodi virtuali per ogni nodo reale
+        """
+        self.repliche = repliche
+        self._punti = []    # Hash ordinati dei nodi virtuali
+        self._proprietari = {}  # hash -> nodo reale
+        self._nodi = set()
+        for nodo in nodi or []:
+            self.aggiungi_nodo(nodo)
+
+    @staticmethod
+    def _hash(valore):
+        """Hash stabile tra processi (a differenza di hash() di Python)"""
+        digest = hashlib.blake2b(valore.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def aggiungi_nodo(self, nodo):
+        """
+        Aggiunge un nodo all'anello.
+
+        Args:
+            nodo (str): Identificativo del nodo
+        """
+        if nodo in self._nodi:
+            return
+        self._nodi.add(nodo)
+        for i in range(self.repliche):
+            punto = self._hash(f"{nodo}#{i}")
+            self._proprietari[punto] = nodo
+            bisect.insort(self._punti, punto)
+
+    def rimuovi_nodo(self, nodo):
+        """
+        Rimuove un nodo dall'anello.
+
+        Args:
+            nodo (str): Identificativo del nodo
+        """
+        if nodo not in self._nodi:
+            return
+        self._nodi.discard(nodo)
+        for i in range(self.repliche):
+            punto = self._hash(f"{nodo}#{i}")
+            if self._proprietari.get(punto) == nodo:
+                del self._proprietari[punto]
+                indice = bisect.bisect_left(self._punti, punto)
+                if indice < len(self._punti) and self._punti[indice] == punto:
+                    self._punti.pop(indice)
+
+    def nodo_per(self, chiave):
+        """
+        Restituisce il nodo responsabile di una chiave.
+
+        Args:
+            chiave (str): La chiave da assegnare
+
+        Returns:
+            str: Il nodo responsabile, o None se l'anello è vuoto
+        """
+        if not self._punti:
+            return None
+        indice = bisect.bisect(self._punti, self._hash(chiave))
+        if indice == len(self._punti):
+            indice = 0
+        return self._proprietari[self._punti[indice]]
+
+    @property
+    def nodi(self):
+        """Insieme dei nodi reali presenti nell'anello"""
+        return set(self._nodi)
+
+    def __len__(self):
+        return len(self._nodi)
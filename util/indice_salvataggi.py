@@ -0,0 +1,233 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+from util.config import SAVE_DIR, SAVE_INDEX_PATH
+
+logger = logging.getLogger("gioco_rpg")
+
+# Campi dell'indice usabili per l'ordinamento
+CAMPI_ORDINAMENTO = {"file", "giocatore", "classe", "livello", "mappa", "timestamp", "versione"}
+
+
+def estrai_metadati(dati):
+    """
+    Estrae dal contenuto di un salvataggio le informazioni mostrate negli elenchi.
+
+    Args:
+        dati (dict): Contenuto del file di salvataggio
+
+    Returns:
+        dict: Metadati del salvataggio
+    """
+    giocatore = dati.get("giocatore", {})
+    if not isinstance(giocatore, dict):
+        giocatore = {}
+    return {
+        "giocatore": giocatore.get("nome", "Sconosciuto"),
+        "classe": giocatore.get("classe", "sconosciuto"),
+        "livello": giocatore.get("livello", 1),
+        "mappa": dati.get("mappa_corrente", "sconosciuta"),
+        "timestamp": dati.get("timestamp", 0),
+        "versione": dati.get("versione_gioco", "sconosciuta")
+    }
+
+
+def formatta_data(timestamp):
+    """
+    Converte il timestamp di un salvataggio in una data leggibile.
+
+    Args:
+        timestamp (float): Secondi dall'epoca
+
+    Returns:
+        str: Data nel formato gg/mm/aaaa hh:mm:ss
+    """
+    return datetime.datetime.fromtimestamp(timestamp or 0).strftime("%d/%m/%Y %H:%M:%S")
+
+
+def _chiave_ordinamento(voce, campo):
+    """Chiave di ordinamento confrontabile anche con valori di tipo inatteso"""
+    valore = voce.get(campo)
+    if campo in ("livello", "timestamp"):
+        try:
+            return float(valore or 0)
+        except (TypeError, ValueError):
+            return 0.0
+    return str(valore or "").lower()
+
+
+class IndiceSalvataggi:
+    """
+    Indice dei metadati dei salvataggi presenti in SAVE_DIR.
+    Ogni voce è associata a (mtime, dimensione) del file: per elencare i salvataggi
+    basta una stat per file, e solo i file modificati fuori dall'indice vengono riletti.
+    L'indice è persistito in un piccolo file JSON condiviso tra i processi.
+    """
+
+    def __init__(self, cartella=SAVE_DIR, percorso_indice=SAVE_INDEX_PATH):
+        """
+        Inizializza l'indice
+
+        Args:
+            cartella (Path): Cartella dei salvataggi
+            percorso_indice (Path): File in cui persistere l'indice
+        """
+        self.cartella = cartella
+        self.percorso_indice = percorso_indice
+        self._lock = threading.RLock()
+        self._voci = {}  # nome file -> metadati con "mtime_ns" e "dimensione"
+        self._firma_indice = None
+
+    def _firma(self, percorso):
+        """Restituisce (mtime_ns, dimensione) di un file, None se non esiste"""
+        try:
+            info = os.stat(percorso)
+            return (info.st_mtime_ns, info.st_size)
+        except OSError:
+            return None
+
+    def _carica(self):
+        """Rilegge l'indice da disco se è stato modificato da un altro processo"""
+        firma = self._firma(self.percorso_indice)
+        if firma is None or firma == self._firma_indice:
+            return
+        try:
+            with open(self.percorso_indice, 'r', encoding='utf-8') as f:
+                self._voci = json.load(f).get("voci", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Indice dei salvataggi illeggibile, verrà ricostruito: {e}")
+            self._voci = {}
+        self._firma_indice = firma
+
+    def _scrivi(self):
+        """Scrive l'indice su disco in modo atomico"""
+        temporaneo = self.percorso_indice.with_name(f"{self.percorso_indice.name}.{os.getpid()}.tmp")
+        try:
+            with open(temporaneo, 'w', encoding='utf-8') as f:
+                json.dump({"voci": self._voci}, f, separators=(",", ":"), ensure_ascii=False)
+            os.replace(temporaneo, self.percorso_indice)
+            self._firma_indice = self._firma(self.percorso_indice)
+        except OSError as e:
+            logger.error(f"Errore durante la scrittura dell'indice dei salvataggi: {e}")
+
+    def _leggi_metadati(self, percorso):
+        """Legge l'intero salvataggio per estrarne i metadati (solo per voci mancanti o obsolete)"""
+        from util.formato_salvataggi import leggi_salvataggio
+        try:
+            return estrai_metadati(leggi_salvataggio(percorso))
+        except (OSError, ValueError, EOFError) as e:
+            return {"giocatore": "Salvataggio corrotto", "errore": str(e)}
+
+    def _nome_indicizzabile(self, percorso):
+        """Restituisce il nome del file se appartiene alla cartella dei salvataggi, altrimenti None"""
+        percorso = os.path.abspath(percorso)
+        if os.path.dirname(percorso) != os.path.abspath(self.cartella) or not percorso.endswith(".json"):
+            return None
+        return os.path.basename(percorso)
+
+    def aggiorna(self, percorso, dati=None):
+        """
+        Aggiorna la voce di un salvataggio appena scritto.
+
+        Args:
+            percorso (str o Path): Percorso del file di salvataggio
+            dati (dict, optional): Contenuto appena salvato, per evitare di rileggere il file
+        """
+        nome = self._nome_indicizzabile(percorso)
+        firma = self._firma(percorso)
+        if nome is None or firma is None:
+            return
+        voce = estrai_metadati(dati) if dati is not None else self._leggi_metadati(percorso)
+        voce["mtime_ns"], voce["dimensione"] = firma
+        with self._lock:
+            self._carica()
+            self._voci[nome] = voce
+            self._scrivi()
+
+    def rimuovi(self, percorso):
+        """
+        Rimuove la voce di un salvataggio eliminato.
+
+        Args:
+            percorso (str o Path): Percorso del file di salvataggio
+        """
+        nome = self._nome_indicizzabile(percorso)
+        with self._lock:
+            self._carica()
+            if nome in self._voci:
+                del self._voci[nome]
+                self._scrivi()
+
+    def elenca(self, ordina_per="timestamp", decrescente=True, offset=0, limite=None, solo_validi=False):
+        """
+        Elenca i salvataggi usando l'indice, rileggendo solo i file obsoleti.
+
+        Args:
+            ordina_per (str): Campo di ordinamento (vedi CAMPI_ORDINAMENTO)
+            decrescente (bool): Se True, ordina in senso decrescente
+            offset (int): Numero di voci da saltare
+            limite (int, optional): Numero massimo di voci da restituire
+            solo_validi (bool): Se True, esclude i salvataggi corrotti
+
+        Returns:
+            tuple: (lista delle voci della pagina, numero totale di salvataggi)
+        """
+        if ordina_per not in CAMPI_ORDINAMENTO:
+            raise ValueError(f"Campo di ordinamento non valido: {ordina_per}")
+
+        with self._lock:
+            self._carica()
+            modificato = False
+            presenti = {}
+            with os.scandir(self.cartella) as voci_cartella:
+                for voce_cartella in voci_cartella:
+                    if voce_cartella.name.endswith(".json") and voce_cartella.is_file():
+                        info = voce_cartella.stat()
+                        presenti[voce_cartella.name] = (info.st_mtime_ns, info.st_size)
+
+            # Rimuovi le voci dei file spariti
+            for nome in list(self._voci):
+                if nome not in presenti:
+                    del self._voci[nome]
+                    modificato = True
+
+            # Rileggi solo i file nuovi o modificati fuori dall'indice
+            for nome, firma in presenti.items():
+                voce = self._voci.get(nome)
+                if voce is None or (voce.get("mtime_ns"), voce.get("dimensione")) != firma:
+                    voce = self._leggi_metadati(self.cartella / nome)
+                    voce["mtime_ns"], voce["dimensione"] = firma
+                    self._voci[nome] = voce
+                    modificato = True
+
+            if modificato:
+                self._scrivi()
+
+            risultato = [dict(voce, file=nome) for nome, voce in self._voci.items()]
+
+        # I salvataggi corrotti restano sempre in fondo all'elenco
+        validi = [v for v in risultato if "errore" not in v]
+        corrotti = [v for v in risultato if "errore" in v]
+        validi.sort(key=lambda v: _chiave_ordinamento(v, ordina_per), reverse=decrescente)
+        corrotti.sort(key=lambda v: v["file"])
+        risultato = validi if solo_validi else validi + corrotti
+        totale = len(risultato)
+        fine = None if limite is None else offset + limite
+        return risultato[offset:fine], totale
+
+
+# Istanza condivisa dell'indice
+indice_salvataggi = IndiceSalvataggi()
+
+
+def get_indice_salvataggi():
+    """
+    Ottieni l'istanza dell'indice dei salvataggi.
+
+    Returns:
+        IndiceSalvataggi: L'istanza condivisa
+    """
+    return indice_salvataggi
@@ -0,0 +1,457 @@
+"""
+Manutenzione offline delle cartelle dei salvataggi, dei backup e delle sessioni.
+
+    python -m util.manutenzione verifica                  controlla l'integrità di ogni file
+    python -m util.manutenzione orfani [--elimina]        trova sessioni abbandonate, giornali e file temporanei
+    python -m util.manutenzione compatta [--formato F]    riscrive salvataggi, backup e sessioni nel formato compatto
+    python -m util.manutenzione migra                     migra i salvataggi alla versione corrente
+    python -m util.manutenzione conservazione             applica la politica di conservazione
+
+Il lavoro sui singoli file viene distribuito su un pool di processi (--processi N),
+con l'avanzamento riportato su stderr. Sono operazioni da eseguire fuori dal percorso
+delle richieste: il server non pulisce più i backup a ogni caricamento.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from util.config import (SAVE_DIR, BACKUPS_DIR, SESSIONS_DIR, JOURNALS_DIR, DEFAULT_SESSION_PREFIX,
+                         SAVE_FORMAT, SAVE_FORMATS, get_journal_path)
+
+logger = logging.getLogger("gioco_rpg")
+
+# Giorni dopo i quali un file di sessione non più usato è considerato abbandonato
+GIORNI_SESSIONI_ABBANDONATE = 7
+
+# Backup conservati dalla politica di conservazione
+MAX_BACKUP = 20
+
+# Età minima (secondi) di un file temporaneo per considerarlo residuo di una scrittura interrotta
+ETA_MINIMA_TEMPORANEI = 3600
+
+
+def _in_parallelo(funzione, argomenti, processi=None, descrizione="file"):
+    """
+    Esegue una funzione su ogni argomento in un pool di processi, riportando l'avanzamento.
+
+    Args:
+        funzione (callable): Funzione di modulo (deve essere serializzabile per il pool)
+        argomenti (list): Argomenti, uno per chiamata
+        processi (int, optional): Numero di processi, None per il numero di CPU
+        descrizione (str): Etichetta mostrata nell'avanzamento
+
+    Returns:
+        list: I risultati, nello stesso ordine degli argomenti (None per le chiamate fallite)
+    """
+    risultati = [None] * len(argomenti)
+    if not argomenti:
+        return risultati
+    totale = len(argomenti)
+    with ProcessPoolExecutor(max_workers=processi) as pool:
+        futuri = {pool.submit(funzione, argomento): i for i, argomento in enumerate(argomenti)}
+        for completati, futuro in enumerate(as_completed(futuri), start=1):
+            try:
+                risultati[futuri[futuro]] = futuro.result()
+            except Exception as e:
+                logger.error(f"{descrizione}: errore su {argomenti[futuri[futuro]]}: {e}")
+            sys.stderr.write(f"\r{descrizione}: {completati}/{totale}")
+            sys.stderr.flush()
+    sys.stderr.write("\n")
+    return risultati
+
+
+def _e_temporaneo(percorso):
+    """I file temporanei delle scritture atomiche iniziano con un punto e finiscono con .tmp"""
+    return percorso.name.startswith(".") and percorso.name.endswith(".tmp")
+
+
+def _file_sessione():
+    return sorted(p for p in SESSIONS_DIR.glob(f"{DEFAULT_SESSION_PREFIX}*.pickle"))
+
+
+def _id_sessione(percorso):
+    """ID della sessione di un file di sessione o di un giornale dei comandi"""
+    return percorso.stem[len(DEFAULT_SESSION_PREFIX):]
+
+
+def _file_salvataggio():
+    return sorted(SAVE_DIR.glob("*.json"))
+
+
+def _file_backup():
+    return sorted(BACKUPS_DIR.glob("*.json"))
+
+
+# --- Operazioni sui singoli file (eseguite nei processi del pool) -----------
+
+def verifica_salvataggio(percorso):
+    """
+    Verifica che un salvataggio sia leggibile e valido.
+
+    Args:
+        percorso (str): Percorso del file
+
+    Returns:
+        str: Descrizione del problema, None se il file è valido
+    """
+    from util.config import validate_save_data
+    from util.formato_salvataggi import leggi_salvataggio
+
+    try:
+        valido, messaggio = validate_save_data(leggi_salvataggio(percorso))
+    except Exception as e:
+        return f"illeggibile: {e}"
+    return None if valido else messaggio
+
+
+def verifica_backup(percorso):
+    """
+    Verifica che un backup sia leggibile e, se è un manifesto, che tutte le sue sezioni esistano.
+
+    Args:
+        percorso (str): Percorso del file
+
+    Returns:
+        str: Descrizione del problema, None se il file è valido
+    """
+    from util.config import read_backup, validate_save_data
+
+    try:
+        documento = read_backup(os.path.basename(percorso))
+    except Exception as e:
+        return f"illeggibile: {e}"
+    # Anche i file delle mappe finiscono tra i backup: si validano solo i salvataggi di gioco
+    if isinstance(documento, dict) and "giocatore" in documento:
+        valido, messaggio = validate_save_data(documento)
+        return None if valido else messaggio
+    return None
+
+
+def verifica_sessione(percorso):
+    """
+    Verifica che un file di sessione sia decodificabile.
+
+    Args:
+        percorso (str): Percorso del file
+
+    Returns:
+        str: Descrizione del problema, None se il file è valido
+    """
+    import pickle
+    from core.snapshot_sessione import decodifica_sessione, e_snapshot
+
+    try:
+        with open(percorso, 'rb') as f:
+            contenuto = f.read()
+        if e_snapshot(contenuto):
+            decodifica_sessione(contenuto)
+        else:
+            pickle.loads(contenuto)
+    except Exception as e:
+        return f"non decodificabile: {e}"
+    return None
+
+
+def verifica_storico(nome):
+    """
+    Verifica che tutte le versioni di un salvataggio nello storico siano ricostruibili.
+
+    Args:
+        nome (str): Nome del salvataggio
+
+    Returns:
+        str: Descrizione del problema, None se lo storico è integro
+    """
+    from util.storico_salvataggi import get_storico_salvataggi
+
+    storico = get_storico_salvataggi()
+    try:
+        for versione in storico.elenca_versioni(nome):
+            if storico.ricostruisci(nome, versione["id"]) is None:
+                return f"versione {versione['id']} non ricostruibile"
+    except Exception as e:
+        return f"storico danneggiato: {e}"
+    return None
+
+
+def compatta_salvataggio(argomento):
+    """
+    Riscrive un salvataggio nel formato indicato se è in un formato diverso.
+
+    Args:
+        argomento (tuple): (percorso, formato)
+
+    Returns:
+        int: Byte risparmiati (negativo se il file è cresciuto), None se già nel formato
+    """
+    from util.formato_salvataggi import leggi_salvataggio, rileva_formato_file, scrivi_salvataggio
+    from util.scrittore_salvataggi import scrivi_file_atomico
+
+    percorso, formato = argomento
+    if rileva_formato_file(percorso) == formato:
+        return None
+    prima = os.path.getsize(percorso)
+    documento = leggi_salvataggio(percorso)
+    scrivi_file_atomico(percorso, lambda f: scrivi_salvataggio(f, documento, formato), binario=True)
+    return prima - os.path.getsize(percorso)
+
+
+def compatta_backup(percorso):
+    """
+    Converte un backup copiato per intero in un manifesto dell'archivio indirizzato per contenuto.
+
+    Args:
+        percorso (str): Percorso del file
+
+    Returns:
+        int: Byte risparmiati nella cartella dei backup, None se già un manifesto o non convertibile
+    """
+    import json
+    from util.archivio_contenuti import get_archivio_contenuti
+    from util.formato_salvataggi import leggi_salvataggio
+    from util.scrittore_salvataggi import scrivi_file_atomico
+
+    try:
+        documento = leggi_salvataggio(percorso)
+    except (OSError, ValueError, EOFError):
+        return None
+    if not isinstance(documento, dict) or documento.get("tipo_backup") == "manifesto":
+        return None
+    prima = os.path.getsize(percorso)
+    mtime = os.path.getmtime(percorso)
+    backup = {
+        "tipo_backup": "manifesto",
+        "originale": os.path.basename(percorso),
+        "timestamp": mtime,
+        "manifesto": get_archivio_contenuti().crea_manifesto(documento)
+    }
+    scrivi_file_atomico(percorso, lambda f: json.dump(backup, f, separators=(",", ":"), ensure_ascii=False))
+    # La conservazione ordina i backup per data di modifica: mantieni quella originale
+    os.utime(percorso, (mtime, mtime))
+    return prima - os.path.getsize(percorso)
+
+
+def compatta_sessione(percorso):
+    """
+    Converte una sessione salvata con pickle nel formato snapshot.
+
+    Args:
+        percorso (str): Percorso del file
+
+    Returns:
+        int: Byte risparmiati, None se già uno snapshot
+    """
+    import pickle
+    from core.snapshot_sessione import codifica_sessione, e_snapshot
+    from util.scrittore_salvataggi import scrivi_file_atomico
+
+    with open(percorso, 'rb') as f:
+        contenuto = f.read()
+    if e_snapshot(contenuto):
+        return None
+    nuovo = codifica_sessione(pickle.loads(contenuto))
+    scrivi_file_atomico(percorso, lambda f: f.write(nuovo), binario=True)
+    return len(contenuto) - len(nuovo)
+
+
+# --- Comandi -----------------------------------------------------------------
+
+def verifica(processi=None):
+    """
+    Controlla l'integrità di salvataggi, backup, sessioni e storico.
+
+    Args:
+        processi (int, optional): Numero di processi del pool
+
+    Returns:
+        dict: categoria -> {"controllati": n, "problemi": {file: descrizione}}
+    """
+    from util.storico_salvataggi import get_storico_salvataggi
+
+    storico = get_storico_salvataggi()
+    nomi_storico = sorted(p.name for p in storico.cartella.iterdir() if p.is_dir()) if storico.cartella.exists() else []
+    categorie = {
+        "salvataggi": (verifica_salvataggio, [str(p) for p in _file_salvataggio()]),
+        "backup": (verifica_backup, [str(p) for p in _file_backup()]),
+        "sessioni": (verifica_sessione, [str(p) for p in _file_sessione()]),
+        "storico": (verifica_storico, nomi_storico),
+    }
+
+    rapporto = {}
+    for categoria, (funzione, elementi) in categorie.items():
+        esiti = _in_parallelo(funzione, elementi, processi, f"verifica {categoria}")
+        rapporto[categoria] = {
+            "controllati": len(elementi),
+            "problemi": {os.path.basename(e): esito for e, esito in zip(elementi, esiti) if esito}
+        }
+    return rapporto
+
+
+def trova_orfani(giorni=GIORNI_SESSIONI_ABBANDONATE, elimina=False):
+    """
+    Trova le sessioni non più usate da più di `giorni` giorni con i loro giornali dei
+    comandi, i giornali rimasti senza sessione e i file temporanei lasciati da
+    scritture interrotte.
+
+    Args:
+        giorni (float): Età oltre la quale una sessione è considerata abbandonata
+        elimina (bool): Se True, elimina i file trovati
+
+    Returns:
+        dict: Liste dei file trovati per tipo e byte occupati
+    """
+    adesso = time.time()
+    sessioni = [p for p in _file_sessione() if adesso - p.stat().st_mtime > giorni * 86400]
+    # Il giornale segue la sorte del file di sessione, come nel mietitore del server
+    giornali = [get_journal_path(_id_sessione(p)) for p in sessioni]
+    giornali = [p for p in giornali if p.exists()]
+    attive = {_id_sessione(p) for p in _file_sessione()}
+    giornali += sorted(
+        p for p in JOURNALS_DIR.glob(f"{DEFAULT_SESSION_PREFIX}*.jsonl")
+        if _id_sessione(p) not in attive and adesso - p.stat().st_mtime > giorni * 86400
+    )
+    temporanei = [
+        p for cartella in (SAVE_DIR, BACKUPS_DIR, SESSIONS_DIR)
+        for p in cartella.rglob(".*.tmp")
+        if _e_temporaneo(p) and adesso - p.stat().st_mtime > ETA_MINIMA_TEMPORANEI
+    ]
+    byte = sum(p.stat().st_size for p in sessioni + giornali + temporanei)
+
+    if elimina:
+        for percorso in sessioni + giornali + temporanei:
+            try:
+                percorso.unlink()
+            except OSError as e:
+                logger.error(f"Errore durante la rimozione di {percorso}: {e}")
+
+    return {
+        "sessioni_abbandonate": [p.name for p in sessioni],
+        "giornali": [p.name for p in giornali],
+        "temporanei": [str(p) for p in temporanei],
+        "byte": byte,
+        "eliminati": elimina
+    }
+
+
+def compatta(formato=SAVE_FORMAT, processi=None):
+    """
+    Riscrive salvataggi, backup e sessioni nella forma più compatta e raccoglie
+    le sezioni non più usate dell'archivio.
+
+    Args:
+        formato (str): Formato in cui riscrivere i salvataggi (uno di SAVE_FORMATS)
+        processi (int, optional): Numero di processi del pool
+
+    Returns:
+        dict: categoria -> {"convertiti": n, "byte_risparmiati": n}
+    """
+    from util.archivio_contenuti import get_archivio_contenuti
+    from util.indice_salvataggi import get_indice_salvataggi
+
+    if formato not in SAVE_FORMATS:
+        raise ValueError(f"Formato di salvataggio non supportato: {formato}")
+
+    salvataggi = _file_salvataggio()
+    lavori = {
+        "salvataggi": (compatta_salvataggio, [(str(p), formato) for p in salvataggi]),
+        "backup": (compatta_backup, [str(p) for p in _file_backup()]),
+        "sessioni": (compatta_sessione, [str(p) for p in _file_sessione()]),
+    }
+
+    rapporto = {}
+    for categoria, (funzione, argomenti) in lavori.items():
+        esiti = [e for e in _in_parallelo(funzione, argomenti, processi, f"compatta {categoria}") if e is not None]
+        rapporto[categoria] = {"convertiti": len(esiti), "byte_risparmiati": sum(esiti)}
+
+    # Le dimensioni dei salvataggi riscritti sono cambiate
+    for percorso in salvataggi:
+        get_indice_salvataggi().aggiorna(percorso)
+
+    rapporto["archivio"] = get_archivio_contenuti().raccogli_spazzatura()
+    return rapporto
+
+
+def applica_conservazione(max_backup=MAX_BACKUP, giorni=GIORNI_SESSIONI_ABBANDONATE):
+    """
+    Applica la politica di conservazione: ultimi backup, sessioni abbandonate,
+    file temporanei e sezioni dell'archivio non più riferite.
+
+    Args:
+        max_backup (int): Numero di backup da conservare
+        giorni (float): Età oltre la quale una sessione viene eliminata
+
+    Returns:
+        dict: Esito di ogni operazione
+    """
+    from util.archivio_contenuti import get_archivio_contenuti
+    from util.config import clean_old_backups
+
+    backup_prima = len(_file_backup())
+    # La rimozione dei backup esegue già la raccolta dell'archivio: si riusa il suo esito
+    archivio = clean_old_backups(max_backup)
+    orfani = trova_orfani(giorni, elimina=True)
+    if archivio is None:
+        archivio = get_archivio_contenuti().raccogli_spazzatura()
+    return {
+        "backup_eliminati": backup_prima - len(_file_backup()),
+        "sessioni_eliminate": len(orfani["sessioni_abbandonate"]),
+        "giornali_eliminati": len(orfani["giornali"]),
+        "temporanei_eliminati": len(orfani["temporanei"]),
+        "archivio": archivio
+    }
+
+
+def _stampa_rapporto(rapporto, rientro=""):
+    for chiave, valore in rapporto.items():
+        if isinstance(valore, dict):
+            print(f"{rientro}{chiave}:")
+            _stampa_rapporto(valore, rientro + "  ")
+        elif isinstance(valore, list):
+            print(f"{rientro}{chiave}: {len(valore)}")
+            for elemento in valore:
+                print(f"{rientro}  {elemento}")
+        else:
+            print(f"{rientro}{chiave}: {valore}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenzione di salvataggi, backup e sessioni")
+    parser.add_argument("--processi", type=int, default=None, help="Numero di processi (predefinito: numero di CPU)")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+
+    comandi.add_parser("verifica", help="Controlla l'integrità di tutti i file")
+
+    parser_orfani = comandi.add_parser("orfani", help="Trova sessioni abbandonate, giornali e file temporanei")
+    parser_orfani.add_argument("--giorni", type=float, default=GIORNI_SESSIONI_ABBANDONATE)
+    parser_orfani.add_argument("--elimina", action="store_true", help="Elimina i file trovati")
+
+    parser_compatta = comandi.add_parser("compatta", help="Riscrive i file nel formato compatto")
+    parser_compatta.add_argument("--formato", choices=SAVE_FORMATS, default=SAVE_FORMAT)
+
+    parser_migra = comandi.add_parser("migra", help="Migra i salvataggi alla versione corrente")
+    parser_migra.add_argument("--prova", action="store_true", help="Esegue le migrazioni senza riscrivere i file")
+
+    parser_conservazione = comandi.add_parser("conservazione", help="Applica la politica di conservazione")
+    parser_conservazione.add_argument("--max-backup", type=int, default=MAX_BACKUP)
+    parser_conservazione.add_argument("--giorni", type=float, default=GIORNI_SESSIONI_ABBANDONATE)
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.comando == "verifica":
+        risultato = verifica(args.processi)
+        _stampa_rapporto(risultato)
+        sys.exit(1 if any(c["problemi"] for c in risultato.values()) else 0)
+    elif args.comando == "orfani":
+        _stampa_rapporto(trova_orfani(args.giorni, args.elimina))
+    elif args.comando == "compatta":
+        _stampa_rapporto(compatta(args.formato, args.processi))
+    elif args.comando == "migra":
+        from util.migrazioni import migra_cartella
+        risultato = migra_cartella(processi=args.processi, scrivi=not args.prova)
+        _stampa_rapporto({"conteggi": risultato["conteggi"], "tempi_passi": risultato["tempi_passi"]})
+    elif args.comando == "conservazione":
+        _stampa_rapporto(applica_conservazione(args.max_backup, args.giorni))
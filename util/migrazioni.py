@@ -0,0 +1,225 @@
+"""
+Registro delle migrazioni dei salvataggi.
+
+Ogni passo di migrazione porta un salvataggio da una versione alla successiva e viene
+registrato con il decoratore @passo_migrazione. I passi si compongono in un percorso
+da qualsiasi versione registrata fino a SAVE_FORMAT_VERSION.
+
+Migrazione in blocco di una cartella (i file migrati vengono riscritti nel loro formato,
+così il costo della migrazione si paga una sola volta):
+    python -m util.migrazioni [cartella] [--processi N] [--prova]
+"""
+import argparse
+import copy
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from util.config import SAVE_DIR, SAVE_FORMAT_VERSION
+
+logger = logging.getLogger("gioco_rpg")
+
+# versione di origine -> (versione di destinazione, funzione del passo)
+_passi = {}
+
+
+def passo_migrazione(da_versione, a_versione):
+    """
+    Decoratore che registra un passo di migrazione.
+    La funzione riceve il dizionario del salvataggio, lo modifica e lo restituisce;
+    il campo versione_gioco viene aggiornato automaticamente.
+
+    Args:
+        da_versione (str): Versione a cui si applica il passo
+        a_versione (str): Versione prodotta dal passo
+    """
+    def registra(funzione):
+        if da_versione in _passi:
+            raise ValueError(f"Migrazione dalla versione {da_versione} già registrata")
+        _passi[da_versione] = (a_versione, funzione)
+        percorso_migrazione.cache_clear()
+        return funzione
+    return registra
+
+
+@functools.lru_cache(maxsize=None)
+def percorso_migrazione(versione, versione_finale=SAVE_FORMAT_VERSION):
+    """
+    Calcola la sequenza di passi che porta una versione alla versione finale.
+
+    Args:
+        versione (str): Versione di partenza
+        versione_finale (str): Versione da raggiungere
+
+    Returns:
+        tuple: Coppie (da_versione, a_versione), vuota se la versione è già quella finale
+
+    Raises:
+        ValueError: Se non esiste un percorso di migrazione
+    """
+    passi = []
+    visitate = set()
+    while versione != versione_finale:
+        if versione in visitate or versione not in _passi:
+            raise ValueError(f"Nessuna migrazione disponibile dalla versione {versione} alla {versione_finale}")
+        visitate.add(versione)
+        destinazione = _passi[versione][0]
+        passi.append((versione, destinazione))
+        versione = destinazione
+    return tuple(passi)
+
+
+def richiede_migrazione(data):
+    """
+    Indica se un salvataggio non è alla versione corrente.
+
+    Args:
+        data (dict): Dati del salvataggio
+
+    Returns:
+        bool: True se il salvataggio va migrato
+    """
+    return data.get("versione_gioco", "0.0.0") != SAVE_FORMAT_VERSION
+
+
+def migra(data, tempi=None):
+    """
+    Migra un salvataggio alla versione corrente applicando i passi registrati.
+
+    Args:
+        data (dict): Dati del salvataggio (vengono modificati sul posto)
+        tempi (dict, optional): Dizionario in cui accumulare i secondi spesi per ogni passo ("da->a")
+
+    Returns:
+        dict: Dati migrati alla versione corrente
+
+    Raises:
+        ValueError: Se non esiste un percorso di migrazione dalla versione del salvataggio
+    """
+    for da_versione, a_versione in percorso_migrazione(data.get("versione_gioco", "0.0.0")):
+        inizio = time.perf_counter()
+        data = _passi[da_versione][1](data)
+        data["versione_gioco"] = a_versione
+        if tempi is not None:
+            chiave = f"{da_versione}->{a_versione}"
+            tempi[chiave] = tempi.get(chiave, 0.0) + time.perf_counter() - inizio
+    return data
+
+
+# --- Passi di migrazione ----------------------------------------------------
+
+@passo_migrazione("0.9.0", "1.0.0")
+def _migra_0_9_0(data):
+    """Aggiunge gli accessori al giocatore"""
+    giocatore = data.get("giocatore")
+    if isinstance(giocatore, dict) and "accessori" not in giocatore:
+        giocatore["accessori"] = []
+    return data
+
+
+# --- Migrazione in blocco ---------------------------------------------------
+
+def migra_file(percorso, scrivi=True):
+    """
+    Migra un singolo file di salvataggio e, se richiesto, lo riscrive nel suo formato.
+    Eseguita nei processi del pool da migra_cartella.
+    Prima della riscrittura la versione originale viene registrata nello storico dei
+    salvataggi, così resta ripristinabile, e dopo viene registrata quella migrata.
+
+    Args:
+        percorso (str): Percorso del file
+        scrivi (bool): Se False, esegue la migrazione senza riscrivere il file
+
+    Returns:
+        dict: Esito con file, versione di partenza, stato ("aggiornato", "migrato", "errore") e tempi per passo
+    """
+    from util.formato_salvataggi import leggi_salvataggio, rileva_formato_file, scrivi_salvataggio
+    from util.scrittore_salvataggi import scrivi_file_atomico
+    from util.storico_salvataggi import get_storico_salvataggi
+
+    esito = {"file": os.path.basename(percorso), "tempi": {}}
+    try:
+        formato = rileva_formato_file(percorso)
+        data = leggi_salvataggio(percorso)
+        esito["versione"] = data.get("versione_gioco", "0.0.0")
+        if not richiede_migrazione(data):
+            esito["stato"] = "aggiornato"
+            return esito
+        if scrivi:
+            # Lo storico conserva il documento registrato: la migrazione lavora su una copia
+            get_storico_salvataggi().registra(percorso, data)
+            data = copy.deepcopy(data)
+        data = migra(data, esito["tempi"])
+        if scrivi:
+            scrivi_file_atomico(percorso, lambda f: scrivi_salvataggio(f, data, formato), binario=True)
+            get_storico_salvataggi().registra(percorso, data)
+        esito["stato"] = "migrato"
+    except Exception as e:
+        esito["stato"] = "errore"
+        esito["errore"] = str(e)
+    return esito
+
+
+def migra_cartella(cartella=SAVE_DIR, processi=None, scrivi=True):
+    """
+    Migra in parallelo tutti i salvataggi di una cartella.
+    Solo i file migrati vengono registrati nello storico dei salvataggi (vedi migra_file),
+    nei processi del pool.
+
+    Args:
+        cartella (str o Path): Cartella dei salvataggi
+        processi (int, optional): Numero di processi, None per il numero di CPU
+        scrivi (bool): Se False, verifica le migrazioni senza riscrivere i file
+
+    Returns:
+        dict: Esiti per file, conteggi per stato e tempi totali per passo
+    """
+    from util.indice_salvataggi import get_indice_salvataggi
+
+    percorsi = sorted(str(p) for p in Path(cartella).glob("*.json"))
+
+    esiti = []
+    inizio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processi) as pool:
+        futuri = [pool.submit(migra_file, percorso, scrivi) for percorso in percorsi]
+        for futuro in as_completed(futuri):
+            esiti.append(futuro.result())
+
+    conteggi = {}
+    tempi = {}
+    for esito in esiti:
+        conteggi[esito["stato"]] = conteggi.get(esito["stato"], 0) + 1
+        for passo, secondi in esito["tempi"].items():
+            tempi[passo] = tempi.get(passo, 0.0) + secondi
+        if scrivi and esito["stato"] == "migrato":
+            get_indice_salvataggi().aggiorna(Path(cartella) / esito["file"])
+
+    esiti.sort(key=lambda e: e["file"])
+    return {
+        "file": esiti,
+        "conteggi": conteggi,
+        "tempi_passi": tempi,
+        "durata": time.perf_counter() - inizio
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra i salvataggi alla versione corrente del formato")
+    parser.add_argument("cartella", nargs="?", default=str(SAVE_DIR), help="Cartella dei salvataggi")
+    parser.add_argument("--processi", type=int, default=None, help="Numero di processi (predefinito: numero di CPU)")
+    parser.add_argument("--prova", action="store_true", help="Esegue le migrazioni senza riscrivere i file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    risultato = migra_cartella(args.cartella, processi=args.processi, scrivi=not args.prova)
+    for esito in risultato["file"]:
+        dettaglio = esito.get("errore") or esito.get("versione", "")
+        print(f"{esito['stato']:10} {esito['file']}  {dettaglio}")
+    print()
+    for passo, secondi in sorted(risultato["tempi_passi"].items()):
+        print(f"passo {passo:20} {secondi * 1000:10.3f} ms")
+    conteggi = ", ".join(f"{stato}: {numero}" for stato, numero in sorted(risultato["conteggi"].items()))
+    print(f"{len(risultato['file'])} salvataggi in {risultato['durata']:.2f} s ({conteggi or 'nessun file'})")
@@ -0,0 +1,103 @@
+"""
+Codifica delle posizioni (x, y) usate come chiavi nei dizionari serializzati
+(oggetti, NPG e porte delle mappe).
+
+Le chiavi vengono scritte nella forma compatta "x,y". In lettura sono accettate
+anche le chiavi dei vecchi salvataggi nella forma "(x, y)" prodotta da str(tupla).
+La decodifica accetta solo numeri interi: a differenza di eval() non può eseguire
+codice contenuto in un salvataggio importato.
+
+Confronto con eval e ast.literal_eval:
+    python -m util.posizioni
+"""
+import time
+
+
+def codifica_posizione(posizione):
+    """
+    Converte una posizione nella chiave compatta usata nei salvataggi.
+
+    Args:
+        posizione (tuple): Coordinate (x, y)
+
+    Returns:
+        str: La chiave nella forma "x,y"
+    """
+    return f"{posizione[0]},{posizione[1]}"
+
+
+def decodifica_posizione(chiave):
+    """
+    Converte una chiave di posizione nella tupla corrispondente.
+
+    Args:
+        chiave (str): Chiave nella forma "x,y" o "(x, y)"
+
+    Returns:
+        tuple: Coordinate (x, y) intere
+
+    Raises:
+        ValueError: Se la chiave non rappresenta una coppia di interi
+    """
+    if chiave[:1] == "(":
+        if chiave[-1:] != ")":
+            raise ValueError(f"Chiave di posizione non valida: {chiave!r}")
+        chiave = chiave[1:-1]
+    x, separatore, y = chiave.partition(",")
+    if not separatore:
+        raise ValueError(f"Chiave di posizione non valida: {chiave!r}")
+    # int() accetta spazi attorno al numero ma non espressioni
+    return (int(x), int(y))
+
+
+def confronta_con_eval(numero_chiavi=10000, ripetizioni=5):
+    """
+    Misura la decodifica delle chiavi di posizione rispetto a eval e ast.literal_eval.
+
+    Args:
+        numero_chiavi (int): Numero di chiavi da decodificare per ogni misura
+        ripetizioni (int): Numero di ripetizioni per ogni misura
+
+    Returns:
+        dict: Tempo medio in millisecondi per ciascun metodo
+    """
+    import ast
+
+    posizioni = [(i % 200, i // 200) for i in range(numero_chiavi)]
+    chiavi_vecchie = [str(p) for p in posizioni]
+    chiavi_compatte = [codifica_posizione(p) for p in posizioni]
+
+    metodi = {
+        "eval": (eval, chiavi_vecchie),
+        "ast.literal_eval": (ast.literal_eval, chiavi_vecchie),
+        "decodifica (x, y)": (decodifica_posizione, chiavi_vecchie),
+        "decodifica x,y": (decodifica_posizione, chiavi_compatte),
+    }
+
+    risultati = {}
+    for nome, (funzione, chiavi) in metodi.items():
+        inizio = time.perf_counter()
+        for _ in range(ripetizioni):
+            for chiave in chiavi:
+                funzione(chiave)
+        risultati[nome] = round((time.perf_counter() - inizio) * 1000 / ripetizioni, 3)
+    return risultati
+
+
+if __name__ == "__main__":
+    import logging
+    from world.mappa import Mappa
+
+    logging.getLogger().setLevel(logging.WARNING)
+    for metodo, millisecondi in confronta_con_eval().items():
+        print(f"{metodo:20} {millisecondi:>10} ms / 10000 chiavi")
+
+    # Caricamento di una mappa grande con migliaia di NPG e porte
+    mappa = Mappa("prova", 200, 50)
+    dati = mappa.to_dict()
+    dati["npg"] = {f"({x}, {y})": {"nome": f"npg_{x}_{y}", "token": "N"} for x in range(0, 200, 2) for y in range(0, 50, 2)}
+    dati["porte"] = {f"({x}, {y})": ["altra_mappa", x, y] for x in range(1, 200, 2) for y in range(1, 50, 2)}
+    inizio = time.perf_counter()
+    Mappa.from_dict(dati)
+    print(f"Mappa.from_dict con {len(dati['npg'])} NPG e {len(dati['porte'])} porte: "
+          f"{(time.perf_counter() - inizio) * 1000:.1f} ms")
@@ -0,0 +1,426 @@
+"""
+Riproduzione deterministica delle sessioni dai giornali dei comandi.
+
+Una sessione viene ricostruita dallo snapshot dell'intestazione del giornale
+(vedi core/giornale_comandi.py) rieseguendo le operazioni annotate con
+StatoGioco.processa_comando, muovi_giocatore e annulla, con un IO che scarta l'output.
+Il seme della sessione rende uguali i tiri di dado, quindi una sessione di produzione
+si riproduce fino al comando che ha causato un errore.
+
+    python -m util.riproduzione riproduci GIORNALE [--fino-a N] [--mostra]
+    python -m util.riproduzione traccia GIORNALE -o TRACCIA
+    python -m util.riproduzione confronta TRACCIA_A TRACCIA_B
+    python -m util.riproduzione benchmark GIORNALE... [--processi N] [--ripetizioni R]
+
+Per confrontare due versioni del codice si produce la traccia dello stesso giornale
+con ciascuna versione (ad esempio in due worktree git) e si confrontano le tracce:
+viene indicata la prima operazione dopo cui gli stati divergono e quali parti
+(giocatore, stati, singole mappe) sono diverse. Il benchmark riproduce molti giornali
+su un pool di processi e riporta i tempi per operazione, così il traffico reale
+diventa un benchmark di regressione.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from core.giornale_comandi import ANNULLA, COMANDO, MOVIMENTO, RICARICA, leggi_giornale
+from core.snapshot_sessione import ripristina_snapshot
+from core.stato_gioco import GameIOWeb
+
+logger = logging.getLogger("gioco_rpg")
+
+
+class GiornaleNonContiguo(Exception):
+    """Un'operazione del giornale non è la successiva della sessione: la riproduzione non può proseguire"""
+
+
+class IONullo(GameIOWeb):
+    """IO della riproduzione: fornisce gli input dei comandi e scarta i messaggi"""
+
+    def mostra_messaggio(self, testo: str):
+        pass
+
+    def messaggio_sistema(self, testo: str):
+        pass
+
+    def messaggio_errore(self, testo: str):
+        pass
+
+    def richiedi_input(self, prompt: str = "") -> str:
+        return self.last_input
+
+
+def prepara_sessione(intestazione):
+    """
+    Ricostruisce la sessione dall'intestazione di un giornale, con l'IO nullo.
+
+    Args:
+        intestazione (dict): Intestazione del giornale
+
+    Returns:
+        StatoGioco: La sessione nello stato di inizio del giornale
+    """
+    sessione = ripristina_snapshot(intestazione["snapshot"])
+    io_nullo = IONullo()
+    sessione.io_buffer = io_nullo
+    sessione.game.io = io_nullo
+    sessione.seme = intestazione["seme"]
+    sessione.operazioni_eseguite = intestazione["operazioni"]
+    return sessione
+
+
+def esegui_operazione(sessione, operazione):
+    """
+    Riesegue un'operazione del giornale su una sessione.
+
+    Args:
+        sessione (StatoGioco): La sessione
+        operazione (dict): Riga del giornale
+
+    Raises:
+        GiornaleNonContiguo: Se l'operazione non è la successiva della sessione
+        ValueError: Se l'operazione è di tipo sconosciuto
+    """
+    tipo = operazione.get("tipo")
+    if tipo == RICARICA:
+        # La sessione era stata ricaricata dal disco senza la cronologia in memoria
+        sessione.game.cronologia.svuota()
+        return
+    if operazione.get("n") != sessione.operazioni_eseguite:
+        raise GiornaleNonContiguo(f"Giornale non contiguo: atteso {sessione.operazioni_eseguite}, trovato {operazione.get('n')}")
+    if tipo == COMANDO:
+        sessione.processa_comando(operazione["arg"])
+    elif tipo == MOVIMENTO:
+        sessione.muovi_giocatore(operazione["arg"])
+    elif tipo == ANNULLA:
+        sessione.annulla(operazione["arg"])
+    else:
+        raise ValueError(f"Operazione sconosciuta: {tipo}")
+
+
+def riproduci(percorso, fino_a=None, al_passo=None):
+    """
+    Riproduce un giornale dei comandi.
+
+    Gli errori delle operazioni vengono raccolti e la riproduzione continua, come fa
+    il server con la sessione in memoria dopo un errore; solo un giornale non contiguo
+    la interrompe.
+
+    Args:
+        percorso (str | Path): File del giornale
+        fino_a (int, optional): Numero di operazioni da riprodurre, None per tutte
+        al_passo (callable, optional): Chiamata dopo ogni operazione con (indice, operazione, sessione)
+
+    Returns:
+        dict: "sessione" riprodotta, "operazioni" eseguite, "tempo_s" di esecuzione
+              (senza la lettura del giornale) ed "errori" ({"n", "tipo", "arg", "errore", "traceback"})
+
+    Raises:
+        GiornaleNonContiguo: Se mancano operazioni nel giornale
+    """
+    intestazione, operazioni = leggi_giornale(percorso)
+    if fino_a is not None:
+        operazioni = operazioni[:fino_a]
+
+    inizio = time.perf_counter()
+    sessione = prepara_sessione(intestazione)
+    errori = []
+    for indice, operazione in enumerate(operazioni):
+        try:
+            esegui_operazione(sessione, operazione)
+        except GiornaleNonContiguo:
+            raise
+        except Exception as e:
+            errori.append({
+                "n": operazione.get("n"),
+                "tipo": operazione.get("tipo"),
+                "arg": operazione.get("arg"),
+                "errore": f"{type(e).__name__}: {e}",
+                "traceback": traceback.format_exc()
+            })
+        if al_passo is not None:
+            al_passo(indice, operazione, sessione)
+
+    return {
+        "sessione": sessione,
+        "operazioni": len(operazioni),
+        "tempo_s": time.perf_counter() - inizio,
+        "errori": errori
+    }
+
+
+def stato_confrontabile(sessione):
+    """
+    Estrae lo stato di una sessione da confrontare tra due riproduzioni,
+    senza i valori che dipendono dall'istante di esecuzione.
+
+    Args:
+        sessione (StatoGioco): La sessione
+
+    Returns:
+        dict: Giocatore, stati, mappa attuale, mappe e stato di attività
+    """
+    game = sessione.game
+    from states.registro_stati import serializza_stato
+
+    giocatore = game.giocatore.to_dict() if game.giocatore else None
+    if giocatore and "achievements" in giocatore:
+        # Gli istanti di sblocco cambiano a ogni riproduzione
+        giocatore["achievements"] = dict(giocatore["achievements"],
+                                         sbloccati=sorted(giocatore["achievements"].get("sbloccati", {})))
+    mappa_attuale = game.gestore_mappe.mappa_attuale
+    return {
+        "giocatore": giocatore,
+        "stati": [serializza_stato(stato) for stato in game.stato_stack],
+        "mappa_attuale": mappa_attuale.nome if mappa_attuale else None,
+        "mappe": {nome: game.gestore_mappe.dati_mappa(nome) for nome in game.gestore_mappe.mappe},
+        "attivo": game.attivo
+    }
+
+
+def _impronta(valore):
+    """Impronta breve della forma JSON canonica di un valore"""
+    testo = json.dumps(valore, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(testo.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def impronta_stato(sessione):
+    """
+    Calcola le impronte delle parti dello stato di una sessione.
+
+    Args:
+        sessione (StatoGioco): La sessione
+
+    Returns:
+        dict: Impronte di giocatore, stati e di ogni mappa, con mappa attuale e stato di attività
+    """
+    stato = stato_confrontabile(sessione)
+    return {
+        "giocatore": _impronta(stato["giocatore"]),
+        "stati": _impronta(stato["stati"]),
+        "mappa_attuale": stato["mappa_attuale"],
+        "attivo": stato["attivo"],
+        "mappe": {nome: _impronta(dati) for nome, dati in stato["mappe"].items()}
+    }
+
+
+def traccia(percorso, fino_a=None):
+    """
+    Riproduce un giornale registrando l'impronta dello stato dopo ogni operazione.
+
+    Args:
+        percorso (str | Path): File del giornale
+        fino_a (int, optional): Numero di operazioni da riprodurre, None per tutte
+
+    Returns:
+        dict: "giornale", "passi" ({"n", "tipo", "arg", "impronta"}) ed "errori" (n ed errore)
+    """
+    passi = []
+
+    def registra_passo(indice, operazione, sessione):
+        passi.append({
+            "n": operazione.get("n"),
+            "tipo": operazione.get("tipo"),
+            "arg": operazione.get("arg"),
+            "impronta": impronta_stato(sessione)
+        })
+
+    risultato = riproduci(percorso, fino_a=fino_a, al_passo=registra_passo)
+    return {
+        "giornale": str(percorso),
+        "passi": passi,
+        "errori": [{"n": errore["n"], "errore": errore["errore"]} for errore in risultato["errori"]]
+    }
+
+
+def _parti_diverse(impronta_a, impronta_b):
+    """Nomi delle parti dello stato con impronte diverse"""
+    diverse = [parte for parte in ("giocatore", "stati", "mappa_attuale", "attivo")
+               if impronta_a.get(parte) != impronta_b.get(parte)]
+    mappe_a, mappe_b = impronta_a.get("mappe", {}), impronta_b.get("mappe", {})
+    diverse.extend(f"mappa:{nome}" for nome in sorted(set(mappe_a) | set(mappe_b))
+                   if mappe_a.get(nome) != mappe_b.get(nome))
+    return diverse
+
+
+def confronta_tracce(traccia_a, traccia_b):
+    """
+    Confronta le tracce dello stesso giornale prodotte da due versioni del codice.
+
+    Args:
+        traccia_a (dict): Traccia prodotta da traccia()
+        traccia_b (dict): Traccia prodotta da traccia()
+
+    Returns:
+        dict: "uguali" (bool), "passo" (indice del primo passo divergente o None),
+              "operazione" divergente, "parti" diverse, "errori_a" ed "errori_b"
+    """
+    passi_a, passi_b = traccia_a["passi"], traccia_b["passi"]
+    risultato = {
+        "uguali": True,
+        "passo": None,
+        "operazione": None,
+        "parti": [],
+        "errori_a": traccia_a.get("errori", []),
+        "errori_b": traccia_b.get("errori", [])
+    }
+    for indice, (passo_a, passo_b) in enumerate(zip(passi_a, passi_b)):
+        if (passo_a["tipo"], passo_a["arg"]) != (passo_b["tipo"], passo_b["arg"]):
+            raise ValueError(f"Le tracce non provengono dallo stesso giornale (passo {indice})")
+        parti = _parti_diverse(passo_a["impronta"], passo_b["impronta"])
+        if parti:
+            risultato.update(uguali=False, passo=indice, parti=parti,
+                             operazione={"n": passo_a["n"], "tipo": passo_a["tipo"], "arg": passo_a["arg"]})
+            return risultato
+    if len(passi_a) != len(passi_b):
+        risultato.update(uguali=False, passo=min(len(passi_a), len(passi_b)), parti=["lunghezza"])
+    elif risultato["errori_a"] != risultato["errori_b"]:
+        risultato.update(uguali=False, parti=["errori"])
+    return risultato
+
+
+def misura_giornale(argomento):
+    """
+    Riproduce un giornale più volte e ne misura i tempi (eseguita nei processi del pool).
+
+    Args:
+        argomento (tuple): (percorso del giornale, ripetizioni)
+
+    Returns:
+        dict: Percorso, operazioni, tempo migliore, millisecondi per operazione ed errori
+    """
+    percorso, ripetizioni = argomento
+    migliore = None
+    for _ in range(max(1, ripetizioni)):
+        risultato = riproduci(percorso)
+        if migliore is None or risultato["tempo_s"] < migliore["tempo_s"]:
+            migliore = risultato
+    operazioni = migliore["operazioni"]
+    return {
+        "giornale": str(percorso),
+        "operazioni": operazioni,
+        "tempo_s": migliore["tempo_s"],
+        "ms_per_operazione": migliore["tempo_s"] * 1000 / operazioni if operazioni else 0.0,
+        "errori": len(migliore["errori"])
+    }
+
+
+def riproduci_molti(percorsi, processi=None, ripetizioni=1):
+    """
+    Riproduce molti giornali su un pool di processi.
+
+    Args:
+        percorsi (list): File dei giornali
+        processi (int, optional): Numero di processi, None per il numero di CPU
+        ripetizioni (int): Riproduzioni per giornale (vale la più veloce)
+
+    Returns:
+        list: I risultati di misura_giornale, nello stesso ordine dei percorsi
+              (con "errore" per i giornali che non è stato possibile riprodurre)
+    """
+    risultati = [None] * len(percorsi)
+    if not percorsi:
+        return risultati
+    with ProcessPoolExecutor(max_workers=processi) as pool:
+        futuri = {pool.submit(misura_giornale, (percorso, ripetizioni)): i for i, percorso in enumerate(percorsi)}
+        for completati, futuro in enumerate(as_completed(futuri), start=1):
+            indice = futuri[futuro]
+            try:
+                risultati[indice] = futuro.result()
+            except Exception as e:
+                risultati[indice] = {"giornale": str(percorsi[indice]), "errore": str(e)}
+            sys.stderr.write(f"\rgiornali: {completati}/{len(percorsi)}")
+            sys.stderr.flush()
+    sys.stderr.write("\n")
+    return risultati
+
+
+def main(argv=None):
+    """Punto di ingresso da riga di comando"""
+    parser = argparse.ArgumentParser(description="Riproduzione delle sessioni dai giornali dei comandi")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+
+    parser_riproduci = comandi.add_parser("riproduci", help="Riproduce un giornale e riporta gli errori")
+    parser_riproduci.add_argument("giornale")
+    parser_riproduci.add_argument("--fino-a", type=int, help="Riproduce solo le prime N operazioni")
+    parser_riproduci.add_argument("--mostra", action="store_true", help="Stampa lo stato finale in JSON")
+
+    parser_traccia = comandi.add_parser("traccia", help="Scrive le impronte dello stato dopo ogni operazione")
+    parser_traccia.add_argument("giornale")
+    parser_traccia.add_argument("-o", "--output", required=True, help="File della traccia")
+    parser_traccia.add_argument("--fino-a", type=int, help="Riproduce solo le prime N operazioni")
+
+    parser_confronta = comandi.add_parser("confronta", help="Confronta due tracce dello stesso giornale")
+    parser_confronta.add_argument("traccia_a")
+    parser_confronta.add_argument("traccia_b")
+
+    parser_benchmark = comandi.add_parser("benchmark", help="Misura la riproduzione di molti giornali")
+    parser_benchmark.add_argument("giornali", nargs="+")
+    parser_benchmark.add_argument("--processi", type=int, help="Processi del pool (default: numero di CPU)")
+    parser_benchmark.add_argument("--ripetizioni", type=int, default=3, help="Riproduzioni per giornale")
+
+    args = parser.parse_args(argv)
+
+    try:
+        return _esegui_comando(args)
+    except GiornaleNonContiguo as e:
+        print(f"{e}: riproduzione interrotta")
+        return 1
+
+
+def _esegui_comando(args):
+    """Esegue il sottocomando scelto sulla riga di comando"""
+    if args.comando == "riproduci":
+        risultato = riproduci(args.giornale, fino_a=args.fino_a)
+        print(f"{risultato['operazioni']} operazioni in {risultato['tempo_s'] * 1000:.1f} ms, "
+              f"{len(risultato['errori'])} errori")
+        for errore in risultato["errori"]:
+            print(f"\noperazione {errore['n']} ({errore['tipo']} {errore['arg']!r}): {errore['errore']}")
+            print(errore["traceback"])
+        if args.mostra:
+            print(json.dumps(stato_confrontabile(risultato["sessione"]), indent=2, ensure_ascii=False, default=str))
+        return 1 if risultato["errori"] else 0
+
+    if args.comando == "traccia":
+        risultato = traccia(args.giornale, fino_a=args.fino_a)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(risultato, f, ensure_ascii=False)
+        print(f"{len(risultato['passi'])} passi, {len(risultato['errori'])} errori -> {args.output}")
+        return 0
+
+    if args.comando == "confronta":
+        with open(args.traccia_a, encoding="utf-8") as f:
+            traccia_a = json.load(f)
+        with open(args.traccia_b, encoding="utf-8") as f:
+            traccia_b = json.load(f)
+        risultato = confronta_tracce(traccia_a, traccia_b)
+        if risultato["uguali"]:
+            print(f"Tracce uguali ({len(traccia_a['passi'])} passi)")
+            return 0
+        operazione = risultato["operazione"] or {}
+        print(f"Divergenza al passo {risultato['passo']} "
+              f"(operazione {operazione.get('n')} {operazione.get('tipo')} {operazione.get('arg')!r}): "
+              f"{', '.join(risultato['parti'])}")
+        for nome in ("errori_a", "errori_b"):
+            for errore in risultato[nome]:
+                print(f"  {nome}: operazione {errore['n']}: {errore['errore']}")
+        return 1
+
+    risultati = riproduci_molti(args.giornali, processi=args.processi, ripetizioni=args.ripetizioni)
+    for risultato in risultati:
+        if "errore" in risultato:
+            print(f"{risultato['giornale']}: {risultato['errore']}")
+            continue
+        print(f"{risultato['giornale']}: {risultato['operazioni']} operazioni, "
+              f"{risultato['tempo_s'] * 1000:.1f} ms, {risultato['ms_per_operazione']:.3f} ms/operazione, "
+              f"{risultato['errori']} errori")
+    return 1 if any("errore" in r or r["errori"] for r in risultati) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
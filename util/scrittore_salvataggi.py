@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger("gioco_rpg")
+
+# Numero di thread dedicati alla scrittura dei salvataggi
+MAX_WORKER_SALVATAGGI = int(os.environ.get("RPG_WORKER_SALVATAGGI", 2))
+
+
+def copia_struttura(valore):
+    """
+    Copia ricorsivamente dizionari e liste di un documento JSON.
+    Più veloce di copy.deepcopy perché i valori scalari sono immutabili e non vengono copiati.
+
+    Args:
+        valore: Documento da copiare
+
+    Returns:
+        Una copia indipendente del documento
+    """
+    if isinstance(valore, dict):
+        return {chiave: copia_struttura(v) for chiave, v in valore.items()}
+    if isinstance(valore, (list, tuple)):
+        return [copia_struttura(v) for v in valore]
+    return valore
+
+
+def scrivi_file_atomico(percorso, scrivi, binario=False):
+    """
+    Scrive un file in modo atomico: file temporaneo nella stessa cartella,
+    fsync, rinomina sul file finale e fsync della cartella.
+    Un crash durante la scrittura lascia intatto il file precedente.
+
+    Args:
+        percorso (str o Path): File di destinazione
+        scrivi (callable): Funzione che riceve il file aperto e vi scrive il contenuto
+        binario (bool): Se True, apre il file temporaneo in modalità binaria
+    """
+    percorso = Path(percorso)
+    percorso.parent.mkdir(exist_ok=True, parents=True)
+    temporaneo = percorso.with_name(f".{percorso.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        if binario:
+            f = open(temporaneo, 'wb')
+        else:
+            f = open(temporaneo, 'w', encoding='utf-8')
+        with f:
+            scrivi(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporaneo, percorso)
+    except BaseException:
+        try:
+            os.unlink(temporaneo)
+        except OSError:
+            pass
+        raise
+
+    # Rende persistente anche la rinomina (non supportato su tutti i sistemi)
+    try:
+        descrittore = os.open(percorso.parent, os.O_RDONLY)
+        try:
+            os.fsync(descrittore)
+        finally:
+            os.close(descrittore)
+    except OSError:
+        pass
+
+
+class ScrittoreSalvataggi:
+    """
+    Pipeline di scrittura asincrona per i salvataggi.
+    Il thread della richiesta paga solo la copia dei dati: serializzazione, fsync,
+    rinomina e registrazione nello storico avvengono su un pool di thread dedicato.
+    I salvataggi dello stesso file vengono scritti in ordine; se più salvataggi dello
+    stesso file sono in attesa viene scritto solo il più recente e tutti i future
+    in attesa vengono completati con il suo esito.
+    """
+
+    def __init__(self, max_worker=MAX_WORKER_SALVATAGGI):
+        """
+        Inizializza lo scrittore
+
+        Args:
+            max_worker (int): Numero di thread di scrittura
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_worker, thread_name_prefix="salvataggi")
+        self._lock = threading.Lock()
+        self._in_attesa = {}  # percorso -> lista di (dati, future, crea_backup)
+        self._attivi = set()  # percorsi con una scrittura in corso o programmata
+        self._completati = 0
+        self._falliti = 0
+        self._accorpati = 0
+        self._profondita_massima = 0
+
+    def accoda(self, percorso, dati, crea_backup=True):
+        """
+        Accoda un salvataggio.
+
+        Args:
+            percorso (str o Path): File di destinazione
+            dati (dict): Documento da salvare (viene copiato subito)
+            crea_backup (bool): Se True, registra la nuova versione nello storico differenziale
+
+        Returns:
+            Future: Completato con True a scrittura avvenuta, o con l'eccezione in caso di errore
+        """
+        copia = copia_struttura(dati)
+        future = Future()
+        chiave = os.path.abspath(percorso)
+        with self._lock:
+            self._in_attesa.setdefault(chiave, []).append((copia, future, crea_backup))
+            self._profondita_massima = max(self._profondita_massima, self._profondita())
+            if chiave not in self._attivi:
+                self._attivi.add(chiave)
+                self._executor.submit(self._svuota, chiave)
+        return future
+
+    def _profondita(self):
+        """Numero di salvataggi in attesa (da chiamare con il lock acquisito)"""
+        return sum(len(richieste) for richieste in self._in_attesa.values())
+
+    def _svuota(self, chiave):
+        """Scrive i salvataggi in attesa per un file finché non ne restano"""
+        while True:
+            with self._lock:
+                richieste = self._in_attesa.pop(chiave, None)
+                if not richieste:
+                    self._attivi.discard(chiave)
+                    return
+
+            dati = richieste[-1][0]
+            crea_backup = any(richiesta[2] for richiesta in richieste)
+            try:
+                self._scrivi(Path(chiave), dati, crea_backup)
+                errore = None
+            except Exception as e:
+                logger.error(f"Errore durante la scrittura del salvataggio {chiave}: {e}")
+                errore = e
+
+            with self._lock:
+                if errore is None:
+                    self._completati += 1
+                else:
+                    self._falliti += 1
+                self._accorpati += len(richieste) - 1
+            for _, future, _ in richieste:
+                if errore is None:
+                    future.set_result(True)
+                else:
+                    future.set_exception(errore)
+
+    def _scrivi(self, percorso, dati, crea_backup):
+        """Esegue scrittura atomica, registrazione nello storico e aggiornamento dell'indice di un salvataggio"""
+        from util.formato_salvataggi import scrivi_salvataggio
+        from util.indice_salvataggi import get_indice_salvataggi
+        from util.storico_salvataggi import get_storico_salvataggi
+
+        storico = get_storico_salvataggi()
+        if crea_backup:
+            # Un salvataggio preesistente senza storico diventa la prima versione
+            storico.assicura_base(percorso)
+
+        scrivi_file_atomico(percorso, lambda f: scrivi_salvataggio(f, dati), binario=True)
+        get_indice_salvataggi().aggiorna(percorso, dati)
+        logger.info(f"Salvataggio completato: {percorso}")
+
+        if crea_backup:
+            try:
+                versione = storico.registra(percorso, dati)
+                if versione is not None:
+                    logger.info(f"Registrata la versione {versione} di {percorso.name} nello storico")
+            except Exception as e:
+                # Il salvataggio è già su disco: un errore dello storico non lo invalida
+                logger.error(f"Errore durante la registrazione di {percorso} nello storico: {e}")
+
+    def metriche(self):
+        """
+        Restituisce le metriche della coda di scrittura.
+
+        Returns:
+            dict: Profondità della coda, scritture in corso e contatori cumulativi
+        """
+        with self._lock:
+            return {
+                "in_coda": self._profondita(),
+                "file_in_scrittura": len(self._attivi),
+                "profondita_massima": self._profondita_massima,
+                "completati": self._completati,
+                "falliti": self._falliti,
+                "accorpati": self._accorpati
+            }
+
+    def chiudi(self, attendi=True):
+        """
+        Arresta il pool di scrittura.
+
+        Args:
+            attendi (bool): Se True, attende il completamento dei salvataggi in coda
+        """
+        self._executor.shutdown(wait=attendi)
+
+
+# Istanza condivisa dello scrittore
+scrittore_salvataggi = ScrittoreSalvataggi()
+
+
+def get_scrittore_salvataggi():
+    """
+    Ottieni l'istanza dello scrittore dei salvataggi.
+
+    Returns:
+        ScrittoreSalvataggi: L'istanza condivisa
+    """
+    return scrittore_salvataggi
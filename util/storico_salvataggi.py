@@ -0,0 +1,449 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from util.config import BACKUPS_DIR
+from util.formato_salvataggi import leggi_salvataggio
+
+logger = logging.getLogger("gioco_rpg")
+
+# Cartella che contiene lo storico differenziale di ogni salvataggio
+STORICO_DIR = BACKUPS_DIR / "storico"
+
+# Numero massimo di delta in una catena prima di scrivere una nuova base completa
+DELTA_PER_BASE = 20
+
+# Numero di catene (base + delta) conservate per ogni salvataggio
+MAX_CATENE = 5
+
+# Numero di salvataggi di cui tenere in memoria l'ultima versione
+MAX_DOCUMENTI_IN_CACHE = 64
+
+# Operazioni dei delta: imposta un valore o elimina una chiave
+OP_IMPOSTA = "s"
+OP_ELIMINA = "d"
+
+
+def calcola_delta(vecchio, nuovo, percorso=None, operazioni=None):
+    """
+    Calcola la differenza strutturale tra due documenti JSON.
+    Dizionari e liste della stessa lunghezza vengono confrontati elemento per elemento,
+    qualsiasi altro valore diverso viene sostituito per intero.
+
+    Args:
+        vecchio: Documento di partenza
+        nuovo: Documento di arrivo
+        percorso (list, optional): Percorso corrente (uso interno)
+        operazioni (list, optional): Lista in cui accumulare le operazioni (uso interno)
+
+    Returns:
+        list: Operazioni [op, percorso, valore] che trasformano vecchio in nuovo
+    """
+    if percorso is None:
+        percorso = []
+    if operazioni is None:
+        operazioni = []
+
+    if isinstance(vecchio, dict) and isinstance(nuovo, dict):
+        for chiave, valore in nuovo.items():
+            if chiave not in vecchio:
+                operazioni.append([OP_IMPOSTA, percorso + [chiave], valore])
+            elif vecchio[chiave] != valore:
+                calcola_delta(vecchio[chiave], valore, percorso + [chiave], operazioni)
+        for chiave in vecchio:
+            if chiave not in nuovo:
+                operazioni.append([OP_ELIMINA, percorso + [chiave]])
+    elif isinstance(vecchio, list) and isinstance(nuovo, list) and len(vecchio) == len(nuovo):
+        for indice, (a, b) in enumerate(zip(vecchio, nuovo)):
+            if a != b:
+                calcola_delta(a, b, percorso + [indice], operazioni)
+    elif vecchio != nuovo or type(vecchio) is not type(nuovo):
+        operazioni.append([OP_IMPOSTA, percorso, nuovo])
+    return operazioni
+
+
+def applica_delta(documento, delta):
+    """
+    Applica a un documento le operazioni prodotte da calcola_delta.
+
+    Args:
+        documento: Documento da modificare (viene modificato sul posto)
+        delta (list): Operazioni da applicare
+
+    Returns:
+        Il documento aggiornato
+    """
+    for operazione in delta:
+        op, percorso = operazione[0], operazione[1]
+        if not percorso:
+            documento = operazione[2]
+            continue
+        contenitore = documento
+        for chiave in percorso[:-1]:
+            contenitore = contenitore[chiave]
+        if op == OP_IMPOSTA:
+            contenitore[percorso[-1]] = operazione[2]
+        elif op == OP_ELIMINA:
+            del contenitore[percorso[-1]]
+    return documento
+
+
+class StoricoSalvataggi:
+    """
+    Storico differenziale dei salvataggi, al posto delle copie complete in backup/.
+    Per ogni salvataggio viene mantenuta una sequenza di catene: ogni catena è un file
+    JSON Lines con una versione base completa seguita dai delta delle versioni successive.
+    Dopo DELTA_PER_BASE delta (o quando i delta superano la dimensione della base) viene
+    avviata una nuova catena, e solo le ultime MAX_CATENE vengono conservate.
+    Ogni versione è ricostruibile applicando alla base i delta fino a quella versione.
+    """
+
+    def __init__(self, cartella=STORICO_DIR, delta_per_base=DELTA_PER_BASE, max_catene=MAX_CATENE,
+                 max_documenti_in_cache=MAX_DOCUMENTI_IN_CACHE):
+        """
+        Inizializza lo storico
+
+        Args:
+            cartella (Path): Cartella radice dello storico
+            delta_per_base (int): Delta massimi per catena
+            max_catene (int): Catene conservate per ogni salvataggio
+            max_documenti_in_cache (int): Ultime versioni tenute in memoria per evitare riletture
+        """
+        self.cartella = Path(cartella)
+        self.delta_per_base = delta_per_base
+        self.max_catene = max_catene
+        self.max_documenti_in_cache = max_documenti_in_cache
+        self._lock = threading.Lock()
+        self._locks_file = {}
+        # nome -> {"id", "documento", "catena", "firma", "n_delta", "byte_delta", "byte_base"}
+        self._cache = OrderedDict()
+
+    # --- Utilità interne -------------------------------------------------
+
+    def _lock_file(self, nome):
+        """Restituisce il lock dedicato a un salvataggio"""
+        with self._lock:
+            lock = self._locks_file.get(nome)
+            if lock is None:
+                lock = self._locks_file[nome] = threading.Lock()
+            return lock
+
+    def _nome(self, percorso_o_nome):
+        """Nome del salvataggio (senza estensione) usato come cartella dello storico"""
+        nome = os.path.basename(str(percorso_o_nome))
+        return nome[:-5] if nome.lower().endswith(".json") else nome
+
+    def _cartella(self, nome):
+        return self.cartella / nome
+
+    def _catene(self, nome):
+        """File delle catene di un salvataggio, dalla più vecchia alla più recente"""
+        cartella = self._cartella(nome)
+        if not cartella.exists():
+            return []
+        return sorted(cartella.glob("*.jsonl"))
+
+    @staticmethod
+    def _firma(percorso):
+        try:
+            info = os.stat(percorso)
+            return (info.st_mtime_ns, info.st_size)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _documento_base(voce):
+        """Documento completo di una riga base, ricomposto dall'archivio se salvato come manifesto"""
+        if "manifesto" in voce:
+            from util.archivio_contenuti import get_archivio_contenuti
+            return get_archivio_contenuti().ricomponi(voce["manifesto"])
+        return voce["base"]
+
+    @staticmethod
+    def _e_base(voce):
+        return "base" in voce or "manifesto" in voce
+
+    @staticmethod
+    def _leggi_catena(percorso):
+        """Legge tutte le righe (versioni) di una catena"""
+        versioni = []
+        with open(percorso, 'r', encoding='utf-8') as f:
+            for riga in f:
+                riga = riga.strip()
+                if riga:
+                    versioni.append(json.loads(riga))
+        return versioni
+
+    def _stato_corrente(self, nome):
+        """
+        Restituisce lo stato dell'ultima catena, dalla cache se ancora valida.
+
+        Returns:
+            dict: Stato della catena, None se il salvataggio non ha storico
+        """
+        with self._lock:
+            stato = self._cache.get(nome)
+            if stato is not None:
+                self._cache.move_to_end(nome)
+        if stato is not None and self._firma(stato["catena"]) == stato["firma"]:
+            return stato
+
+        catene = self._catene(nome)
+        if not catene:
+            return None
+        versioni = self._leggi_catena(catene[-1])
+        if not versioni or not self._e_base(versioni[0]):
+            return None
+
+        documento = self._documento_base(versioni[0])
+        byte_base = len(json.dumps(documento, separators=(",", ":"), ensure_ascii=False))
+        byte_delta = 0
+        for versione in versioni[1:]:
+            documento = applica_delta(documento, versione["delta"])
+            byte_delta += len(json.dumps(versione["delta"], separators=(",", ":")))
+        stato = {
+            "id": versioni[-1]["id"],
+            "documento": documento,
+            "catena": catene[-1],
+            "firma": self._firma(catene[-1]),
+            "n_delta": len(versioni) - 1,
+            "byte_delta": byte_delta,
+            "byte_base": byte_base
+        }
+        self._memorizza(nome, stato)
+        return stato
+
+    def _memorizza(self, nome, stato):
+        """Inserisce lo stato di una catena nella cache LRU"""
+        with self._lock:
+            self._cache[nome] = stato
+            self._cache.move_to_end(nome)
+            while len(self._cache) > self.max_documenti_in_cache:
+                self._cache.popitem(last=False)
+
+    def _aggiungi_riga(self, percorso, voce):
+        """Accoda una versione a una catena e la rende persistente"""
+        riga = json.dumps(voce, separators=(",", ":"), ensure_ascii=False) + "\n"
+        with open(percorso, 'a', encoding='utf-8') as f:
+            f.write(riga)
+            f.flush()
+            os.fsync(f.fileno())
+        return len(riga)
+
+    def _nuova_catena(self, nome, id_versione, documento, timestamp):
+        """
+        Avvia una nuova catena e applica la politica di conservazione.
+        La base viene salvata come manifesto dell'archivio indirizzato per contenuto:
+        le sezioni invariate rispetto alle basi precedenti non occupano altro spazio.
+        """
+        from util.archivio_contenuti import get_archivio_contenuti
+
+        cartella = self._cartella(nome)
+        cartella.mkdir(parents=True, exist_ok=True)
+        percorso = cartella / f"{id_versione:08d}.jsonl"
+        manifesto = get_archivio_contenuti().crea_manifesto(documento)
+        self._aggiungi_riga(percorso, {"id": id_versione, "timestamp": timestamp, "manifesto": manifesto})
+        # Il costo di una base resta quello del documento completo, anche se deduplicato
+        byte_base = len(json.dumps(documento, separators=(",", ":"), ensure_ascii=False))
+
+        catene = self._catene(nome)
+        for vecchia in catene[:max(0, len(catene) - self.max_catene)]:
+            try:
+                vecchia.unlink()
+                logger.info(f"Rimossa catena di storico obsoleta: {vecchia}")
+            except OSError as e:
+                logger.error(f"Errore durante la rimozione della catena {vecchia}: {e}")
+
+        self._memorizza(nome, {
+            "id": id_versione,
+            "documento": documento,
+            "catena": percorso,
+            "firma": self._firma(percorso),
+            "n_delta": 0,
+            "byte_delta": 0,
+            "byte_base": byte_base
+        })
+
+    # --- API pubblica ----------------------------------------------------
+
+    def assicura_base(self, percorso):
+        """
+        Se un salvataggio esistente non ha ancora uno storico, ne registra il contenuto
+        attuale come prima versione (ad es. salvataggi creati prima dello storico).
+
+        Args:
+            percorso (str o Path): Percorso del file di salvataggio
+        """
+        nome = self._nome(percorso)
+        with self._lock_file(nome):
+            if self._catene(nome) or not os.path.exists(percorso):
+                return
+            try:
+                documento = leggi_salvataggio(percorso)
+            except (OSError, ValueError, EOFError) as e:
+                logger.warning(f"Impossibile registrare nello storico il salvataggio {percorso}: {e}")
+                return
+            self._nuova_catena(nome, 1, documento, documento.get("timestamp", time.time()))
+
+    def registra_file(self, percorso):
+        """
+        Registra come nuova versione il contenuto attuale di un file di salvataggio.
+
+        Args:
+            percorso (str o Path): Percorso del file di salvataggio
+
+        Returns:
+            int: Id della versione registrata, None se invariato o illeggibile
+        """
+        try:
+            documento = leggi_salvataggio(percorso)
+        except (OSError, ValueError, EOFError) as e:
+            logger.warning(f"Impossibile registrare nello storico il salvataggio {percorso}: {e}")
+            return None
+        return self.registra(percorso, documento)
+
+    def registra(self, percorso, documento):
+        """
+        Registra una nuova versione di un salvataggio.
+
+        Args:
+            percorso (str o Path): Percorso (o nome) del file di salvataggio
+            documento (dict): Contenuto completo della nuova versione (non va modificato dopo la chiamata)
+
+        Returns:
+            int: Id della versione registrata, None se il contenuto non è cambiato
+        """
+        nome = self._nome(percorso)
+        timestamp = documento.get("timestamp", time.time()) if isinstance(documento, dict) else time.time()
+        with self._lock_file(nome):
+            stato = self._stato_corrente(nome)
+            if stato is None:
+                self._nuova_catena(nome, 1, documento, timestamp)
+                return 1
+
+            delta = calcola_delta(stato["documento"], documento)
+            if not delta:
+                return None
+
+            id_versione = stato["id"] + 1
+            byte_delta = len(json.dumps(delta, separators=(",", ":"), ensure_ascii=False))
+            if stato["n_delta"] >= self.delta_per_base or stato["byte_delta"] + byte_delta > stato["byte_base"]:
+                # Rebase: la catena è troppo lunga o i delta costano più di una base
+                self._nuova_catena(nome, id_versione, documento, timestamp)
+                return id_versione
+
+            self._aggiungi_riga(stato["catena"], {"id": id_versione, "timestamp": timestamp, "delta": delta})
+            stato["documento"] = documento
+            stato["id"] = id_versione
+            stato["n_delta"] += 1
+            stato["byte_delta"] += byte_delta
+            stato["firma"] = self._firma(stato["catena"])
+            return id_versione
+
+    def elenca_versioni(self, nome_file):
+        """
+        Elenca le versioni disponibili di un salvataggio.
+
+        Args:
+            nome_file (str): Nome del file di salvataggio
+
+        Returns:
+            list: Versioni dalla più recente, con id, timestamp e tipo ("base" o "delta")
+        """
+        nome = self._nome(nome_file)
+        versioni = []
+        with self._lock_file(nome):
+            for catena in self._catene(nome):
+                for voce in self._leggi_catena(catena):
+                    versioni.append({
+                        "id": voce["id"],
+                        "timestamp": voce.get("timestamp"),
+                        "tipo": "base" if self._e_base(voce) else "delta"
+                    })
+        versioni.reverse()
+        return versioni
+
+    def ricostruisci(self, nome_file, id_versione=None):
+        """
+        Ricostruisce il contenuto di un salvataggio a una certa versione.
+
+        Args:
+            nome_file (str): Nome del file di salvataggio
+            id_versione (int, optional): Versione da ricostruire, None per l'ultima
+
+        Returns:
+            dict: Il documento ricostruito, None se la versione non esiste
+        """
+        nome = self._nome(nome_file)
+        with self._lock_file(nome):
+            catene = self._catene(nome)
+            if id_versione is None:
+                stato = self._stato_corrente(nome)
+                return json.loads(json.dumps(stato["documento"])) if stato else None
+
+            # Le catene sono nominate con l'id della loro base: basta trovare l'ultima base <= id
+            candidate = [c for c in catene if int(c.stem) <= id_versione]
+            if not candidate:
+                return None
+            documento = None
+            for voce in self._leggi_catena(candidate[-1]):
+                if voce["id"] > id_versione:
+                    break
+                if self._e_base(voce):
+                    documento = self._documento_base(voce)
+                else:
+                    documento = applica_delta(documento, voce["delta"])
+                if voce["id"] == id_versione:
+                    return documento
+            return None
+
+    def manifesti(self):
+        """
+        Restituisce i manifesti delle basi di tutte le catene, per la raccolta dell'archivio.
+
+        Returns:
+            generator: I manifesti trovati
+        """
+        catene = self.cartella.glob("*/*.jsonl") if self.cartella.exists() else []
+        for catena in catene:
+            try:
+                with open(catena, 'r', encoding='utf-8') as f:
+                    voce = json.loads(f.readline() or "{}")
+            except (OSError, ValueError):
+                continue
+            if "manifesto" in voce:
+                yield voce["manifesto"]
+
+    def dimensione(self, nome_file=None):
+        """
+        Restituisce lo spazio occupato dallo storico.
+
+        Args:
+            nome_file (str, optional): Limita il calcolo a un salvataggio
+
+        Returns:
+            int: Byte occupati su disco
+        """
+        if nome_file is not None:
+            catene = self._catene(self._nome(nome_file))
+        else:
+            catene = self.cartella.glob("*/*.jsonl") if self.cartella.exists() else []
+        return sum(c.stat().st_size for c in catene)
+
+
+# Istanza condivisa dello storico
+storico_salvataggi = StoricoSalvataggi()
+
+
+def get_storico_salvataggi():
+    """
+    Ottieni l'istanza dello storico dei salvataggi.
+
+    Returns:
+        StoricoSalvataggi: L'istanza condivisa
+    """
+    return storico_salvataggi
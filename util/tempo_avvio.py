@@ -0,0 +1,125 @@
+"""
+Controllo del tempo di avvio del server e del gioco da terminale.
+
+Misura con `python -X importtime` il tempo di importazione dei moduli di ingresso,
+in un interprete nuovo per ogni misura, e lo confronta con un budget. Controlla anche
+che i moduli pesanti (stati di gioco) non vengano importati all'avvio: vanno caricati
+dal registro degli stati alla prima partita.
+
+    python -m util.tempo_avvio [server main] [--ripetizioni N] [--dettaglio K]
+
+Esce con codice 1 se un modulo supera il budget o importa moduli differiti, così può
+essere usato come controllo di regressione prima di un rilascio.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Directory del progetto, da cui vengono importati i moduli di ingresso
+RADICE_PROGETTO = Path(__file__).resolve().parent.parent
+
+# Budget (millisecondi) del tempo di importazione dei moduli di ingresso
+BUDGET_AVVIO_MS = {
+    "server": float(os.environ.get("RPG_BUDGET_AVVIO_SERVER_MS", 400)),
+    "main": float(os.environ.get("RPG_BUDGET_AVVIO_MAIN_MS", 150))
+}
+
+# Moduli che un modulo di ingresso non deve importare all'avvio
+MODULI_DIFFERITI = {
+    "server": ("states.taverna", "states.mercato", "states.dialogo", "states.combattimento",
+               "states.gestione_inventario", "states.prova_abilita", "states.mappa_state"),
+    "main": ("states.taverna", "states.mercato", "states.dialogo", "states.combattimento")
+}
+
+
+def misura_importazione(modulo, ripetizioni=3):
+    """
+    Misura il tempo di importazione di un modulo in un interprete nuovo.
+    Di più misure viene tenuta la più veloce, la meno disturbata dal resto del sistema.
+
+    Args:
+        modulo (str): Nome del modulo da importare
+        ripetizioni (int): Numero di misure
+
+    Returns:
+        dict: "totale_ms" (tempo cumulativo del modulo) e "moduli" ({nome: (proprio_us,
+              cumulativo_us)} di tutti i moduli importati nella misura migliore)
+
+    Raises:
+        RuntimeError: Se l'importazione fallisce
+    """
+    migliore = None
+    for _ in range(max(1, ripetizioni)):
+        processo = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+            cwd=RADICE_PROGETTO, capture_output=True, text=True
+        )
+        if processo.returncode != 0:
+            errore = processo.stderr.strip().splitlines()
+            raise RuntimeError(f"Importazione di {modulo} fallita: {errore[-1] if errore else processo.returncode}")
+
+        moduli = {}
+        for riga in processo.stderr.splitlines():
+            if not riga.startswith("import time:"):
+                continue
+            campi = riga[len("import time:"):].split("|")
+            if len(campi) != 3 or not campi[0].strip().isdigit():
+                continue  # Riga di intestazione
+            moduli[campi[2].strip()] = (int(campi[0]), int(campi[1]))
+
+        totale_ms = moduli.get(modulo, (0, 0))[1] / 1000
+        if migliore is None or totale_ms < migliore["totale_ms"]:
+            migliore = {"totale_ms": totale_ms, "moduli": moduli}
+    return migliore
+
+
+def controlla(modulo, ripetizioni=3, dettaglio=10):
+    """
+    Misura un modulo di ingresso, lo confronta con il budget e stampa un rapporto.
+
+    Args:
+        modulo (str): Modulo di ingresso ("server", "main")
+        ripetizioni (int): Numero di misure
+        dettaglio (int): Numero di moduli più costosi da riportare
+
+    Returns:
+        bool: True se il modulo rispetta budget e importazioni differite
+    """
+    try:
+        misura = misura_importazione(modulo, ripetizioni)
+    except RuntimeError as e:
+        print(f"{modulo}: {e}")
+        return False
+
+    budget = BUDGET_AVVIO_MS.get(modulo)
+    entro_budget = budget is None or misura["totale_ms"] <= budget
+    differiti = [m for m in MODULI_DIFFERITI.get(modulo, ()) if m in misura["moduli"]]
+
+    esito = "OK" if entro_budget and not differiti else "FALLITO"
+    budget_testo = f" (budget {budget:.0f} ms)" if budget is not None else ""
+    print(f"{modulo}: {misura['totale_ms']:.1f} ms{budget_testo} - {esito}")
+    for nome in differiti:
+        print(f"  importato all'avvio ma da caricare in modo differito: {nome}")
+
+    piu_costosi = sorted(misura["moduli"].items(), key=lambda voce: voce[1][0], reverse=True)
+    for nome, (proprio, cumulativo) in piu_costosi[:dettaglio]:
+        print(f"  {proprio / 1000:8.1f} ms proprio {cumulativo / 1000:8.1f} ms cumulativo  {nome}")
+    return esito == "OK"
+
+
+def main(argv=None):
+    """Punto di ingresso da riga di comando"""
+    parser = argparse.ArgumentParser(description="Controllo del tempo di avvio")
+    parser.add_argument("moduli", nargs="*", default=["server", "main"], help="Moduli di ingresso da misurare")
+    parser.add_argument("--ripetizioni", type=int, default=5, help="Misure per modulo (vale la più veloce)")
+    parser.add_argument("--dettaglio", type=int, default=10, help="Moduli più costosi da riportare")
+    args = parser.parse_args(argv)
+
+    risultati = [controlla(modulo, args.ripetizioni, args.dettaglio) for modulo in args.moduli]
+    return 0 if all(risultati) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Verifica locale del deployment a shard (vedi router_shard.py).
+
+Avvia un router con N shard su processi locali e controlla, passando dal router:
+- affinità: le richieste di una sessione arrivano sempre allo shard che l'anello le assegna;
+- aggiunta: le sessioni spostate sul nuovo shard mantengono lo stato e i vecchi
+  proprietari non le tengono più in memoria, le altre restano dove erano;
+- drenaggio: le sessioni dello shard drenato vengono servite da un altro shard con lo
+  stato intatto.
+
+    python -m util.verifica_shard [--shard N] [--sessioni S] [--porta-base P]
+
+Le sessioni create dalla verifica vengono eliminate alla fine. Esce con codice 1 al
+primo controllo fallito.
+"""
+import argparse
+import http.client
+import json
+import logging
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.parse import quote
+
+logger = logging.getLogger("gioco_rpg")
+
+
+class VerificaFallita(Exception):
+    """Un controllo della verifica non è soddisfatto"""
+
+
+def _controlla(condizione, messaggio):
+    if not condizione:
+        raise VerificaFallita(messaggio)
+
+
+def _richiesta(porta, metodo, percorso, dati=None):
+    """
+    Esegue una richiesta JSON verso il router.
+
+    Returns:
+        tuple: (codice di stato, corpo decodificato, shard che ha risposto)
+    """
+    connessione = http.client.HTTPConnection("127.0.0.1", porta, timeout=120)
+    try:
+        corpo = json.dumps(dati).encode("utf-8") if dati is not None else None
+        headers = {"Content-Type": "application/json"} if corpo is not None else {}
+        connessione.request(metodo, percorso, body=corpo, headers=headers)
+        risposta = connessione.getresponse()
+        contenuto = risposta.read()
+        try:
+            dati_risposta = json.loads(contenuto or b"null")
+        except ValueError:
+            dati_risposta = None
+        return risposta.status, dati_risposta, risposta.getheader("X-RPG-Shard")
+    finally:
+        connessione.close()
+
+
+def _stato_sessione(porta, id_sessione):
+    """
+    Returns:
+        tuple: (stato della sessione senza l'ultimo output, shard che ha risposto)
+    """
+    codice, stato, shard = _richiesta(porta, "GET", f"/stato?id_sessione={quote(id_sessione)}")
+    _controlla(codice == 200, f"/stato di {id_sessione} ha risposto {codice} da {shard}")
+    stato.pop("output", None)
+    return stato, shard
+
+
+def _in_memoria(router):
+    """
+    Returns:
+        dict: {id_shard: insieme delle sessioni in memoria} per gli shard nell'anello
+    """
+    risultato = {}
+    for id_shard in router.anello.nodi:
+        _, risposta = router.shard[id_shard].richiesta("GET", "/shard/sessioni")
+        risultato[id_shard] = set((risposta or {}).get("sessioni", []))
+    return risultato
+
+
+def controlla_affinita(router, porta, sessioni, ripetizioni=3):
+    """
+    Controlla che ogni sessione sia servita dallo shard assegnato dall'anello con lo
+    stato atteso.
+
+    Args:
+        router (RouterShard): Il router
+        porta (int): Porta del router
+        sessioni (dict): {id_sessione: stato atteso}
+        ripetizioni (int, optional): Richieste per sessione
+
+    Returns:
+        dict: {id_sessione: shard che l'ha servita}
+    """
+    proprietari = {}
+    for id_sessione, atteso in sessioni.items():
+        previsto = router.anello.nodo_per(id_sessione)
+        for _ in range(ripetizioni):
+            stato, shard = _stato_sessione(porta, id_sessione)
+            _controlla(shard == previsto, f"{id_sessione} servita da {shard} invece di {previsto}")
+            _controlla(stato == atteso, f"Stato di {id_sessione} cambiato su {shard}")
+        proprietari[id_sessione] = previsto
+    return proprietari
+
+
+def verifica(numero_shard=3, numero_sessioni=24, porta_base=5101):
+    """
+    Esegue la verifica completa.
+
+    Args:
+        numero_shard (int, optional): Shard avviati all'inizio (almeno 2)
+        numero_sessioni (int, optional): Sessioni create attraverso il router
+        porta_base (int, optional): Prima porta usata dagli shard
+
+    Raises:
+        VerificaFallita: Al primo controllo non soddisfatto
+    """
+    from router_shard import RouterShard, crea_handler
+    from util.config import get_journal_path, get_session_path
+
+    _controlla(numero_shard >= 2, "Servono almeno 2 shard per verificare il drenaggio")
+    router = RouterShard(porta_base=porta_base)
+    server = None
+    sessioni = {}
+    try:
+        for _ in range(numero_shard):
+            _controlla(router.aggiungi_shard() is not None, "Avvio di uno shard non riuscito")
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), crea_handler(router))
+        server.daemon_threads = True
+        porta = server.server_address[1]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        # Sessioni create attraverso il router
+        for i in range(numero_sessioni):
+            codice, risposta, shard = _richiesta(porta, "POST", "/inizia", {"nome": f"Verifica{i}", "classe": "guerriero"})
+            _controlla(codice == 200, f"/inizia ha risposto {codice}")
+            id_sessione = risposta["id_sessione"]
+            _controlla(shard == router.anello.nodo_per(id_sessione),
+                       f"{id_sessione} creata su {shard} invece che sul suo proprietario")
+            sessioni[id_sessione], _ = _stato_sessione(porta, id_sessione)
+            _controlla(sessioni[id_sessione]["nome"] == f"Verifica{i}", f"Nome di {id_sessione} errato")
+
+        proprietari = controlla_affinita(router, porta, sessioni)
+        print(f"Affinità: {len(sessioni)} sessioni su {len(set(proprietari.values()))} shard - OK")
+
+        # Aggiunta di uno shard attraverso il router
+        codice, risposta, _ = _richiesta(porta, "POST", "/router/aggiungi", {})
+        _controlla(codice == 200, f"/router/aggiungi ha risposto {codice}")
+        nuovo = risposta["shard"]
+        spostate = {id_sessione for id_sessione in sessioni if router.anello.nodo_per(id_sessione) == nuovo}
+        for id_sessione, vecchio in proprietari.items():
+            if id_sessione not in spostate:
+                _controlla(router.anello.nodo_per(id_sessione) == vecchio,
+                           f"{id_sessione} spostata da {vecchio} a uno shard diverso da {nuovo}")
+        memoria = _in_memoria(router)
+        for id_sessione in spostate:
+            _controlla(id_sessione not in memoria[proprietari[id_sessione]],
+                       f"{id_sessione} ancora in memoria su {proprietari[id_sessione]} dopo l'aggiunta di {nuovo}")
+        proprietari = controlla_affinita(router, porta, sessioni)
+        print(f"Aggiunta di {nuovo}: {len(spostate)} sessioni spostate e rilasciate - OK")
+
+        # Drenaggio di uno degli shard iniziali
+        drenato = next(id_shard for id_shard in sorted(router.anello.nodi) if id_shard != nuovo)
+        codice, risposta, _ = _richiesta(porta, "POST", "/router/drena", {"shard": drenato})
+        _controlla(codice == 200, f"/router/drena ha risposto {codice}: {risposta}")
+        _controlla(drenato not in router.anello.nodi, f"{drenato} ancora nell'anello dopo il drenaggio")
+        proprietari_dopo = controlla_affinita(router, porta, sessioni)
+        drenate = [id_sessione for id_sessione, shard in proprietari.items() if shard == drenato]
+        for id_sessione, shard in proprietari.items():
+            if shard != drenato:
+                _controlla(proprietari_dopo[id_sessione] == shard,
+                           f"{id_sessione} spostata da {shard} durante il drenaggio di {drenato}")
+        print(f"Drenaggio di {drenato}: {len(drenate)} sessioni servite da altri shard - OK")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        router.arresta_tutti()
+        for id_sessione in sessioni:
+            for percorso in (get_session_path(id_sessione), get_journal_path(id_sessione)):
+                percorso.unlink(missing_ok=True)
+
+
+def main(argv=None):
+    """Punto di ingresso da riga di comando"""
+    parser = argparse.ArgumentParser(description="Verifica di affinità, aggiunta e drenaggio degli shard")
+    parser.add_argument("--shard", type=int, default=3, help="Shard avviati all'inizio (almeno 2)")
+    parser.add_argument("--sessioni", type=int, default=24, help="Sessioni create attraverso il router")
+    parser.add_argument("--porta-base", type=int, default=5101, help="Prima porta usata dagli shard")
+    args = parser.parse_args(argv)
+
+    try:
+        verifica(args.shard, args.sessioni, args.porta_base)
+    except VerificaFallita as e:
+        print(f"FALLITO: {e}")
+        return 1
+    print("Verifica degli shard completata")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Verifica locale del formato snapshot delle sessioni web (vedi core/snapshot_sessione.py).
+
+Gioca alcune sequenze di comandi su una sessione nuova e, dopo ogni comando, codifica
+la sessione e la ricostruisce, controllando che:
+- la codifica riesca in ogni fase (a metà di un dialogo, di un combattimento, di un
+  cambio di equipaggiamento...);
+- la sessione ricostruita abbia lo stesso stato e le stesse statistiche del giocatore
+  (modificatori dell'equipaggiamento compresi) di quella in memoria;
+- il comando successivo, eseguito sulla sessione ricostruita, dia lo stesso output e lo
+  stesso stato che dà sulla sessione in memoria.
+
+    python -m util.verifica_snapshot [--scenario NOME] [--mostra]
+
+Esce con codice 1 al primo controllo fallito.
+"""
+import argparse
+import logging
+import sys
+
+logger = logging.getLogger("gioco_rpg")
+
+# nome -> (comandi dopo l'apertura della sessione, stato da raggiungere, condizione sullo stato)
+SCENARI = {
+    "taverna": (["", "3", "", "1", "", "2"], "TavernaState",
+                lambda stato: "npg_lista_mostrata" in stato.dati_contestuali),
+    "inventario": (["", "7", "", "1", "", "2", "", "4"], "GestioneInventarioState",
+                   lambda stato: stato.fase != "menu_principale"),
+    "dialogo": (["", "1", "", "1", "1", "1", "1", "2", "1"], "DialogoState",
+                lambda stato: stato.stato_corrente != "inizio"),
+    "prova_abilita": (["", "8", "", "1", "", "2", "", "1", "2"], "ProvaAbilitaState",
+                      lambda stato: stato.dati_contestuali.get("fase_npg") == "scelta_npg"),
+    "combattimento": (["", "5", "", "1", "s", "", "", "3", "", "1", "1", "", "3", "", "3", "1"], "CombattimentoState",
+                      lambda stato: stato.dati_temporanei.get("fase_equip") == "scelta_item"),
+    "mercato": (["", "2", "", "1", "", "1"], "MercatoState",
+                lambda stato: hasattr(stato, "prima_visita_completata")),
+    "sfida_npg": (["", "5", "", "1", "s", "", "", "1", "", "", "", "1"], "CombattimentoState",
+                  lambda stato: stato.npg_ostile is not None and stato.turno > 1),
+}
+
+
+class VerificaFallita(Exception):
+    """Un controllo della verifica non è soddisfatto"""
+
+
+def _controlla(condizione, messaggio):
+    if not condizione:
+        raise VerificaFallita(messaggio)
+
+
+def _nuova_sessione():
+    """
+    Returns:
+        StatoGioco: Una sessione nuova dopo il comando di apertura, come dopo /inizia
+    """
+    from core.stato_gioco import StatoGioco
+    from entities.giocatore import Giocatore
+    from states.taverna import TavernaState
+
+    sessione = StatoGioco(Giocatore("Verifica", "guerriero"), TavernaState(None))
+    sessione.processa_comando("")
+    return sessione
+
+
+def _statistiche(sessione):
+    """Statistiche correnti del giocatore, comprese quelle derivate dall'equipaggiamento"""
+    from entities.entita import CARATTERISTICHE
+
+    giocatore = sessione.game.giocatore
+    statistiche = {caratteristica: getattr(giocatore, caratteristica) for caratteristica in CARATTERISTICHE}
+    statistiche.update(difesa=giocatore.difesa, hp=giocatore.hp, mana=giocatore.mana,
+                       # L'equipaggiamento indossato deve essere lo stesso oggetto dell'inventario
+                       equipaggiamento_in_inventario=all(
+                           any(oggetto is posseduto for posseduto in giocatore.inventario)
+                           for oggetto in [giocatore.arma, giocatore.armatura] + giocatore.accessori
+                           if oggetto is not None))
+    return statistiche
+
+
+def _differenze(atteso, ottenuto, percorso=""):
+    """Percorsi delle prime differenze tra due strutture JSON"""
+    if isinstance(atteso, dict) and isinstance(ottenuto, dict):
+        diverse = []
+        for chiave in sorted(set(atteso) | set(ottenuto), key=str):
+            diverse.extend(_differenze(atteso.get(chiave), ottenuto.get(chiave), f"{percorso}/{chiave}"))
+        return diverse
+    if isinstance(atteso, list) and isinstance(ottenuto, list) and len(atteso) == len(ottenuto):
+        diverse = []
+        for indice, (a, b) in enumerate(zip(atteso, ottenuto)):
+            diverse.extend(_differenze(a, b, f"{percorso}/{indice}"))
+        return diverse
+    return [] if atteso == ottenuto else [percorso or "/"]
+
+
+def verifica_scenario(nome, mostra=False):
+    """
+    Gioca uno scenario controllando il giro codifica/ricostruzione dopo ogni comando.
+
+    Args:
+        nome (str): Nome dello scenario in SCENARI
+        mostra (bool, optional): Stampa lo stato in cima alla pila dopo ogni comando
+
+    Raises:
+        VerificaFallita: Al primo controllo non soddisfatto
+    """
+    from core.snapshot_sessione import codifica_sessione, decodifica_sessione
+    from util.riproduzione import stato_confrontabile
+
+    comandi, stato_atteso, condizione = SCENARI[nome]
+    sessione = _nuova_sessione()
+    ricostruita = None
+    raggiunto = False
+    for passo, comando in enumerate(comandi, 1):
+        output = sessione.processa_comando(comando)
+        stato = sessione.game.stato_corrente()
+        if mostra:
+            print(f"  {passo:>2} {comando!r:6} -> {type(stato).__name__} fase={getattr(stato, 'fase', None)}")
+        if type(stato).__name__ == stato_atteso and condizione(stato):
+            raggiunto = True
+
+        if ricostruita is not None:
+            # La sessione ricostruita al passo precedente deve proseguire come quella in memoria
+            _controlla(ricostruita.processa_comando(comando) == output,
+                       f"{nome}, passo {passo} ({comando!r}): output diverso sulla sessione ricostruita")
+            diverse = _differenze(stato_confrontabile(sessione), stato_confrontabile(ricostruita))
+            _controlla(not diverse, f"{nome}, passo {passo} ({comando!r}): la sessione ricostruita prosegue "
+                                    f"diversamente in {', '.join(diverse[:5])}")
+
+        try:
+            contenuto = codifica_sessione(sessione)
+        except Exception as e:
+            raise VerificaFallita(f"{nome}, passo {passo} ({comando!r}): codifica non riuscita: {type(e).__name__}: {e}")
+        ricostruita = decodifica_sessione(contenuto)
+
+        diverse = _differenze(stato_confrontabile(sessione), stato_confrontabile(ricostruita))
+        _controlla(not diverse, f"{nome}, passo {passo} ({comando!r}): stato diverso dopo la ricostruzione in "
+                                f"{', '.join(diverse[:5])}")
+        diverse = _differenze(_statistiche(sessione), _statistiche(ricostruita))
+        _controlla(not diverse, f"{nome}, passo {passo} ({comando!r}): statistiche diverse dopo la ricostruzione "
+                                f"in {', '.join(diverse)}")
+
+    _controlla(raggiunto, f"{nome}: lo scenario non raggiunge la fase da verificare in {stato_atteso}")
+
+
+def main(argv=None):
+    """Punto di ingresso da riga di comando"""
+    parser = argparse.ArgumentParser(description="Verifica del giro codifica/ricostruzione delle sessioni web")
+    parser.add_argument("--scenario", choices=sorted(SCENARI), action="append",
+                        help="Scenario da verificare (ripetibile, default: tutti)")
+    parser.add_argument("--mostra", action="store_true", help="Stampa lo stato dopo ogni comando")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    for nome in args.scenario or SCENARI:
+        try:
+            verifica_scenario(nome, mostra=args.mostra)
+        except VerificaFallita as e:
+            print(f"FALLITO: {e}")
+            return 1
+        print(f"{nome}: {len(SCENARI[nome][0])} comandi - OK")
+    print("Verifica degli snapshot completata")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 from world.mappa import Mappa
 from world.gestore_mappe import GestitoreMappe
 from entities.giocatore import Giocatore
-import random
+from util.casualita import rng
 
 class ControllerMappa:
     def __init__(self, larghezza=80, altezza=60, dim_cella=1):
@@ -300,8 +300,8 @@ class ControllerMappa:
             tentativi = 0
             
             while not posizionato and tentativi < 20:
-                x = random.randint(1, mappa.larghezza - 2)
-                y = random.randint(1, mappa.altezza - 2)
+                x = rng().randint(1, mappa.larghezza - 2)
+                y = rng().randint(1, mappa.altezza - 2)
                 
                 # Verifica se la posizione è valida e libera
                 if mappa.is_posizione_valida(x, y) and (x, y) not in mappa.oggetti and (x, y) not in mappa.npg:
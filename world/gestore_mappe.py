@@ -6,17 +6,100 @@ from entities.npg import NPG
 from entities.nemico import Nemico
 from world.mappa import MappaComponente, MappaCaricatore
 from pathlib import Path
+from collections.abc import MutableMapping
 from util.data_manager import get_data_manager
+from core.eventi_gioco import GIOCATORE_MOSSO, MAPPA_CAMBIATA
 import json
 import os
 import logging
 from util.config import get_save_path, create_backup, SAVE_FORMAT_VERSION
 
+class MappePigre(MutableMapping):
+    """
+    Dizionario nome -> Mappa che ricostruisce ogni mappa di un salvataggio solo al primo accesso.
+    Finché una mappa non viene richiesta resta nella sua forma serializzata all'interno
+    del salvataggio; elenco dei nomi e test di appartenenza non ricostruiscono nulla.
+    """
+
+    def __init__(self, idrata):
+        """
+        Args:
+            idrata (callable): Funzione (nome, dati) -> Mappa che ricostruisce una mappa
+        """
+        self._idrata = idrata
+        self._mappe = {}  # Mappe già ricostruite
+        self._sezioni = {}  # Mappe ancora serializzate: nome -> (vista del salvataggio, percorso)
+        self._ordine = []
+
+    def aggiungi_sezione(self, nome, vista, percorso):
+        """
+        Registra una mappa da ricostruire al primo accesso.
+
+        Args:
+            nome (str): Nome della mappa
+            vista: Vista del salvataggio (vedi util.formato_salvataggi.apri_salvataggio)
+            percorso (tuple): Percorso della mappa nel salvataggio
+        """
+        if nome not in self._sezioni and nome not in self._mappe:
+            self._ordine.append(nome)
+        self._mappe.pop(nome, None)
+        self._sezioni[nome] = (vista, percorso)
+
+    def e_caricata(self, nome):
+        """Indica se una mappa è già stata ricostruita"""
+        return nome in self._mappe
+
+    def dati_serializzati(self, nome):
+        """
+        Restituisce la forma serializzata di una mappa non ancora ricostruita.
+
+        Returns:
+            dict: I dati della mappa, None se la mappa è già stata ricostruita o non esiste
+        """
+        if nome not in self._sezioni:
+            return None
+        vista, percorso = self._sezioni[nome]
+        return vista.leggi(*percorso)
+
+    def __getitem__(self, nome):
+        if nome in self._mappe:
+            return self._mappe[nome]
+        if nome not in self._sezioni:
+            raise KeyError(nome)
+        mappa = self._idrata(nome, self.dati_serializzati(nome))
+        del self._sezioni[nome]
+        self._mappe[nome] = mappa
+        return mappa
+
+    def __setitem__(self, nome, mappa):
+        if nome not in self._sezioni and nome not in self._mappe:
+            self._ordine.append(nome)
+        self._sezioni.pop(nome, None)
+        self._mappe[nome] = mappa
+
+    def __delitem__(self, nome):
+        if nome not in self._sezioni and nome not in self._mappe:
+            raise KeyError(nome)
+        self._sezioni.pop(nome, None)
+        self._mappe.pop(nome, None)
+        self._ordine.remove(nome)
+
+    def __contains__(self, nome):
+        return nome in self._mappe or nome in self._sezioni
+
+    def __iter__(self):
+        return iter(list(self._ordine))
+
+    def __len__(self):
+        return len(self._ordine)
+
+
 class GestitoreMappe:
     def __init__(self):
         """Inizializza il gestore mappe"""
         self.mappe = {}  # Nome mappa -> oggetto Mappa
         self.mappa_attuale = None
+        self.eventi = None  # Bus degli eventi del Game, impostato da Game.collega_eventi
         self.data_manager = get_data_manager()
         self.mappa_caricatore = MappaCaricatore(Path("data/mappe"))
         self.inizializza_mappe()
@@ -266,9 +349,25 @@ class GestitoreMappe:
             logging.error(traceback.format_exc())
         
     def ottieni_mappa(self, nome):
-        """Restituisce una mappa per nome"""
+        """Restituisce una mappa per nome (se proviene da un salvataggio viene ricostruita al primo accesso)"""
         return self.mappe.get(nome)
     
+    def dati_mappa(self, nome):
+        """
+        Restituisce la forma serializzata di una mappa senza ricostruirla se non è mai stata usata.
+        
+        Args:
+            nome (str): Nome della mappa
+            
+        Returns:
+            dict: I dati della mappa come prodotti da Mappa.to_dict()
+        """
+        if isinstance(self.mappe, MappePigre):
+            dati = self.mappe.dati_serializzati(nome)
+            if dati is not None:
+                return dati
+        return self.mappe[nome].to_dict()
+    
     def imposta_mappa_attuale(self, nome):
         """Imposta la mappa attuale per riferimento facile"""
         if nome in self.mappe:
@@ -384,6 +483,10 @@ class GestitoreMappe:
         giocatore.x = nuovo_x
         giocatore.y = nuovo_y
         
+        eventi = getattr(self, "eventi", None)
+        if eventi is not None:
+            eventi.emetti(GIOCATORE_MOSSO, mappa=giocatore.mappa_corrente, x=nuovo_x, y=nuovo_y)
+        
         # Se c'è una porta, cambia mappa
         if porta_dest:
             mappa_dest, x_dest, y_dest = porta_dest
@@ -432,6 +535,7 @@ class GestitoreMappe:
             return {"successo": False, "messaggio": f"Posizione ({x}, {y}) già occupata nella mappa {nome_mappa}"}
             
         # Aggiorna la mappa e la posizione del giocatore
+        mappa_precedente = giocatore.mappa_corrente
         giocatore.mappa_corrente = nome_mappa
         giocatore.x = x
         giocatore.y = y
@@ -439,6 +543,10 @@ class GestitoreMappe:
         # Imposta la nuova mappa come mappa attuale
         self.imposta_mappa_attuale(nome_mappa)
         
+        eventi = getattr(self, "eventi", None)
+        if eventi is not None:
+            eventi.emetti(MAPPA_CAMBIATA, da=mappa_precedente, a=nome_mappa, x=x, y=y)
+        
         return {"successo": True, "messaggio": f"Sei entrato in {nome_mappa}"}
     
     def ottieni_info_posizione(self, x, y, mappa=None):
@@ -491,10 +599,10 @@ class GestitoreMappe:
         Returns:
             dict: Rappresentazione del gestore mappe in formato dizionario
         """
-        # Lista delle mappe serializzate
+        # Lista delle mappe serializzate (quelle mai usate restano nella forma già serializzata)
         mappe_dict = {}
-        for nome, mappa in self.mappe.items():
-            mappe_dict[nome] = mappa.to_dict()
+        for nome in self.mappe:
+            mappe_dict[nome] = self.dati_mappa(nome)
             
         return {
             "mappe": mappe_dict,
@@ -538,6 +646,45 @@ class GestitoreMappe:
             print(f"Errore durante il caricamento delle mappe: {e}")
             return False
     
+    def _idrata_mappa(self, nome_mappa, mappa_dict):
+        """Ricostruisce una mappa serializzata, come from_dict, quando viene usata per la prima volta"""
+        logging.getLogger("gioco_rpg").info(f"Caricamento della mappa {nome_mappa} dal salvataggio")
+        mappa = Mappa.from_dict(mappa_dict)
+        self.carica_oggetti_interattivi_da_json(mappa, nome_mappa)
+        return mappa
+    
+    def from_vista(self, vista, percorso=("mappe",)):
+        """
+        Carica lo stato del gestore mappe da un salvataggio aperto con apri_salvataggio.
+        Viene ricostruita subito solo la mappa attuale: le altre vengono ricostruite
+        al primo accesso (ottieni_mappa, self.mappe[nome]...).
+        
+        Args:
+            vista: Vista del salvataggio
+            percorso (tuple): Percorso della sezione delle mappe nel salvataggio
+            
+        Returns:
+            bool: True se il caricamento è avvenuto con successo, False altrimenti
+        """
+        try:
+            mappe = MappePigre(self._idrata_mappa)
+            for nome_mappa in vista.chiavi(*percorso, "mappe"):
+                mappe.aggiungi_sezione(nome_mappa, vista, tuple(percorso) + ("mappe", nome_mappa))
+            self.mappe = mappe
+            
+            # Imposta la mappa attuale
+            mappa_attuale_nome = vista.leggi(*percorso, "mappa_attuale")
+            if mappa_attuale_nome and mappa_attuale_nome in self.mappe:
+                self.mappa_attuale = self.mappe[mappa_attuale_nome]
+            elif self.mappe:
+                # Se non c'è una mappa attuale, imposta la prima disponibile
+                self.mappa_attuale = self.mappe[next(iter(self.mappe))]
+            
+            return True
+        except Exception as e:
+            logging.getLogger("gioco_rpg").error(f"Errore durante il caricamento delle mappe: {e}")
+            return False
+    
     def salva(self, percorso_file="mappe_salvataggio.json"):
         """
         Salva lo stato completo di tutte le mappe e relativi oggetti interattivi.
@@ -6,6 +6,7 @@ from entities.nemico import Nemico
 import json
 import logging
 from pathlib import Path
+from util.posizioni import codifica_posizione, decodifica_posizione
 
 class Mappa:
     def __init__(self, nome, larghezza, altezza, tipo="interno"):
@@ -173,19 +174,19 @@ class Mappa:
         oggetti_dict = {}
         for pos, obj in self.oggetti.items():
             if hasattr(obj, 'to_dict'):
-                oggetti_dict[str(pos)] = obj.to_dict()
+                oggetti_dict[codifica_posizione(pos)] = obj.to_dict()
             else:
-                oggetti_dict[str(pos)] = {"nome": obj.nome, "token": obj.token}
+                oggetti_dict[codifica_posizione(pos)] = {"nome": obj.nome, "token": obj.token}
         
         npg_dict = {}
         for pos, npg in self.npg.items():
             if hasattr(npg, 'to_dict'):
-                npg_dict[str(pos)] = npg.to_dict()
+                npg_dict[codifica_posizione(pos)] = npg.to_dict()
             else:
-                npg_dict[str(pos)] = {"nome": npg.nome, "token": npg.token}
+                npg_dict[codifica_posizione(pos)] = {"nome": npg.nome, "token": npg.token}
         
         # Serializza le porte
-        porte_dict = {str(pos): list(dest) for pos, dest in self.porte.items()}
+        porte_dict = {codifica_posizione(pos): list(dest) for pos, dest in self.porte.items()}
         
         return {
             "nome": self.nome,
@@ -223,15 +224,24 @@ class Mappa:
             mappa.griglia = [riga.copy() for riga in data["griglia"]]
         
         # Carica gli oggetti
-        from items.oggetto_interattivo import OggettoInterattivo
+        from items.oggetto_interattivo import OggettoInterattivo, Baule, Porta, Leva, Trappola, OggettoRompibile
+        classi_oggetti = {
+            "baule": Baule,
+            "porta": Porta,
+            "leva": Leva,
+            "trappola": Trappola,
+            "oggetto_rompibile": OggettoRompibile
+        }
         for pos_str, obj_data in data.get("oggetti", {}).items():
             try:
-                # Converti la stringa di posizione in tupla
-                pos = eval(pos_str)  # Sicuro perché la posizione è una tupla semplice (x, y)
+                # Converti la chiave di posizione ("x,y" o la vecchia forma "(x, y)") in tupla
+                pos = decodifica_posizione(pos_str)
                 
                 # Crea l'oggetto usando from_dict se disponibile
                 if isinstance(obj_data, dict):
-                    obj = OggettoInterattivo.from_dict(obj_data)
+                    # Usa la sottoclasse indicata dal tipo per non perdere i suoi attributi
+                    classe_oggetto = classi_oggetti.get(obj_data.get("tipo"), OggettoInterattivo)
+                    obj = classe_oggetto.from_dict(obj_data)
                     mappa.oggetti[pos] = obj
                     # Aggiorna la posizione dell'oggetto
                     obj.posizione = (pos[0], pos[1], mappa.nome)
@@ -242,8 +252,8 @@ class Mappa:
         from entities.npg import NPG
         for pos_str, npg_data in data.get("npg", {}).items():
             try:
-                # Converti la stringa di posizione in tupla
-                pos = eval(pos_str)
+                # Converti la chiave di posizione ("x,y" o la vecchia forma "(x, y)") in tupla
+                pos = decodifica_posizione(pos_str)
                 
                 # Crea l'NPG usando from_dict se disponibile
                 if isinstance(npg_data, dict):
@@ -260,7 +270,7 @@ class Mappa:
         # Carica le porte
         for pos_str, dest_data in data.get("porte", {}).items():
             try:
-                pos = eval(pos_str)
+                pos = decodifica_posizione(pos_str)
                 # Converti la lista di destinazione in tupla
                 if isinstance(dest_data, list) and len(dest_data) == 3:
                     mappa.porte[pos] = (dest_data[0], dest_data[1], dest_data[2])